@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+# Apache 2.0
+
+""" This module contains the helpers used by local/recognize.py to follow the
+progress of the recognition pipeline without re-reading its logs.
+
+LogTail follows a set of growing log files and counts matching lines, reading
+only the bytes appended since the previous poll. TimedProcess runs a command
+in the background and records its wall-clock time, CPU time and peak memory
+in a ResourceUsage, as GNU time did for recognize.sh. ProgressBar renders the
+same progress bar as local/progressbar.sh, extended with an ETA.
+"""
+
+from __future__ import division
+from __future__ import print_function
+import glob
+import os
+import subprocess
+import sys
+import time
+
+
+def format_duration(seconds):
+    """Formats a number of seconds as h:mm:ss."""
+    seconds = int(seconds)
+    return "{0}:{1:02d}:{2:02d}".format(seconds // 3600, seconds % 3600 // 60,
+                                        seconds % 60)
+
+
+class LogTail(object):
+    """Follows all files matching a glob pattern and counts the lines that
+    contain 'match' (or all lines if 'match' is None). Each poll only reads
+    the bytes appended to the files since the previous poll, so the cost of
+    following a log is proportional to its growth rather than its size.
+    Files that shrink (e.g. are rewritten by a retried job) are re-read from
+    the start.
+    """
+
+    def __init__(self, pattern, match=None):
+        self.pattern = pattern
+        self.match = match.encode() if match is not None else None
+        self.offsets = {}
+        self.partial = {}
+        self.counts = {}
+
+    def poll(self):
+        """Reads new data from the followed files and returns the total number
+        of matching lines seen so far."""
+        for path in glob.glob(self.pattern):
+            self._read_new_data(path)
+        return self.count()
+
+    def count(self):
+        return sum(self.counts.values())
+
+    def _read_new_data(self, path):
+        offset = self.offsets.get(path, 0)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        if size < offset:
+            offset = 0
+            self.partial[path] = b''
+            self.counts[path] = 0
+        if size == offset:
+            return
+
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(size - offset)
+        self.offsets[path] = offset + len(data)
+
+        # Only complete lines are counted; a trailing partial line is kept
+        # until the rest of it has been written.
+        data = self.partial.get(path, b'') + data
+        complete, newline, rest = data.rpartition(b'\n')
+        self.partial[path] = rest
+        if not newline:
+            return
+        if self.match is None:
+            count = complete.count(b'\n') + 1
+        else:
+            count = complete.count(self.match)
+        self.counts[path] = self.counts.get(path, 0) + count
+
+
+class ProgressBar(object):
+    """Renders a progress bar with an ETA on a single terminal line."""
+
+    def __init__(self, total, label, width=50, stream=sys.stdout):
+        self.total = total
+        self.label = label
+        self.width = width
+        self.stream = stream
+        self.start_time = time.time()
+
+    def update(self, done):
+        if self.total <= 0 or done > self.total:
+            return
+        filled = done * self.width // self.total
+        eta = ""
+        if done > 0:
+            elapsed = time.time() - self.start_time
+            eta = ", ETA " + format_duration(
+                elapsed * (self.total - done) / done)
+        self.stream.write("\r[{0}{1}] {2} ({3}/{4}{5})\r".format(
+            '#' * filled, ' ' * (self.width - filled), self.label, done,
+            self.total, eta))
+        self.stream.flush()
+
+    def clear(self):
+        self.stream.write("\r{0}\r".format(' ' * (self.width + 80)))
+        self.stream.flush()
+
+
+class ResourceUsage(object):
+    """Accumulates the resource usage of one or more processes: elapsed
+    (wall-clock) time, user and system CPU time and the peak resident set
+    size in kB."""
+
+    def __init__(self):
+        self.elapsed = 0.0
+        self.user_time = 0.0
+        self.system_time = 0.0
+        self.max_rss = 0
+
+    def add(self, elapsed, user_time, system_time, max_rss):
+        self.elapsed += elapsed
+        self.user_time += user_time
+        self.system_time += system_time
+        self.max_rss = max(self.max_rss, max_rss)
+
+    def add_usage(self, other):
+        self.add(other.elapsed, other.user_time, other.system_time,
+                 other.max_rss)
+
+    def time_line(self):
+        """Returns the usage in the format of GNU time -f "%e %U %S %M"."""
+        return "{0:.2f} {1:.2f} {2:.2f} {3}".format(
+            self.elapsed, self.user_time, self.system_time, self.max_rss)
+
+    def write(self, filename):
+        with open(filename, 'w') as f:
+            print(self.time_line(), file=f)
+
+    def summary(self, label):
+        return "{0} completed in {1} (CPU: {2}), Memory used: {3} MB".format(
+            label, format_duration(self.elapsed),
+            format_duration(self.user_time + self.system_time),
+            self.max_rss // 1000)
+
+
+class TimedProcess(object):
+    """Runs a shell command in the background and records its resource usage
+    in self.usage when it finishes. The process is reaped with os.wait4(),
+    which reports the same figures for the process and its children as GNU
+    time does.
+    """
+
+    def __init__(self, command, log_file=None, env=None):
+        self.command = command
+        self.start_time = time.time()
+        self.usage = ResourceUsage()
+        self.returncode = None
+        self.process = subprocess.Popen(command, shell=True,
+                                        executable='/bin/bash',
+                                        stdout=log_file,
+                                        stderr=subprocess.STDOUT,
+                                        env=env)
+
+    def poll(self):
+        """Returns the exit status if the process has finished, else None."""
+        if self.returncode is None:
+            pid, status, rusage = os.wait4(self.process.pid, os.WNOHANG)
+            if pid != 0:
+                self._finish(status, rusage)
+        return self.returncode
+
+    def wait(self):
+        if self.returncode is None:
+            pid, status, rusage = os.wait4(self.process.pid, 0)
+            self._finish(status, rusage)
+        return self.returncode
+
+    def _finish(self, status, rusage):
+        self.usage.add(time.time() - self.start_time, rusage.ru_utime,
+                       rusage.ru_stime, rusage.ru_maxrss)
+        if os.WIFSIGNALED(status):
+            self.returncode = -os.WTERMSIG(status)
+        else:
+            self.returncode = os.WEXITSTATUS(status)
+        # The process has been reaped; stop Popen from waiting for it again.
+        self.process.returncode = self.returncode
+
+
+def monitor(process, tail, progress_bar, interval=1.0):
+    """Waits for 'process' (a TimedProcess) to finish, updating 'progress_bar'
+    with the count of 'tail' every 'interval' seconds. Returns the exit
+    status of the process."""
+    while process.poll() is None:
+        progress_bar.update(tail.poll())
+        time.sleep(interval)
+    progress_bar.update(tail.poll())
+    progress_bar.clear()
+    return process.returncode
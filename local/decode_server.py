@@ -0,0 +1,656 @@
+#!/usr/bin/env python
+
+# Apache 2.0
+
+""" Decode server for repeated recognition requests.
+
+Every run of recognize.sh copies the acoustic model and loads final.mdl,
+HCLG.fst and the i-vector extractor from scratch, which dominates the latency
+of small batches. This server starts online2-wav-nnet3-latgen-faster once per
+decoder and keeps it running, with its models loaded, for all requests. The
+speech segments of a request are streamed to the decoders through a FIFO and
+their lattices are read back from the decoders' output, so the cost of a
+request is its diarization, the decoding itself and the output stage.
+
+Requests are passed through a file queue in the server directory:
+
+  local/decode_server.py serve [options] <server-dir>
+  local/decode_server.py submit [--wait true] <server-dir> \\
+      [recognize options] <sources> <decode-dir>
+  local/decode_server.py stop <server-dir>
+
+A request takes the options of local/recognize.py, except for the options
+selecting the models (--model, --lpath, --symtab, --wordbound, --extractor),
+which are those of the server. The exit status of a request is written to
+<server-dir>/done/<request-id>.status. Like recognize.sh, the server has to be
+run from the root of the decoder directory.
+"""
+
+from __future__ import print_function
+import argparse
+import errno
+import fcntl
+import glob
+import gzip
+import io
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import wave
+
+import decode_monitor
+import recognize
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+handler.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    '%(asctime)s [%(pathname)s:%(lineno)s - '
+    '%(funcName)s - %(levelname)s ] %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Decode server that keeps the models loaded between "
+        "recognition requests.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    serve = subparsers.add_parser(
+        "serve", help="Run the server.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    serve.add_argument("--model", type=str, default="bliss_models/AM/online")
+    serve.add_argument("--lpath", type=str, default="bliss_models/Lang")
+    serve.add_argument("--extractor", type=str,
+                       default="bliss_models/AM/online/ivector_extractor")
+    serve.add_argument("--symtab", type=str,
+                       help="Defaults to <lpath>/words.txt.")
+    serve.add_argument("--wordbound", type=str,
+                       help="Defaults to <lpath>/phones/word_boundary.int.")
+    serve.add_argument("--num-decoders", type=int, default=1,
+                       help="Number of decoder processes, each of which "
+                       "keeps its own copy of the models in memory.")
+    serve.add_argument("--max-requests", type=int, default=2,
+                       help="Maximum number of requests in progress; the "
+                       "diarization of one request overlaps with the "
+                       "decoding of another.")
+    serve.add_argument("--beam", type=float, default=15.0)
+    serve.add_argument("--lattice-beam", type=float, default=6.0)
+    serve.add_argument("--post-decode-acwt", type=float, default=10.0)
+    serve.add_argument("--poll-interval", type=float, default=1.0,
+                       help="Seconds between checks of the request queue.")
+    serve.add_argument("server_dir", help="Directory of the request queue.")
+
+    submit = subparsers.add_parser(
+        "submit", help="Submit a request.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    submit.add_argument("--wait", type=recognize.str_to_bool, default=True,
+                        help="Wait until the request has been processed and "
+                        "exit with its status.")
+    submit.add_argument("server_dir", help="Directory of the request queue.")
+    submit.add_argument("recognize_args", nargs=argparse.REMAINDER,
+                        help="Options and arguments of local/recognize.py.")
+
+    stop = subparsers.add_parser("stop", help="Stop the server.")
+    stop.add_argument("server_dir", help="Directory of the request queue.")
+
+    args = parser.parse_args()
+    if args.command is None:
+        parser.error("a command is required")
+    if args.command == "serve":
+        if args.symtab is None:
+            args.symtab = os.path.join(args.lpath, "words.txt")
+        if args.wordbound is None:
+            args.wordbound = os.path.join(args.lpath, "phones",
+                                          "word_boundary.int")
+    return args
+
+
+def make_sentinel_wav(key):
+    """Returns a Kaldi binary archive entry holding 10ms of silence. One is
+    written after the segments of every batch, so that a decoder looking for
+    a segment that could not be extracted finds a later key and moves on,
+    instead of blocking until the next batch arrives."""
+    data = io.BytesIO()
+    writer = wave.open(data, 'wb')
+    writer.setnchannels(1)
+    writer.setsampwidth(2)
+    writer.setframerate(16000)
+    writer.writeframes(b'\0\0' * 160)
+    writer.close()
+    return key.encode() + b' \0B' + data.getvalue()
+
+
+class DecodeBatch(object):
+    """The utterances of one request that are assigned to one decoder. The
+    lattices received for them are written to a gzipped text archive."""
+
+    def __init__(self, speakers, segments, wav_scp, lattices, log):
+        self.speakers = speakers
+        self.segments = segments
+        self.wav_scp = wav_scp
+        self.log = log
+        self.total = sum(len(utts) for spk, utts in speakers)
+        self.done = 0
+        self.skipped = []
+        self.error = None
+        self.condition = threading.Condition()
+        self.lattice_file = gzip.open(lattices, 'wb')
+
+    def add_lattice(self, utt, lines):
+        with self.condition:
+            self.lattice_file.write("{0} \n".format(utt).encode())
+            self.lattice_file.writelines(lines)
+            self.lattice_file.write(b'\n')
+            self.done += 1
+            self.condition.notify_all()
+
+    def skip(self, utt):
+        with self.condition:
+            self.skipped.append(utt)
+            self.done += 1
+            self.condition.notify_all()
+
+    def fail(self, error):
+        with self.condition:
+            if self.error is None:
+                self.error = error
+            self.condition.notify_all()
+
+    def wait(self, decoder):
+        """Waits until all lattices have been received from 'decoder';
+        returns an error message if decoding failed, else None."""
+        with self.condition:
+            while self.done < self.total and self.error is None:
+                self.condition.wait(1.0)
+                if not decoder.is_alive() and self.done < self.total:
+                    self.error = "decoder {0} exited, see {1}".format(
+                        decoder.index, decoder.log)
+            self.lattice_file.close()
+        return self.error
+
+
+class PersistentDecoder(object):
+    """An online2-wav-nnet3-latgen-faster process that keeps the model and
+    graph loaded and decodes successive batches.
+
+    The speakers of a batch are written to the decoder's spk2utt input
+    (stdin) and the speech segments, extracted by extract-segments, to a FIFO
+    that the decoder reads as its "ark,s,cs" wav input. Because that input
+    must be sorted and read in order, the utterances get keys made of a batch
+    sequence number, a speaker index and an utterance index of fixed width;
+    the lattices read back from the decoder's output are stored under the
+    original utterance ids.
+    """
+
+    def __init__(self, index, args, work_dir, env):
+        self.index = index
+        self.args = args
+        self.env = env
+        self.fifo = os.path.join(work_dir, "wav.{0}.fifo".format(index))
+        self.log = os.path.join(work_dir, "decoder.{0}.log".format(index))
+        self.feed_lock = threading.Lock()
+        self.condition = threading.Condition()
+        self.pending = {}
+        self.sequence = 0
+        self.process = None
+        self.wav_fd = None
+        self.log_file = None
+
+    def command(self):
+        args = self.args
+        graph = os.path.join(args.model, "graph")
+        frame_subsampling_opt = ""
+        factor_file = os.path.join(args.model, "frame_subsampling_factor")
+        if os.path.isfile(factor_file):
+            with open(factor_file) as f:
+                frame_subsampling_opt = "--frame-subsampling-factor={0}".format(
+                    f.read().strip())
+        # The options are those used by steps/online/nnet3/decode.sh when
+        # called from recognize.sh.
+        return ("online2-wav-nnet3-latgen-faster --do-endpointing=false "
+                "--frames-per-chunk=20 --extra-left-context-initial=0 "
+                "--online=true {fs_opt} --config={model}/conf/online.conf "
+                "--min-active=200 --max-active=7000 --beam={beam} "
+                "--lattice-beam={lattice_beam} --acoustic-scale=1.0 "
+                "--word-symbol-table={graph}/words.txt {model}/final.mdl "
+                "{graph}/HCLG.fst ark:- 'ark,s,cs:{fifo}' "
+                "'ark,t,f:|lattice-scale --acoustic-scale={post_acwt} ark:- "
+                "ark,t,f:-'".format(
+                    fs_opt=frame_subsampling_opt, model=args.model,
+                    beam=args.beam, lattice_beam=args.lattice_beam,
+                    graph=graph, fifo=self.fifo,
+                    post_acwt=args.post_decode_acwt))
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        if os.path.exists(self.fifo):
+            os.remove(self.fifo)
+        os.mkfifo(self.fifo)
+        self.log_file = open(self.log, 'a')
+        command = self.command()
+        print("# " + command, file=self.log_file)
+        self.log_file.flush()
+        self.process = subprocess.Popen(command, shell=True,
+                                        executable='/bin/bash',
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE,
+                                        env=self.env)
+        self.wav_fd = self.open_fifo()
+        for target in [self.read_lattices, self.read_log]:
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+        logger.info("Started decoder %d (pid %d)", self.index,
+                    self.process.pid)
+
+    def open_fifo(self):
+        """Opens the write end of the FIFO once the decoder has opened its
+        read end, or raises an exception if the decoder exits before."""
+        while True:
+            try:
+                fd = os.open(self.fifo, os.O_WRONLY | os.O_NONBLOCK)
+                break
+            except OSError as e:
+                if e.errno != errno.ENXIO:
+                    raise
+            if self.process.poll() is not None:
+                raise Exception("Decoder {0} exited with status {1}, see "
+                                "{2}".format(self.index,
+                                             self.process.returncode,
+                                             self.log))
+            time.sleep(0.1)
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags & ~os.O_NONBLOCK)
+        return fd
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except IOError:
+            pass
+        os.close(self.wav_fd)
+        self.process.wait()
+        self.log_file.close()
+        os.remove(self.fifo)
+        self.process = None
+
+    def read_lattices(self):
+        """Reads the text archive of lattices written by the decoder. Every
+        entry is a line with the key, the lattice and an empty line."""
+        key = None
+        lines = []
+        for line in iter(self.process.stdout.readline, b''):
+            if key is None:
+                fields = line.split()
+                if fields:
+                    key = fields[0].decode()
+                    lines = []
+            elif line.strip():
+                lines.append(line)
+            else:
+                with self.condition:
+                    batch, utt = self.pending.pop(key, (None, None))
+                if batch is not None:
+                    batch.add_lattice(utt, lines)
+                key = None
+
+        with self.condition:
+            batches = set(batch for batch, utt in self.pending.values())
+            self.pending = {}
+        for batch in batches:
+            batch.fail("decoder {0} exited, see {1}".format(self.index,
+                                                            self.log))
+
+    def read_log(self):
+        for line in iter(self.process.stderr.readline, b''):
+            line = line.decode(errors='replace')
+            self.log_file.write(line)
+            self.log_file.flush()
+            if "Did not find audio for utterance" in line:
+                key = line.split()[-1]
+                with self.condition:
+                    batch, utt = self.pending.pop(key, (None, None))
+                if batch is not None:
+                    batch.skip(utt)
+
+    def resource_usage(self):
+        """Returns the user and system CPU time and the peak memory in kB
+        of the decoder process so far, read from /proc."""
+        try:
+            with open("/proc/{0}/stat".format(self.process.pid)) as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            ticks = float(os.sysconf('SC_CLK_TCK'))
+            user_time = int(fields[11]) / ticks
+            system_time = int(fields[12]) / ticks
+            max_rss = 0
+            with open("/proc/{0}/status".format(self.process.pid)) as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        max_rss = int(line.split()[1])
+            return user_time, system_time, max_rss
+        except (IOError, OSError, AttributeError):
+            return 0.0, 0.0, 0
+
+    def decode(self, batch, work_dir):
+        """Decodes 'batch' and waits until all its lattices have been
+        received. Returns an error message on failure, else None."""
+        with self.feed_lock:
+            try:
+                if not self.is_alive():
+                    self.start()
+            except Exception as e:
+                batch.fail(str(e))
+                return batch.wait(self)
+            self.sequence += 1
+            prefix = "{0:08d}".format(self.sequence)
+            segments_file = os.path.join(
+                work_dir, "segments.{0}".format(self.index))
+            spk2utt_lines = []
+            with open(segments_file, 'w') as f, self.condition:
+                for s, (spk, utts) in enumerate(batch.speakers):
+                    spk_key = "{0}-{1:06d}".format(prefix, s)
+                    keys = []
+                    for u, utt in enumerate(utts):
+                        key = "{0}-{1:06d}".format(spk_key, u)
+                        self.pending[key] = (batch, utt)
+                        keys.append(key)
+                        print(key, " ".join(batch.segments[utt]), file=f)
+                    spk2utt_lines.append("{0} {1}\n".format(
+                        spk_key, " ".join(keys)))
+
+            try:
+                self.process.stdin.write("".join(spk2utt_lines).encode())
+                self.process.stdin.flush()
+                # The decoder reads the segments as it gets to their
+                # utterances, so this returns when the batch is nearly
+                # decoded.
+                extract = subprocess.Popen(
+                    "extract-segments scp,p:{0} {1} ark:-".format(
+                        batch.wav_scp, segments_file),
+                    shell=True, stdout=self.wav_fd, stderr=batch.log,
+                    env=self.env)
+                extract.wait()
+                os.write(self.wav_fd, make_sentinel_wav(prefix + "-~"))
+                if extract.returncode != 0:
+                    batch.fail("extract-segments exited with status "
+                               "{0}".format(extract.returncode))
+            except (IOError, OSError) as e:
+                batch.fail("unable to send batch to decoder {0}: "
+                           "{1}".format(self.index, e))
+        return batch.wait(self)
+
+
+class ServerRequest(recognize.PipelinedRecognizer):
+    """A recognition request handled by the server: the input files are
+    diarized in parallel as in the pipelined mode of local/recognize.py,
+    after which their speech segments are decoded by the server's decoders
+    and the output stage of recognize.sh produces the .ctm and .txt files.
+    The decoding resources in time.decode.log are those of the shared
+    decoder processes over the time the request was being decoded."""
+
+    stages = ["diarization", "decode"]
+
+    def __init__(self, args, server):
+        super(ServerRequest, self).__init__(args, server.env)
+        self.server = server
+
+    def run_stages(self):
+        start_time = time.time()
+        audio_files = self.prepare_sources("Decode server request")
+        self.process_files(audio_files, "Diarization")
+        if not self.decoded:
+            self.write_stage_usage()
+            recognize.die("No segments extracted (no speech found)")
+        self.combine_data()
+        self.decode_segments()
+        self.write_stage_usage()
+        self.produce_output()
+        print("Request completed in {0}".format(
+            decode_monitor.format_duration(time.time() - start_time)))
+        self.report_failures()
+
+    def process_file(self, index, audio, basefile, file_dir):
+        data = os.path.join(file_dir, "data")
+        if not os.path.isdir(data):
+            os.makedirs(data)
+        with open(os.path.join(file_dir, "log"), 'w') as log_file:
+            if not self.diarize(audio, basefile, data, log_file):
+                return "no speech found"
+        with self.lock:
+            self.decoded.append(file_dir)
+        return "diarized"
+
+    def decode_segments(self):
+        """Distributes the speakers over the decoders, balancing the amount
+        of speech, and waits for their lattices."""
+        self.set_stage("Decoding")
+        all_dir = os.path.join(self.data, "ALL")
+        segments = {}
+        duration = {}
+        with open(os.path.join(all_dir, "segments")) as f:
+            for line in f:
+                fields = line.split()
+                segments[fields[0]] = fields[1:4]
+        spk2utt = {}
+        with open(os.path.join(all_dir, "utt2spk")) as f:
+            for line in f:
+                utt, spk = line.split()
+                spk2utt.setdefault(spk, []).append(utt)
+                duration[spk] = duration.get(spk, 0.0) + \
+                    float(segments[utt][2]) - float(segments[utt][1])
+
+        decoders = self.server.decoders
+        assigned = [[] for decoder in decoders]
+        load = [0.0 for decoder in decoders]
+        for spk in sorted(spk2utt, key=lambda spk: -duration[spk]):
+            j = load.index(min(load))
+            assigned[j].append((spk, sorted(spk2utt[spk])))
+            load[j] += duration[spk]
+
+        shutil.rmtree(self.rescore, ignore_errors=True)
+        os.makedirs(os.path.join(self.rescore, "log"))
+        jobs = []
+        for decoder, speakers in zip(decoders, assigned):
+            if not speakers:
+                continue
+            job = len(jobs) + 1
+            log = open(os.path.join(self.rescore, "log",
+                                    "decode.{0}.log".format(job)), 'w')
+            batch = DecodeBatch(sorted(speakers), segments,
+                                os.path.join(all_dir, "wav.scp"),
+                                os.path.join(self.rescore,
+                                             "lat.{0}.gz".format(job)), log)
+            jobs.append((decoder, batch))
+        with open(os.path.join(self.rescore, "num_jobs"), 'w') as f:
+            print(len(jobs), file=f)
+
+        start_time = time.time()
+        start_usage = [decoder.resource_usage() for decoder, batch in jobs]
+        errors = []
+
+        def decode(decoder, batch):
+            error = decoder.decode(batch, self.rescore)
+            if error is not None:
+                errors.append(error)
+
+        threads = [threading.Thread(target=decode, args=job) for job in jobs]
+        for thread in threads:
+            thread.start()
+        progress_bar = decode_monitor.ProgressBar(
+            sum(batch.total for decoder, batch in jobs), "Decoding")
+        while any(thread.is_alive() for thread in threads):
+            progress_bar.update(sum(batch.done for decoder, batch in jobs))
+            time.sleep(self.args.progress_interval)
+        for thread in threads:
+            thread.join()
+        progress_bar.clear()
+
+        usage = self.usage["decode"]
+        usage.elapsed += time.time() - start_time
+        for (decoder, batch), before in zip(jobs, start_usage):
+            after = decoder.resource_usage()
+            usage.add(0.0, max(0.0, after[0] - before[0]),
+                      max(0.0, after[1] - before[1]), after[2])
+            batch.log.close()
+            if batch.skipped:
+                print("No audio found for {0} segment{1}".format(
+                    len(batch.skipped), "s" if len(batch.skipped) > 1
+                    else ""))
+        print(usage.summary("Decoding"))
+        if errors:
+            recognize.die("Decoding failed: " + "; ".join(errors))
+
+
+class DecodeServer(object):
+
+    def __init__(self, args):
+        self.args = args
+        self.server_dir = args.server_dir
+        self.queue_dir = os.path.join(self.server_dir, "queue")
+        self.active_dir = os.path.join(self.server_dir, "active")
+        self.done_dir = os.path.join(self.server_dir, "done")
+        self.work_dir = os.path.join(self.server_dir, "work")
+        for d in [self.queue_dir, self.active_dir, self.done_dir,
+                  self.work_dir]:
+            if not os.path.isdir(d):
+                os.makedirs(d)
+        self.env = recognize.load_shell_environment(["./path.sh",
+                                                     "./cmd.sh"])
+        for name in ["train_cmd", "decode_cmd", "cuda_cmd", "mkgraph_cmd"]:
+            self.env[name] = "run.pl"
+        self.decoders = [PersistentDecoder(i + 1, args, self.work_dir,
+                                           self.env)
+                         for i in range(args.num_decoders)]
+        self.slots = threading.Semaphore(args.max_requests)
+
+    def serve(self):
+        with open(os.path.join(self.server_dir, "server.pid"), 'w') as f:
+            print(os.getpid(), file=f)
+        stop_file = os.path.join(self.server_dir, "stop")
+        if os.path.exists(stop_file):
+            os.remove(stop_file)
+        # Requests that were in progress when a previous server stopped are
+        # queued again.
+        for request in glob.glob(os.path.join(self.active_dir, "*.request")):
+            shutil.move(request, self.queue_dir)
+
+        for decoder in self.decoders:
+            decoder.start()
+        logger.info("Decode server ready, queue: %s", self.queue_dir)
+
+        threads = []
+        while not os.path.exists(stop_file):
+            for request in sorted(glob.glob(os.path.join(self.queue_dir,
+                                                         "*.request"))):
+                if not self.slots.acquire(False):
+                    break
+                active = os.path.join(self.active_dir,
+                                      os.path.basename(request))
+                shutil.move(request, active)
+                thread = threading.Thread(target=self.handle,
+                                          args=(active,))
+                thread.start()
+                threads.append(thread)
+            threads = [thread for thread in threads if thread.is_alive()]
+            time.sleep(self.args.poll_interval)
+
+        logger.info("Stopping decode server")
+        for thread in threads:
+            thread.join()
+        for decoder in self.decoders:
+            decoder.stop()
+        os.remove(stop_file)
+        os.remove(os.path.join(self.server_dir, "server.pid"))
+
+    def handle(self, request):
+        request_id = os.path.basename(request)[:-len(".request")]
+        status = 1
+        result = ""
+        try:
+            with open(request) as f:
+                argv = [line.rstrip('\n') for line in f]
+            args = recognize.get_args(argv)
+            result = args.result
+            for name in ["model", "lpath", "symtab", "wordbound",
+                         "extractor"]:
+                setattr(args, name, getattr(self.args, name))
+            logger.info("Processing request %s: %s", request_id,
+                        " ".join(argv))
+            ServerRequest(args, self).main(["decode_server.py"] + argv)
+            status = 0
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else 1
+        except Exception:
+            logger.exception("Request %s failed", request_id)
+        finally:
+            with open(os.path.join(self.done_dir,
+                                   request_id + ".status"), 'w') as f:
+                print(status, result, file=f)
+            os.remove(request)
+            self.slots.release()
+            logger.info("Finished request %s with status %d", request_id,
+                        status)
+
+
+def submit(args):
+    """Queues a request and, with --wait true, waits for its status."""
+    argv = args.recognize_args
+    recognize_args = recognize.get_args(argv)
+    # The server resolves relative paths from its own working directory.
+    positional = recognize_args.sources + [recognize_args.result]
+    if argv[-len(positional):] != positional:
+        sys.exit("{0}: the sources and the decode directory must be the last "
+                 "arguments".format(sys.argv[0]))
+    argv = argv[:-len(positional)] + [os.path.abspath(path)
+                                      for path in positional]
+
+    request_id = "{0}-{1}".format(time.strftime("%Y%m%d%H%M%S"),
+                                  os.getpid())
+    queue_dir = os.path.join(args.server_dir, "queue")
+    if not os.path.isdir(queue_dir):
+        sys.exit("{0}: no decode server queue in {1}".format(
+            sys.argv[0], args.server_dir))
+    tmp = os.path.join(queue_dir, "." + request_id)
+    with open(tmp, 'w') as f:
+        for arg in argv:
+            print(arg, file=f)
+    os.rename(tmp, os.path.join(queue_dir, request_id + ".request"))
+    print("Submitted request {0}".format(request_id))
+    if not args.wait:
+        return
+
+    status_file = os.path.join(args.server_dir, "done",
+                               request_id + ".status")
+    while not os.path.exists(status_file):
+        time.sleep(1)
+    with open(status_file) as f:
+        status = int(f.read().split()[0])
+    print("Request {0} finished with status {1}, output in {2}".format(
+        request_id, status, argv[-1]))
+    sys.exit(status)
+
+
+def main():
+    args = get_args()
+    if args.command == "serve":
+        DecodeServer(args).serve()
+    elif args.command == "submit":
+        submit(args)
+    elif args.command == "stop":
+        open(os.path.join(args.server_dir, "stop"), 'w').close()
+
+
+if __name__ == "__main__":
+    main()
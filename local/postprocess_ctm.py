@@ -0,0 +1,614 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Apache 2.0
+
+""" Produces the 1-best output of recognize.sh from the CTMs of the decoding
+jobs in a single pass.
+
+This does what the output stage of recognize.sh used to do with a chain of
+sorts and perl scripts: it maps the word ids to words (utils/int2sym.pl),
+converts the segment times to recording times (local/ctm_time_correct.pl),
+combines numbers (local/combine_numbers.pl), restores compounds
+(local/compound-restoration.pl), removes hesitations and unknown words,
+optionally applies the GLM with csrfilt.sh, and writes the sentences
+(local/ctmseg2sent.pl), the plain text and the CTM with end-of-sentence
+markers.
+
+The CTMs of the jobs are sorted in memory and merged, instead of sorting their
+concatenation twice, and the lines of a recording are sorted again after
+number combination only among themselves, as soon as no later line can belong
+to that recording. The output is the same as that of the scripts above, with
+one exception: where combine_numbers.pl tries the number words in perl's hash
+order (e.g. "zes" or "zestig" for "zestigjarige"), this always tries the
+longest matching word first.
+
+The files are read and written as latin-1, which passes all bytes through
+unchanged, so the words are compared byte by byte like the perl scripts did.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+import argparse
+import bisect
+import heapq
+import io
+import itertools
+import os
+import re
+import subprocess
+import sys
+
+
+def str_to_bool(value):
+    if value == "true":
+        return True
+    elif value == "false":
+        return False
+    raise argparse.ArgumentTypeError(
+        "Expected true or false, got '{0}'".format(value))
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Turns the CTMs of the decoding jobs into the 1-best "
+        "output of recognize.sh.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--symtab", type=str,
+                        help="If given, the words in the input CTMs are "
+                        "integers that are mapped with this symbol table.")
+    parser.add_argument("--segments", type=str,
+                        help="If given, the input CTMs are per segment and "
+                        "are converted to recording times with this segments "
+                        "file. Required for the sentence output.")
+    parser.add_argument("--compounds", type=str,
+                        default="local/compounds-release.lst",
+                        help="List of compounds to restore.")
+    parser.add_argument("--compound-log", type=str, default="-",
+                        help="File the restored compounds are appended to; "
+                        "'-' is the standard error.")
+    parser.add_argument("--glm", type=str,
+                        help="If given and not empty, the CTM is filtered "
+                        "with csrfilt.sh and this GLM.")
+    parser.add_argument("--prefilt-ctm", type=str,
+                        help="Where to write the CTM before filtering with "
+                        "--glm; defaults to <ctm>.prefilt.")
+    parser.add_argument("--output-dir", type=str,
+                        help="If given, write 1Best.<ident>txt with the "
+                        "sentences, and <name>.<ident>txt and "
+                        "<name>.<ident>ctm, with <name> the name of this "
+                        "directory, with the text and the CTM with "
+                        "end-of-sentence markers.")
+    parser.add_argument("--ident", type=str, default="",
+                        help="Infix of the output file names in "
+                        "--output-dir.")
+    parser.add_argument("--splittext", type=str_to_bool, default=True,
+                        help="Also write the sentences of every recording to "
+                        "<output-dir>/<recording>.<ident>txt.")
+    parser.add_argument("ctms", nargs='+',
+                        help="CTMs of the decoding jobs.")
+    parser.add_argument("ctm", help="Output CTM.")
+    args = parser.parse_args()
+    if args.output_dir is not None and args.segments is None:
+        parser.error("--output-dir requires --segments")
+    return args
+
+
+def open_file(filename, mode='r'):
+    """Opens 'filename' as latin-1 text; '-' is the standard error for
+    writing."""
+    if filename == "-" and mode != 'r':
+        return io.open(sys.stderr.fileno(), mode, encoding="latin-1",
+                       newline="", closefd=False)
+    return io.open(filename, mode, encoding="latin-1", newline="")
+
+
+def as_bytes(text):
+    """Returns the latin-1 text that holds the UTF-8 encoding of 'text', the
+    form in which the words are read."""
+    return text.encode("utf-8").decode("latin-1")
+
+
+# perl's and awk's split() only split at ASCII whitespace, while str.split()
+# would also split at the latin-1 characters that UTF-8 uses as continuation
+# bytes.
+_FIELD_RE = re.compile(r"[^ \t\n\r\f\v]+")
+_NUMBER_RE = re.compile(
+    r"[ \t\n\r\f\v]*([+-]?(?:(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?|"
+    r"[iI][nN][fF]|[nN][aA][nN]))")
+_SORT_NUMBER_RE = re.compile(r"[ \t]*(-?(?:\d+\.?\d*|\.\d+))")
+
+
+def split_fields(line):
+    return _FIELD_RE.findall(line)
+
+
+def to_number(text):
+    """Returns the value of 'text' as a number in perl and awk, i.e. of its
+    numeric prefix (0 if there is none)."""
+    match = _NUMBER_RE.match(text)
+    return float(match.group(1)) if match else 0.0
+
+
+def sort_number(text):
+    """Returns the value of 'text' as a sort -n key."""
+    match = _SORT_NUMBER_RE.match(text)
+    return float(match.group(1)) if match else 0.0
+
+
+def format_number(value):
+    """Formats 'value' as perl prints a number."""
+    return "%.15g" % value
+
+
+def format_awk_number(value):
+    """Formats 'value' as awk prints a number."""
+    if abs(value) < 1e16 and value == int(value):
+        return "%d" % value
+    return "%.6g" % value
+
+
+def get_field(fields, index):
+    return fields[index] if index < len(fields) else ""
+
+
+def read_symbol_table(filename):
+    int2sym = {}
+    with open_file(filename) as f:
+        for line in f:
+            fields = split_fields(line)
+            if len(fields) != 2:
+                raise ValueError("bad line in symbol table file {0}: "
+                                 "{1}".format(filename, line))
+            int2sym[fields[1]] = fields[0]
+    return int2sym
+
+
+def read_segments(filename):
+    """Returns a dict from segment to (recording, start, end) as strings."""
+    segments = {}
+    with open_file(filename) as f:
+        for line in f:
+            fields = split_fields(line)
+            segments[fields[0]] = (get_field(fields, 1), get_field(fields, 2),
+                                   get_field(fields, 3))
+    return segments
+
+
+def read_compounds(filename):
+    """Returns a dict from the first to the second part to the compound, for
+    the compounds in 'filename' that consist of two words joined directly or
+    with an 's' or 'n', as read by local/compound-restoration.pl."""
+    compounds = {}
+    pattern = re.compile(
+        r"^([^\t]+)\t+([^ \t\n\r\f\v]+)[ \t\n\r\f\v]+(.*)[ \t\n\r\f\v]"
+        r"([^ \t\n\r\f\v]+)$")
+    with open_file(filename) as f:
+        for line in f:
+            match = pattern.match(line.rstrip("\n"))
+            if match and match.group(3) in ["+", "+ s +", "+ n +"]:
+                compounds.setdefault(match.group(2), {})[match.group(4)] = \
+                    match.group(1)
+    return compounds
+
+
+def read_job_ctm(filename, int2sym, segments):
+    """Returns the sorted lines of a job CTM as (recording, start, line,
+    fields) tuples, after mapping the words with 'int2sym' and converting
+    the times with 'segments' when they are not None."""
+    lines = []
+    with open_file(filename) as f:
+        for line in f:
+            fields = split_fields(line)
+            line = line.rstrip("\n")
+            if int2sym is not None and len(fields) > 4:
+                if re.match(r"\d+$", fields[4]) is None:
+                    raise ValueError("found noninteger token {0} in "
+                                     "{1}".format(fields[4], filename))
+                if fields[4] not in int2sym:
+                    raise ValueError("integer {0} in {1} not in symbol "
+                                     "table".format(fields[4], filename))
+                fields[4] = int2sym[fields[4]]
+                line = " ".join(fields)
+            if segments is not None:
+                recording, offset, _ = segments.get(fields[0], ("", "0", ""))
+                fields[2] = format_number(to_number(get_field(fields, 2)) +
+                                          to_number(offset))
+                fields[0] = recording
+                line = " ".join(fields)
+            lines.append((fields[0], sort_number(get_field(fields, 2)), line,
+                          fields))
+    lines.sort()
+    return lines
+
+
+class NumberCombiner(object):
+    """Combines the words of numbers into single words according to the rules
+    of 'Onze Taal' (http://www.onzetaal.nl/advies/getallen.php), like
+    local/combine_numbers.pl, including its quirks: a line that follows a
+    written line in the buffer is sometimes kept back, and at the end only
+    the first buffered line is written.
+
+    Every line gets a level; a run of lines whose levels form one of the
+    'combinations' is replaced by one line with the concatenated words.
+    """
+
+    dump_level = 99
+
+    levels = dict(
+        [(as_bytes(word), 1) for word in ["één", "een"]] +
+        [(word, 2) for word in ["twee", "drie", "vier"]] +
+        [(word, 3) for word in ["vijf", "zes", "zeven", "acht", "negen"]] +
+        [("tien", 4)] +
+        [(word, 5) for word in ["elf", "twaalf", "dertien", "veertien"]] +
+        [(word, 6) for word in ["twintig", "dertig", "veertig", "vijftig",
+                                "zestig", "zeventig", "tachtig",
+                                "negentig"]] +
+        [("honderd", 7), ("duizend", 8)] +
+        [(as_bytes(word), 9) for word in ["en", "ën"]] +
+        [(word, 11) for word in ["jarige", "jarig", "plusser", "plussers",
+                                 "maal", "delig", "delige", "tallig",
+                                 "tallige", "ponder", "persoons", "kops",
+                                 "tonner", "voudig", "voudige"]])
+
+    combinations = {
+        "3 4": 5,
+        "1 9 6": 23, "2 9 6": 23, "3 9 6": 23, "26 9 6": 23,
+        "10 6": 23,
+        "2 7": 21, "3 7": 21, "5 7": 22, "23 7": 22,
+        "21 23": 24, "22 23": 25,
+        "21 1": 26, "21 2": 26, "21 3": 26,
+        "7 1": 26, "7 2": 26, "7 3": 26,
+        "7 4": 27, "7 5": 27, "7 6": 27, "21 4": 27, "21 5": 27, "21 6": 27,
+        "2 8": 90, "3 8": 90, "4 8": 90, "5 8": 90, "6 8": 90, "7 8": 90,
+        "21 8": 90, "23 8": 90, "24 8": 90, "26 8": 90, "27 8": 90,
+        "1 11": 91, "2 11": 91, "3 11": 91, "4 11": 91, "5 11": 91,
+        "6 11": 95, "7 11": 92, "8 11": 93,
+        "21 11": 94, "22 11": 94, "23 11": 94, "24 11": 94, "25 11": 94,
+        "26 11": 94, "27 11": 94, "90 11": 94,
+        "7 91": 96, "8 91": 96, "21 91": 96, "22 91": 96,
+        "7 95": 96, "8 95": 96, "21 95": 96, "22 95": 96,
+        "2 92": 96, "3 92": 96, "4 92": 96, "5 92": 96, "23 92": 96,
+        "7 93": 96, "21 93": 96, "23 91": 96, "24 91": 96, "26 91": 96,
+        "27 91": 96,
+        "1 9 95": 96, "2 9 95": 96, "3 9 95": 96, "26 9 95": 96,
+        "10 95": 96}
+
+    detection = dict(combinations)
+    detection.update({"1 9": 10, "2 9": 10, "3 9": 10, "26 9": 10})
+
+    # The number words, longest first, so that e.g. "zestig" is preferred to
+    # "zes".
+    prefixes = sorted(levels, key=lambda word: (-len(word), word))
+
+    replacements = [(as_bytes(old), as_bytes(new)) for old, new in
+                    [("tweeen", "tweeën"), ("drieen", "drieën"),
+                     ("éénen", "eenen")]]
+
+    def __init__(self):
+        # For every level, the levels that may follow it within a word, and
+        # the level of the combination.
+        self.next_levels = {}
+        for combination, level in self.detection.items():
+            parts = [int(part) for part in combination.split()]
+            if len(parts) == 2:
+                self.next_levels.setdefault(parts[0], {})[parts[1]] = level
+        # The buffer of [fields, level] of the lines not written yet.
+        self.lines = []
+        self.num_columns = 0
+        self.level = self.dump_level
+
+    def get_level(self, word):
+        """Returns the level of 'word', which may be a combined number, e.g.
+        'tweeëntwintigjarige'."""
+        if word in self.levels:
+            return self.levels[word]
+        allowed = dict((level, level) for level in range(1, 9))
+        while len(allowed) > 0 and len(word) > 0:
+            self.level = self.dump_level
+            for prefix in self.prefixes:
+                if self.levels[prefix] in allowed and word.startswith(prefix):
+                    self.level = allowed[self.levels[prefix]]
+                    word = word[len(prefix):]
+                    break
+            allowed = self.next_levels.get(self.level, {})
+        return self.level
+
+    def combine(self):
+        lines = self.lines
+        if len(lines) == 1:
+            return
+        key = " ".join(str(level) for fields, level in lines)
+        if key in self.combinations:
+            first = lines[0][0]
+            duration = to_number(first[3])
+            for fields, level in lines[1:]:
+                first[4] += fields[4]
+                duration += to_number(fields[3])
+            first[3] = format_number(duration)
+            lines[0][1] = self.combinations[key]
+            del lines[1:]
+        elif lines[-1][1] != 9:
+            lines[0][1] = self.dump_level
+
+    def write(self):
+        """Yields the fields of the lines to write and removes them from the
+        buffer, skipping the line after each one like
+        local/combine_numbers.pl."""
+        lines = self.lines
+        t = 0
+        while t < len(lines):
+            fields, level = lines[t]
+            if level == self.dump_level:
+                if len(fields) > 4:
+                    for old, new in self.replacements:
+                        fields[4] = fields[4].replace(old, new, 1)
+                yield [get_field(fields, k) for k in range(self.num_columns)]
+                del lines[t]
+            t += 1
+
+    def add(self, fields):
+        """Adds a line and yields the fields of the lines that can be
+        written."""
+        fields = list(fields)
+        self.num_columns = len(fields)
+        self.lines.append([fields, self.get_level(get_field(fields, 4))])
+        self.combine()
+        for output in self.write():
+            yield output
+
+    def finish(self):
+        if len(self.lines) > 0:
+            self.lines[0][1] = self.dump_level
+            for output in self.write():
+                yield output
+
+    def get_recordings(self):
+        """Returns the recordings of the lines in the buffer."""
+        return set(get_field(fields, 0) for fields, level in self.lines)
+
+
+def combine_numbers(records):
+    """Yields the fields of the lines of 'records' (sorted by recording and
+    start time) after combining numbers, sorted again by recording and start
+    time. The lines of a recording are sorted when the input has moved past
+    it and no line of it or of an earlier recording is in the buffer of the
+    NumberCombiner."""
+    combiner = NumberCombiner()
+    pending = {}
+
+    def get_sorted_lines(recording):
+        # The line printed by local/combine_numbers.pl ends in a space.
+        lines = [(sort_number(get_field(fields, 2)),
+                  "".join(field + " " for field in fields), fields)
+                 for fields in pending.pop(recording)]
+        lines.sort()
+        return [fields for _, _, fields in lines]
+
+    current = None
+    for recording, _, _, fields in records:
+        if recording != current:
+            current = recording
+            first_held = min(combiner.get_recordings() | set([current]))
+            for name in sorted(pending):
+                if name >= first_held:
+                    break
+                for output in get_sorted_lines(name):
+                    yield output
+        for output in combiner.add(fields):
+            pending.setdefault(get_field(output, 0), []).append(output)
+    for output in combiner.finish():
+        pending.setdefault(get_field(output, 0), []).append(output)
+    for name in sorted(pending):
+        for output in get_sorted_lines(name):
+            yield output
+
+
+def restore_compounds(records, compounds, log):
+    """Yields the CTM lines of 'records' after joining adjacent words of a
+    recording that form a compound, like local/compound-restoration.pl. As
+    in that script, after a compound the next pair is not checked and, if it
+    belongs to different recordings, the second line of it is lost."""
+    def format_line(fields):
+        return " ".join(get_field(fields, k) for k in range(6))
+
+    records = iter(records)
+    previous = next(records, None)
+    join_next = False
+    while previous is not None:
+        current = next(records, None)
+        if current is None:
+            yield format_line(previous)
+            return
+        if get_field(previous, 0) == get_field(current, 0):
+            compound = compounds.get(get_field(previous, 4), {}).get(
+                get_field(current, 4))
+            join_next = compound is not None
+            if join_next:
+                log.write("Found compound: {0}\n".format(compound))
+                previous = previous + [""] * (6 - len(previous))
+                previous[3] = format_number(to_number(previous[3]) +
+                                            to_number(get_field(current, 3)))
+                previous[4] = compound
+        yield format_line(previous)
+        if join_next:
+            current = next(records, None)
+        previous = current
+
+
+class SentenceWriter(object):
+    """Collects the words of a CTM per segment and writes them as sentences,
+    like local/ctmseg2sent.pl."""
+
+    def __init__(self, segments):
+        self.segments = segments
+        # For every recording, its segments sorted by start time, their
+        # start times and the running maximum of their end times.
+        self.recordings = {}
+        items = sorted((recording, to_number(start), to_number(end), segment)
+                       for segment, (recording, start, end) in
+                       segments.items())
+        for recording, group in itertools.groupby(items, lambda x: x[0]):
+            group = list(group)
+            max_ends = []
+            for item in group:
+                max_ends.append(max(item[2], max_ends[-1]) if max_ends
+                                else item[2])
+            self.recordings[recording] = (
+                [item[1] for item in group], max_ends,
+                [(item[2], item[3]) for item in group])
+        self.words = {}
+        self.seen_recordings = set()
+        self.ignore = False
+
+    def find_segment(self, recording, time):
+        if recording not in self.recordings:
+            return None
+        starts, max_ends, segments = self.recordings[recording]
+        k = bisect.bisect_right(starts, time) - 1
+        while k >= 0 and max_ends[k] > time:
+            end, segment = segments[k]
+            if time < end:
+                return segment
+            k -= 1
+        return None
+
+    def add(self, line):
+        fields = split_fields(line)
+        word = get_field(fields, 4)
+        if word == "<ALT_BEGIN>":
+            return
+        elif word == "<ALT>":
+            self.ignore = True
+            return
+        elif word == "<ALT_END>":
+            self.ignore = False
+            return
+        if self.ignore:
+            return
+        recording = get_field(fields, 0)
+        self.seen_recordings.add(recording)
+        segment = self.find_segment(recording,
+                                    to_number(get_field(fields, 2)))
+        if segment is not None:
+            self.words.setdefault(segment, []).append(word)
+
+    def get_sentences(self, recording):
+        """Returns the sentences of the segments of 'recording' with words,
+        sorted by start time."""
+        segments = sorted(
+            (to_number(self.segments[segment][1]), segment)
+            for segment in self.words
+            if self.segments[segment][0] == recording)
+        sentences = []
+        for _, segment in segments:
+            text = " ".join(self.words[segment])
+            if text[:1] >= "a" and text[:1] <= "z":
+                text = text[0].upper() + text[1:]
+            sentences.append("{0}. ({1} {2})\n".format(
+                text, segment, self.segments[segment][1]))
+        return sentences
+
+
+def write_output(ctm_lines, sentence_writer, args):
+    """Writes the sentences, the text and the CTM with end-of-sentence
+    markers to --output-dir."""
+    ident = args.ident
+    output_dir = args.output_dir
+    name = os.path.basename(os.path.normpath(output_dir))
+    sentences = []
+    with open_file(os.path.join(output_dir, "1Best.{0}txt".format(ident)),
+                   'w') as f:
+        for recording in sorted(sentence_writer.seen_recordings):
+            recording_sentences = sentence_writer.get_sentences(recording)
+            if args.splittext:
+                with open_file(os.path.join(output_dir, "{0}.{1}txt".format(
+                        recording, ident)), 'w') as g:
+                    for sentence in recording_sentences:
+                        g.write(sentence)
+            for sentence in recording_sentences:
+                f.write(sentence)
+            sentences.extend(recording_sentences)
+
+    with open_file(os.path.join(output_dir, "{0}.{1}txt".format(name, ident)),
+                   'w') as f:
+        for sentence in sentences:
+            f.write(sentence.split("(", 1)[0].rstrip("\n") + "\n")
+
+    # Every sentence but the first gets an end-of-sentence marker at its
+    # start time, as cut from the sentence, on the recording and channel of
+    # the first CTM line; all lines are sorted by end time.
+    begin = " ".join(ctm_lines[0].split(" ")[:2]) if ctm_lines else ""
+    lines = list(ctm_lines)
+    for sentence in sentences[1:]:
+        fields = sentence.rstrip("\n").split("(")
+        fields = fields[1 if len(fields) > 1 else 0].split(" ")
+        start = fields[1 if len(fields) > 1 else 0].replace(")", "")
+        lines.append("{0} {1} 0.00 <eos> 1.00".format(begin, start))
+    items = []
+    for line in lines:
+        fields = split_fields(line)
+        end = format_awk_number(to_number(get_field(fields, 2)) +
+                                to_number(get_field(fields, 3)))
+        line = "{0} {1}".format(line, end)
+        key = split_fields(line)[6] if len(split_fields(line)) > 6 else ""
+        items.append((sort_number(key), line))
+    items.sort()
+    with open_file(os.path.join(output_dir, "{0}.{1}ctm".format(name, ident)),
+                   'w') as f:
+        for _, line in items:
+            fields = split_fields(" ".join(line.split(" ")[:6]))
+            f.write("%s %s %.2f %.2f %s %.2f\n" % (
+                get_field(fields, 0), get_field(fields, 1),
+                to_number(get_field(fields, 2)),
+                to_number(get_field(fields, 3)), get_field(fields, 4),
+                to_number(get_field(fields, 5))))
+
+
+def main():
+    args = get_args()
+    try:
+        int2sym = None if args.symtab is None else \
+            read_symbol_table(args.symtab)
+        segments = None if args.segments is None else \
+            read_segments(args.segments)
+        compounds = read_compounds(args.compounds)
+        records = heapq.merge(*[read_job_ctm(ctm, int2sym, segments)
+                                for ctm in args.ctms])
+    except (IOError, OSError, ValueError) as e:
+        sys.exit("postprocess_ctm.py: error reading input: {0}".format(e))
+
+    filter_glm = args.glm is not None and os.path.isfile(args.glm) and \
+        os.path.getsize(args.glm) > 0
+    if filter_glm:
+        ctm = prefilt_ctm = args.prefilt_ctm or args.ctm + ".prefilt"
+    else:
+        ctm = args.ctm
+
+    ctm_lines = []
+    hesitation = re.compile("uh|<unk>")
+    with open_file(args.compound_log, 'a') as log, \
+            open_file(ctm, 'w') as f:
+        for line in restore_compounds(combine_numbers(records), compounds,
+                                      log):
+            if hesitation.search(line) is None:
+                f.write(line + "\n")
+                ctm_lines.append(line)
+
+    if filter_glm:
+        with open(prefilt_ctm) as f, open(args.ctm, 'w') as g:
+            if subprocess.call(["csrfilt.sh", "-s", "-i", "ctm", "-t", "hyp",
+                                args.glm], stdin=f, stdout=g) != 0:
+                sys.exit("postprocess_ctm.py: csrfilt.sh failed")
+        with open_file(args.ctm) as f:
+            ctm_lines = [line.rstrip("\n") for line in f]
+
+    if args.output_dir is not None:
+        sentence_writer = SentenceWriter(segments)
+        for line in ctm_lines:
+            sentence_writer.add(line)
+        write_output(ctm_lines, sentence_writer, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,956 @@
+#!/usr/bin/env python
+
+# Apache 2.0
+
+""" Python driver for the recognition pipeline of recognize.sh.
+
+This runs the same stages as recognize.sh (data preparation and diarization,
+feature generation, i-vector extraction and decoding, and the output stage)
+with the same options. Instead of re-reading all decode and diarization logs
+every second or two, it follows them through local/decode_monitor.py, reads
+only the newly written bytes, reports progress with an ETA, and records the
+time, CPU time and peak memory of every stage in
+<decode-dir>/intermediate/time.<stage>.log.
+
+Like recognize.sh, it has to be run from the root of the decoder directory.
+"""
+
+from __future__ import print_function
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import decode_monitor
+
+
+def str_to_bool(value):
+    if value == "true":
+        return True
+    elif value == "false":
+        return False
+    raise argparse.ArgumentTypeError(
+        "Expected true or false, got '{0}'".format(value))
+
+
+def read_config(config):
+    """Reads a shell-style config file of name=value lines, as sourced by
+    utils/parse_options.sh, into a dict."""
+    values = {}
+    with open(config) as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if '=' not in line:
+                continue
+            name, value = line.split('=', 1)
+            values[name.strip().replace('-', '_')] = \
+                value.strip().strip('"\'')
+    return values
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Transcribes audio files with the BLISS models; see "
+        "recognize.sh for the meaning of the options.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--config", type=str,
+                        help="Config file with name=value lines containing "
+                        "options; command-line options take precedence.")
+    parser.add_argument("--cmd", type=str, default="utils/run.pl",
+                        help="Command used to run parallel jobs.")
+    parser.add_argument("--nj", type=int, default=8,
+                        help="Maximum number of simultaneous jobs used for "
+                        "feature generation and decoding.")
+    parser.add_argument("--stage", type=int, default=0)
+    parser.add_argument("--file-types", type=str, default="wav mp3",
+                        help="File types to include for transcription.")
+    parser.add_argument("--splittext", type=str_to_bool, default=True,
+                        help="Split resulting 1Best.txt into separate .txt "
+                        "files for each input file.")
+    parser.add_argument("--dorescore", type=str_to_bool, default=True,
+                        help="Rescore with the large LM.")
+    parser.add_argument("--copyall", type=str_to_bool, default=False,
+                        help="Copy all source files (true) or use "
+                        "symlinks (false).")
+    parser.add_argument("--overwrite", type=str_to_bool, default=True,
+                        help="Overwrite the 1st pass output if already "
+                        "present.")
+    parser.add_argument("--multichannel", type=str_to_bool, default=False)
+    parser.add_argument("--inv-acoustic-scale", type=str, default="11",
+                        help="Used for 1-best and N-best generation, may "
+                        "have multiple values.")
+    parser.add_argument("--nbest", type=int, default=0,
+                        help="If >0, generate NBest.ctm with this amount of "
+                        "transcription alternatives.")
+    parser.add_argument("--word-ins-penalty", type=str, default="-1.0",
+                        help="Used for 1-best generation, may have multiple "
+                        "values.")
+    parser.add_argument("--beam", type=float, default=11)
+    parser.add_argument("--decode-mbr", type=str_to_bool, default=True)
+    parser.add_argument("--model", type=str,
+                        default="bliss_models/AM/online")
+    parser.add_argument("--lmodel", type=str,
+                        default="bliss_models/LM/LM.gz")
+    parser.add_argument("--lpath", type=str, default="bliss_models/Lang")
+    parser.add_argument("--llpath", type=str,
+                        default="bliss_models/LM/rnn_folder")
+    parser.add_argument("--extractor", type=str,
+                        default="bliss_models/AM/online/ivector_extractor")
+    parser.add_argument("--symtab", type=str,
+                        help="Defaults to <lpath>/words.txt.")
+    parser.add_argument("--wordbound", type=str,
+                        help="Defaults to <lpath>/phones/word_boundary.int.")
+    parser.add_argument("--cache-alignment", type=str_to_bool, default=False,
+                        help="Push and word-align the lattices once and "
+                        "produce the output for all --inv-acoustic-scale "
+                        "and --word-ins-penalty values from them, in "
+                        "parallel.")
+    parser.add_argument("--pipelined", type=str_to_bool, default=False,
+                        help="Take every input file through diarization, "
+                        "features, i-vectors, decoding and CTM generation "
+                        "independently, with at most --nj files in progress, "
+                        "instead of running each stage for all files before "
+                        "the next one.")
+    parser.add_argument("--progress-interval", type=float, default=1.0,
+                        help="Seconds between progress updates.")
+    parser.add_argument("sources", nargs='+',
+                        help="Source directories, audio files, or text files "
+                        "listing audio files.")
+    parser.add_argument("result", help="Decode directory.")
+    return parser
+
+
+def get_args(argv=None):
+    parser = get_parser()
+
+    # Options from the config file become defaults, so that options given on
+    # the command line take precedence, as with utils/parse_options.sh.
+    config_parser = argparse.ArgumentParser(add_help=False)
+    config_parser.add_argument("--config", type=str)
+    # utils/parse_options.sh accepts both --file-types and --file_types.
+    if argv is None:
+        argv = sys.argv[1:]
+    argv = [arg.replace('_', '-') if arg.startswith('--') else arg
+            for arg in argv]
+    config_args, unused = config_parser.parse_known_args(argv)
+    if config_args.config is not None:
+        parser.set_defaults(**read_config(config_args.config))
+    args = parser.parse_args(argv)
+
+    if args.symtab is None:
+        args.symtab = os.path.join(args.lpath, "words.txt")
+    if args.wordbound is None:
+        args.wordbound = os.path.join(args.lpath, "phones",
+                                      "word_boundary.int")
+    return args
+
+
+def die(message):
+    print("-------------- fatal error ----------------", file=sys.stderr)
+    print(message, file=sys.stderr)
+    print("-------------------------------------------", file=sys.stderr)
+    sys.exit(2)
+
+
+def load_shell_environment(scripts):
+    """Returns os.environ as modified by sourcing the given shell scripts
+    (e.g. path.sh and cmd.sh)."""
+    command = "".join("[ -f {0} ] && . {0} >/dev/null; ".format(script)
+                      for script in scripts) + "env -0"
+    output = subprocess.check_output(['bash', '-c', command])
+    if not isinstance(output, str):
+        output = output.decode()
+    env = {}
+    for item in output.split('\0'):
+        if '=' in item:
+            name, value = item.split('=', 1)
+            env[name] = value
+    return env
+
+
+def concatenate_files(filenames, target):
+    """Writes the concatenation of 'filenames', in sorted order, to
+    'target'."""
+    with open(target, 'wb') as f:
+        for filename in sorted(filenames):
+            with open(filename, 'rb') as g:
+                shutil.copyfileobj(g, f)
+
+
+def count_lines(filename):
+    with open(filename, 'rb') as f:
+        return sum(1 for line in f)
+
+
+class Recognizer(object):
+    """Runs the stages of recognize.sh for one decode directory."""
+
+    def __init__(self, args, env=None):
+        self.args = args
+        self.result = args.result
+        self.inter = os.path.join(self.result, "intermediate")
+        self.data = os.path.join(self.inter, "data")
+        self.logging = os.path.join(self.inter, "log")
+        self.rescore = os.path.join(self.inter, "decode")
+        self.multiple_iac = len(args.inv_acoustic_scale.split()) > 1
+        self.multiple_wip = len(args.word_ins_penalty.split()) > 1
+
+        if env is None:
+            env = load_shell_environment(["./path.sh", "./cmd.sh"])
+        self.env = dict(env)
+        for name in ["train_cmd", "decode_cmd", "cuda_cmd", "mkgraph_cmd"]:
+            self.env[name] = "run.pl"
+        self.env["nj"] = str(args.nj)
+        self.log_file = None
+
+    def set_stage(self, description):
+        with open(os.path.join(self.inter, "stage"), 'w') as f:
+            print(description, file=f)
+
+    def start(self, command):
+        """Starts 'command' in the background with its output appended to
+        the log."""
+        self.log_file.flush()
+        return decode_monitor.TimedProcess(command, log_file=self.log_file,
+                                           env=self.env)
+
+    def run(self, command, usage, error):
+        """Runs 'command', adding its resource usage to 'usage'; dies with
+        'error' if it fails."""
+        process = self.start(command)
+        process.wait()
+        usage.add_usage(process.usage)
+        if process.returncode != 0:
+            die(error)
+
+    def run_and_follow(self, command, tail, total, label, usage, error):
+        """Runs 'command' in the background while showing a progress bar for
+        the lines counted by 'tail'."""
+        process = self.start(command)
+        progress_bar = decode_monitor.ProgressBar(total, label)
+        decode_monitor.monitor(process, tail, progress_bar,
+                               self.args.progress_interval)
+        usage.add_usage(process.usage)
+        if process.returncode != 0:
+            die(error)
+
+    def main(self, argv):
+        if not os.path.isdir(self.inter):
+            os.makedirs(self.inter)
+        shutil.copy(os.path.abspath(__file__), self.inter)
+        with open(self.logging, 'w') as f:
+            print(" ".join(argv), file=f)
+        self.log_file = open(self.logging, 'a')
+        try:
+            self.run_stages()
+        finally:
+            self.log_file.close()
+
+    def run_stages(self):
+        if self.args.stage <= 3:
+            self.prepare_data()
+
+        all_dir = os.path.join(self.data, "ALL")
+        for f in ["spk2utt", "segments"]:
+            if not os.path.isfile(os.path.join(all_dir, f)):
+                print("{0}: No speech found, exiting.".format(sys.argv[0]))
+                sys.exit(1)
+
+        num_speakers = count_lines(os.path.join(all_dir, "spk2utt"))
+        if num_speakers == 0:
+            print("No speech found, exiting.")
+            return
+        nj = self.args.nj
+        if nj > num_speakers:
+            nj = num_speakers
+            print("Number of speakers is less than {0}, reducing number "
+                  "of jobs to {1}".format(self.args.nj, nj))
+
+        if self.args.stage <= 5:
+            self.make_features(nj)
+        if self.args.stage <= 6:
+            self.decode(nj)
+        if self.args.stage <= 8 and \
+                os.path.exists(os.path.join(self.rescore, "num_jobs")):
+            self.produce_output()
+
+    def add_sources(self):
+        """Copies or links the source audio (files, lists of files and
+        directories) into the data directory."""
+        data = self.data
+        for source in self.args.sources:
+            if os.path.isfile(source):
+                file_type = subprocess.check_output(
+                    ['file', '-ib', source]).decode()
+                if 'audio' in file_type:
+                    print("Argument {0} is a sound file, using it as "
+                          "audio".format(source))
+                    self.add_file(os.path.realpath(source))
+                elif 'text' in file_type:
+                    print("Argument {0} is a text file, using it as list of "
+                          "files to copy".format(source))
+                    with open(source) as f:
+                        for filename in f.read().split():
+                            self.add_file(filename)
+            elif os.path.isdir(source):
+                sys.stdout.write("Argument {0} is a directory, copying "
+                                 "contents..  ".format(source))
+                sys.stdout.flush()
+                source = os.path.abspath(source)
+                for root, dirs, files in os.walk(source):
+                    relative = os.path.relpath(root, source)
+                    target = os.path.normpath(os.path.join(data, relative))
+                    if not os.path.isdir(target):
+                        os.makedirs(target)
+                    for name in files:
+                        self.add_file(os.path.join(root, name), target)
+                print("done")
+            else:
+                print("Argument {0} cannot be processed - "
+                      "skipping".format(source))
+
+    def add_file(self, filename, target_dir=None):
+        target = os.path.join(target_dir or self.data,
+                              os.path.basename(filename))
+        try:
+            if os.path.lexists(target):
+                os.remove(target)
+            if self.args.copyall:
+                shutil.copy2(filename, target)
+            else:
+                os.symlink(filename, target)
+        except (IOError, OSError) as e:
+            die("unable to {0} data to {1}: {2}".format(
+                "copy" if self.args.copyall else "link", self.data, e))
+
+    def write_file_list(self):
+        """Writes test.flist, the audio files in the data directory with one
+        of the requested file types, and returns their number."""
+        extensions = tuple("." + file_type.lower()
+                           for file_type in self.args.file_types.split())
+        num_files = 0
+        with open(os.path.join(self.data, "test.flist"), 'w') as f:
+            for root, dirs, files in os.walk(self.data):
+                for name in files:
+                    if name.lower().endswith(extensions):
+                        print(os.path.join(root, name), file=f)
+                        num_files += 1
+        return num_files
+
+    def prepare_data(self):
+        """Data preparation and diarization, as local/decode_prepdata.sh."""
+        data = self.data
+        all_dir = os.path.join(data, "ALL")
+        liumlog = os.path.join(all_dir, "liumlog")
+        if not os.path.isdir(liumlog):
+            os.makedirs(liumlog)
+        print("Data preparation (dir={0})".format(data), file=sys.stderr)
+        self.set_stage("Data preparation (dir={0})".format(data))
+
+        self.add_sources()
+        num_files = self.write_file_list()
+
+        # prepare data & do diarization; every finished file is appended to
+        # done.log.
+        done_log = os.path.join(liumlog, "done.log")
+        open(done_log, 'w').close()
+        usage = decode_monitor.ResourceUsage()
+        self.run_and_follow("local/flist2scp.sh {0}".format(data),
+                            decode_monitor.LogTail(done_log),
+                            num_files, "Diarization", usage,
+                            "data preparation failed (flist2scp.sh)")
+        print(usage.summary("Diarization"))
+        usage.write(os.path.join(self.inter, "time.diarization.log"))
+
+        segments = os.path.join(all_dir, "segments")
+        num_segments = count_lines(segments) if os.path.exists(segments) \
+            else 0
+        print("Split {0} source file{1} into {2} segment{3}".format(
+            num_files, "s" if num_files > 1 else "",
+            num_segments, "s" if num_segments > 1 else ""))
+        concatenate_files(glob.glob(os.path.join(data, "*.glm")),
+                          os.path.join(all_dir, "all.glm"))
+        self.run("utils/fix_data_dir.sh {0}".format(all_dir), usage,
+                 "fix data dir failed")
+        self.run("cp -r {0} {1}".format(liumlog, self.result), usage,
+                 "unable to copy diarization logs to {0}".format(self.result))
+
+        if num_files == 0:
+            die("No files prepared (no input found)")
+        if num_segments == 0:
+            die("No segments extracted (no speech found)")
+
+    def make_features(self, nj):
+        self.set_stage("Feature generation")
+        all_dir = os.path.join(self.data, "ALL")
+        mfcc_conf = os.path.join(self.args.model, "conf", "mfcc.conf")
+        if os.path.exists(mfcc_conf):
+            shutil.copy(mfcc_conf, self.inter)
+        usage = decode_monitor.ResourceUsage()
+        self.run("steps/make_mfcc.sh --cmd '{cmd}' --nj {nj} --mfcc-config "
+                 "{inter}/mfcc.conf {data} {data}/log {inter}/mfcc".format(
+                     cmd=self.env["train_cmd"], nj=nj, inter=self.inter,
+                     data=all_dir),
+                 usage, "Feature generation failed (make_mfcc.sh)")
+        self.run("steps/compute_cmvn_stats.sh {data} {data}/log "
+                 "{inter}/mfcc".format(data=all_dir, inter=self.inter),
+                 usage, "Feature generation failed (compute_cmvn_stats.sh)")
+        usage.write(os.path.join(self.inter, "time.features.log"))
+
+    def decode(self, nj):
+        args = self.args
+        self.set_stage("Decoding")
+        all_dir = os.path.join(self.data, "ALL")
+        segments = os.path.join(all_dir, "segments")
+        duration = 0.0
+        total_lines = 0
+        with open(segments) as f:
+            for line in f:
+                fields = line.split()
+                duration += float(fields[3]) - float(fields[2])
+                total_lines += 1
+        seconds = int(round(duration))
+        print("Duration of speech: {0}h:{1}m:{2}s".format(
+            seconds // 3600, seconds % 3600 // 60, seconds % 60))
+        shutil.rmtree(os.path.join(self.inter, "decode"), ignore_errors=True)
+
+        usage = decode_monitor.ResourceUsage()
+        self.run("steps/online/nnet2/extract_ivectors_online.sh --cmd '{cmd}' "
+                 "--nj {nj} --beam {beam} {data} {extractor} "
+                 "{data}/ivectors_hires".format(
+                     cmd=self.env["train_cmd"], nj=nj, beam=args.beam,
+                     data=all_dir, extractor=args.extractor),
+                 usage, "Extacting vectors failed (extract_ivectors_online.sh)")
+
+        tmp_decode = os.path.join(self.result, "tmp")
+        if not os.path.isdir(tmp_decode):
+            os.makedirs(tmp_decode)
+        tmp = tempfile.mkdtemp(dir=tmp_decode)
+        self.run("cp -r {0}/* {1}".format(args.model, tmp_decode), usage,
+                 "unable to copy the models to {0}".format(tmp_decode))
+        self.run_and_follow(
+            "steps/online/nnet3/decode.sh --acwt 1.0 --post-decode-acwt 10.0 "
+            "--skip-scoring true --nj {nj} {model}/graph {data} {tmp}".format(
+                nj=nj, model=args.model, data=all_dir, tmp=tmp),
+            decode_monitor.LogTail(os.path.join(tmp, "log", "decode.*.log"),
+                                   "Log-like per frame for utterance"),
+            total_lines, "Chain Decoding", usage,
+            "Decoding failed (decode.sh)")
+        print(usage.summary("Chain decoding"))
+
+        shutil.move(tmp, os.path.join(self.inter, "decode"))
+        shutil.rmtree(tmp_decode, ignore_errors=True)
+        usage.write(os.path.join(self.inter, "time.decode.log"))
+
+    def get_frame_shift_opt(self):
+        model = self.args.model
+        if os.path.isfile(os.path.join(model, "frame_shift")):
+            with open(os.path.join(model, "frame_shift")) as f:
+                return "--frame-shift={0}".format(f.read().strip())
+        if os.path.isfile(os.path.join(model, "frame_subsampling_factor")):
+            with open(os.path.join(model, "frame_subsampling_factor")) as f:
+                return "--frame-shift=0.0{0}".format(f.read().strip())
+        return ""
+
+    def produce_output(self):
+        """Generates the 1-best CTM and text output for every combination of
+        inverse acoustic scale and word insertion penalty."""
+        args = self.args
+        self.set_stage("Producing output")
+        all_dir = os.path.join(self.data, "ALL")
+        rescore = self.rescore
+        result = self.result
+        for pattern in [os.path.join(all_dir, "1Best.*"),
+                        os.path.join(result, "1Best*"),
+                        os.path.join(rescore, "1Best.*")]:
+            for filename in glob.glob(pattern):
+                os.remove(filename)
+        with open(os.path.join(rescore, "num_jobs")) as f:
+            num_jobs = int(f.read().strip())
+        frame_shift_opt = self.get_frame_shift_opt()
+
+        usage = decode_monitor.ResourceUsage()
+        if args.cache_alignment:
+            self.produce_ctms_from_cache(num_jobs, frame_shift_opt, usage)
+        for iac, wip, ident in self.output_parameters():
+            if not args.cache_alignment:
+                self.run(self.ctm_job_command(
+                    num_jobs, args.nj, ident,
+                    self.lattice_to_ctm_command(
+                        "{0}/lat.JOB.gz".format(rescore), iac, wip,
+                        "{0}/1Best.{1}JOB.ctm".format(rescore, ident),
+                        frame_shift_opt, escape=True)),
+                    usage, "Lattice to CTM conversion failed")
+            self.run(self.postprocess_command(ident), usage,
+                     "Producing output failed")
+        usage.write(os.path.join(self.inter, "time.output.log"))
+
+    def produce_ctms_from_cache(self, num_jobs, frame_shift_opt, usage):
+        """Pushes and word-aligns the lattices once, then converts the
+        aligned lattices to CTMs for all output parameters in parallel."""
+        args = self.args
+        rescore = self.rescore
+        self.run("{cmd} --max-jobs-run {nj} JOB=1:{num_jobs} "
+                 "{inter}/l2c_log/align.JOB.log {pipeline}".format(
+                     cmd=args.cmd, nj=args.nj, num_jobs=num_jobs,
+                     inter=self.inter,
+                     pipeline=self.align_lattices_command(
+                         "{0}/lat.JOB.gz".format(rescore),
+                         "{0}/lat_aligned.JOB.gz".format(rescore),
+                         escape=True)),
+                 usage, "Lattice alignment failed")
+
+        parameters = list(self.output_parameters())
+        max_jobs = (args.nj + len(parameters) - 1) // len(parameters)
+        processes = [
+            self.start(self.ctm_job_command(
+                num_jobs, max_jobs, ident,
+                self.lattice_to_ctm_command(
+                    "{0}/lat_aligned.JOB.gz".format(rescore), iac, wip,
+                    "{0}/1Best.{1}JOB.ctm".format(rescore, ident),
+                    frame_shift_opt, escape=True, aligned=True)))
+            for iac, wip, ident in parameters]
+        for process in processes:
+            process.wait()
+            usage.add_usage(process.usage)
+        if any(process.returncode != 0 for process in processes):
+            die("Lattice to CTM conversion failed")
+
+    def ctm_job_command(self, num_jobs, max_jobs, ident, pipeline):
+        return ("{cmd} --max-jobs-run {max_jobs} JOB=1:{num_jobs} "
+                "{inter}/l2c_log/lat2ctm.{ident}JOB.log {pipeline}".format(
+                    cmd=self.args.cmd, max_jobs=max_jobs, num_jobs=num_jobs,
+                    inter=self.inter, ident=ident, pipeline=pipeline))
+
+    def output_parameters(self):
+        """Yields (inv-acoustic-scale, word-ins-penalty, ident) for every
+        combination to produce output for; 'ident' is the infix of the
+        output file names, empty for parameters with a single value."""
+        for iac in self.args.inv_acoustic_scale.split():
+            for wip in self.args.word_ins_penalty.split():
+                ident = ""
+                if self.multiple_wip:
+                    ident = wip + "."
+                if self.multiple_iac:
+                    ident += iac + "."
+                yield iac, wip, ident
+
+    def align_lattices_command(self, lattices, aligned, escape=False):
+        """Returns the pipeline that pushes and word-aligns the gzipped
+        lattices, writing them gzipped to 'aligned'."""
+        args = self.args
+        pipe = " \\| " if escape else " | "
+        return pipe.join([
+            "gunzip -c {0}".format(lattices),
+            "lattice-push ark:- ark:-",
+            "lattice-align-words {0} {1}/final.mdl ark:- "
+            "'ark:|gzip -c >{2}'".format(args.wordbound, args.model,
+                                         aligned)])
+
+    def lattice_to_ctm_command(self, lattices, iac, wip, ctm,
+                               frame_shift_opt, escape=False, aligned=False):
+        """Returns the pipeline that converts the gzipped lattices to a CTM
+        with word ids and segment times, as read by local/postprocess_ctm.py.
+        With escape=True, the pipes are escaped for use with
+        run.pl/queue.pl. With
+        aligned=True, the lattices are those written by
+        align_lattices_command(); the word insertion penalty only changes
+        the graph cost of the word arcs, so it can be added after pushing and
+        aligning."""
+        args = self.args
+        pipe = " \\| " if escape else " | "
+        penalty = "lattice-add-penalty --word-ins-penalty={0} ark:- " \
+            "ark:-".format(wip)
+        if aligned:
+            commands = ["gunzip -c {0}".format(lattices), penalty]
+        else:
+            commands = [
+                "gunzip -c {0}".format(lattices),
+                "lattice-push ark:- ark:-",
+                penalty,
+                "lattice-align-words {0} {1}/final.mdl ark:- ark:-".format(
+                    args.wordbound, args.model)]
+        return pipe.join(commands + [
+            "lattice-to-ctm-conf {0} --inv-acoustic-scale={1} ark:- "
+            "{2}".format(frame_shift_opt, iac, ctm)])
+
+    def normalize_ctm_command(self, raw_ctm, segments, ctm, log):
+        """Returns the command that maps the words and corrects the times of
+        a CTM of lattice_to_ctm_command(), combines numbers, restores
+        compounds and removes hesitations and unknown words."""
+        return ("local/postprocess_ctm.py --symtab {symtab} "
+                "--segments {segments} --compound-log {log} {raw} "
+                "{ctm}".format(symtab=self.args.symtab, segments=segments,
+                               log=log, raw=raw_ctm, ctm=ctm))
+
+    def postprocess_command(self, ident):
+        """Returns the command that turns the per-job CTMs into the final
+        .ctm and .txt output."""
+        data = os.path.join(self.data, "ALL")
+        return ("local/postprocess_ctm.py --symtab {symtab} "
+                "--segments {data}/segments --compound-log {log} "
+                "--glm {data}/all.glm "
+                "--prefilt-ctm {rescore}/1Best_prefilt.{ident}ctm "
+                "--output-dir {result} --ident '{ident}' "
+                "--splittext {splittext} {rescore}/1Best.{ident}*.ctm "
+                "{result}/1Best.{ident}ctm".format(
+                    symtab=self.args.symtab, data=data, log=self.logging,
+                    rescore=self.rescore, ident=ident, result=self.result,
+                    splittext="true" if self.args.splittext else "false"))
+
+
+class FileFailed(Exception):
+    """Raised when one of the stages fails for a single input file."""
+    pass
+
+
+class PipelinedRecognizer(Recognizer):
+    """Runs the recognition pipeline per input file (--pipelined true).
+
+    Every file goes through diarization, feature generation, i-vector
+    extraction, decoding and lattice-to-CTM conversion on its own, in
+    <decode-dir>/intermediate/files/<name>, using single-job Kaldi commands.
+    At most --nj files are in progress at any time, largest files first, so a
+    long file no longer holds back all other files at every stage barrier,
+    and the normalized CTM of a file (files/<name>/1Best.ctm) is available
+    as soon as that file has been decoded. When all files are done, their
+    data directories and CTMs are combined and the output stage of
+    recognize.sh produces the final .ctm and .txt files.
+
+    The time.<stage>.log files contain the usage summed over all files, so
+    their elapsed times can exceed the wall-clock time of the run.
+    """
+
+    stages = ["diarization", "features", "ivectors", "decode", "ctm"]
+
+    def __init__(self, args, env=None):
+        super(PipelinedRecognizer, self).__init__(args, env)
+        self.files_dir = os.path.join(self.inter, "files")
+        self.lock = threading.Lock()
+        self.usage = dict((stage, decode_monitor.ResourceUsage())
+                          for stage in self.stages)
+        self.progress_bar = None
+        self.num_done = 0
+        self.decoded = []
+        self.failed = []
+        self.uem_opt = ""
+        self.frame_shift_opt = ""
+        self.model_dir = os.path.join(self.result, "tmp")
+
+    def run_stages(self):
+        start_time = time.time()
+        audio_files = self.prepare_sources("Pipelined recognition")
+        self.link_model_dir()
+        self.process_files(audio_files, "Pipelined recognition")
+        shutil.rmtree(self.model_dir, ignore_errors=True)
+        self.write_stage_usage()
+        if not self.decoded:
+            die("No segments extracted (no speech found)")
+        self.combine_data()
+
+        self.set_stage("Producing output")
+        usage = decode_monitor.ResourceUsage()
+        for iac, wip, ident in self.output_parameters():
+            self.run(self.postprocess_command(ident), usage,
+                     "Producing output failed")
+        usage.write(os.path.join(self.inter, "time.output.log"))
+        print("Pipelined recognition completed in {0}".format(
+            decode_monitor.format_duration(time.time() - start_time)))
+        self.report_failures()
+
+    def prepare_sources(self, stage):
+        """Collects the source audio and references in the data directory
+        and returns the list of audio files to process."""
+        all_dir = os.path.join(self.data, "ALL")
+        liumlog = os.path.join(all_dir, "liumlog")
+        for d in [liumlog, self.files_dir, self.rescore]:
+            if not os.path.isdir(d):
+                os.makedirs(d)
+        print("Data preparation (dir={0})".format(self.data), file=sys.stderr)
+        self.set_stage(stage)
+
+        self.add_sources()
+        self.write_file_list()
+        with open(os.path.join(self.data, "test.flist")) as f:
+            audio_files = [line.strip() for line in f if line.strip()]
+        if not audio_files:
+            die("No files prepared (no input found)")
+        self.prepare_references()
+        mfcc_conf = os.path.join(self.args.model, "conf", "mfcc.conf")
+        if os.path.exists(mfcc_conf):
+            shutil.copy(mfcc_conf, self.inter)
+        self.frame_shift_opt = self.get_frame_shift_opt()
+        for pattern in [os.path.join(all_dir, "1Best.*"),
+                        os.path.join(self.result, "1Best*"),
+                        os.path.join(self.rescore, "1Best.*")]:
+            for filename in glob.glob(pattern):
+                os.remove(filename)
+        open(os.path.join(liumlog, "done.log"), 'w').close()
+        return audio_files
+
+    def process_files(self, audio_files, label):
+        """Runs process_file() for all files, with at most --nj files in
+        progress."""
+        # Largest files first, so that a long file does not end up being
+        # processed on its own at the end of the batch.
+        jobs = sorted(enumerate(audio_files, 1),
+                      key=lambda job: -self.file_size(job[1]))
+        self.progress_bar = decode_monitor.ProgressBar(len(jobs), label)
+        threads = [threading.Thread(target=self.worker, args=(jobs,))
+                   for i in range(min(self.args.nj, len(jobs)))]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            with self.lock:
+                self.progress_bar.update(self.num_done)
+            time.sleep(self.args.progress_interval)
+        for thread in threads:
+            thread.join()
+        self.progress_bar.clear()
+
+    def write_stage_usage(self):
+        for stage in self.stages:
+            self.usage[stage].write(
+                os.path.join(self.inter, "time.{0}.log".format(stage)))
+
+    def report_failures(self):
+        if self.failed:
+            print("Processing failed for {0} file{1}: {2}".format(
+                len(self.failed), "s" if len(self.failed) > 1 else "",
+                " ".join(self.failed)), file=sys.stderr)
+            sys.exit(1)
+
+    def link_model_dir(self):
+        """steps/online/nnet3/decode.sh reads the model from the parent of
+        the decode directory. Instead of copying the model for every run, as
+        recognize.sh does, the per-file decode directories are created in a
+        directory of symlinks to the model files."""
+        shutil.rmtree(self.model_dir, ignore_errors=True)
+        os.makedirs(self.model_dir)
+        model = os.path.abspath(self.args.model)
+        for name in os.listdir(model):
+            os.symlink(os.path.join(model, name),
+                       os.path.join(self.model_dir, name))
+
+    @staticmethod
+    def file_size(filename):
+        try:
+            return os.path.getsize(filename)
+        except OSError:
+            return 0
+
+    def prepare_references(self):
+        """Collects the .glm, .uem and .stm files of the sources, as
+        local/flist2scp.sh does before the diarization."""
+        all_dir = os.path.join(self.data, "ALL")
+        glm = os.path.join(all_dir, "all.glm")
+        concatenate_files(glob.glob(os.path.join(self.data, "*.glm")), glm)
+        uem = os.path.join(all_dir, "test.uem")
+        uem_lines = []
+        for filename in glob.glob(os.path.join(self.data, "*.uem")):
+            with open(filename, 'rb') as f:
+                uem_lines.extend(f.readlines())
+        with open(uem, 'wb') as f:
+            f.writelines(sorted(uem_lines))
+        if uem_lines:
+            self.uem_opt = "--uem {0}".format(uem)
+        stms = sorted(glob.glob(os.path.join(self.data, "*.stm")))
+        ref = os.path.join(all_dir, "ref.stm")
+        if stms and os.path.getsize(glm) > 0:
+            self.run("cat {0} | csrfilt.sh -s -i stm -t ref {1} >{2}".format(
+                " ".join(stms), glm, ref), decode_monitor.ResourceUsage(),
+                "unable to filter the reference stm files")
+        else:
+            concatenate_files(stms, ref)
+
+    def worker(self, jobs):
+        while True:
+            with self.lock:
+                if not jobs:
+                    return
+                index, audio = jobs.pop(0)
+            basefile = os.path.splitext(os.path.basename(audio))[0]
+            file_dir = os.path.join(self.files_dir, basefile)
+            try:
+                message = self.process_file(index, audio, basefile, file_dir)
+            except (FileFailed, IOError, OSError) as e:
+                message = "failed ({0}), see {1}/log".format(e, file_dir)
+                with self.lock:
+                    self.failed.append(audio)
+            with self.lock:
+                self.num_done += 1
+                self.progress_bar.clear()
+                print("{0}: {1} ({2}/{3})".format(
+                    basefile, message, self.num_done,
+                    self.progress_bar.total))
+                self.progress_bar.update(self.num_done)
+
+    def run_file_command(self, stage, command, log_file):
+        log_file.write("# {0}\n".format(command))
+        log_file.flush()
+        process = decode_monitor.TimedProcess(command, log_file=log_file,
+                                              env=self.env)
+        process.wait()
+        with self.lock:
+            self.usage[stage].add_usage(process.usage)
+        if process.returncode != 0:
+            raise FileFailed("{0} exited with status {1}".format(
+                stage, process.returncode))
+
+    def process_file(self, index, audio, basefile, file_dir):
+        """Runs all stages for one input file and returns a message
+        describing the result."""
+        args = self.args
+        data = os.path.join(file_dir, "data")
+        decode = os.path.join(file_dir, "decode")
+        if not os.path.isdir(data):
+            os.makedirs(data)
+        with open(os.path.join(file_dir, "log"), 'w') as log_file:
+            if not self.diarize(audio, basefile, data, log_file):
+                return "no speech found"
+
+            self.run_file_command(
+                "features",
+                "steps/make_mfcc.sh --cmd run.pl --nj 1 --mfcc-config "
+                "{inter}/mfcc.conf {data} {data}/log {dir}/mfcc && "
+                "steps/compute_cmvn_stats.sh {data} {data}/log "
+                "{dir}/mfcc".format(inter=self.inter, data=data,
+                                    dir=file_dir), log_file)
+            self.run_file_command(
+                "ivectors",
+                "steps/online/nnet2/extract_ivectors_online.sh --cmd run.pl "
+                "--nj 1 --beam {beam} {data} {extractor} "
+                "{data}/ivectors_hires".format(
+                    beam=args.beam, data=data, extractor=args.extractor),
+                log_file)
+            shutil.rmtree(decode, ignore_errors=True)
+            tmp = tempfile.mkdtemp(dir=self.model_dir)
+            self.run_file_command(
+                "decode",
+                "steps/online/nnet3/decode.sh --acwt 1.0 "
+                "--post-decode-acwt 10.0 --skip-scoring true --nj 1 "
+                "{model}/graph {data} {tmp}".format(
+                    model=args.model, data=data, tmp=tmp), log_file)
+            shutil.move(tmp, decode)
+
+            lattices = os.path.join(decode, "lat.1.gz")
+            if args.cache_alignment:
+                aligned = os.path.join(decode, "lat_aligned.1.gz")
+                self.run_file_command(
+                    "ctm", self.align_lattices_command(lattices, aligned),
+                    log_file)
+                lattices = aligned
+
+            # The raw CTM of the file takes the place of the CTM of decoding
+            # job <index>, so that the output stage can combine them.
+            for iac, wip, ident in self.output_parameters():
+                raw_ctm = "{0}/1Best.{1}{2}.ctm".format(self.rescore, ident,
+                                                       index)
+                ctm = os.path.join(file_dir, "1Best.{0}ctm".format(ident))
+                self.run_file_command(
+                    "ctm", self.lattice_to_ctm_command(
+                        lattices, iac, wip, raw_ctm, self.frame_shift_opt,
+                        aligned=args.cache_alignment), log_file)
+                # the compound log gets its own file, as log_file is not
+                # opened for appending.
+                self.run_file_command(
+                    "ctm", self.normalize_ctm_command(
+                        raw_ctm, os.path.join(data, "segments"), ctm,
+                        os.path.join(file_dir, "compound.log")),
+                    log_file)
+
+        with self.lock:
+            self.decoded.append(file_dir)
+        return "done, see {0}".format(ctm)
+
+    def diarize(self, audio, basefile, data, log_file):
+        """Diarizes one input file and writes the Kaldi data directory of its
+        speech segments, as local/flist2scp.sh does for all files. Returns
+        False if no speech was found."""
+        liumlog = os.path.join(self.data, "ALL", "liumlog")
+        with open(os.path.join(data, "wav.scp"), 'w') as f:
+            print("{0} sox {1} -r 16k -e signed-integer -t wav - remix - "
+                  "|".format(basefile, audio), file=f)
+
+        seg = os.path.join(liumlog, basefile + ".seg")
+        if not os.path.exists(seg):
+            if audio.rsplit('.', 1)[-1] == 'wav':
+                command = "local/diarization.sh {uem} {wav} {liumlog}".format(
+                    uem=self.uem_opt, wav=audio, liumlog=liumlog)
+            else:
+                # The diarization requires a wav file.
+                wav = os.path.join(self.data, basefile + ".wav")
+                command = ("sox {audio} -t wav {wav} && "
+                           "local/diarization.sh {uem} {wav} {liumlog}; "
+                           "status=$?; rm -f {wav}; exit $status".format(
+                               audio=audio, wav=wav, uem=self.uem_opt,
+                               liumlog=liumlog))
+            self.run_file_command("diarization", command, log_file)
+            if not os.path.exists(seg):
+                raise FileFailed("diarization produced no segmentation")
+        with self.lock:
+            with open(os.path.join(liumlog, "done.log"), 'a') as f:
+                print(audio, file=f)
+
+        segments = []
+        utt2spk = set()
+        with open(seg) as f:
+            for line in f:
+                fields = line.split()
+                if ';;' in line or not fields:
+                    continue
+                utt = "{0}.{1:05d}".format(fields[0], len(segments) + 1)
+                start = float(fields[2])
+                segments.append("{0} {1} {2:.3f} {3:.3f}".format(
+                    utt, fields[0], start / 100,
+                    (start + float(fields[3])) / 100))
+                utt2spk.add(("{0}-{1}".format(fields[0], fields[-1]), utt))
+        if not segments:
+            return False
+        with open(os.path.join(data, "segments"), 'w') as f:
+            for line in segments:
+                print(line, file=f)
+        with open(os.path.join(data, "utt2spk"), 'w') as f:
+            for spk, utt in sorted(utt2spk):
+                print(utt, spk, file=f)
+        self.run_file_command("diarization",
+                              "utils/fix_data_dir.sh {0}".format(data),
+                              log_file)
+        return True
+
+    def combine_data(self):
+        """Combines the data directories of the decoded files into the ALL
+        data directory that the output stage reads."""
+        all_dir = os.path.join(self.data, "ALL")
+        for name in ["wav.scp", "segments", "utt2spk"]:
+            concatenate_files([os.path.join(file_dir, "data", name)
+                              for file_dir in self.decoded],
+                             os.path.join(all_dir, name))
+        usage = decode_monitor.ResourceUsage()
+        self.run("utils/fix_data_dir.sh {0}".format(all_dir), usage,
+                 "fix data dir failed")
+        self.run("cp -r {0} {1}".format(os.path.join(all_dir, "liumlog"),
+                                        self.result), usage,
+                 "unable to copy diarization logs to {0}".format(self.result))
+        num_files = len(self.decoded)
+        num_segments = count_lines(os.path.join(all_dir, "segments"))
+        print("Decoded {0} source file{1} with {2} segment{3}".format(
+            num_files, "s" if num_files > 1 else "",
+            num_segments, "s" if num_segments > 1 else ""))
+
+
+def main():
+    args = get_args()
+    if args.pipelined:
+        PipelinedRecognizer(args).main(sys.argv)
+    else:
+        Recognizer(args).main(sys.argv)
+
+
+if __name__ == "__main__":
+    main()
@@ -26,6 +26,8 @@ beam=11
 decode_mbr=true
 miac=
 mwip=
+cache_alignment=false		# push and word-align the lattices once and produce the output for all iac/wip values from them
+pipelined=false			# take each file through all stages independently, see local/recognize.py
 
 model=bliss_models/AM/online
 lmodel=bliss_models/LM/LM.gz
@@ -52,8 +54,15 @@ export decode_cmd=run.pl
 export cuda_cmd=run.pl
 export mkgraph_cmd=run.pl
 
+all_args=("$@")
 . parse_options.sh || exit 1;
 
+# In pipelined mode, the python driver runs diarization, features, i-vectors,
+# decoding and CTM generation per file, with at most $nj files in progress.
+if $pipelined; then
+    exec python local/recognize.py "${all_args[@]}"
+fi
+
 if [ $# -lt 2 ]; then
     echo "Wrong #arguments ($#, expected 2)"
     echo "Usage: decode.sh [options] <source-dir|source files|txt-file list of source files> <decode-dir>"
@@ -71,6 +80,8 @@ if [ $# -lt 2 ]; then
     echo "  --file-types <extensions>          # include audio files with the given extensions, default \"wav mp3\" "
     echo "  --copyall <true/false>             # copy all source files (true) or use symlinks (false), value is $copyall"
     echo "  --splittext <true/false>           # split resulting 1Best.txt into separate .txt files for each input file, value is $splittext"
+    echo "  --cache-alignment <true/false>     # align the lattices once for all --inv-acoustic-scale/--word-ins-penalty values, value is $cache_alignment"
+    echo "  --pipelined <true/false>           # process each file through all stages independently, value is $pipelined"
     exit 1;
 fi
 
@@ -185,33 +196,55 @@ if [ $stage -le 8 ] && [ -e $rescore/num_jobs ]; then
 		frame_shift_opt="--frame-shift=0.0$factor"
 	fi
 
+	if $cache_alignment; then
+		# The word insertion penalty only changes the graph cost of the word
+		# arcs, so it can be added after pushing and aligning; the aligned
+		# lattices are shared by all iac/wip values, which are run in parallel.
+		$cmd --max-jobs-run $nj JOB=1:$numjobs $inter/l2c_log/align.JOB.log \
+			gunzip -c $rescore/lat.JOB.gz \| \
+			lattice-push ark:- ark:- \| \
+			lattice-align-words $wordbound $model/final.mdl ark:- "ark:|gzip -c >$rescore/lat_aligned.JOB.gz" || exit 1;
+		numparams=$(( $(echo $inv_acoustic_scale | wc -w) * $(echo $word_ins_penalty | wc -w) ))
+		maxjobs=$(( (nj + numparams - 1) / numparams ))
+		pids=
+		for iac in $inv_acoustic_scale; do
+			for wip in $word_ins_penalty; do
+				ident=
+				[ $mwip ] && ident="$wip."
+				[ $miac ] && ident="$ident$iac."
+				$cmd --max-jobs-run $maxjobs JOB=1:$numjobs $inter/l2c_log/lat2ctm.${ident}JOB.log \
+					gunzip -c $rescore/lat_aligned.JOB.gz \| \
+					lattice-add-penalty --word-ins-penalty=$wip ark:- ark:- \| \
+					lattice-to-ctm-conf $frame_shift_opt --inv-acoustic-scale=$iac ark:- $rescore/1Best.${ident}JOB.ctm &
+				pids="$pids $!"
+			done
+		done
+		for pid in $pids; do
+			wait $pid || exit 1;
+		done
+	fi
+
 	# produce 1-Best with confidence
 	for iac in $inv_acoustic_scale; do
 		for wip in $word_ins_penalty; do
 			ident=
 			[ $mwip ] && ident="$wip."
 			[ $miac ] && ident="$ident$iac."
+			$cache_alignment || \
 			$cmd --max-jobs-run $nj JOB=1:$numjobs $inter/l2c_log/lat2ctm.${ident}JOB.log \
 				gunzip -c $rescore/lat.JOB.gz \| \
 				lattice-push ark:- ark:- \| \
 				lattice-add-penalty --word-ins-penalty=$wip ark:- ark:- \| \
 				lattice-align-words $wordbound $model/final.mdl ark:- ark:- \| \
-				lattice-to-ctm-conf $frame_shift_opt --inv-acoustic-scale=$iac ark:- - \| utils/int2sym.pl -f 5 $symtab \| \
-				local/ctm_time_correct.pl $data/ALL/segments \| sort \> $rescore/1Best.${ident}JOB.ctm | exit 1;
-			cat $rescore/1Best.${ident}*.ctm >$rescore/1Best_raw.${ident}ctm
-
-			cat $rescore/1Best_raw.${ident}ctm | sort -k1,1 -k3,3n | \
-				perl local/combine_numbers.pl | sort -k1,1 -k3,3n | local/compound-restoration.pl 2>>$logging | \
-				grep -E --text -v 'uh|<unk>' >$result/1Best.${ident}ctm
-			[ -s $data/ALL/all.glm ] && mv $result/1Best.${ident}ctm $rescore/1Best_prefilt.${ident}ctm && \
-				cat $rescore/1Best_prefilt.${ident}ctm | csrfilt.sh -s -i ctm -t hyp $data/ALL/all.glm >$result/1Best.${ident}ctm
-
-			local/ctmseg2sent.pl $result $splittext $ident
-                        cat $result/1Best.txt | cut -d'(' -f 1 > $result/$(basename $result).txt
-                        begin_line=$(cut -d' ' -f 1-2 $result/1Best.ctm | head -n1)
-                        tail -n +2 $result/1Best.txt | cut -d'(' -f2 | cut -d' ' -f2 | sed 's/)//g' > $result/temp1
-			cat $result/temp1 | sed "s/^/$begin_line /g" | sed 's/$/ 0.00 <eos> 1.00/g' > $result/eos.ctm
-			cat $result/1Best.ctm $result/eos.ctm | awk '{print $0, $3+$4}'| sort -nk7 | cut -d' ' -f 1-6 | awk '{printf "%s %s %.2f %.2f %s %.2f\n", $1, $2, $3, $4, $5, $6}' > $result/$(basename $result).ctm
+				lattice-to-ctm-conf $frame_shift_opt --inv-acoustic-scale=$iac ark:- $rescore/1Best.${ident}JOB.ctm || exit 1;
+
+			# map the words, correct the times, combine numbers, restore compounds,
+			# filter and write the sentences, text and ctm in one pass over the job ctms
+			local/postprocess_ctm.py --symtab $symtab --segments $data/ALL/segments \
+				--compound-log $logging --glm $data/ALL/all.glm \
+				--prefilt-ctm $rescore/1Best_prefilt.${ident}ctm \
+				--output-dir $result --ident "$ident" --splittext $splittext \
+				$rescore/1Best.${ident}*.ctm $result/1Best.${ident}ctm || exit 1
 
 		done
 	done
@@ -1,4 +1,6 @@
 class Interval:
+	__slots__ = ('btime', 'etime', 'text')
+
 	def __init__(self, btime, etime, text):
 		self.btime = btime
 		self.etime = etime
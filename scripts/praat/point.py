@@ -1,4 +1,6 @@
 class Point:
+	__slots__ = ('time', 'text')
+
 	def __init__(self, time, text):
 		self.time = time
 		self.text = text
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-import sys,codecs
+import codecs
 
 from .intervaltier import *
 from .pointtier import *
@@ -7,6 +7,7 @@ from .point import *
 from .interval import *
 from .textgridtype import *
 from .tiertype import *
+from .textgridstream import TextgridWriter
 from fileinput import close
 
 class Textgrid:	
@@ -159,60 +160,14 @@ class Textgrid:
 				
 				return line_index-1
 	
-	def write(self, file=None): 
-		if file:
-			handle = codecs.open(file, 'w')
-		else:
-			handle = sys.stdout
-			
-		handle.write("File type = \"ooTextFile\"\n" + \
-						"Object class = \"TextGrid\"\n" + \
-						"\n" + \
-						'xmin = ' + repr(self.btime) + "\n" + \
-						'xmax = ' + repr(self.etime) + "\n" + \
-						'tiers? <exists>' + "\n" + \
-						'size = ' + repr(len(self.tiers)) + "\n" + \
-						'item []:\n')
-		
-		tiers = self.tiers
-		tier_index = 1
-		for tier in tiers:
-			handle.write('\titem [' + repr(tier_index) + ']:\n')
-
+	def write(self, file=None):
+		writer = TextgridWriter(file, self.btime, self.etime, len(self.tiers))
+		for tier in self.tiers:
 			if isinstance(tier, IntervalTier):
-				handle.write('\t\tclass = \"IntervalTier\"\n' + \
-							'\t\tname = \"' + tier.name + '\"\n' + \
-							'\t\txmin = ' + repr(tier.btime) + '\n' + \
-							'\t\txmax = ' + repr(tier.etime) + '\n' + \
-							'\t\tintervals: size = ' + repr(len(tier.intervals)) + '\n')
-				intervals = tier.intervals
-				interval_index = 1
-				
-				for interval in intervals:
-					handle.write('\t\tintervals [' + repr(interval_index) + ']\n' + \
-								'\t\t\txmin = ' + repr(interval.btime) + "\n" + \
-								'\t\t\txmax = ' + repr(interval.etime) + "\n" + \
-								'\t\t\ttext = \"' + interval.text + '\"\n')
-					interval_index += 1
-			
+				writer.write_interval_tier(tier.name, tier.btime, tier.etime, tier.intervals, len(tier.intervals))
 			elif isinstance(tier, PointTier):
-				handle.write('\t\tclass = \"TextTier\"\n' + \
-							'\t\tname = \"' + tier.name + '\"\n' + \
-							'\t\txmin = ' + repr(tier.btime) + "\n" + \
-							'\t\txmax = ' + repr(tier.etime) + "\n" + \
-							'\t\tpoints: size = ' + repr(len(tier.points)) + "\n")
-				points = tier.points
-				point_index = 1
-				
-				for point in points:
-					handle.write('\t\tpoints [' + repr(point_index) + ']\n' + \
-								'\t\t\ttime = ' + repr(point.time) + "\n" + \
-								'\t\t\tmark = \"' + point.text + '\"\n')
-					point_index += 1
-			
-			tier_index += 1
-		if file:
-			handle.close()
+				writer.write_point_tier(tier.name, tier.btime, tier.etime, tier.points, len(tier.points))
+		writer.close()
 
 	""" Get the index of the first occurrence of an IntervalTier object having the specified 
 	name.
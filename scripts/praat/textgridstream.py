@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+import sys, io, shutil, tempfile
+
+from .interval import *
+from .point import *
+from .textgridtype import *
+from .tiertype import *
+
+# Streaming access to Praat TextGrid files. Unlike Textgrid.read, which reads the
+# whole file and builds all tiers up front, TextgridReader parses the file line by
+# line and hands out the intervals/points of one tier at a time. TextgridWriter
+# writes a long syntax TextGrid incrementally from (possibly generated) intervals.
+
+# Number of lines taken by a single interval/point, indexed by (file type, tier type).
+ITEM_LINES = {
+	(TextgridType.LONG, TierType.INTERVAL): 4,
+	(TextgridType.LONG, TierType.POINT): 3,
+	(TextgridType.SHORT, TierType.INTERVAL): 3,
+	(TextgridType.SHORT, TierType.POINT): 2,
+}
+
+# Intervals spooled in memory before a tier of unknown size is moved to disk.
+SPOOL_MAX_SIZE = 4 * 1024 * 1024
+
+if sys.version_info[0] >= 3:
+	def to_output_text(text):
+		return text
+else:
+	def to_output_text(text):
+		# Under Python 2 the TextGrid is written as bytes, like Textgrid.write
+		# always did: byte strings (e.g. labels read from a CTM) are written
+		# as they are, and unicode strings (e.g. from TextgridReader) as UTF-8.
+		if isinstance(text, unicode):
+			return text.encode('utf-8')
+		return text
+
+class StreamedTier:
+	""" A tier header read by TextgridReader. Iterating over it yields the
+	Interval or Point objects of the tier, read lazily from the file. The items
+	can only be iterated once, and only until the reader moves to the next tier.
+	"""
+	__slots__ = ('reader', 'type', 'name', 'btime', 'etime', 'size', 'remaining')
+
+	def __init__(self, reader, type, name, btime, etime, size):
+		self.reader = reader
+		self.type = type
+		self.name = name
+		self.btime = btime
+		self.etime = etime
+		self.size = size
+		self.remaining = size
+
+	def __iter__(self):
+		return self.reader.read_items(self)
+
+class TextgridReader:
+	""" Reads a TextGrid file (long or short syntax) tier by tier.
+
+	Usage:
+		with TextgridReader(file) as reader:
+			for tier in reader:
+				for interval in tier:
+					...
+	"""
+	def __init__(self, file):
+		self.file = file
+		self.handle = io.open(file, 'r', encoding='utf-8')
+		self.btime = 0.0
+		self.etime = 0.0
+		self.nr_tiers = 0
+		self.type = TextgridType.LONG
+		self.current_tier = None
+		self.read_header()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def __iter__(self):
+		return self.iter_tiers()
+
+	def close(self):
+		self.handle.close()
+
+	def next_line(self):
+		line = self.handle.readline()
+		if not line:
+			raise ValueError("Unexpected end of TextGrid file '" + self.file + "'")
+		return line.strip()
+
+	def next_value(self):
+		line = self.next_line()
+		if self.type == TextgridType.LONG:
+			return line.split('=', 1)[1].strip()
+		return line
+
+	def read_header(self):
+		for i in range(3):
+			self.next_line()
+		line = self.next_line()
+		if line.startswith('xmin'):
+			self.type = TextgridType.LONG
+			self.btime = float(line.split('=', 1)[1])
+		else:
+			self.type = TextgridType.SHORT
+			self.btime = float(line)
+		self.etime = float(self.next_value())
+		self.next_line()
+		self.nr_tiers = int(self.next_value())
+		if self.type == TextgridType.LONG:
+			# item []:
+			self.next_line()
+
+	def read_tier_header(self):
+		if self.type == TextgridType.LONG:
+			# item [n]:
+			self.next_line()
+		type = self.next_value()[1:-1]
+		name = self.next_value()[1:-1]
+		btime = float(self.next_value())
+		etime = float(self.next_value())
+		size = int(self.next_value())
+		return StreamedTier(self, type, name, btime, etime, size)
+
+	def iter_tiers(self):
+		for tier_index in range(self.nr_tiers):
+			if self.current_tier is not None:
+				self.skip_items(self.current_tier)
+			self.current_tier = self.read_tier_header()
+			yield self.current_tier
+
+	def read_items(self, tier):
+		long_syntax = self.type == TextgridType.LONG
+		while tier.remaining > 0:
+			if tier is not self.current_tier:
+				raise ValueError("Tier '" + tier.name + "' was already passed by the reader")
+			if long_syntax:
+				# intervals [n]: / points [n]:
+				self.next_line()
+			if tier.type == TierType.INTERVAL:
+				btime = float(self.next_value())
+				etime = float(self.next_value())
+				item = Interval(btime, etime, self.next_value()[1:-1])
+			else:
+				time = float(self.next_value())
+				item = Point(time, self.next_value()[1:-1])
+			tier.remaining -= 1
+			yield item
+
+	def skip_items(self, tier):
+		nr_lines = tier.remaining * ITEM_LINES[(self.type, tier.type)]
+		for i in range(nr_lines):
+			self.next_line()
+		tier.remaining = 0
+
+class TextgridWriter:
+	""" Writes a TextGrid file in long syntax one tier at a time. The items of a
+	tier may be any iterable (e.g. a generator); when the number of items is not
+	given, they are spooled to a temporary file to determine the tier size.
+
+	Usage:
+		with TextgridWriter(file, btime, etime, nr_tiers) as writer:
+			writer.write_interval_tier(name, btime, etime, intervals)
+	"""
+	def __init__(self, file=None, btime=0.0, etime=0.0, nr_tiers=1):
+		self.file = file
+		self.nr_tiers = nr_tiers
+		self.tier_index = 0
+		if not file:
+			self.handle = sys.stdout
+		elif sys.version_info[0] >= 3:
+			self.handle = io.open(file, 'w', encoding='utf-8')
+		else:
+			self.handle = open(file, 'w')
+		self.write("File type = \"ooTextFile\"\n" + \
+						"Object class = \"TextGrid\"\n" + \
+						"\n" + \
+						'xmin = ' + repr(btime) + "\n" + \
+						'xmax = ' + repr(etime) + "\n" + \
+						'tiers? <exists>' + "\n" + \
+						'size = ' + repr(nr_tiers) + "\n" + \
+						'item []:\n')
+
+	def __enter__(self):
+		return self
+
+	def write(self, text):
+		self.handle.write(to_output_text(text))
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		# don't hide an exception raised in the with block behind the tier count check
+		self.close(check_tiers=exc_type is None)
+
+	def close(self, check_tiers=True):
+		if self.file:
+			self.handle.close()
+		if check_tiers and self.tier_index != self.nr_tiers:
+			raise ValueError("Wrote " + repr(self.tier_index) + " tiers to TextGrid declaring " + \
+							repr(self.nr_tiers) + " tiers")
+
+	def write_interval_tier(self, name, btime, etime, intervals, size=None):
+		self.write_tier('IntervalTier', 'intervals', name, btime, etime,
+						self.format_intervals(intervals), size)
+
+	def write_point_tier(self, name, btime, etime, points, size=None):
+		self.write_tier('TextTier', 'points', name, btime, etime,
+						self.format_points(points), size)
+
+	def format_intervals(self, intervals):
+		interval_index = 1
+		for interval in intervals:
+			yield '\t\tintervals [' + repr(interval_index) + ']\n' + \
+					'\t\t\txmin = ' + repr(interval.btime) + "\n" + \
+					'\t\t\txmax = ' + repr(interval.etime) + "\n" + \
+					'\t\t\ttext = \"' + interval.text + '\"\n'
+			interval_index += 1
+
+	def format_points(self, points):
+		point_index = 1
+		for point in points:
+			yield '\t\tpoints [' + repr(point_index) + ']\n' + \
+					'\t\t\ttime = ' + repr(point.time) + "\n" + \
+					'\t\t\tmark = \"' + point.text + '\"\n'
+			point_index += 1
+
+	def write_tier(self, tier_class, item_name, name, btime, etime, items, size):
+		self.tier_index += 1
+		if self.tier_index > self.nr_tiers:
+			raise ValueError("TextGrid declares only " + repr(self.nr_tiers) + " tiers")
+
+		spool = None
+		if size is None:
+			if sys.version_info[0] >= 3:
+				spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, mode='w+', encoding='utf-8')
+			else:
+				spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, mode='w+b')
+			size = 0
+			for item in items:
+				spool.write(to_output_text(item))
+				size += 1
+			spool.seek(0)
+
+		self.write('\titem [' + repr(self.tier_index) + ']:\n' + \
+						'\t\tclass = \"' + tier_class + '\"\n' + \
+						'\t\tname = \"' + name + '\"\n' + \
+						'\t\txmin = ' + repr(btime) + '\n' + \
+						'\t\txmax = ' + repr(etime) + '\n' + \
+						'\t\t' + item_name + ': size = ' + repr(size) + '\n')
+
+		if spool is not None:
+			shutil.copyfileobj(spool, self.handle)
+			spool.close()
+		else:
+			nr_written = 0
+			for item in items:
+				self.write(item)
+				nr_written += 1
+			if nr_written != size:
+				raise ValueError("Tier '" + name + "' declared " + repr(size) + \
+								" items but " + repr(nr_written) + " were written")
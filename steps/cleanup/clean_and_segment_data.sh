@@ -19,6 +19,9 @@ cleanup=true
 nj=4
 graph_opts=
 segmentation_opts=
+cleanup_nj=0  # If > 0, stages 5 to 7 are done in a single pass over the
+              # ctm-edits by steps/cleanup/internal/cleanup_ctm_edits.py,
+              # with this many processes.
 
 . ./path.sh
 . utils/parse_options.sh
@@ -47,6 +50,8 @@ if [ $# -ne 5 ]; then
   echo "  --segmentation-opts 'opts'  # Additional options to segment_ctm_edits.py."
   echo "                              # Please run steps/cleanup/internal/segment_ctm_edits.py"
   echo "                              # without arguments to see allowed options."
+  echo "  --cleanup-nj <n>            # If > 0, modify, taint and segment the ctm-edits in a"
+  echo "                              # single pass with this many processes (default: 0)"
   echo "  --graph-opts 'opts'         # Additional options to make_biased_lm_graphs.sh."
   echo "                              # Please run steps/cleanup/make_biased_lm_graphs.sh"
   echo "                              # without arguments to see allowed options."
@@ -126,7 +131,27 @@ if [ $stage -le 4 ]; then
   steps/cleanup/internal/get_non_scored_words.py $lang > $dir/non_scored_words.txt
 fi
 
-if [ $stage -le 5 ]; then
+if [ $stage -le 7 ] && [ $cleanup_nj -gt 0 ]; then
+  echo "$0: modifying, tainting and creating segmentation from ctm-edits file"
+  echo "   ... in a single pass."
+
+  $cmd --num-threads $cleanup_nj $dir/log/cleanup_ctm_edits.log \
+    steps/cleanup/internal/cleanup_ctm_edits.py --nj=$cleanup_nj --stats-verbose=3 \
+      $segmentation_opts \
+      --oov-symbol-file=$lang/oov.txt \
+      --ctm-edits-out=$dir/ctm_edits.segmented \
+      --word-stats-out=$dir/word_stats.txt \
+      $dir/non_scored_words.txt \
+      $dir/lattice_oracle/ctm_edits $dir/text $dir/segments || exit 1
+
+  echo "$0: contents of $dir/log/cleanup_ctm_edits.log are:"
+  cat $dir/log/cleanup_ctm_edits.log
+  echo "For word-level statistics on p(not-being-in-a-segment), with 'worst' words at the top,"
+  echo "see $dir/word_stats.txt"
+  echo "For detailed utterance-level debugging information, see $dir/ctm_edits.segmented"
+fi
+
+if [ $stage -le 5 ] && [ $cleanup_nj -eq 0 ]; then
   echo "$0: modifying ctm-edits file to allow repetitions [for dysfluencies] and "
   echo "   ... to fix reference mismatches involving non-scored words. "
 
@@ -138,7 +163,7 @@ if [ $stage -le 5 ]; then
   echo " a list of commonly-repeated words."
 fi
 
-if [ $stage -le 6 ]; then
+if [ $stage -le 6 ] && [ $cleanup_nj -eq 0 ]; then
   echo "$0: applying 'taint' markers to ctm-edits file to mark silences and"
   echo "  ... non-scored words that are next to errors."
   $cmd $dir/log/taint_ctm_edits.log \
@@ -147,7 +172,7 @@ if [ $stage -le 6 ]; then
 fi
 
 
-if [ $stage -le 7 ]; then
+if [ $stage -le 7 ] && [ $cleanup_nj -eq 0 ]; then
   echo "$0: creating segmentation from ctm-edits file."
 
   $cmd $dir/log/segment_ctm_edits.log \
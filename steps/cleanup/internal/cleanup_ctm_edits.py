@@ -0,0 +1,446 @@
+#!/usr/bin/env python
+
+# Apache 2.0
+
+from __future__ import print_function
+import argparse
+import collections
+import io
+import logging
+import multiprocessing
+import sys
+
+import modify_ctm_edits
+import segment_ctm_edits
+import segment_ctm_edits_mild
+import taint_ctm_edits
+
+"""
+This script does in a single pass over a 'ctm-edits' file what
+modify_ctm_edits.py, taint_ctm_edits.py and segment_ctm_edits.py (or
+segment_ctm_edits_mild.py) do one after the other, i.e. it produces the
+segmentation and text from the ctm-edits produced by get_ctm_edits.py.
+
+The ctm-edits are read once and grouped per utterance; each utterance goes
+through the modify, taint and segment stages in memory, using the functions
+of those scripts, so the intermediate ctm-edits are not written to disk
+(unless --modified-ctm-edits-out or --tainted-ctm-edits-out are given).
+Batches of utterances are processed by a pool of --nj processes, and the
+outputs are written in the order of the input.  The statistics that the
+three scripts print are accumulated over all processes and printed at the
+end.
+
+All the options that are not listed below, and the positional arguments
+<non-scored-words-file> <ctm-edits-in> <text-out> <segments-out>, are those of
+the segmentation script selected with --segmenter.  For example, the stages 5
+to 7 of steps/cleanup/clean_and_segment_data.sh are equivalent to
+
+steps/cleanup/internal/cleanup_ctm_edits.py --stats-verbose=3 \\
+  --oov-symbol-file=data/lang/oov.txt \\
+  --ctm-edits-out=exp/cleanup/ctm_edits.segmented \\
+  --word-stats-out=exp/cleanup/word_stats.txt \\
+  exp/cleanup/non_scored_words.txt exp/cleanup/lattice_oracle/ctm_edits \\
+  exp/cleanup/text exp/cleanup/segments
+"""
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+handler.setLevel(logging.INFO)
+formatter = logging.Formatter('%(asctime)s [%(filename)s:%(lineno)s - '
+                              '%(funcName)s - %(levelname)s ] %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# The statistics accumulated in module-level variables of
+# modify_ctm_edits.py and taint_ctm_edits.py.
+MODIFY_STATS = ['num_lines', 'num_correct_lines', 'ref_change_stats',
+                'repetition_stats']
+TAINT_STATS = ['num_lines_of_type', 'num_tainted_lines',
+               'num_del_lines_giving_taint', 'num_sub_lines_giving_taint',
+               'num_ins_lines_giving_taint']
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="""This program does the work of modify_ctm_edits.py,
+        taint_ctm_edits.py and segment_ctm_edits.py (or
+        segment_ctm_edits_mild.py) in a single pass over the ctm-edits,
+        using several processes.  Options not listed here, and the positional
+        arguments <non-scored-words-file> <ctm-edits-in> <text-out>
+        <segments-out>, are passed to the segmentation script.  See comments
+        at the top of the script for more information.""")
+
+    parser.add_argument("--nj", type=int, default=4,
+                        help="Number of processes to use")
+    parser.add_argument("--batch-size", type=int, default=100,
+                        help="Number of utterances given to a process at a "
+                        "time")
+    parser.add_argument("--segmenter", type=str, default="default",
+                        choices=["default", "mild"],
+                        help="Segmentation to use: 'default' for "
+                        "segment_ctm_edits.py, 'mild' for "
+                        "segment_ctm_edits_mild.py")
+    parser.add_argument("--allow-repetitions", type=str, default='true',
+                        choices=['true', 'false'],
+                        help="Same as the option of modify_ctm_edits.py")
+    parser.add_argument("--remove-deletions", type=str, default="true",
+                        choices=["true", "false"],
+                        help="Same as the option of taint_ctm_edits.py")
+    parser.add_argument("--stats-verbose", type=int, default=1,
+                        choices=[0, 1, 2, 3],
+                        help="Verbose level of the statistics of the modify "
+                        "and taint stages, like the --verbose option of "
+                        "modify_ctm_edits.py and taint_ctm_edits.py (the "
+                        "--verbose option is that of the segmentation "
+                        "script)")
+    parser.add_argument("--modified-ctm-edits-out", type=str,
+                        help="If supplied, the ctm-edits after the modify "
+                        "stage (as written by modify_ctm_edits.py) are "
+                        "written to this file")
+    parser.add_argument("--tainted-ctm-edits-out", type=str,
+                        help="If supplied, the ctm-edits after the taint "
+                        "stage (as written by taint_ctm_edits.py) are "
+                        "written to this file")
+
+    args, segmenter_argv = parser.parse_known_args()
+
+    if args.nj < 1 or args.batch_size < 1:
+        raise ValueError("--nj and --batch-size must be positive")
+    args.allow_repetitions = bool(args.allow_repetitions == 'true')
+    args.remove_deletions = bool(args.remove_deletions == "true")
+
+    return args, segmenter_argv
+
+
+def read_utterances(ctm_edits_in):
+    """Yields (utterance-id, split-lines) pairs from a ctm-edits file, with
+    the lines of each utterance split into fields.  The lines of an utterance
+    are expected to be contiguous, as they are for the separate scripts."""
+    cur_utterance = None
+    split_lines_of_cur_utterance = []
+    for line in ctm_edits_in:
+        split_line = line.split()
+        if len(split_line) == 0:
+            sys.exit("cleanup_ctm_edits.py: got an empty or whitespace "
+                     "input line")
+        if split_line[0] != cur_utterance:
+            if len(split_lines_of_cur_utterance) > 0:
+                yield cur_utterance, split_lines_of_cur_utterance
+            cur_utterance = split_line[0]
+            split_lines_of_cur_utterance = []
+        split_lines_of_cur_utterance.append(split_line)
+    if cur_utterance is None:
+        sys.exit("cleanup_ctm_edits.py: empty input")
+    yield cur_utterance, split_lines_of_cur_utterance
+
+
+def get_batches(iterable, batch_size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+
+def open_file(filename, mode):
+    try:
+        return open(filename, mode)
+    except IOError:
+        sys.exit("cleanup_ctm_edits.py: error opening file "
+                 "{0}".format(filename))
+
+
+def reset_stats(namespace, names):
+    """Sets the statistics 'names' in the dict 'namespace' (the vars() of a
+    module or an object) to zero."""
+    for name in names:
+        if isinstance(namespace[name], dict):
+            namespace[name].clear()
+        else:
+            namespace[name] = 0
+
+
+def get_stats(namespace, names):
+    """Returns a copy of the statistics 'names' in 'namespace' that can be
+    passed between processes."""
+    return dict((name, dict(namespace[name])
+                 if isinstance(namespace[name], dict) else namespace[name])
+                for name in names)
+
+
+def add_stats(namespace, stats):
+    """Adds the statistics 'stats', as returned by get_stats(), to those in
+    'namespace'.  The counts in dicts may be numbers or lists of numbers."""
+    for name, value in stats.items():
+        if isinstance(value, dict):
+            total = namespace[name]
+            for key, count in value.items():
+                if isinstance(count, list):
+                    total[key] = [x + y for x, y in zip(
+                        total.get(key, [0] * len(count)), count)]
+                else:
+                    total[key] = total.get(key, 0) + count
+        else:
+            namespace[name] += value
+
+
+class DefaultSegmenter(object):
+    """The segmentation of segment_ctm_edits.py, whose options and statistics
+    are module-level variables of that script."""
+
+    def __init__(self, segmenter_argv):
+        segment_ctm_edits.ParseArgs(segmenter_argv)
+        self.args = segment_ctm_edits.args
+        self.ctm_edits_in = open_file(self.args.ctm_edits_in, 'r')
+        self.text_out = open_file(self.args.text_out, 'w')
+        self.segments_out = open_file(self.args.segments_out, 'w')
+        self.ctm_edits_out = None
+        if self.args.ctm_edits_out is not None:
+            self.ctm_edits_out = open_file(self.args.ctm_edits_out, 'w')
+
+    def stats(self):
+        return [('segment', vars(segment_ctm_edits),
+                 ['segment_total_length', 'num_segments', 'word_count_pair',
+                  'num_utterances', 'num_utterances_without_segments',
+                  'total_length_of_utterances'])]
+
+    def segment(self, utterance, split_lines_of_utt, text_out, segments_out,
+                ctm_edits_out):
+        (segments_for_utterance,
+         deleted_segments_for_utterance) = (
+             segment_ctm_edits.GetSegmentsForUtterance(split_lines_of_utt))
+        segment_ctm_edits.AccWordStatsForUtterance(split_lines_of_utt,
+                                                   segments_for_utterance)
+        segment_ctm_edits.WriteSegmentsForUtterance(
+            text_out, segments_out, utterance, segments_for_utterance)
+        if ctm_edits_out is not None:
+            segment_ctm_edits.PrintDebugInfoForUtterance(
+                ctm_edits_out, split_lines_of_utt, segments_for_utterance,
+                deleted_segments_for_utterance)
+
+    def print_stats(self):
+        segment_ctm_edits.PrintSegmentStats()
+        if self.args.word_stats_out is not None:
+            segment_ctm_edits.PrintWordStats(self.args.word_stats_out)
+        if self.args.ctm_edits_out is not None:
+            logger.info("detailed utterance-level debug information is "
+                        "in %s", self.args.ctm_edits_out)
+
+
+class MildSegmenter(object):
+    """The segmentation of segment_ctm_edits_mild.py."""
+
+    def __init__(self, segmenter_argv):
+        self.args = segment_ctm_edits_mild.get_args(segmenter_argv)
+        segment_ctm_edits_mild.read_non_scored_words(
+            self.args.non_scored_words_in)
+        self.oov_symbol = segment_ctm_edits_mild.read_oov_symbol(self.args)
+        self.ctm_edits_in = self.args.ctm_edits_in
+        self.text_out = self.args.text_out
+        self.segments_out = self.args.segments_out
+        self.ctm_edits_out = self.args.ctm_edits_out
+        self.utterance_stats = segment_ctm_edits_mild.UtteranceStats()
+        self.word_stats = segment_ctm_edits_mild.WordStats()
+
+    def stats(self):
+        return [('utterance', vars(self.utterance_stats),
+                 sorted(vars(self.utterance_stats).keys())),
+                ('word', vars(self.word_stats), ['word_count_pair'])]
+
+    def segment(self, utterance, split_lines_of_utt, text_out, segments_out,
+                ctm_edits_out):
+        (segments_for_utterance,
+         deleted_segments_for_utterance) = (
+             segment_ctm_edits_mild.get_segments_for_utterance(
+                 split_lines_of_utt, args=self.args,
+                 utterance_stats=self.utterance_stats))
+        self.word_stats.accumulate_for_utterance(split_lines_of_utt,
+                                                 segments_for_utterance)
+        segment_ctm_edits_mild.write_segments_for_utterance(
+            text_out, segments_out, utterance, segments_for_utterance,
+            oov_symbol=self.oov_symbol, frame_length=self.args.frame_length)
+        if ctm_edits_out is not None:
+            segment_ctm_edits_mild.print_debug_info_for_utterance(
+                ctm_edits_out, split_lines_of_utt, segments_for_utterance,
+                deleted_segments_for_utterance,
+                frame_length=self.args.frame_length)
+
+    def print_stats(self):
+        self.utterance_stats.print_segment_stats()
+        if self.args.word_stats_out is not None:
+            self.word_stats.print(self.args.word_stats_out)
+        if self.args.ctm_edits_out is not None:
+            logger.info("detailed utterance-level debug information is "
+                        "in %s", self.args.ctm_edits_out.name)
+
+
+class CtmEditsCleaner(object):
+    """Runs the modify, taint and segment stages on batches of utterances.
+
+    The stages keep their statistics in module-level variables (or, for
+    segment_ctm_edits_mild.py, in objects); process_batch() returns the
+    statistics of its batch with the outputs, so that the totals can be
+    accumulated in self.totals whichever process did the batch.
+    """
+
+    def __init__(self, args, segmenter_argv):
+        self.args = args
+        if args.segmenter == "mild":
+            self.segmenter = MildSegmenter(segmenter_argv)
+            non_scored_words = segment_ctm_edits_mild.non_scored_words()
+        else:
+            self.segmenter = DefaultSegmenter(segmenter_argv)
+            non_scored_words = segment_ctm_edits.non_scored_words
+        modify_ctm_edits.non_scored_words.update(non_scored_words)
+
+        self.modified_ctm_edits_out = None
+        if args.modified_ctm_edits_out is not None:
+            self.modified_ctm_edits_out = open_file(
+                args.modified_ctm_edits_out, 'w')
+        self.tainted_ctm_edits_out = None
+        if args.tainted_ctm_edits_out is not None:
+            self.tainted_ctm_edits_out = open_file(
+                args.tainted_ctm_edits_out, 'w')
+
+        self.totals = {}
+        for key, namespace, names in self.stats():
+            reset_stats(namespace, names)
+            self.totals[key] = get_stats(namespace, names)
+
+    def stats(self):
+        return ([('modify', vars(modify_ctm_edits), MODIFY_STATS),
+                 ('taint', vars(taint_ctm_edits), TAINT_STATS)]
+                + self.segmenter.stats())
+
+    def process_batch(self, batch):
+        """Runs all the stages on 'batch', a list of (utterance-id,
+        split-lines) pairs.  Returns a 2-tuple (outputs, stats), where
+        'outputs' maps the name of each output to the text to write to it for
+        this batch, and 'stats' the statistics of the batch."""
+        for key, namespace, names in self.stats():
+            reset_stats(namespace, names)
+        outputs = dict((name, io.StringIO()) for name in [
+            'modified', 'tainted', 'text', 'segments', 'ctm_edits'])
+        for utterance, split_lines_of_utt in batch:
+            try:
+                split_lines_of_utt = modify_ctm_edits.ProcessUtterance(
+                    split_lines_of_utt, self.args.allow_repetitions)
+                if self.modified_ctm_edits_out is not None:
+                    for split_line in split_lines_of_utt:
+                        print(' '.join(split_line), file=outputs['modified'])
+                split_lines_of_utt = taint_ctm_edits.ProcessUtterance(
+                    split_lines_of_utt, self.args.remove_deletions)
+                if self.tainted_ctm_edits_out is not None:
+                    for split_line in split_lines_of_utt:
+                        print(' '.join(split_line), file=outputs['tainted'])
+                # An utterance whose lines were all removed would not appear
+                # in the input of the segmentation script.
+                if len(split_lines_of_utt) == 0:
+                    continue
+                self.segmenter.segment(
+                    utterance, split_lines_of_utt, outputs['text'],
+                    outputs['segments'],
+                    (outputs['ctm_edits']
+                     if self.segmenter.ctm_edits_out is not None else None))
+            except Exception:
+                logger.error("Error with utterance %s", utterance)
+                raise
+        stats = dict((key, get_stats(namespace, names))
+                     for key, namespace, names in self.stats())
+        return (dict((name, output.getvalue())
+                     for name, output in outputs.items()), stats)
+
+    def write_batch(self, outputs, stats):
+        for name, handle in [('modified', self.modified_ctm_edits_out),
+                             ('tainted', self.tainted_ctm_edits_out),
+                             ('text', self.segmenter.text_out),
+                             ('segments', self.segmenter.segments_out),
+                             ('ctm_edits', self.segmenter.ctm_edits_out)]:
+            if handle is not None:
+                handle.write(outputs[name])
+        for key in stats:
+            add_stats(self.totals[key], stats[key])
+
+    def run(self):
+        batches = get_batches(read_utterances(self.segmenter.ctm_edits_in),
+                              self.args.batch_size)
+        if self.args.nj == 1:
+            for batch in batches:
+                self.write_batch(*self.process_batch(batch))
+            return
+
+        # The worker processes are forked, so they inherit this object and
+        # the state of the scripts (options, non-scored words) through
+        # _global_cleaner.  At most 2 * nj batches are in flight, so the
+        # input is not read much ahead of the output.
+        global _global_cleaner
+        _global_cleaner = self
+        pool = multiprocessing.Pool(self.args.nj)
+        try:
+            pending = collections.deque()
+            for batch in batches:
+                if len(pending) >= 2 * self.args.nj:
+                    self.write_batch(*pending.popleft().get())
+                pending.append(pool.apply_async(process_batch, (batch,)))
+            while len(pending) > 0:
+                self.write_batch(*pending.popleft().get())
+        except:
+            pool.terminate()
+            raise
+        pool.close()
+        pool.join()
+
+    def close(self):
+        try:
+            for handle in [self.modified_ctm_edits_out,
+                           self.tainted_ctm_edits_out,
+                           self.segmenter.text_out,
+                           self.segmenter.segments_out,
+                           self.segmenter.ctm_edits_out]:
+                if handle is not None:
+                    handle.close()
+        except IOError:
+            sys.exit("cleanup_ctm_edits.py: error closing one or more "
+                     "outputs (broken pipe or full disk?)")
+
+    def print_stats(self):
+        for key, namespace, names in self.stats():
+            reset_stats(namespace, names)
+            add_stats(namespace, self.totals[key])
+        modify_ctm_edits.PrintNonScoredStats(self.args.stats_verbose)
+        modify_ctm_edits.PrintRepetitionStats(self.args.stats_verbose)
+        taint_ctm_edits.PrintStats(self.args.stats_verbose)
+        self.segmenter.print_stats()
+
+
+_global_cleaner = None
+
+
+def process_batch(batch):
+    """Processes a batch in a worker process of the pool."""
+    try:
+        return _global_cleaner.process_batch(batch)
+    except SystemExit as e:
+        # The scripts report errors with sys.exit(), which would kill the
+        # worker instead of reaching the main process.
+        raise RuntimeError(str(e))
+
+
+def main():
+    args, segmenter_argv = get_args()
+    try:
+        cleaner = CtmEditsCleaner(args, segmenter_argv)
+        cleaner.run()
+        cleaner.close()
+        cleaner.print_stats()
+    except:
+        logger.error("Failed cleaning up the ctm-edits")
+        raise
+
+
+if __name__ == '__main__':
+    main()
@@ -7,13 +7,14 @@ from __future__ import print_function
 import sys
 import argparse
 import math
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
-parser = argparse.ArgumentParser(description="""
+parser = argparse.ArgumentParser(prog="make_one_biased_lm.py", description="""
 This script creates a biased language model suitable for alignment and
 data-cleanup purposes.   It reads (possibly multiple) lines of integerized text
 from the input and writes a text-form FST of a backoff language model to
-the standard output, to be piped into fstcompile.""")
+the standard output, to be piped into fstcompile.  It can also be imported as a
+module; see MakeBiasedLm().""")
 
 parser.add_argument("--word-disambig-symbol", type = int, required = True,
                     help = "Integer corresponding to the disambiguation "
@@ -39,12 +40,6 @@ parser.add_argument("--discounting-constant", type = float, default = 0.3,
 parser.add_argument("--verbose", type = int, default = 0,
                     choices=[0,1,2,3,4,5], help = "Verbose level")
 
-args = parser.parse_args()
-
-if args.verbose >= 1:
-    print(' '.join(sys.argv), file = sys.stderr)
-
-
 
 
 class NgramCounts:
@@ -72,6 +67,11 @@ class NgramCounts:
         # backoff_symbol is kind of a pseudo-word, it's used in keeping track of
         # the backoff counts in each state.
         self.backoff_symbol = -1
+        # The BackgroundLm given to AddTopWords(), and the top words that
+        # don't occur in the unigram state with their counts.
+        self.background = None
+        self.absent_top_words = []
+        self.absent_top_word_counts = []
         self.counts = []
         for n in range(ngram_order):
             # The 'lambda: defaultdict(float)' is an anonymous function taking
@@ -96,8 +96,8 @@ class NgramCounts:
         try:
             words = [self.bos_symbol] + [ int(x) for x in line.split() ] + [self.eos_symbol]
         except:
-            sys.exit("make_one_biased_lm.py: bad input line {0} (expected a sequence "
-                     "of integers)".format(line))
+            raise ValueError("make_one_biased_lm.py: bad input line {0} (expected a "
+                             "sequence of integers)".format(line))
 
         for n in range(1, len(words)):
             predicted_word = words[n]
@@ -105,15 +105,13 @@ class NgramCounts:
             history = tuple(words[history_start:n])
             self.AddCount(history, predicted_word, 1.0)
 
-    def AddRawCountsFromStandardInput(self):
+    # 'lines' is an iterable of strings, e.g. sys.stdin.
+    def AddRawCountsFromLines(self, lines, verbose = 0):
         lines_processed = 0
-        while True:
-            line = sys.stdin.readline()
-            if line == '':
-                break
+        for line in lines:
             self.AddRawCountsFromLine(line)
             lines_processed += 1
-        if lines_processed == 0 or args.verbose > 0:
+        if lines_processed == 0 or verbose > 0:
             print("make_one_biased_lm.py: processed {0} lines of input".format(
                     lines_processed), file = sys.stderr)
 
@@ -141,7 +139,7 @@ class NgramCounts:
         hist_to_total_count = self.GetHistToTotalCount()
         for n in reversed(range(2, self.ngram_order)):
             this_order_counts = self.counts[n]
-            for hist in this_order_counts.keys():
+            for hist in list(this_order_counts.keys()):
                 if hist_to_total_count[hist] < min_count:
                     # we need to completely back off this count.
                     word_to_count = this_order_counts[hist]
@@ -194,42 +192,37 @@ class NgramCounts:
         print('total count = {0}, excluding discount = {1}'.format(
                 total, total_excluding_backoff), file = sys.stderr)
 
-    def AddTopWords(self, top_words_file):
+    # 'background' is a BackgroundLm.  The top words that occur in the
+    # unigram state get their counts added here; the others are not added to
+    # the counts, but only to the total count of the unigram state (see
+    # GetTotalCountMap()), and GetFstLines() takes their arcs from
+    # 'background'.
+    def AddTopWords(self, background):
         empty_history = ()
         word_to_count = self.counts[0][empty_history]
         total = sum(word_to_count.values())
-        try:
-            f = open(top_words_file)
-        except:
-            sys.exit("make_one_biased_lm.py: error opening top-words file: "
-                     "--top-words=" + top_words_file)
-        while True:
-            line = f.readline()
-            if line == '':
-                break
-            try:
-                [ word_index, prob ] = line.split()
-                word_index = int(word_index)
-                prob = float(prob)
-                assert word_index > 0 and prob > 0.0
+        for word_index, prob in background.word_to_prob.items():
+            if word_index in word_to_count:
                 word_to_count[word_index] += prob * total
-            except Exception as e:
-                sys.exit("make_one_biased_lm.py: could not make sense of the "
-                         "line '{0}' in op-words file: {1} ".format(line, str(e)))
-        f.close()
+            else:
+                self.absent_top_words.append(word_index)
+                self.absent_top_word_counts.append(prob * total)
+        self.background = background
 
 
     def GetTotalCountMap(self):
-        # This function, called from PrintAsFst, returns a map from
+        # This function, called from GetFstLines, returns a map from
         # history to the total-count for that state.
         total_count_map = dict()
         for n in range(0, self.ngram_order):
             for hist, word_to_count in self.counts[n].items():
                 total_count_map[hist] = sum(word_to_count.values())
+        for count in self.absent_top_word_counts:
+            total_count_map[()] += count
         return total_count_map
 
     def GetHistToStateMap(self):
-        # This function, called from PrintAsFst, returns a map from
+        # This function, called from GetFstLines, returns a map from
         # history to integer FST-state.
         hist_to_state = dict()
         fst_state_counter = 0
@@ -249,8 +242,9 @@ class NgramCounts:
             prob += backoff_prob * prob_in_backoff
         return prob
 
-    # This function prints the estimated language model as an FST.
-    def PrintAsFst(self, word_disambig_symbol):
+    # This function returns the estimated language model as a list of lines
+    # of a text-form FST.
+    def GetFstLines(self, word_disambig_symbol):
         # n is the history-length (== order + 1).  We iterate over the
         # history-length in the order 1, 0, 2, 3, and then iterate over the
         # histories of each order in sorted order.  Putting order 1 first
@@ -261,8 +255,9 @@ class NgramCounts:
         # History will map from history (as a tuple) to integer FST-state.
         hist_to_state = self.GetHistToStateMap()
         total_count_map = self.GetTotalCountMap()
+        lines = []
 
-        for n in [ 1, 0 ] + range(2, self.ngram_order):
+        for n in [ 1, 0 ] + list(range(2, self.ngram_order)):
             this_order_counts = self.counts[n]
             # For order 1, make sure the keys are sorted.
             keys = this_order_counts.keys() if n != 1 else sorted(this_order_counts.keys())
@@ -279,34 +274,111 @@ class NgramCounts:
                         while not next_hist in hist_to_state:
                             next_hist = next_hist[1:]
                         next_fst_state = hist_to_state[next_hist]
-                        print(this_fst_state, next_fst_state, word, word,
-                              this_cost)
+                        fields = [this_fst_state, next_fst_state, word, word,
+                                  this_cost]
                     elif word == self.eos_symbol:
                         # print final-prob for this state.
-                        print(this_fst_state, this_cost)
+                        fields = [this_fst_state, this_cost]
                     else:
                         assert word == self.backoff_symbol
                         backoff_fst_state = hist_to_state[hist[1:len(hist)]]
-                        print(this_fst_state, backoff_fst_state,
-                              word_disambig_symbol, 0, this_cost)
-
-
-ngram_counts = NgramCounts(args.ngram_order)
-ngram_counts.AddRawCountsFromStandardInput()
-
-if args.verbose >= 3:
-    ngram_counts.Print("Raw counts:")
-ngram_counts.CompletelyDiscountLowCountStates(args.min_lm_state_count)
-if args.verbose >= 3:
-    ngram_counts.Print("Counts after discounting low-count states:")
-ngram_counts.ApplyBackoff(args.discounting_constant)
-if args.verbose >= 3:
-    ngram_counts.Print("Counts after applying Kneser-Ney discounting:")
-if args.top_words != None:
-    ngram_counts.AddTopWords(args.top_words)
+                        fields = [this_fst_state, backoff_fst_state,
+                                  word_disambig_symbol, 0, this_cost]
+                    lines.append(' '.join([ str(x) for x in fields ]))
+                if hist == () and len(self.absent_top_words) > 0:
+                    assert this_fst_state == 0
+                    absent_word_lines = self.background.absent_word_lines
+                    lines.extend([ absent_word_lines[word]
+                                   for word in self.absent_top_words ])
+        return lines
+
+
+# This class holds the part of the biased LMs that comes from the top words
+# (see the --top-words option) and doesn't depend on the text: a top word that
+# doesn't occur in the text gets an arc with cost -log(prob / (1 + total_prob))
+# from the unigram state (state 0) to itself, where 'total_prob' is the sum of
+# the probabilities of the top words.  Programs that build many LMs, like
+# make_biased_lms.py, create it once and share it between the LMs, so the
+# work per LM only depends on the LM's own n-grams.
+class BackgroundLm:
+    # 'top_words' is a list of (word, prob) pairs, as returned by
+    # ReadTopWords().
+    def __init__(self, top_words):
+        self.word_to_prob = OrderedDict()
+        for word, prob in top_words:
+            self.word_to_prob[word] = self.word_to_prob.get(word, 0.0) + prob
+        total_prob = sum(self.word_to_prob.values())
+        self.absent_word_lines = dict()
+        for word, prob in self.word_to_prob.items():
+            this_cost = -math.log(prob / (1.0 + total_prob))
+            self.absent_word_lines[word] = ' '.join(
+                [ str(x) for x in [0, 0, word, word, this_cost] ])
+
+
+# This function reads the file given to the --top-words option, with lines
+# '<integer-id-of-word> <prob>', and returns a list of (word, prob) pairs.
+def ReadTopWords(top_words_file):
+    try:
+        f = open(top_words_file)
+    except:
+        raise ValueError("make_one_biased_lm.py: error opening top-words file: "
+                         "--top-words=" + top_words_file)
+    top_words = []
+    for line in f:
+        try:
+            [ word_index, prob ] = line.split()
+            word_index = int(word_index)
+            prob = float(prob)
+            assert word_index > 0 and prob > 0.0
+            top_words.append((word_index, prob))
+        except Exception as e:
+            raise ValueError("make_one_biased_lm.py: could not make sense of the "
+                             "line '{0}' in op-words file: {1} ".format(line, str(e)))
+    f.close()
+    return top_words
+
+
+# This function estimates the biased LM from 'lines' (an iterable of strings
+# containing sequences of integer word-ids) and returns it as a list of lines
+# of a text-form FST.  'args' contains the options of this script, e.g. as
+# returned by parser.parse_args(); 'background', if not None, is the
+# BackgroundLm of the top words, which callers that build many LMs can create
+# just once (otherwise it's created from args.top_words, if set).
+def MakeBiasedLm(lines, args, background = None):
+    ngram_counts = NgramCounts(args.ngram_order)
+    ngram_counts.AddRawCountsFromLines(lines, args.verbose)
+
+    if args.verbose >= 3:
+        ngram_counts.Print("Raw counts:")
+    ngram_counts.CompletelyDiscountLowCountStates(args.min_lm_state_count)
+    if args.verbose >= 3:
+        ngram_counts.Print("Counts after discounting low-count states:")
+    ngram_counts.ApplyBackoff(args.discounting_constant)
     if args.verbose >= 3:
-        ngram_counts.Print("Counts after applying top-n-words")
-ngram_counts.PrintAsFst(args.word_disambig_symbol)
+        ngram_counts.Print("Counts after applying Kneser-Ney discounting:")
+    if background is None and args.top_words != None:
+        background = BackgroundLm(ReadTopWords(args.top_words))
+    if background is not None:
+        ngram_counts.AddTopWords(background)
+        if args.verbose >= 3:
+            ngram_counts.Print("Counts after applying top-n-words")
+    return ngram_counts.GetFstLines(args.word_disambig_symbol)
+
+
+def Main():
+    args = parser.parse_args()
+    if args.verbose >= 1:
+        print(' '.join(sys.argv), file = sys.stderr)
+    try:
+        lines = MakeBiasedLm(sys.stdin, args)
+    except ValueError as e:
+        sys.exit(str(e))
+    for line in lines:
+        print(line)
+
+
+if __name__ == "__main__":
+    Main()
 
 
 # test comand:
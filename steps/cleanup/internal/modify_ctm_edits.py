@@ -98,8 +98,6 @@ parser.add_argument("ctm_edits_out", metavar = "<ctm-edits-out>",
                     help = "Filename of output ctm-edits file. "
                     "Use /dev/stdout for standard output.")
 
-args = parser.parse_args()
-
 
 
 def ReadNonScoredWords(non_scored_words_file):
@@ -304,13 +302,13 @@ def ProcessUtteranceForRepetitions(split_lines_of_utt):
 # note: split_lines_of_utt is a list of lists, one per line, each containing the
 # sequence of fields.
 # Returns the same format of data after processing.
-def ProcessUtterance(split_lines_of_utt):
+def ProcessUtterance(split_lines_of_utt, allow_repetitions=True):
     new_split_lines_of_utt = []
     for split_line in split_lines_of_utt:
         new_split_line = ProcessLineForNonScoredWords(split_line)
         if new_split_line != []:
             new_split_lines_of_utt.append(new_split_line)
-    if args.allow_repetitions == 'true':
+    if allow_repetitions:
         new_split_lines_of_utt = ProcessUtteranceForRepetitions(new_split_lines_of_utt)
     return new_split_lines_of_utt
 
@@ -343,7 +341,8 @@ def ProcessData():
 
     while True:
         if len(split_pending_line) == 0 or split_pending_line[0] != cur_utterance:
-            split_lines_of_cur_utterance = ProcessUtterance(split_lines_of_cur_utterance)
+            split_lines_of_cur_utterance = ProcessUtterance(
+                split_lines_of_cur_utterance, args.allow_repetitions == 'true')
             for split_line in split_lines_of_cur_utterance:
                 print(' '.join(split_line), file = f_out)
             split_lines_of_cur_utterance = []
@@ -364,8 +363,8 @@ def ProcessData():
         sys.exit("modify_ctm_edits.py: error closing ctm-edits output "
                  "(broken pipe or full disk?)")
 
-def PrintNonScoredStats():
-    if args.verbose < 1:
+def PrintNonScoredStats(verbose=1):
+    if verbose < 1:
         return
     if num_lines == 0:
         print("modify_ctm_edits.py: processed no input.", file = sys.stderr)
@@ -383,7 +382,7 @@ def PrintNonScoredStats():
 
     keys = sorted(ref_change_stats.keys(), reverse=True,
                   key = lambda x: ref_change_stats[x])
-    num_keys_to_print = 40 if args.verbose >= 2 else 10
+    num_keys_to_print = 40 if verbose >= 2 else 10
 
     print("modify_ctm_edits.py: most common edits (as percentages "
           "of all such edits) are:\n" +
@@ -393,8 +392,8 @@ def PrintNonScoredStats():
           file = sys.stderr)
 
 
-def PrintRepetitionStats():
-    if args.verbose < 1 or sum(repetition_stats.values()) == 0:
+def PrintRepetitionStats(verbose=1):
+    if verbose < 1 or sum(repetition_stats.values()) == 0:
         return
     num_lines_modified = sum(repetition_stats.values())
     num_incorrect_lines = num_lines - num_correct_lines
@@ -410,7 +409,7 @@ def PrintRepetitionStats():
 
     keys = sorted(repetition_stats.keys(), reverse=True,
                   key = lambda x: repetition_stats[x])
-    num_keys_to_print = 40 if args.verbose >= 2 else 10
+    num_keys_to_print = 40 if verbose >= 2 else 10
 
     print("modify_ctm_edits.py: most common repetitions inserted into reference (as percentages "
           "of all words fixed in this way) are:\n" +
@@ -421,7 +420,6 @@ def PrintRepetitionStats():
 
 
 non_scored_words = set()
-ReadNonScoredWords(args.non_scored_words_in)
 
 num_lines = 0
 num_correct_lines = 0
@@ -435,6 +433,15 @@ ref_change_stats = defaultdict(int)
 # in allowing repetitions.
 repetition_stats = defaultdict(int)
 
-ProcessData()
-PrintNonScoredStats()
-PrintRepetitionStats()
+
+def main():
+    global args
+    args = parser.parse_args()
+    ReadNonScoredWords(args.non_scored_words_in)
+    ProcessData()
+    PrintNonScoredStats(args.verbose)
+    PrintRepetitionStats(args.verbose)
+
+
+if __name__ == "__main__":
+    main()
@@ -109,8 +109,6 @@ parser.add_argument("segments_out", metavar = "<segments-out>",
                     "but instead of <recording-id>, the second field is the old utterance-id, i.e "
                     "<new-utterance-id> <old-utterance-id> <start-time> <end-time>")
 
-args = parser.parse_args()
-
 
 
 
@@ -1008,23 +1006,35 @@ def ReadNonScoredWords(non_scored_words_file):
 
 
 
-non_scored_words = set()
-ReadNonScoredWords(args.non_scored_words_in)
-
-oov_symbol = None
-if args.oov_symbol_file != None:
+def ReadOovSymbol(oov_symbol_file):
+    global oov_symbol
     try:
-        with open(args.oov_symbol_file) as f:
+        with open(oov_symbol_file) as f:
             line = f.readline()
             assert len(line.split()) == 1
             oov_symbol = line.split()[0]
             assert f.readline() == ''
     except Exception as e:
         sys.exit("segment_ctm_edits.py: error reading file --oov-symbol-file=" +
-                 args.oov_symbol_file + ", error is: " + str(e))
-elif args.unk_padding != 0.0:
-    sys.exit("segment_ctm_edits.py: if the --unk-padding option is nonzero (which "
-             "it is by default, the --oov-symbol-file option must be supplied.")
+                 oov_symbol_file + ", error is: " + str(e))
+
+
+# This parses the command line 'argv' (sys.argv[1:] if None) into the global
+# 'args' and reads the files it names that the segmentation depends on.  It is
+# also called by cleanup_ctm_edits.py, which does the segmentation in-process.
+def ParseArgs(argv = None):
+    global args
+    args = parser.parse_args(argv)
+    ReadNonScoredWords(args.non_scored_words_in)
+    if args.oov_symbol_file != None:
+        ReadOovSymbol(args.oov_symbol_file)
+    elif args.unk_padding != 0.0:
+        sys.exit("segment_ctm_edits.py: if the --unk-padding option is nonzero (which "
+                 "it is by default, the --oov-symbol-file option must be supplied.")
+
+
+non_scored_words = set()
+oov_symbol = None
 
 # segment_total_length and num_segments are maps from
 # 'stage' strings; see AccumulateSegmentStats for details.
@@ -1038,11 +1048,16 @@ num_utterances_without_segments = 0
 total_length_of_utterances = 0
 
 
-ProcessData()
-PrintSegmentStats()
-if args.word_stats_out != None:
-    PrintWordStats(args.word_stats_out)
-if args.ctm_edits_out != None:
-    print("segment_ctm_edits.py: detailed utterance-level debug information "
-          "is in " + args.ctm_edits_out, file = sys.stderr)
+def main():
+    ParseArgs()
+    ProcessData()
+    PrintSegmentStats()
+    if args.word_stats_out != None:
+        PrintWordStats(args.word_stats_out)
+    if args.ctm_edits_out != None:
+        print("segment_ctm_edits.py: detailed utterance-level debug information "
+              "is in " + args.ctm_edits_out, file = sys.stderr)
+
 
+if __name__ == "__main__":
+    main()
@@ -37,14 +37,17 @@ _global_formatter = logging.Formatter(
 _global_handler.setFormatter(_global_formatter)
 _global_logger.addHandler(_global_handler)
 
-_global_non_scored_words = {}
+_global_non_scored_words = set()
+
+# Number of decimals kept in lengths computed from cumulative sums.
+LENGTH_PRECISION = 6
 
 
 def non_scored_words():
     return _global_non_scored_words
 
 
-def get_args():
+def get_args(argv=None):
     parser = argparse.ArgumentParser(
         description="""This program produces segmentation and text information
         based on reading ctm-edits input format which is produced by
@@ -232,7 +235,7 @@ def get_args():
     parser.add_argument("--verbose", type=int, default=0,
                         help="Use higher verbosity for more debugging output")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     if args.verbose > 2:
         _global_handler.setLevel(logging.DEBUG)
@@ -345,6 +348,31 @@ class SegmentStats(object):
             raise RuntimeError("Error in segment stats {0}".format(self))
         return proportion
 
+    def accumulate_line(self, split_line_of_utt):
+        """Adds the contribution of a single ctm-edits line to the stats,
+        except for total_length, which depends on the segment boundaries."""
+        this_duration = float(split_line_of_utt[3])
+        if split_line_of_utt[7] not in ['cor', 'fix', 'sil']:
+            # TODO(vimal): The commented part below is is apparently
+            # not true in modify_ctm_edits.py.
+            # Need to check this or change comments there.
+            # assert (split_line_of_utt[6] not in non_scored_words)
+            assert not is_tainted(split_line_of_utt)
+            self.num_incorrect_words += 1
+            self.incorrect_words_length += this_duration
+        if split_line_of_utt[7] == 'sil':
+            self.silence_length += this_duration
+        else:
+            if split_line_of_utt[6] not in non_scored_words():
+                self.num_words += 1
+        if (is_tainted(split_line_of_utt)
+                and split_line_of_utt[7] not in 'sil'
+                and split_line_of_utt[6] not in non_scored_words()):
+            # If ref_word is not a non-scored word, this would be
+            # counted as an incorrect word.
+            self.num_tainted_words += 1
+            self.tainted_nonsilence_length += this_duration
+
     def combine(self, other, scale=1):
         """Merges this stats with another stats object."""
         self.num_incorrect_words += scale * other.num_incorrect_words
@@ -406,6 +434,64 @@ class SegmentStats(object):
                     total_length=self.total_length))
 
 
+class CumulativeSegmentStats(object):
+    """Prefix sums of the per-line stats of an utterance, so that the stats
+    of any range of ctm-edits lines can be obtained in constant time without
+    creating a Segment. Element i of each list is the sum over the first i
+    lines.
+    """
+
+    def __init__(self, split_lines_of_utt):
+        stats = SegmentStats()
+        self.num_incorrect_words = [0]
+        self.num_tainted_words = [0]
+        self.incorrect_words_length = [0]
+        self.tainted_nonsilence_length = [0]
+        self.silence_length = [0]
+        self.num_words = [0]
+        for split_line in split_lines_of_utt:
+            try:
+                stats.accumulate_line(split_line)
+            except Exception:
+                _global_logger.error(
+                    "Something went wrong when computing stats at "
+                    "ctm line %s", split_line)
+                raise
+            self.num_incorrect_words.append(stats.num_incorrect_words)
+            self.num_tainted_words.append(stats.num_tainted_words)
+            self.incorrect_words_length.append(stats.incorrect_words_length)
+            self.tainted_nonsilence_length.append(
+                stats.tainted_nonsilence_length)
+            self.silence_length.append(stats.silence_length)
+            self.num_words.append(stats.num_words)
+
+    def get_stats(self, start_index, end_index, total_length):
+        """Returns the stats of lines start_index ... end_index - 1, for a
+        segment of length 'total_length'."""
+        # The lengths are differences of sums over the whole utterance; they
+        # are rounded to remove the rounding errors of those sums, which would
+        # otherwise make the comparisons with the thresholds depend on the
+        # position of the segment in the utterance.
+        stats = SegmentStats()
+        stats.num_incorrect_words = (self.num_incorrect_words[end_index]
+                                     - self.num_incorrect_words[start_index])
+        stats.num_tainted_words = (self.num_tainted_words[end_index]
+                                   - self.num_tainted_words[start_index])
+        stats.incorrect_words_length = round(
+            self.incorrect_words_length[end_index]
+            - self.incorrect_words_length[start_index], LENGTH_PRECISION)
+        stats.tainted_nonsilence_length = round(
+            self.tainted_nonsilence_length[end_index]
+            - self.tainted_nonsilence_length[start_index], LENGTH_PRECISION)
+        stats.silence_length = round(self.silence_length[end_index]
+                                     - self.silence_length[start_index],
+                                     LENGTH_PRECISION)
+        stats.num_words = (self.num_words[end_index]
+                           - self.num_words[start_index])
+        stats.total_length = round(total_length, LENGTH_PRECISION)
+        return stats
+
+
 class Segment(object):
     """Class to store segments."""
 
@@ -475,7 +561,6 @@ class Segment(object):
         """
         self.stats = SegmentStats()
         for i in range(self.start_index, self.end_index):
-            this_duration = float(self.split_lines_of_utt[i][3])
             assert self.start_keep_proportion == 1.0
             assert self.end_keep_proportion == 1.0
             # TODO(vimal): Decide if keep proportion must be applied
@@ -488,29 +573,7 @@ class Segment(object):
                 assert self.start_keep_proportion == self.end_keep_proportion
 
             try:
-                if self.split_lines_of_utt[i][7] not in ['cor', 'fix', 'sil']:
-                    # TODO(vimal): The commented part below is is apparently
-                    # not true in modify_ctm_edits.py.
-                    # Need to check this or change comments there.
-                    # assert (self.split_lines_of_utt[i][6]
-                    #         not in non_scored_words)
-                    assert not is_tainted(self.split_lines_of_utt[i])
-                    self.stats.num_incorrect_words += 1
-                    self.stats.incorrect_words_length += this_duration
-                if self.split_lines_of_utt[i][7] == 'sil':
-                    self.stats.silence_length += this_duration
-                else:
-                    if (self.split_lines_of_utt[i][6]
-                            not in non_scored_words()):
-                        self.stats.num_words += 1
-                if (is_tainted(self.split_lines_of_utt[i])
-                        and self.split_lines_of_utt[i][7] not in 'sil'
-                        and (self.split_lines_of_utt[i][6]
-                             not in non_scored_words())):
-                    # If ref_word is not a non-scored word, this would be
-                    # counted as an incorrect word.
-                    self.stats.num_tainted_words += 1
-                    self.stats.tainted_nonsilence_length += this_duration
+                self.stats.accumulate_line(self.split_lines_of_utt[i])
             except Exception:
                 _global_logger.error(
                     "Something went wrong when computing stats at "
@@ -1197,13 +1260,27 @@ class SegmentsMerger(object):
     appropriate statistics required for this process in objects of
     SegmentStats class.
 
+    The stats of a candidate cluster are computed from prefix sums over the
+    lines of the utterance and over the segment boundaries, so that trying
+    a merge does not create any Segment objects; the merged Segment is only
+    created when a merge is accepted.
+
     Paramters:
         segments - a reference to the list of inital segments
-        merged_segments - stores all the initial segments as well
-                          as the newly created segments
+        merged_segments - stores the segments of the current clusters,
+                          i.e. the initial segments that have not been
+                          merged and the segments created by merging
         between_segments - stores the inter-segment "segments"
                            for the initial segments
         split_lines_of_utt - a reference to the CTM lines
+        line_stats - prefix sums of the stats of the CTM lines
+        cumulative_lengths - cumulative_lengths[k] is the total length of
+                             the segments before segment k plus their
+                             join_lengths
+        join_lengths - join_lengths[k] is the length added when merging
+                       segment k with segment k - 1: the length of the
+                       inter-segment "segment" between them, minus the
+                       duration of the line they share, if any
     """
 
     def __init__(self, segments):
@@ -1217,6 +1294,9 @@ class SegmentsMerger(object):
 
         self.merged_segments = {}
         self.between_segments = [None for i in range(len(segments) + 1)]
+        self.line_stats = CumulativeSegmentStats(self.split_lines_of_utt)
+        self.join_lengths = [0 for i in range(len(segments))]
+        self.cumulative_lengths = [0]
 
         if segments[0].start_index > 0:
             self.between_segments[0] = Segment(
@@ -1225,178 +1305,217 @@ class SegmentsMerger(object):
 
         for i, x in enumerate(segments):
             x.compute_stats()
-            self.merged_segments[(i, )] = x
+            self.merged_segments[(i, i)] = x
 
             if i > 0 and segments[i].start_index > segments[i - 1].end_index:
                 self.between_segments[i] = Segment(
                     self.split_lines_of_utt, segments[i - 1].end_index,
                     segments[i].start_index, compute_segment_stats=True)
+                self.join_lengths[i] = (
+                    self.between_segments[i].stats.total_length)
+            elif (i > 0 and segments[i - 1].end_index
+                  == segments[i].start_index + 1):
+                # The segments share a line, which is only counted once.
+                self.join_lengths[i] = -float(
+                    self.split_lines_of_utt[segments[i].start_index][3])
+            self.cumulative_lengths.append(self.cumulative_lengths[-1]
+                                           + x.stats.total_length
+                                           + self.join_lengths[i])
 
         if segments[-1].end_index < len(self.split_lines_of_utt):
             self.between_segments[-1] = Segment(
                 self.split_lines_of_utt, segments[-1].end_index,
                 len(self.split_lines_of_utt), compute_segment_stats=True)
 
-    def _get_merged_cluster(self, cluster1, cluster2, rejected_clusters=None,
-                            max_intersegment_incorrect_words_length=1):
-        try:
-            assert cluster2[0] > cluster1[-1]
-            new_cluster = cluster1 + cluster2
-            new_cluster_tup = tuple(new_cluster)
-
-            if (rejected_clusters is not None
-                    and new_cluster_tup in rejected_clusters):
-                return (None, new_cluster, True)
-
-            if new_cluster_tup in self.merged_segments:
-                return (self.merged_segments[new_cluster_tup],
-                        new_cluster, False)
-
-            if cluster1[-1] == -1:
-                assert len(cluster1) == 1
-                # Consider merging cluster2 with the region before the 0^th
-                # segment
-                if (self.between_segments[0] is None
-                        or self.between_segments[0].stats.total_length == 0
-                        or (self.between_segments[0]
+    def _get_cluster_stats(self, first, last):
+        """Returns the stats of the segment that merging the clusters
+        first ... last would produce, in constant time. The clusters are
+        segment indexes, where -1 and len(self.segments) stand for the regions
+        before the first and after the last segment."""
+        num_segments = len(self.segments)
+        first_segment = max(first, 0)
+        last_segment = min(last, num_segments - 1)
+        total_length = (self.cumulative_lengths[last_segment + 1]
+                        - self.cumulative_lengths[first_segment]
+                        - self.join_lengths[first_segment])
+        if first == -1:
+            start_index = 0
+            total_length += self.between_segments[0].stats.total_length
+        else:
+            start_index = self.segments[first_segment].start_index
+        if last == num_segments:
+            end_index = len(self.split_lines_of_utt)
+            total_length += self.between_segments[-1].stats.total_length
+        else:
+            end_index = self.segments[last_segment].end_index
+        return self.line_stats.get_stats(start_index, end_index,
+                                         total_length)
+
+    def _get_merged_cluster_stats(self, start, end, next_end,
+                                  max_intersegment_incorrect_words_length=1):
+        """Returns the stats of the segment obtained by merging the adjacent
+        clusters start ... end and end + 1 ... next_end, or None if the merge
+        is rejected because of the region between them."""
+        assert next_end > end >= start
+        if end == -1:
+            # Consider merging the next cluster with the region before the
+            # 0^th segment
+            if (self.between_segments[0] is None
+                    or self.between_segments[0].stats.total_length == 0
+                    or (self.between_segments[0]
+                        .stats.incorrect_words_length
+                        > max_intersegment_incorrect_words_length)):
+                # Reject zero length or bad start region
+                return None
+        else:
+            if end + 1 == len(self.segments):
+                assert next_end == end + 1
+                if (self.between_segments[-1] is None
+                        or (self.between_segments[-1]
+                            .stats.total_length == 0)
+                        or (self.between_segments[-1]
                             .stats.incorrect_words_length
                             > max_intersegment_incorrect_words_length)):
-                    # Reject zero length or bad start region
-                    return (None, new_cluster, True)
+                    # Reject zero length or bad end region
+                    return None
+            if (self.between_segments[end + 1] is not None
+                    and (self.between_segments[end + 1]
+                         .stats.incorrect_words_length
+                         > max_intersegment_incorrect_words_length)):
+                return None
+
+        return self._get_cluster_stats(start, next_end)
+
+    def _merge_clusters(self, start, end, next_end):
+        """Creates the Segment for the merge of the adjacent clusters
+        start ... end and end + 1 ... next_end, which replaces theirs in
+        self.merged_segments, and returns it."""
+        try:
+            if end == -1:
                 merged_segment = self.between_segments[0].copy()
             else:
-                merged_segment = self.merged_segments[tuple(cluster1)].copy()
-
-                if cluster2[0] == len(self.segments):
-                    assert len(cluster2) == 1
-                    if (self.between_segments[-1] is None
-                            or (self.between_segments[-1]
-                                .stats.total_length == 0)
-                            or (self.between_segments[-1]
-                                .stats.incorrect_words_length
-                                > max_intersegment_incorrect_words_length)):
-                        # Reject zero length or bad end region
-                        return (None, new_cluster, True)
-                if self.between_segments[cluster2[0]] is not None:
-                    if (self.between_segments[cluster2[0]]
-                            .stats.incorrect_words_length
-                            > max_intersegment_incorrect_words_length):
-                        return (None, new_cluster, True)
+                merged_segment = self.merged_segments.pop(
+                    (start, end)).copy()
+                if self.between_segments[end + 1] is not None:
                     merged_segment.merge_adjacent_segment(
-                        self.between_segments[cluster2[0]])
+                        self.between_segments[end + 1])
 
-            if cluster2[0] < len(self.segments):
+            if end + 1 < len(self.segments):
                 merged_segment.merge_adjacent_segment(
-                    self.merged_segments[tuple(cluster2)])
+                    self.merged_segments.pop((end + 1, next_end)))
             # else:
             # Already done
             # merged_segment.merge_adjacent_segment(self.between_segments[-1])
 
-            self.merged_segments[new_cluster_tup] = merged_segment
-            return (merged_segment, new_cluster, False)
+            self.merged_segments[(start, next_end)] = merged_segment
+            return merged_segment
         except:
-            _global_logger.error("Failed merging cluster1 %s and cluster2 %s",
-                                 cluster1, cluster2)
-            for i in (cluster1 + cluster2):
-                if i >= 0 and i < len(self.segments):
-                    _global_logger.error("Segment %d = %s", i,
-                                         self.segments[i])
+            _global_logger.error("Failed merging clusters %d-%d and %d-%d",
+                                 start, end, end + 1, next_end)
+            for i in range(max(start, 0), min(next_end + 1,
+                                              len(self.segments))):
+                _global_logger.error("Segment %d = %s", i, self.segments[i])
             raise
 
     def merge_clusters(self, scoring_function,
                        max_wer=10, max_bad_proportion=0.3,
                        max_segment_length=10,
                        max_intersegment_incorrect_words_length=1):
+        """Does agglomerative clustering of the segments: repeatedly merges
+        the pair of neighboring clusters whose merged segment has the best
+        score according to scoring_function, among the pairs whose merged
+        segment satisfies max_wer, max_bad_proportion and max_segment_length.
+        scoring_function is called with the SegmentStats of the merged
+        segment.
+
+        The clusters are contiguous ranges of segment indexes, where -1 and
+        len(self.segments) stand for the regions before the first and after
+        the last segment. The candidate pairs are kept in a single heap;
+        after a merge only the two pairs formed with the neighbors of the new
+        cluster are scored, and heap entries of pairs that no longer exist
+        are skipped when they are popped. A rejected pair is dropped for
+        good, as clusters only grow and the same pair cannot occur again.
+        Ties between scores are broken in favor of the leftmost pair.
+
+        Returns the list of clusters, each a list of segment indexes; the
+        segment of a cluster is self.merged_segments[(first, last)].
+        """
         for i, x in enumerate(self.segments):
             _global_logger.debug("before agglomerative clustering, segment %d"
                                  " = %s", i, x)
 
-        # Initial clusters are the individual segments themselves.
-        clusters = [[x] for x in range(-1, len(self.segments) + 1)]
-
-        rejected_clusters = set()
-
-        while len(clusters) > 1:
-            try:
-                _global_logger.debug("Current clusters: %s", clusters)
-
-                heap = []
-
-                for i in range(len(clusters) - 1):
-                    merged_segment, new_cluster, reject = (
-                        self._get_merged_cluster(
-                            clusters[i], clusters[i + 1], rejected_clusters,
-                            max_intersegment_incorrect_words_length=(
-                                max_intersegment_incorrect_words_length)))
-                    if reject:
-                        rejected_clusters.add(tuple(new_cluster))
-                        continue
+        last_index = len(self.segments)
 
-                    heapq.heappush(heap, (-scoring_function(merged_segment),
-                                          (merged_segment, i, new_cluster)))
-
-                candidate_index = -1
-                candidate_cluster = None
-
-                while True:
-                    try:
-                        score, tup = heapq.heappop(heap)
-                    except IndexError:
-                        break
-
-                    segment, index, cluster = tup
-
-                    _global_logger.debug(
-                        "Considering new cluster: (%d, %s)", index, cluster)
-
-                    if segment.stats.wer() > max_wer:
-                        _global_logger.debug(
-                            "Rejecting cluster with "
-                            "WER%% %.2f > %.2f", segment.stats.wer(), max_wer)
-                        rejected_clusters.add(tuple(cluster))
-                        continue
-
-                    if segment.stats.bad_proportion() > max_bad_proportion:
-                        _global_logger.debug(
-                            "Rejecting cluster with bad-proportion "
-                            "%.2f > %.2f", segment.stats.bad_proportion(),
-                            max_bad_proportion)
-                        rejected_clusters.add(tuple(cluster))
-                        continue
-
-                    if segment.stats.total_length > max_segment_length:
-                        _global_logger.debug(
-                            "Rejecting cluster with length "
-                            "%.2f > %.2f", segment.stats.total_length,
-                            max_segment_length)
-                        rejected_clusters.add(tuple(cluster))
-                        continue
-
-                    candidate_index, candidate_cluster = tup[1:]
-                    _global_logger.debug("Accepted cluster (%d, %s)",
-                                         candidate_index, candidate_cluster)
-                    break
+        # Initial clusters are the individual segments themselves.
+        # cluster_end[start] is the last index of the cluster starting at
+        # 'start' and cluster_prev[start] the start of the cluster before it.
+        cluster_end = dict((x, x) for x in range(-1, last_index + 1))
+        cluster_prev = dict((x, x - 1) for x in range(-1, last_index + 1))
+
+        heap = []
+
+        def push_candidate(start):
+            if start < -1 or cluster_end[start] == last_index:
+                return
+            end = cluster_end[start]
+            next_end = cluster_end[end + 1]
+            stats = self._get_merged_cluster_stats(
+                start, end, next_end,
+                max_intersegment_incorrect_words_length=(
+                    max_intersegment_incorrect_words_length))
+            if stats is None:
+                return
+            heapq.heappush(heap, (-scoring_function(stats),
+                                  start, end, next_end, stats))
+
+        for start in range(-1, last_index):
+            push_candidate(start)
+
+        while heap:
+            score, start, end, next_end, stats = heapq.heappop(heap)
+            if (cluster_end.get(start) != end
+                    or cluster_end.get(end + 1) != next_end):
+                # One of the clusters has been merged since this pair was
+                # scored.
+                continue
 
-                if candidate_index == -1:
-                    return clusters
+            _global_logger.debug(
+                "Considering new cluster: %d-%d", start, next_end)
 
-                new_clusters = []
+            if stats.wer() > max_wer:
+                _global_logger.debug(
+                    "Rejecting cluster with "
+                    "WER%% %.2f > %.2f", stats.wer(), max_wer)
+                continue
 
-                for i in range(candidate_index):
-                    new_clusters.append(clusters[i])
-                new_clusters.append(candidate_cluster)
-                for i in range(candidate_index + 2, len(clusters)):
-                    new_clusters.append(clusters[i])
+            if stats.bad_proportion() > max_bad_proportion:
+                _global_logger.debug(
+                    "Rejecting cluster with bad-proportion "
+                    "%.2f > %.2f", stats.bad_proportion(),
+                    max_bad_proportion)
+                continue
 
-                if len(new_clusters) >= len(clusters):
-                    raise RuntimeError("Old: {0}; New: {1}".format(
-                        clusters, new_clusters))
-                clusters = new_clusters
-            except Exception:
-                _global_logger.error(
-                    "Failed merging clusters %s", clusters)
-                raise
+            if stats.total_length > max_segment_length:
+                _global_logger.debug(
+                    "Rejecting cluster with length "
+                    "%.2f > %.2f", stats.total_length,
+                    max_segment_length)
+                continue
 
+            _global_logger.debug("Accepted cluster %d-%d", start, next_end)
+            self._merge_clusters(start, end, next_end)
+            del cluster_end[end + 1]
+            cluster_end[start] = next_end
+            if next_end < last_index:
+                cluster_prev[next_end + 1] = start
+            push_candidate(cluster_prev[start])
+            push_candidate(start)
+
+        clusters = []
+        start = -1
+        while start <= last_index:
+            clusters.append(list(range(start, cluster_end[start] + 1)))
+            start = cluster_end[start] + 1
         return clusters
 
 
@@ -1405,8 +1524,7 @@ def merge_segments(segments, args):
         _global_logger.debug("Got no segments at merging segments stage")
         return []
 
-    def scoring_function(segment):
-        stats = segment.stats
+    def scoring_function(stats):
         try:
             return (-stats.wer() - args.silence_factor * stats.silence_length
                     - args.incorrect_words_factor
@@ -1452,7 +1570,8 @@ def merge_segments(segments, args):
                 # not merged with the last segment
                 break
 
-            new_segments.append(merger.merged_segments[tuple(cluster)])
+            new_segments.append(
+                merger.merged_segments[(cluster[0], cluster[-1])])
         except Exception:
             _global_logger.error("Error with cluster (%d, %s)",
                                  cluster_index, cluster)
@@ -1959,6 +2078,30 @@ def read_non_scored_words(non_scored_words_file):
     non_scored_words_file.close()
 
 
+def read_oov_symbol(args):
+    """Returns the OOV symbol from --oov-symbol-file, or None if the option
+    was not given."""
+    oov_symbol = None
+    if args.oov_symbol_file is not None:
+        try:
+            line = args.oov_symbol_file.readline()
+            assert len(line.split()) == 1
+            oov_symbol = line.split()[0]
+            assert args.oov_symbol_file.readline() == ''
+            args.oov_symbol_file.close()
+        except Exception:
+            _global_logger.error("error reading file "
+                                 "--oov-symbol-file=%s",
+                                 args.oov_symbol_file.name)
+            raise
+    elif args.unk_padding != 0.0:
+        raise ValueError(
+            "if the --unk-padding option is nonzero (which "
+            "it is by default, "
+            "the --oov-symbol-file option must be supplied.")
+    return oov_symbol
+
+
 class UtteranceStats(object):
 
     def __init__(self):
@@ -2014,25 +2157,7 @@ def main():
         global _global_non_scored_words
         _global_non_scored_words = set()
         read_non_scored_words(args.non_scored_words_in)
-
-        oov_symbol = None
-        if args.oov_symbol_file is not None:
-            try:
-                line = args.oov_symbol_file.readline()
-                assert len(line.split()) == 1
-                oov_symbol = line.split()[0]
-                assert args.oov_symbol_file.readline() == ''
-                args.oov_symbol_file.close()
-            except Exception:
-                _global_logger.error("error reading file "
-                                     "--oov-symbol-file=%s",
-                                     args.oov_symbol_file.name)
-                raise
-        elif args.unk_padding != 0.0:
-            raise ValueError(
-                "if the --unk-padding option is nonzero (which "
-                "it is by default, "
-                "the --oov-symbol-file option must be supplied.")
+        oov_symbol = read_oov_symbol(args)
 
         utterance_stats = UtteranceStats()
         word_stats = WordStats()
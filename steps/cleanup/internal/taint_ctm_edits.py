@@ -63,8 +63,6 @@ parser.add_argument("ctm_edits_out", metavar = "<ctm-edits-out>",
                     help = "Filename of output ctm-edits file. "
                     "Use /dev/stdout for standard output.")
 
-args = parser.parse_args()
-args.remove_deletions = bool(args.remove_deletions == "true")
 
 
 
@@ -184,8 +182,8 @@ def ProcessData():
         sys.exit("taint_ctm_edits.py: error closing ctm-edits output "
                  "(broken pipe or full disk?)")
 
-def PrintNonScoredStats():
-    if args.verbose < 1:
+def PrintNonScoredStats(verbose=1):
+    if verbose < 1:
         return
     if num_lines == 0:
         print("taint_ctm_edits.py: processed no input.", file = sys.stderr)
@@ -203,7 +201,7 @@ def PrintNonScoredStats():
 
     keys = sorted(ref_change_stats.keys(), reverse=True,
                   key = lambda x: ref_change_stats[x])
-    num_keys_to_print = 40 if args.verbose >= 2 else 10
+    num_keys_to_print = 40 if verbose >= 2 else 10
 
     print("taint_ctm_edits.py: most common edits (as percentages "
           "of all such edits) are:\n" +
@@ -213,9 +211,9 @@ def PrintNonScoredStats():
           file = sys.stderr)
 
 
-def PrintStats():
+def PrintStats(verbose=1):
     tot_lines = sum(num_lines_of_type.values())
-    if args.verbose < 1 or tot_lines == 0:
+    if verbose < 1 or tot_lines == 0:
         return
     print("taint_ctm_edits.py: processed {0} input lines, whose edit-types were: ".format(tot_lines) +
           ', '.join([ '%s = %.2f%%' % (k, num_lines_of_type[k] * 100.0 / tot_lines)
@@ -244,6 +242,15 @@ num_del_lines_giving_taint = 0
 num_sub_lines_giving_taint = 0
 num_ins_lines_giving_taint = 0
 
-ProcessData()
-PrintStats()
+
+def main():
+    global args
+    args = parser.parse_args()
+    args.remove_deletions = bool(args.remove_deletions == "true")
+    ProcessData()
+    PrintStats(args.verbose)
+
+
+if __name__ == "__main__":
+    main()
 
@@ -3,9 +3,13 @@
 from __future__ import print_function
 import sys
 import argparse
-import math
-import subprocess
-from collections import defaultdict
+import functools
+import itertools
+import multiprocessing
+import shlex
+
+sys.path.insert(0, 'steps/cleanup/internal')
+import make_one_biased_lm
 
 parser = argparse.ArgumentParser(description="""
 This script is a wrapper for make_one_biased_lm.py that reads a Kaldi archive
@@ -13,7 +17,9 @@ of (integerized) text data from the standard input and writes a Kaldi archive of
 backoff-language-model FSTs to the standard-output.  It takes care of
 grouping utterances to respect the --min-words-per-graph option.  It writes
 the graphs to the standard output and also outputs a map from input utterance-ids
-to the per-group utterance-ids that index the output graphs.""")
+to the per-group utterance-ids that index the output graphs.  The LMs are
+built in this process (or in --num-processes worker processes), not by running
+make_one_biased_lm.py once per group.""")
 
 parser.add_argument("--lm-opts", type = str, default = "",
                     help = "Options to pass in to make_one_biased_lm.py (which "
@@ -22,12 +28,26 @@ parser.add_argument("--min-words-per-graph", type = int, default = 100,
                     help = "Minimum number of words per utterance group; this program "
                     "will try to arrange the input utterances into groups such that each "
                     "one has at least this many words in total.")
+parser.add_argument("--num-processes", type = int, default = 1,
+                    help = "Number of processes that build the LMs of the groups "
+                    "in parallel; the graphs are still written in input order.")
 parser.add_argument("utterance_map", type = str,
                     help = "Filename to which a map from input utterances to grouped "
                     "utterances, is written")
 
 args = parser.parse_args()
 
+lm_args = make_one_biased_lm.parser.parse_args(shlex.split(args.lm_opts))
+if lm_args.verbose >= 1:
+    print("make_one_biased_lm.py " + args.lm_opts, file = sys.stderr)
+try:
+    # the part of the LMs that comes from the top words is the same for all
+    # groups, so we create it once.
+    background = (make_one_biased_lm.BackgroundLm(
+                      make_one_biased_lm.ReadTopWords(lm_args.top_words))
+                  if lm_args.top_words != None else None)
+except ValueError as e:
+    sys.exit(str(e))
 
 
 try:
@@ -36,10 +56,43 @@ except:
     sys.exit("make_biased_lms.py: error opening {0} to write utterance map".format(
             args.utterance_map))
 
-# This processes one group of input lines; 'group_of_lines' is
-# an array of lines of input integerized text, e.g.
+
+# This generator reads the input lines and yields them in groups with at least
+# args.min_words_per_graph words (except possibly the last one); each group
+# is an array of lines of input integerized text, e.g.
 # [ 'utt1 67 89 432', 'utt2 89 48 62' ]
-def ProcessGroupOfLines(group_of_lines):
+def GetGroupsOfLines():
+    num_words_this_group = 0
+    this_group_of_lines = []  # An array of strings, one per line
+
+    while True:
+        line = sys.stdin.readline();
+        num_words_this_group += len(line.split())
+        if line != '':
+            this_group_of_lines.append(line)
+        if num_words_this_group >= args.min_words_per_graph or \
+            (line == '' and len(this_group_of_lines) != 0):
+            yield this_group_of_lines
+            num_words_this_group = 0
+            this_group_of_lines = []
+        if line == '':
+            break
+
+
+# This returns the lines of the text-form FST of the LM for one group of input
+# lines (with the utterance-ids still in them).  It's called in the worker
+# processes if --num-processes > 1, so it reports errors by raising
+# exceptions rather than exiting.
+def GetLmOfGroup(lm_args, background, group_of_lines):
+    # get rid of the utterance ids.
+    return make_one_biased_lm.MakeBiasedLm(
+        [ ' '.join(line.split()[1:]) for line in group_of_lines ],
+        lm_args, background)
+
+
+# This writes one group of input lines and its LM; 'fst_lines' is the text-form
+# FST returned by GetLmOfGroup().
+def WriteGroupOfLines(group_of_lines, fst_lines):
     num_lines = len(group_of_lines)
     try:
         first_utterance_id = group_of_lines[0].split()[0]
@@ -50,48 +103,44 @@ def ProcessGroupOfLines(group_of_lines):
     # print the group utterance-id to the stdout; it forms the name in
     # the text-form archive.
     print(group_utterance_id)
-    sys.stdout.flush()
 
-    try:
-        command = "steps/cleanup/internal/make_one_biased_lm.py " + args.lm_opts
-        p = subprocess.Popen(command, shell = True, stdin = subprocess.PIPE,
-                            stdout = sys.stdout, stderr = sys.stderr)
-        for line in group_of_lines:
-            a = line.split()
-            if len(a) == 0:
-                sys.exit("make_biased_lms.py: empty input line")
-            utterance_id = a[0]
-            # print <utt> <utt-group> to utterance-map file
-            print(utterance_id, group_utterance_id, file = utterance_map_file)
-            rest_of_line = ' '.join(a[1:])  # get rid of utterance id.
-            print(rest_of_line, file=p.stdin)
-        p.stdin.close()
-        assert p.wait() == 0
-    except Exception as e:
-        sys.exit("make_biased_lms.py: error calling subprocess, command was: " +
-                 command + ", error was : " + str(e))
+    for line in group_of_lines:
+        a = line.split()
+        if len(a) == 0:
+            sys.exit("make_biased_lms.py: empty input line")
+        utterance_id = a[0]
+        # print <utt> <utt-group> to utterance-map file
+        print(utterance_id, group_utterance_id, file = utterance_map_file)
+    sys.stdout.write(''.join([ line + '\n' for line in fst_lines ]))
     # Print a blank line; this terminates the FST in the Kaldi fst-archive
     # format.
     print("")
     sys.stdout.flush()
 
 
-
-num_words_this_group = 0
-this_group_of_lines = []  # An array of strings, one per line
-
-while True:
-    line = sys.stdin.readline();
-    num_words_this_group += len(line.split())
-    if line != '':
-        this_group_of_lines.append(line)
-    if num_words_this_group >= args.min_words_per_graph or \
-        (line == '' and len(this_group_of_lines) != 0):
-        ProcessGroupOfLines(this_group_of_lines)
-        num_words_this_group = 0
-        this_group_of_lines = []
-    if line == '':
-        break
+get_lm = functools.partial(GetLmOfGroup, lm_args, background)
+try:
+    if args.num_processes > 1:
+        # The groups are given to the pool in batches, so that at most
+        # 'batch_size' groups are held in memory (pool.imap() would read
+        # ahead without limit); the LMs of a batch come back in input order.
+        batch_size = 10 * args.num_processes
+        groups = GetGroupsOfLines()
+        pool = multiprocessing.Pool(args.num_processes)
+        while True:
+            batch = list(itertools.islice(groups, batch_size))
+            if len(batch) == 0:
+                break
+            for group_of_lines, fst_lines in zip(batch, pool.map(get_lm, batch)):
+                WriteGroupOfLines(group_of_lines, fst_lines)
+        pool.close()
+        pool.join()
+    else:
+        for group_of_lines in GetGroupsOfLines():
+            WriteGroupOfLines(group_of_lines, get_lm(group_of_lines))
+except ValueError as e:
+    sys.exit("make_biased_lms.py: error making LM: " + str(e))
+utterance_map_file.close()
 
 
 # test comand [to be run from ../..]
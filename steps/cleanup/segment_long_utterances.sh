@@ -47,6 +47,9 @@ min_non_scored_length_to_split_at=0.3
 stage=-1
 
 cmd=run.pl
+cleanup_nj=0  # If > 0, stages 11 to 13 are done in a single pass over the
+              # ctm-edits by steps/cleanup/internal/cleanup_ctm_edits.py,
+              # with this many processes.
 
 . utils/parse_options.sh
 
@@ -385,7 +388,7 @@ if [ $stage -le 10 ]; then
     ${data_uniform_seg}/segments $dir/lats/score_$lmwt/ctm_edits $dir/ctm_edits
 fi
 
-if [ $stage -le 11 ]; then
+if [ $stage -le 11 ] && [ $cleanup_nj -eq 0 ]; then
   echo "$0: modifying ctm-edits file to allow repetitions [for dysfluencies] and "
   echo "   ... to fix reference mismatches involving non-scored words. "
 
@@ -397,7 +400,7 @@ if [ $stage -le 11 ]; then
   echo " a list of commonly-repeated words."
 fi
 
-if [ $stage -le 12 ]; then
+if [ $stage -le 12 ] && [ $cleanup_nj -eq 0 ]; then
   echo "$0: applying 'taint' markers to ctm-edits file to mark silences and"
   echo "  ... non-scored words that are next to errors."
   $cmd $dir/log/taint_ctm_edits.log \
@@ -422,17 +425,33 @@ if [ $stage -le 13 ]; then
   --splitting.min-non-scored-length=$min_non_scored_length_to_split_at
   )
   
-  $cmd $dir/log/segment_ctm_edits.log \
-    steps/cleanup/internal/segment_ctm_edits_mild.py \
-      ${segmentation_opts[@]} $segmentation_extra_opts \
-      --oov-symbol-file=$lang/oov.txt \
-      --ctm-edits-out=$dir/ctm_edits.segmented \
-      --word-stats-out=$dir/word_stats.txt \
-      $dir/non_scored_words.txt \
-      $dir/ctm_edits.tainted $dir/text $dir/segments
-
-  echo "$0: contents of $dir/log/segment_ctm_edits.log are:"
-  cat $dir/log/segment_ctm_edits.log
+  if [ $cleanup_nj -gt 0 ]; then
+    # This also does the work of stages 11 and 12.
+    log=$dir/log/cleanup_ctm_edits.log
+    $cmd --num-threads $cleanup_nj $log \
+      steps/cleanup/internal/cleanup_ctm_edits.py \
+        --nj=$cleanup_nj --segmenter=mild --stats-verbose=3 \
+        --remove-deletions=false \
+        ${segmentation_opts[@]} $segmentation_extra_opts \
+        --oov-symbol-file=$lang/oov.txt \
+        --ctm-edits-out=$dir/ctm_edits.segmented \
+        --word-stats-out=$dir/word_stats.txt \
+        $dir/non_scored_words.txt \
+        $dir/ctm_edits $dir/text $dir/segments
+  else
+    log=$dir/log/segment_ctm_edits.log
+    $cmd $log \
+      steps/cleanup/internal/segment_ctm_edits_mild.py \
+        ${segmentation_opts[@]} $segmentation_extra_opts \
+        --oov-symbol-file=$lang/oov.txt \
+        --ctm-edits-out=$dir/ctm_edits.segmented \
+        --word-stats-out=$dir/word_stats.txt \
+        $dir/non_scored_words.txt \
+        $dir/ctm_edits.tainted $dir/text $dir/segments
+  fi
+
+  echo "$0: contents of $log are:"
+  cat $log
   echo "For word-level statistics on p(not-being-in-a-segment), with 'worst' words at the top,"
   echo "see $dir/word_stats.txt"
   echo "For detailed utterance-level debugging information, see $dir/ctm_edits.segmented"
@@ -11,6 +11,7 @@ import sys, random, argparse, os, imp
 sys.path.append("steps/data/")
 from reverberate_data_dir import ParseFileToDict
 from reverberate_data_dir import WriteDictToFile
+from reverberate_data_dir import MakeRecipe
 data_lib = imp.load_source('dml', 'steps/data/data_dir_manipulation_lib.py')
 
 def GetArgs():
@@ -39,6 +40,19 @@ def GetArgs():
                         help="Background noise data directory")
     parser.add_argument("--fg-noise-dir", type=str, dest="fg_noise_dir",
                         help="Foreground noise data directory")
+    parser.add_argument("--wav-archive", type=str, dest="wav_archive", default=None,
+                        help="If specified, the augmented recordings are computed in this process (with numpy, "
+                        "see steps/data/wav_augmentation_lib.py) and written to this wave archive, and the wav.scp "
+                        "points into the archive instead of containing wav-reverberate pipes.")
+    parser.add_argument("--num-processes", type=int, dest="num_processes", default=1,
+                        help="Number of processes used to compute the recordings written to --wav-archive")
+    parser.add_argument("--wav-cache-dir", type=str, dest="wav_cache_dir", default=None,
+                        help="If specified with --wav-archive, the computed recordings are also kept in this directory, "
+                        "indexed by a hash of how they were generated, and are taken from there when the same "
+                        "recording is requested again (e.g. when re-running the augmentation).")
+    parser.add_argument("--wav-cache-size", type=float, dest="wav_cache_size", default=20.0,
+                        help="Maximum size of --wav-cache-dir in gigabytes; the least recently used recordings "
+                        "are removed from it beyond this size.")
     parser.add_argument("input_dir", help="Input data directory")
     parser.add_argument("output_dir", help="Output data directory")
 
@@ -54,6 +68,12 @@ def CheckArgs(args):
         raise Exception("--fg-interval must be 0 or greater")
     if args.bg_noise_dir is None and args.fg_noise_dir is None:
         raise Exception("Either --fg-noise-dir or --bg-noise-dir must be specified")
+    if args.num_processes < 1:
+        raise Exception("--num-processes must be at least 1")
+    if args.wav_cache_dir is not None and args.wav_archive is None:
+        raise Exception("--wav-cache-dir can only be used with --wav-archive")
+    if args.wav_cache_size <= 0:
+        raise Exception("--wav-cache-size must be positive")
     return args
 
 def GetNoiseList(noise_wav_scp_filename):
@@ -67,8 +87,10 @@ def GetNoiseList(noise_wav_scp_filename):
         noise_wavs[toks[0]] = wav.rstrip()
     return noise_utts, noise_wavs
 
+# If recipe is not None, the noises are also added to it (see
+# steps/data/wav_augmentation_lib.py).
 def AugmentWav(utt, wav, dur, fg_snr_opts, bg_snr_opts, fg_noise_utts, \
-    bg_noise_utts, noise_wavs, noise2dur, interval, num_opts):
+    bg_noise_utts, noise_wavs, noise2dur, interval, num_opts, recipe = None):
     # This section is common to both foreground and background noises
     new_wav = ""
     dur_str = str(dur)
@@ -89,6 +111,8 @@ def AugmentWav(utt, wav, dur, fg_snr_opts, bg_snr_opts, fg_noise_utts, \
             snrs.append(snr)
             start_times.append(0)
             noises.append(noise)
+            if recipe is not None:
+                recipe['noises'].append((MakeRecipe(noise_wavs[noise_utt], duration = dur), 0, snr))
 
     # Now handle the foreground noises
     if len(fg_noise_utts) > 0:
@@ -99,6 +123,8 @@ def AugmentWav(utt, wav, dur, fg_snr_opts, bg_snr_opts, fg_noise_utts, \
             snrs.append(snr)
             noise_dur = noise2dur[noise_utt]
             start_times.append(tot_noise_dur)
+            if recipe is not None:
+                recipe['noises'].append((MakeRecipe(noise), tot_noise_dur, snr))
             tot_noise_dur += noise_dur + interval
             noises.append(noise)
 
@@ -165,6 +191,9 @@ def main():
     random.seed(args.random_seed)
     new_utt2wav = {}
     new_utt2spk = {}
+    new_utt2recipe = None
+    if args.wav_archive is not None:
+        new_utt2recipe = {}
 
     # Augment each line in the wav file
     for line in wav_scp_file:
@@ -172,16 +201,28 @@ def main():
         utt = toks[0]
         wav = " ".join(toks[1:])
         dur = reco2dur[utt]
+        recipe = None
+        if new_utt2recipe is not None:
+            recipe = MakeRecipe(wav)
         new_wav = AugmentWav(utt, wav, dur, fg_snrs, bg_snrs, fg_noise_utts,
             bg_noise_utts, noise_wavs, noise_reco2dur, args.fg_interval,
-            num_bg_noises)
+            num_bg_noises, recipe)
         new_utt = utt + "-" + args.utt_suffix
         new_utt2wav[new_utt] = new_wav
+        if new_utt2recipe is not None:
+            new_utt2recipe[new_utt] = recipe
 
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    WriteDictToFile(new_utt2wav, output_dir + "/wav.scp")
+    if new_utt2recipe is None:
+        WriteDictToFile(new_utt2wav, output_dir + "/wav.scp")
+    else:
+        print("Writing the augmented recordings to {0}...".format(args.wav_archive))
+        aug_lib = imp.load_source('wal', 'steps/data/wav_augmentation_lib.py')
+        aug_lib.WriteWaveArchive(new_utt2recipe, args.wav_archive,
+            output_dir + "/wav.scp", args.num_processes, args.wav_cache_dir,
+            int(args.wav_cache_size * 2**30))
     CopyFileIfExists(args.utt_suffix, "utt2spk", input_dir, output_dir)
     CopyFileIfExists(args.utt_suffix, "utt2lang", input_dir, output_dir)
     CopyFileIfExists(args.utt_suffix, "text", input_dir, output_dir)
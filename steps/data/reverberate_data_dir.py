@@ -5,7 +5,7 @@
 
 # we're using python 3.x style print but want it to work in python 2.x,
 from __future__ import print_function
-import argparse, shlex, glob, math, os, random, sys, warnings, copy, imp, ast
+import argparse, shlex, glob, math, os, random, sys, warnings, copy, imp, ast, multiprocessing, pickle
 
 data_lib = imp.load_source('dml', 'steps/data/data_dir_manipulation_lib.py')
 
@@ -71,6 +71,31 @@ def GetArgs():
                         "the RIRs/noises will be resampled to the rate of the source data.")
     parser.add_argument("--include-original-data", type=str, help="If true, the output data includes one copy of the original data",
                          choices=['true', 'false'], default = "false")
+    parser.add_argument("--wav-archive", type=str, default=None,
+                        help="If specified, the reverberated recordings are computed in this process (with numpy, "
+                        "see steps/data/wav_augmentation_lib.py) and written to this wave archive, and the wav.scp "
+                        "points into the archive instead of containing wav-reverberate pipes.")
+    parser.add_argument("--num-processes", type=int, default=1,
+                        help="Number of processes used to generate the output data directory, and to compute the "
+                        "recordings written to --wav-archive. The output does not depend on the number of processes.")
+    parser.add_argument("--augmentation-index", type=str, default=None,
+                        help="If specified, the index of the rooms, RIRs and noises built from --rir-set-parameters "
+                        "and --noise-set-parameters (with the tables used to sample them) is saved to this file, and "
+                        "is loaded from it instead of parsing the lists again if the lists and options are unchanged.")
+    parser.add_argument("--wav-cache-dir", type=str, default=None,
+                        help="If specified with --wav-archive, the computed recordings are also kept in this directory, "
+                        "indexed by a hash of how they were generated, and are taken from there when the same "
+                        "recording is requested again (e.g. when re-running the augmentation).")
+    parser.add_argument("--wav-cache-size", type=float, default=20.0,
+                        help="Maximum size of --wav-cache-dir in gigabytes; the least recently used recordings "
+                        "are removed from it beyond this size.")
+    parser.add_argument("--speed-perturb-factors", type=str, default=None,
+                        help="If specified with --wav-archive, e.g. '0.9:1.0:1.1', each reverberated recording is "
+                        "also speed-perturbed (like 'sox ... speed') by a factor picked at random from this list; "
+                        "the times in the segments file are scaled accordingly.")
+    parser.add_argument("--volume-range", type=str, default=None,
+                        help="If specified with --wav-archive, e.g. '0.125:2', each reverberated recording is also "
+                        "scaled by a volume factor picked uniformly at random from this range.")
     parser.add_argument("input_dir",
                         help="Input data directory")
     parser.add_argument("output_dir",
@@ -117,6 +142,29 @@ def CheckArgs(args):
     if args.source_sampling_rate is not None and args.source_sampling_rate <= 0:
         raise Exception("--source-sampling-rate cannot be non-positive")
 
+    if args.num_processes < 1:
+        raise Exception("--num-processes must be at least 1")
+
+    if args.wav_cache_dir is not None and args.wav_archive is None:
+        raise Exception("--wav-cache-dir can only be used with --wav-archive")
+
+    if args.wav_cache_size <= 0:
+        raise Exception("--wav-cache-size must be positive")
+
+    if args.speed_perturb_factors is not None:
+        if args.wav_archive is None:
+            raise Exception("--speed-perturb-factors can only be used with --wav-archive")
+        args.speed_perturb_factors = [float(x) for x in args.speed_perturb_factors.split(':')]
+        if min(args.speed_perturb_factors) <= 0:
+            raise Exception("--speed-perturb-factors must be positive")
+
+    if args.volume_range is not None:
+        if args.wav_archive is None:
+            raise Exception("--volume-range can only be used with --wav-archive")
+        args.volume_range = [float(x) for x in args.volume_range.split(':')]
+        if len(args.volume_range) != 2 or not 0 < args.volume_range[0] <= args.volume_range[1]:
+            raise Exception("--volume-range must be of the form <min>:<max> with 0 < min <= max")
+
     return args
 
 
@@ -132,22 +180,43 @@ class list_cyclic_iterator:
     return item
 
 
-# This functions picks an item from the collection according to the associated probability distribution.
-# The probability estimate of each item in the collection is stored in the "probability" field of
-# the particular item. x : a collection (list or dictionary) where the values contain a field called probability
-def PickItemWithProbability(x):
-   if isinstance(x, dict):
-     plist = list(set(x.values()))
-   else:
-     plist = x
-   total_p = sum(item.probability for item in plist)
-   p = random.uniform(0, total_p)
-   accumulate_p = 0
-   for item in plist:
-      if accumulate_p + item.probability >= p:
-         return item
-      accumulate_p += item.probability
-   assert False, "Shouldn't get here as the accumulated probability should always equal to 1"
+# This class picks items from a list according to the associated probability distribution,
+# in constant time per pick, using Walker's alias method (with Vose's construction of the tables).
+# The probability estimate of each item in the list is stored in the "probability" field of
+# the particular item; the probabilities do not need to sum to 1.
+class AliasTable:
+  def __init__(self, items):
+    self.items = list(items)
+    num_items = len(self.items)
+    assert num_items > 0
+    total_p = sum(item.probability for item in self.items)
+    assert total_p > 0, "The probabilities of the items should not all be zero"
+    scaled_p = [item.probability * num_items / total_p for item in self.items]
+    # item i is picked with probability threshold[i] when column i is picked,
+    # and item alias[i] otherwise.
+    self.threshold = [1.0] * num_items
+    self.alias = list(range(num_items))
+    small = [i for i in range(num_items) if scaled_p[i] < 1.0]
+    large = [i for i in range(num_items) if scaled_p[i] >= 1.0]
+    while len(small) > 0 and len(large) > 0:
+      i = small.pop()
+      j = large.pop()
+      self.threshold[i] = scaled_p[i]
+      self.alias[i] = j
+      scaled_p[j] = (scaled_p[j] + scaled_p[i]) - 1.0
+      if scaled_p[j] < 1.0:
+        small.append(j)
+      else:
+        large.append(j)
+    # whatever remains in small or large has a probability of 1 up to rounding errors,
+    # so it keeps its threshold of 1.
+
+  def Pick(self):
+    x = random.random() * len(self.items)
+    i = int(x)
+    if x - i < self.threshold[i]:
+      return self.items[i]
+    return self.items[self.alias[i]]
 
 
 # This function parses a file and pack the data into a dictionary
@@ -202,18 +271,19 @@ def CreateCorruptedUtt2uniq(input_dir, output_dir, num_replicas, include_origina
 
 def AddPointSourceNoise(noise_addition_descriptor,  # descriptor to store the information of the noise added
                         room,  # the room selected
-                        pointsource_noise_list, # the point source noise list
+                        pointsource_noise_table, # the alias table of the point source noises, or None if there are none
                         pointsource_noise_addition_probability, # Probability of adding point-source noises
                         foreground_snrs, # the SNR for adding the foreground noises
                         background_snrs, # the SNR for adding the background noises
                         speech_dur,  # duration of the recording
-                        max_noises_recording  # Maximum number of point-source noises that can be added
+                        max_noises_recording,  # Maximum number of point-source noises that can be added
+                        recipe = None  # if not None, the recipe of the recording to which the noises are added
                         ):
-    if len(pointsource_noise_list) > 0 and random.random() < pointsource_noise_addition_probability and max_noises_recording >= 1:
+    if pointsource_noise_table is not None and random.random() < pointsource_noise_addition_probability and max_noises_recording >= 1:
         for k in range(random.randint(1, max_noises_recording)):
             # pick the RIR to reverberate the point-source noise
-            noise = PickItemWithProbability(pointsource_noise_list)
-            noise_rir = PickItemWithProbability(room.rir_list)
+            noise = pointsource_noise_table.Pick()
+            noise_rir = room.rir_table.Pick()
             # If it is a background noise, the noise will be extended and be added to the whole speech
             # if it is a foreground noise, the noise will not extended and be added at a random time of the speech
             if noise.bg_fg_type == "background":
@@ -231,22 +301,27 @@ def AddPointSourceNoise(noise_addition_descriptor,  # descriptor to store the in
             else:
                 noise_addition_descriptor['noise_io'].append("{0} {1} - - |".format(noise.noise_rspecifier, noise_rvb_command))
 
+            if recipe is not None:
+                noise_recipe = MakeRecipe(noise.noise_rspecifier, rir = noise_rir.rir_rspecifier,
+                                          duration = speech_dur if noise.bg_fg_type == "background" else None)
+                recipe['noises'].append((noise_recipe, noise_addition_descriptor['start_times'][-1],
+                                         noise_addition_descriptor['snrs'][-1]))
+
     return noise_addition_descriptor
 
 
 # This function randomly decides whether to reverberate, and sample a RIR if it does
 # It also decides whether to add the appropriate noises
 # This function return the string of options to the binary wav-reverberate
-def GenerateReverberationOpts(room_dict,  # the room dictionary, please refer to MakeRoomDict() for the format
-                              pointsource_noise_list, # the point source noise list
-                              iso_noise_dict, # the isotropic noise dictionary
+def GenerateReverberationOpts(augmentation_index,  # the index of the rooms and noises, please refer to AugmentationIndex
                               foreground_snrs, # the SNR for adding the foreground noises
                               background_snrs, # the SNR for adding the background noises
                               speech_rvb_probability, # Probability of reverberating a speech signal
                               isotropic_noise_addition_probability, # Probability of adding isotropic noises
                               pointsource_noise_addition_probability, # Probability of adding point-source noises
                               speech_dur,  # duration of the recording
-                              max_noises_recording  # Maximum number of point-source noises that can be added
+                              max_noises_recording,  # Maximum number of point-source noises that can be added
+                              recipe = None  # if not None, the recipe of the recording, which is filled in with the RIR and noises
                               ):
     reverberate_opts = ""
     noise_addition_descriptor = {'noise_io': [],
@@ -254,19 +329,18 @@ def GenerateReverberationOpts(room_dict,  # the room dictionary, please refer to
                                  'snrs': []}
     # Randomly select the room
     # Here the room probability is a sum of the probabilities of the RIRs recorded in the room.
-    room = PickItemWithProbability(room_dict)
+    room = augmentation_index.room_table.Pick()
     # Randomly select the RIR in the room
-    speech_rir = PickItemWithProbability(room.rir_list)
+    speech_rir = room.rir_table.Pick()
     if random.random() < speech_rvb_probability:
         # pick the RIR to reverberate the speech
         reverberate_opts += """--impulse-response="{0}" """.format(speech_rir.rir_rspecifier)
+        if recipe is not None:
+            recipe['rir'] = speech_rir.rir_rspecifier
 
-    rir_iso_noise_list = []
-    if speech_rir.room_id in iso_noise_dict:
-        rir_iso_noise_list = iso_noise_dict[speech_rir.room_id]
     # Add the corresponding isotropic noise associated with the selected RIR
-    if len(rir_iso_noise_list) > 0 and random.random() < isotropic_noise_addition_probability:
-        isotropic_noise = PickItemWithProbability(rir_iso_noise_list)
+    if speech_rir.room_id in augmentation_index.iso_noise_tables and random.random() < isotropic_noise_addition_probability:
+        isotropic_noise = augmentation_index.iso_noise_tables[speech_rir.room_id].Pick()
         # extend the isotropic noise to the length of the speech waveform
         # check if the rspecifier is a pipe or not
         if len(isotropic_noise.noise_rspecifier.split()) == 1:
@@ -275,15 +349,19 @@ def GenerateReverberationOpts(room_dict,  # the room dictionary, please refer to
             noise_addition_descriptor['noise_io'].append("{0} wav-reverberate --duration={1} - - |".format(isotropic_noise.noise_rspecifier, speech_dur))
         noise_addition_descriptor['start_times'].append(0)
         noise_addition_descriptor['snrs'].append(background_snrs.next())
+        if recipe is not None:
+            recipe['noises'].append((MakeRecipe(isotropic_noise.noise_rspecifier, duration = speech_dur),
+                                     0, noise_addition_descriptor['snrs'][-1]))
 
     noise_addition_descriptor = AddPointSourceNoise(noise_addition_descriptor,  # descriptor to store the information of the noise added
                                                     room,  # the room selected
-                                                    pointsource_noise_list, # the point source noise list
+                                                    augmentation_index.pointsource_noise_table, # the alias table of the point source noises
                                                     pointsource_noise_addition_probability, # Probability of adding point-source noises
                                                     foreground_snrs, # the SNR for adding the foreground noises
                                                     background_snrs, # the SNR for adding the background noises
                                                     speech_dur,  # duration of the recording
-                                                    max_noises_recording  # Maximum number of point-source noises that can be added
+                                                    max_noises_recording,  # Maximum number of point-source noises that can be added
+                                                    recipe  # the recipe of the recording, if any
                                                     )
 
     assert len(noise_addition_descriptor['noise_io']) == len(noise_addition_descriptor['start_times'])
@@ -307,6 +385,115 @@ def GetNewId(id, prefix=None, copy=0):
     return new_id
 
 
+# This function creates the description of an augmented recording used when the
+# recordings are written to a wave archive by steps/data/wav_augmentation_lib.py;
+# please refer to that file for the meaning of the fields.
+# The default shift_output=True is that of wav-reverberate.
+def MakeRecipe(wav, rir = None, shift_output = True, duration = None, speed = None, volume = None):
+    return {'wav': wav,
+            'rir': rir,
+            'shift_output': shift_output,
+            'duration': duration,
+            'noises': [],
+            'speed': speed,
+            'volume': volume}
+
+
+# This function randomly picks the speed and volume perturbation of a recording
+# (if they are enabled) and records them in its recipe.  The durations and start
+# times of the additive signals are scaled to the duration of the speed-perturbed
+# recording.  The factors are drawn from their own random generator, so that the
+# reverberation and noises are the same with or without the perturbation.
+def PerturbRecipe(recipe,
+                  perturb_random, # the random.Random instance from which the factors are drawn
+                  speed_perturb_factors, # if not None, the list of speed factors to pick from
+                  volume_range # if not None, the [min, max] of the volume factor
+                  ):
+    if speed_perturb_factors is not None:
+        speed = perturb_random.choice(speed_perturb_factors)
+        if speed != 1.0:
+            recipe['speed'] = speed
+            noises = []
+            for noise_recipe, start_time, snr in recipe['noises']:
+                if noise_recipe['duration'] is not None:
+                    noise_recipe['duration'] = round(noise_recipe['duration'] / speed, 2)
+                noises.append((noise_recipe, round(start_time / speed, 2), snr))
+            recipe['noises'] = noises
+    if volume_range is not None:
+        recipe['volume'] = perturb_random.uniform(volume_range[0], volume_range[1])
+
+
+# The recordings of each copy of the data are generated in shards of this many
+# recordings.  Each shard is generated with its own random seed, so the shards can
+# be generated by several processes and the output does not depend on the number
+# of processes.
+RECORDINGS_PER_SHARD = 1000
+
+# The options of GenerateReverberatedWavScp() shared by all the shards; in the
+# worker processes this is set by the initializer of the pool.
+shard_options = None
+
+def SetShardOptions(options):
+    global shard_options
+    shard_options = options
+
+
+# This function generates the pipeline commands (and if required, the recipes)
+# of the recordings in one shard, see GenerateReverberatedWavScp()
+def GenerateReverberatedShard(shard):
+    copy, shard_index, recording_ids = shard
+    opts = shard_options
+    random.seed("{0}-{1}-{2}".format(opts.random_seed, copy, shard_index))
+    perturb_random = random.Random("{0}-{1}-{2}-perturb".format(opts.random_seed, copy, shard_index))
+    foreground_snrs = list_cyclic_iterator(list(opts.foreground_snr_array))
+    background_snrs = list_cyclic_iterator(list(opts.background_snr_array))
+    corrupted_wav_scp = {}
+    recipes = None
+    if opts.write_recipes:
+        recipes = {}
+
+    for recording_id in recording_ids:
+        wav_original_pipe = opts.wav_scp[recording_id]
+        # check if it is really a pipe
+        if len(wav_original_pipe.split()) == 1:
+            wav_original_pipe = "cat {0} |".format(wav_original_pipe)
+        speech_dur = opts.durations[recording_id]
+        max_noises_recording = math.floor(opts.max_noises_per_minute * speech_dur / 60)
+        recipe = None
+        if recipes is not None:
+            recipe = MakeRecipe(opts.wav_scp[recording_id], shift_output = (opts.shift_output == "true"))
+
+        # prefix using index 0 is reserved for original data e.g. rvb0_swb0035 corresponds to the swb0035 recording in original data
+        reverberate_opts = ""
+        if copy > 0:
+            reverberate_opts = GenerateReverberationOpts(opts.augmentation_index,  # the index of the rooms and noises, please refer to AugmentationIndex
+                                                         foreground_snrs, # the SNR for adding the foreground noises
+                                                         background_snrs, # the SNR for adding the background noises
+                                                         opts.speech_rvb_probability, # Probability of reverberating a speech signal
+                                                         opts.isotropic_noise_addition_probability, # Probability of adding isotropic noises
+                                                         opts.pointsource_noise_addition_probability, # Probability of adding point-source noises
+                                                         speech_dur,  # duration of the recording
+                                                         max_noises_recording,  # Maximum number of point-source noises that can be added
+                                                         recipe  # the recipe of the recording, if any
+                                                         )
+
+        if reverberate_opts == "":
+            wav_corrupted_pipe = "{0}".format(wav_original_pipe)
+        else:
+            wav_corrupted_pipe = "{0} wav-reverberate --shift-output={1} {2} - - |".format(wav_original_pipe, opts.shift_output, reverberate_opts)
+
+        new_recording_id = GetNewId(recording_id, opts.prefix, copy)
+        corrupted_wav_scp[new_recording_id] = wav_corrupted_pipe
+        if recipes is not None:
+            if reverberate_opts == "":
+                recipe = MakeRecipe(opts.wav_scp[recording_id])
+            if copy > 0:
+                PerturbRecipe(recipe, perturb_random, opts.speed_perturb_factors, opts.volume_range)
+            recipes[new_recording_id] = recipe
+
+    return (corrupted_wav_scp, recipes)
+
+
 # This is the main function to generate pipeline command for the corruption
 # The generic command of wav-reverberate will be like:
 # wav-reverberate --duration=t --impulse-response=rir.wav
@@ -314,9 +501,7 @@ def GetNewId(id, prefix=None, copy=0):
 def GenerateReverberatedWavScp(wav_scp,  # a dictionary whose values are the Kaldi-IO strings of the speech recordings
                                durations, # a dictionary whose values are the duration (in sec) of the speech recordings
                                output_dir, # output directory to write the corrupted wav.scp
-                               room_dict,  # the room dictionary, please refer to MakeRoomDict() for the format
-                               pointsource_noise_list, # the point source noise list
-                               iso_noise_dict, # the isotropic noise dictionary
+                               augmentation_index,  # the index of the rooms and noises, please refer to AugmentationIndex
                                foreground_snr_array, # the SNR for adding the foreground noises
                                background_snr_array, # the SNR for adding the background noises
                                num_replicas, # Number of replicate to generated for the data
@@ -326,49 +511,58 @@ def GenerateReverberatedWavScp(wav_scp,  # a dictionary whose values are the Kal
                                shift_output, # option whether to shift the output waveform
                                isotropic_noise_addition_probability, # Probability of adding isotropic noises
                                pointsource_noise_addition_probability, # Probability of adding point-source noises
-                               max_noises_per_minute # maximum number of point-source noises that can be added to a recording according to its duration
+                               max_noises_per_minute, # maximum number of point-source noises that can be added to a recording according to its duration
+                               random_seed, # seed from which the random seeds of the shards are derived
+                               num_processes = 1, # number of processes generating the shards
+                               recipes = None, # if not None, a dictionary which is filled with the recipes of the recordings instead of writing the wav.scp
+                               speed_perturb_factors = None, # if not None, the speed factors of the recipes are picked from this list
+                               volume_range = None # if not None, the volume factors of the recipes are picked from this [min, max] range
                                ):
-    foreground_snrs = list_cyclic_iterator(foreground_snr_array)
-    background_snrs = list_cyclic_iterator(background_snr_array)
-    corrupted_wav_scp = {}
-    keys = wav_scp.keys()
-    keys.sort()
+    SetShardOptions(argparse.Namespace(wav_scp = wav_scp,
+                                       durations = durations,
+                                       augmentation_index = augmentation_index,
+                                       foreground_snr_array = list(foreground_snr_array),
+                                       background_snr_array = list(background_snr_array),
+                                       prefix = prefix,
+                                       speech_rvb_probability = speech_rvb_probability,
+                                       shift_output = shift_output,
+                                       isotropic_noise_addition_probability = isotropic_noise_addition_probability,
+                                       pointsource_noise_addition_probability = pointsource_noise_addition_probability,
+                                       max_noises_per_minute = max_noises_per_minute,
+                                       random_seed = random_seed,
+                                       write_recipes = recipes is not None,
+                                       speed_perturb_factors = speed_perturb_factors,
+                                       volume_range = volume_range))
+    keys = sorted(wav_scp.keys())
     if include_original:
         start_index = 0
     else:
         start_index = 1
 
+    shards = []
     for i in range(start_index, num_replicas+1):
-        for recording_id in keys:
-            wav_original_pipe = wav_scp[recording_id]
-            # check if it is really a pipe
-            if len(wav_original_pipe.split()) == 1:
-                wav_original_pipe = "cat {0} |".format(wav_original_pipe)
-            speech_dur = durations[recording_id]
-            max_noises_recording = math.floor(max_noises_per_minute * speech_dur / 60)
-
-            reverberate_opts = GenerateReverberationOpts(room_dict,  # the room dictionary, please refer to MakeRoomDict() for the format
-                                                         pointsource_noise_list, # the point source noise list
-                                                         iso_noise_dict, # the isotropic noise dictionary
-                                                         foreground_snrs, # the SNR for adding the foreground noises
-                                                         background_snrs, # the SNR for adding the background noises
-                                                         speech_rvb_probability, # Probability of reverberating a speech signal
-                                                         isotropic_noise_addition_probability, # Probability of adding isotropic noises
-                                                         pointsource_noise_addition_probability, # Probability of adding point-source noises
-                                                         speech_dur,  # duration of the recording
-                                                         max_noises_recording  # Maximum number of point-source noises that can be added
-                                                         )
+        for shard_index, shard_start in enumerate(range(0, len(keys), RECORDINGS_PER_SHARD)):
+            shards.append((i, shard_index, keys[shard_start:shard_start + RECORDINGS_PER_SHARD]))
 
-            # prefix using index 0 is reserved for original data e.g. rvb0_swb0035 corresponds to the swb0035 recording in original data
-            if reverberate_opts == "" or i == 0:
-                wav_corrupted_pipe = "{0}".format(wav_original_pipe)
-            else:
-                wav_corrupted_pipe = "{0} wav-reverberate --shift-output={1} {2} - - |".format(wav_original_pipe, shift_output, reverberate_opts)
+    pool = None
+    if num_processes > 1:
+        pool = multiprocessing.Pool(num_processes, SetShardOptions, (shard_options,))
+        shard_results = pool.imap_unordered(GenerateReverberatedShard, shards)
+    else:
+        shard_results = (GenerateReverberatedShard(shard) for shard in shards)
+
+    corrupted_wav_scp = {}
+    for shard_wav_scp, shard_recipes in shard_results:
+        corrupted_wav_scp.update(shard_wav_scp)
+        if recipes is not None:
+            recipes.update(shard_recipes)
 
-            new_recording_id = GetNewId(recording_id, prefix, i)
-            corrupted_wav_scp[new_recording_id] = wav_corrupted_pipe
+    if pool is not None:
+        pool.close()
+        pool.join()
 
-    WriteDictToFile(corrupted_wav_scp, output_dir + "/wav.scp")
+    if recipes is None:
+        WriteDictToFile(corrupted_wav_scp, output_dir + "/wav.scp")
 
 
 # This function replicate the entries in files like segments, utt2spk, text
@@ -392,12 +586,23 @@ def AddPrefixToFields(input_file, output_file, num_replicas, include_original, p
     f.close()
 
 
+# This function divides the start and end times in the segments file by the speed
+# factor of the recording of each segment, if it was speed-perturbed
+def ScaleSegmentTimes(segments_file, recipes):
+    lines = [line.split() for line in open(segments_file)]
+    with open(segments_file, "w") as f:
+        for parts in lines:
+            speed = recipes[parts[1]]['speed'] if parts[1] in recipes else None
+            if speed is not None:
+                parts[2] = "{0:.2f}".format(float(parts[2]) / speed)
+                parts[3] = "{0:.2f}".format(float(parts[3]) / speed)
+            print(" ".join(parts), file=f)
+
+
 # This function creates multiple copies of the necessary files, e.g. utt2spk, wav.scp ...
 def CreateReverberatedCopy(input_dir,
                            output_dir,
-                           room_dict,  # the room dictionary, please refer to MakeRoomDict() for the format
-                           pointsource_noise_list, # the point source noise list
-                           iso_noise_dict, # the isotropic noise dictionary
+                           augmentation_index,  # the index of the rooms and noises, please refer to AugmentationIndex
                            foreground_snr_string, # the SNR for adding the foreground noises
                            background_snr_string, # the SNR for adding the background noises
                            num_replicas, # Number of replicate to generated for the data
@@ -407,7 +612,14 @@ def CreateReverberatedCopy(input_dir,
                            shift_output, # option whether to shift the output waveform
                            isotropic_noise_addition_probability, # Probability of adding isotropic noises
                            pointsource_noise_addition_probability, # Probability of adding point-source noises
-                           max_noises_per_minute  # maximum number of point-source noises that can be added to a recording according to its duration
+                           max_noises_per_minute,  # maximum number of point-source noises that can be added to a recording according to its duration
+                           random_seed,  # seed from which the random seeds of the shards are derived
+                           wav_archive = None, # if not None, the wave archive to which the reverberated recordings are written
+                           num_processes = 1, # number of processes generating the data and computing the recordings written to wav_archive
+                           wav_cache_dir = None, # if not None, the cache of the recordings written to wav_archive
+                           wav_cache_size = None, # maximum size of wav_cache_dir in bytes
+                           speed_perturb_factors = None, # if not None, the speed factors to pick from for the recordings written to wav_archive
+                           volume_range = None # if not None, the [min, max] range of the volume factors of the recordings written to wav_archive
                            ):
 
     wav_scp = ParseFileToDict(input_dir + "/wav.scp", value_processor = lambda x: " ".join(x))
@@ -424,10 +636,19 @@ def CreateReverberatedCopy(input_dir,
     foreground_snr_array = map(lambda x: float(x), foreground_snr_string.split(':'))
     background_snr_array = map(lambda x: float(x), background_snr_string.split(':'))
 
-    GenerateReverberatedWavScp(wav_scp, durations, output_dir, room_dict, pointsource_noise_list, iso_noise_dict,
+    recipes = None
+    if wav_archive is not None:
+        recipes = {}
+    GenerateReverberatedWavScp(wav_scp, durations, output_dir, augmentation_index,
                foreground_snr_array, background_snr_array, num_replicas, include_original, prefix,
                speech_rvb_probability, shift_output, isotropic_noise_addition_probability,
-               pointsource_noise_addition_probability, max_noises_per_minute)
+               pointsource_noise_addition_probability, max_noises_per_minute, random_seed,
+               num_processes, recipes, speed_perturb_factors, volume_range)
+    if wav_archive is not None:
+        print("Writing the reverberated recordings to {0}...".format(wav_archive))
+        aug_lib = imp.load_source('wal', 'steps/data/wav_augmentation_lib.py')
+        aug_lib.WriteWaveArchive(recipes, wav_archive, output_dir + "/wav.scp", num_processes,
+                                 wav_cache_dir, wav_cache_size)
 
     AddPrefixToFields(input_dir + "/utt2spk", output_dir + "/utt2spk", num_replicas, include_original, prefix, field = [0,1])
     data_lib.RunKaldiCommand("utils/utt2spk_to_spk2utt.pl <{output_dir}/utt2spk >{output_dir}/spk2utt"
@@ -443,6 +664,8 @@ def CreateReverberatedCopy(input_dir,
         AddPrefixToFields(input_dir + "/text", output_dir + "/text", num_replicas, include_original, prefix, field =[0])
     if os.path.isfile(input_dir + "/segments"):
         AddPrefixToFields(input_dir + "/segments", output_dir + "/segments", num_replicas, include_original, prefix, field = [0,1])
+        if recipes is not None:
+            ScaleSegmentTimes(output_dir + "/segments", recipes)
     if os.path.isfile(input_dir + "/reco2file_and_channel"):
         AddPrefixToFields(input_dir + "/reco2file_and_channel", output_dir + "/reco2file_and_channel", num_replicas, include_original, prefix, field = [0,1])
 
@@ -554,9 +777,7 @@ def MakeRoomDict(rir_list):
     for rir in rir_list:
         if rir.room_id not in room_dict:
             # add new room
-            room_dict[rir.room_id] = lambda: None
-            setattr(room_dict[rir.room_id], "rir_list", [])
-            setattr(room_dict[rir.room_id], "probability", 0)
+            room_dict[rir.room_id] = argparse.Namespace(room_id = rir.room_id, rir_list = [], probability = 0)
         room_dict[rir.room_id].rir_list.append(rir)
 
     # the probability of the room is the sum of probabilities of its RIR
@@ -627,18 +848,77 @@ def ParseNoiseList(noise_set_para_array, smoothing_weight, sampling_rate = None)
     return (pointsource_noise_list, iso_noise_dict)
 
 
-def Main():
-    args = GetArgs()
-    random.seed(args.random_seed)
+# This class is the index of the rooms and noises used to generate the
+# reverberated data. It has the following attributes:
+# room_table: the alias table of the rooms (please refer to MakeRoomDict() for their format);
+#   each room has an attribute rir_table, the alias table of its RIRs.
+# pointsource_noise_table: the alias table of the point-source noises, or None if there are none.
+# iso_noise_tables: a dictionary from the room-id to the alias table of its isotropic noises.
+# signature: describes the lists and options from which the index was built, see GetIndexSignature().
+class AugmentationIndex:
+  def __init__(self, rir_list, pointsource_noise_list, iso_noise_dict, signature):
+    room_dict = MakeRoomDict(rir_list)
+    for room_id in room_dict.keys():
+      room_dict[room_id].rir_table = AliasTable(room_dict[room_id].rir_list)
+    self.room_table = AliasTable([room_dict[room_id] for room_id in sorted(room_dict.keys())])
+    self.pointsource_noise_table = None
+    if len(pointsource_noise_list) > 0:
+      self.pointsource_noise_table = AliasTable(pointsource_noise_list)
+    self.iso_noise_tables = {}
+    for room_id in iso_noise_dict.keys():
+      self.iso_noise_tables[room_id] = AliasTable(iso_noise_dict[room_id])
+    self.num_rirs = len(rir_list)
+    self.num_pointsource_noises = len(pointsource_noise_list)
+    self.num_iso_noises = sum(len(iso_noise_dict[key]) for key in iso_noise_dict.keys())
+    self.signature = signature
+
+
+# This function returns a description of the RIR and noise lists and of the options
+# they are parsed with; a saved index is only used if its signature is the same.
+def GetIndexSignature(args):
+    list_files = []
+    for set_para in args.rir_set_para_array + (args.noise_set_para_array or []):
+        filename = set_para.split(',')[-1].strip()
+        stat = os.stat(filename)
+        list_files.append((filename, stat.st_size, stat.st_mtime))
+    return repr((args.rir_set_para_array, args.noise_set_para_array,
+                 args.rir_smoothing_weight, args.noise_smoothing_weight,
+                 args.source_sampling_rate, list_files))
+
+
+# This function loads the index from args.augmentation_index if it is up to date,
+# and otherwise builds it from the RIR and noise lists (and saves it if args.augmentation_index
+# is specified).
+def GetAugmentationIndex(args):
+    signature = GetIndexSignature(args)
+    if args.augmentation_index is not None and os.path.isfile(args.augmentation_index):
+        with open(args.augmentation_index, 'rb') as f:
+            augmentation_index = pickle.load(f)
+        if augmentation_index.signature == signature:
+            print("Loaded the index of RIRs and noises from {0}".format(args.augmentation_index))
+            return augmentation_index
+        print("The index {0} is out of date, rebuilding it".format(args.augmentation_index))
+
     rir_list = ParseRirList(args.rir_set_para_array, args.rir_smoothing_weight, args.source_sampling_rate)
-    print("Number of RIRs is {0}".format(len(rir_list)))
     pointsource_noise_list = []
     iso_noise_dict = {}
     if args.noise_set_para_array is not None:
         pointsource_noise_list, iso_noise_dict = ParseNoiseList(args.noise_set_para_array, args.noise_smoothing_weight, args.source_sampling_rate)
-        print("Number of point-source noises is {0}".format(len(pointsource_noise_list)))
-        print("Number of isotropic noises is {0}".format(sum(len(iso_noise_dict[key]) for key in iso_noise_dict.keys())))
-    room_dict = MakeRoomDict(rir_list)
+    augmentation_index = AugmentationIndex(rir_list, pointsource_noise_list, iso_noise_dict, signature)
+
+    if args.augmentation_index is not None:
+        with open(args.augmentation_index, 'wb') as f:
+            pickle.dump(augmentation_index, f, pickle.HIGHEST_PROTOCOL)
+    return augmentation_index
+
+
+def Main():
+    args = GetArgs()
+    augmentation_index = GetAugmentationIndex(args)
+    print("Number of RIRs is {0}".format(augmentation_index.num_rirs))
+    if args.noise_set_para_array is not None:
+        print("Number of point-source noises is {0}".format(augmentation_index.num_pointsource_noises))
+        print("Number of isotropic noises is {0}".format(augmentation_index.num_iso_noises))
 
     if args.include_original_data == "true":
         include_original = True
@@ -647,9 +927,7 @@ def Main():
 
     CreateReverberatedCopy(input_dir = args.input_dir,
                            output_dir = args.output_dir,
-                           room_dict = room_dict,
-                           pointsource_noise_list = pointsource_noise_list,
-                           iso_noise_dict = iso_noise_dict,
+                           augmentation_index = augmentation_index,
                            foreground_snr_string = args.foreground_snr_string,
                            background_snr_string = args.background_snr_string,
                            num_replicas = args.num_replicas,
@@ -659,7 +937,14 @@ def Main():
                            shift_output = args.shift_output,
                            isotropic_noise_addition_probability = args.isotropic_noise_addition_probability,
                            pointsource_noise_addition_probability = args.pointsource_noise_addition_probability,
-                           max_noises_per_minute = args.max_noises_per_minute)
+                           max_noises_per_minute = args.max_noises_per_minute,
+                           random_seed = args.random_seed,
+                           wav_archive = args.wav_archive,
+                           num_processes = args.num_processes,
+                           wav_cache_dir = args.wav_cache_dir,
+                           wav_cache_size = int(args.wav_cache_size * 2**30),
+                           speed_perturb_factors = args.speed_perturb_factors,
+                           volume_range = args.volume_range)
 
 if __name__ == "__main__":
     Main()
@@ -0,0 +1,361 @@
+# Apache 2.0
+#
+# This module renders augmented recordings in-process with numpy.  It is used by
+# steps/data/reverberate_data_dir.py and steps/data/augment_data_dir.py when
+# --wav-archive is given: instead of writing a chain of wav-reverberate pipes to
+# wav.scp (which is re-run each time the wav.scp is read, e.g. by every run of
+# make_mfcc.sh), the augmented recordings are computed once and written to a
+# wave archive, and the wav.scp points into that archive.
+#
+# What to render is described by a "recipe", which is a dictionary with the
+# following keys (see MakeRecipe() in steps/data/reverberate_data_dir.py):
+#   wav           rxfilename of the recording: a filename, a piped command
+#                 ending in '|', or an archive offset such as foo.ark:1234.
+#   rir           rxfilename of the impulse response, or None.
+#   shift_output  if True, the output is shifted by the position of the peak
+#                 of the RIR and has the length of the input.
+#   duration      if not None, the output is extended (by repetition) or
+#                 truncated to this duration in seconds.
+#   noises        a list of (recipe, start_time, snr) tuples, the additive
+#                 signals; each noise is itself rendered from its recipe.
+#   speed         if not None, the recording is first speed-perturbed by this
+#                 factor, like "sox ... speed <factor>" does, i.e. it is
+#                 resampled so that it plays this many times faster (changing
+#                 both the tempo and the pitch); see SpeedPerturb().
+#   volume        if not None, the output is scaled by this factor after it is
+#                 normalized to the power of the input.
+# The computation follows src/featbin/wav-reverberate.cc, except that only the
+# first channel of each recording is used.
+#
+# The rendered recordings can also be kept in a cache directory, indexed by a
+# hash of their recipe (together with the size and modification time of the
+# files it reads), so that the same recording is not computed again when the
+# augmentation is re-run, e.g. in another experiment.  The least recently used
+# entries are removed once the cache grows beyond its maximum size.
+
+from __future__ import print_function
+import fractions, hashlib, io, json, multiprocessing, os, re, struct, subprocess, tempfile, time, wave
+import numpy as np
+
+# The early reverberation used for the SNR computations is the part of the RIR
+# from 1ms before its peak to 50ms after it (as in wav-reverberate).
+EARLY_RIR_BEFORE_PEAK = 0.001
+EARLY_RIR_AFTER_PEAK = 0.05
+
+# The number of zeros of the windowed-sinc filter on each side used for the speed
+# perturbation (as the num_zeros of LinearResample in src/feat/resample.h).
+RESAMPLE_NUM_ZEROS = 32
+
+
+def ReadWave(rxfilename):
+    """ Reads a 16-bit wave file from a Kaldi rxfilename and returns a tuple
+        (sampling frequency, samples of the first channel as float64) """
+    rxfilename = rxfilename.strip()
+    if rxfilename.endswith('|'):
+        p = subprocess.Popen(rxfilename[:-1], shell = True, stdout = subprocess.PIPE)
+        data = p.communicate()[0]
+        if p.returncode != 0:
+            raise Exception("There was an error while running the command {0}".format(rxfilename))
+        return _ReadWaveFromStream(io.BytesIO(data), rxfilename)
+
+    filename, offset = rxfilename, 0
+    m = re.match(r'^(.+):(\d+)$', rxfilename)
+    if m is not None and not os.path.exists(rxfilename):
+        filename, offset = m.group(1), int(m.group(2))
+    with open(filename, 'rb') as f:
+        f.seek(offset)
+        return _ReadWaveFromStream(f, rxfilename)
+
+
+def _ReadWaveFromStream(f, rxfilename):
+    w = wave.open(f, 'rb')
+    if w.getsampwidth() != 2:
+        raise Exception("Only 16-bit wave files are supported: {0}".format(rxfilename))
+    num_channels = w.getnchannels()
+    samples = np.frombuffer(w.readframes(w.getnframes()), dtype = '<i2')
+    samples = samples.reshape(-1, num_channels)[:, 0].astype(np.float64)
+    return w.getframerate(), samples
+
+
+def GetWaveBytes(samp_freq, samples):
+    """ Returns the samples as a 16-bit mono wave file; like Kaldi, the samples
+        are truncated towards zero and clipped to the 16-bit range """
+    data = np.clip(np.trunc(samples), -32768, 32767).astype('<i2').tobytes()
+    header = struct.pack('<4sI4s4sIHHIIHH4sI', b'RIFF', 36 + len(data), b'WAVE',
+                         b'fmt ', 16, 1, 1, samp_freq, samp_freq * 2, 2, 16,
+                         b'data', len(data))
+    return header + data
+
+
+def FftConvolve(signal, filter):
+    num_samp = len(signal) + len(filter) - 1
+    fft_length = 1 << (num_samp - 1).bit_length()
+    return np.fft.irfft(np.fft.rfft(signal, fft_length) * np.fft.rfft(filter, fft_length),
+                        fft_length)[:num_samp]
+
+
+def ComputeEarlyReverbEnergy(rir, signal, samp_freq):
+    peak_index = int(np.argmax(rir))
+    start_index = max(0, peak_index - int(EARLY_RIR_BEFORE_PEAK * samp_freq))
+    end_index = min(len(rir), peak_index + int(EARLY_RIR_AFTER_PEAK * samp_freq))
+    early_reverb = FftConvolve(signal, rir[start_index:end_index])
+    return np.dot(early_reverb, early_reverb) / len(early_reverb)
+
+
+def AddNoise(noise, snr_db, start_time, samp_freq, signal_power, signal):
+    """ Scales the noise to the requested SNR w.r.t. signal_power and adds it to
+        the signal (in place) starting at start_time; the noise is not repeated """
+    noise_power = np.dot(noise, noise) / len(noise)
+    if noise_power == 0:
+        return
+    scale = np.sqrt(10 ** (-snr_db / 10.0) * signal_power / noise_power)
+    offset = int(start_time * samp_freq)
+    add_length = min(len(signal) - offset, len(noise))
+    if add_length > 0:
+        signal[offset:offset + add_length] += scale * noise[:add_length]
+
+
+def SpeedPerturb(signal, speed):
+    """ Returns the signal resampled to play 'speed' times faster.  As in
+        LinearResample (src/feat/resample.cc), each output sample is a sum of
+        the input samples weighted by a Hanning-windowed sinc filter, whose
+        cutoff is 0.95 times the lower of the input and output Nyquist
+        frequencies, so that speeding up does not alias.  The speed is
+        approximated by a fraction p/q with q <= 1000, so that the output
+        samples fall at only q different phases between the input samples and
+        the filter weights are computed once for each phase. """
+    ratio = fractions.Fraction(speed).limit_denominator(1000)
+    if ratio == 1:
+        return signal
+    speed = float(ratio)
+    num_phases = ratio.denominator
+    num_samp = int(round(len(signal) / speed))
+    # in cycles per input sample
+    cutoff = 0.95 * 0.5 * min(1.0, 1.0 / speed)
+    window_width = RESAMPLE_NUM_ZEROS / (2.0 * cutoff)
+    max_offset = int(np.ceil(window_width))
+    offsets = np.arange(-max_offset, max_offset + 1)
+
+    # weights[i, j] is the weight of the input sample at offsets[j] from an
+    # output sample at phase i / num_phases after the preceding input sample.
+    delta_t = (np.arange(num_phases) / float(num_phases))[:, np.newaxis] - offsets
+    window = 0.5 * (1 + np.cos(2 * np.pi * cutoff / RESAMPLE_NUM_ZEROS * delta_t))
+    weights = np.where(np.abs(delta_t) < window_width,
+                       window * 2 * cutoff * np.sinc(2 * cutoff * delta_t), 0.0)
+
+    padded = np.concatenate([np.zeros(max_offset), signal, np.zeros(max_offset + 1)])
+    position = np.arange(num_samp, dtype = np.int64) * ratio.numerator
+    index = position // num_phases + max_offset
+    phase = position % num_phases
+    output = np.zeros(num_samp)
+    for j in range(len(offsets)):
+        output += weights[phase, j] * padded[index + offsets[j]]
+    return output
+
+
+# The RIRs are shared by many recordings, so each process keeps the ones it has
+# read.
+rir_cache = {}
+
+def ReadRir(rxfilename):
+    if rxfilename not in rir_cache:
+        samp_freq, rir = ReadWave(rxfilename)
+        rir_cache[rxfilename] = (samp_freq, rir / (1 << 15))
+    return rir_cache[rxfilename]
+
+
+def RenderRecipe(recipe):
+    """ Returns a tuple (sampling frequency, samples) of the recording described
+        by the recipe """
+    samp_freq, signal = ReadWave(recipe['wav'])
+    if recipe['speed'] is not None:
+        signal = SpeedPerturb(signal, recipe['speed'])
+    num_samp_input = len(signal)
+    if num_samp_input == 0:
+        raise Exception("Empty recording {0}".format(recipe['wav']))
+    power_before_reverb = np.dot(signal, signal) / num_samp_input
+
+    shift_index = 0
+    num_samp_output = num_samp_input
+    if recipe['rir'] is not None:
+        rir_samp_freq, rir = ReadRir(recipe['rir'])
+        if rir_samp_freq != samp_freq:
+            raise Exception("Sampling frequency of the RIR {0} does not match that of "
+                            "the recording {1}".format(recipe['rir'], recipe['wav']))
+        early_energy = ComputeEarlyReverbEnergy(rir, signal, samp_freq)
+        signal = FftConvolve(signal, rir)
+        if recipe['shift_output']:
+            shift_index = int(np.argmax(rir))
+        else:
+            num_samp_output = len(signal)
+    else:
+        early_energy = power_before_reverb
+
+    for noise_recipe, start_time, snr in recipe['noises']:
+        noise_samp_freq, noise = RenderRecipe(noise_recipe)
+        if noise_samp_freq != samp_freq:
+            raise Exception("Sampling frequency of the additive signal {0} does not match "
+                            "that of the recording {1}".format(noise_recipe['wav'], recipe['wav']))
+        AddNoise(noise, float(snr), float(start_time), samp_freq, early_energy, signal)
+
+    power_after_reverb = np.dot(signal, signal) / len(signal)
+    if power_after_reverb > 0:
+        signal *= np.sqrt(power_before_reverb / power_after_reverb)
+    if recipe['volume'] is not None:
+        signal *= recipe['volume']
+
+    signal = signal[shift_index:shift_index + num_samp_output]
+    if recipe['duration'] is not None:
+        num_samp_output = int(samp_freq * recipe['duration'])
+        num_repeats = -(-num_samp_output // len(signal))
+        signal = np.tile(signal, num_repeats)[:num_samp_output]
+    return samp_freq, signal
+
+
+# Change this if the way the recordings are rendered changes, so that the
+# recordings in existing caches are not used any more.
+CACHE_VERSION = 1
+
+def GetFileStamps(recipe, stamps):
+    """ Appends to 'stamps' the (filename, size, modification time) of the files
+        read by the recipe; piped commands are identified by their text only """
+    for rxfilename in [recipe['wav'], recipe['rir']]:
+        if rxfilename is not None and not rxfilename.strip().endswith('|'):
+            filename = re.sub(r':\d+$', '', rxfilename.strip())
+            if os.path.exists(filename):
+                stat = os.stat(filename)
+                stamps.append([filename, stat.st_size, stat.st_mtime])
+    for noise_recipe, start_time, snr in recipe['noises']:
+        GetFileStamps(noise_recipe, stamps)
+    return stamps
+
+
+def GetCacheFile(cache_dir, recipe):
+    stamps = GetFileStamps(recipe, [])
+    text = json.dumps([CACHE_VERSION, recipe, stamps], sort_keys = True)
+    digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, digest[:2], digest + '.wav')
+
+
+def ReadCacheFile(cache_file):
+    try:
+        with open(cache_file, 'rb') as f:
+            data = f.read()
+    except IOError:
+        return None
+    # the modification time is used to find the least recently used entries;
+    # the entry may already have been evicted by another process sharing the
+    # cache, but we have its data anyway.
+    try:
+        os.utime(cache_file, None)
+    except OSError:
+        pass
+    return data
+
+
+def WriteCacheFile(cache_file, data):
+    # we write to a temporary file and rename it, so that processes that share
+    # the cache never see a partially written entry.
+    cache_subdir = os.path.dirname(cache_file)
+    if not os.path.isdir(cache_subdir):
+        try:
+            os.makedirs(cache_subdir)
+        except OSError:
+            if not os.path.isdir(cache_subdir):
+                raise
+    fd, tmp_file = tempfile.mkstemp(dir = cache_subdir, suffix = '.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.rename(tmp_file, cache_file)
+
+
+# Temporary files of the cache (see WriteCacheFile()) older than this many
+# seconds were left by processes that were killed, and are removed on eviction.
+STALE_TMP_FILE_AGE = 3600
+
+def EvictFromCache(cache_dir, max_size):
+    """ Removes the least recently used entries of the cache until the total
+        size of the remaining ones is at most max_size bytes, and the stale
+        temporary files. Other processes sharing the cache may remove
+        entries at the same time. """
+    entries = []
+    total_size = 0
+    now = time.time()
+    for cache_subdir, dirs, files in os.walk(cache_dir):
+        for name in files:
+            if not (name.endswith('.wav') or name.endswith('.tmp')):
+                continue
+            filename = os.path.join(cache_subdir, name)
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            if name.endswith('.tmp'):
+                if now - stat.st_mtime > STALE_TMP_FILE_AGE:
+                    try:
+                        os.remove(filename)
+                    except OSError:
+                        pass
+                continue
+            entries.append((stat.st_mtime, stat.st_size, filename))
+            total_size += stat.st_size
+    entries.sort()
+    for mtime, size, filename in entries:
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+        total_size -= size
+
+
+def RenderItem(item):
+    key, recipe, cache_dir = item
+    cache_file = None
+    if cache_dir is not None:
+        cache_file = GetCacheFile(cache_dir, recipe)
+        data = ReadCacheFile(cache_file)
+        if data is not None:
+            return key, data, True
+    samp_freq, signal = RenderRecipe(recipe)
+    data = GetWaveBytes(samp_freq, signal)
+    if cache_file is not None:
+        WriteCacheFile(cache_file, data)
+    return key, data, False
+
+
+def WriteWaveArchive(recipes, archive, wav_scp, num_processes = 1,
+                     cache_dir = None, max_cache_size = None):
+    """ Renders the recipes (a dictionary from recording-id to recipe), writes
+        them to the wave archive and writes a wav.scp pointing into it. With
+        num_processes > 1 the recordings are rendered by a pool of processes,
+        but they are written in sorted order in any case.  If cache_dir is not
+        None, recordings found in the cache are not rendered again, the newly
+        rendered ones are added to it and, if max_cache_size (in bytes) is not
+        None, the cache is then reduced to that size. """
+    items = ((key, recipes[key], cache_dir) for key in sorted(recipes.keys()))
+    pool = None
+    if num_processes > 1:
+        pool = multiprocessing.Pool(num_processes)
+        rendered = pool.imap(RenderItem, items, chunksize = 4)
+    else:
+        rendered = (RenderItem(item) for item in items)
+
+    num_cached = 0
+    with open(archive, 'wb') as ark, open(wav_scp, 'w') as scp:
+        for key, data, cached in rendered:
+            ark.write(key.encode('utf-8') + b' ')
+            print("{0} {1}:{2}".format(key, archive, ark.tell()), file = scp)
+            ark.write(data)
+            num_cached += cached
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    if cache_dir is not None:
+        print("Took {0} of {1} recordings from the cache {2}".format(
+              num_cached, len(recipes), cache_dir))
+        if max_cache_size is not None:
+            EvictFromCache(cache_dir, max_cache_size)
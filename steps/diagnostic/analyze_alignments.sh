@@ -8,6 +8,8 @@
 
 # begin configuration section.
 cmd=run.pl
+num_processes=1  # number of processes that read the phone stats of the jobs in
+                 # analyze_phone_length_stats.py.
 #end configuration section.
 
 echo "$0 $@"  # Print the command line for logging
@@ -19,6 +21,7 @@ if [ $# -ne 2 ]; then
   echo "Usage: $0 [options] <lang-dir> <ali-dir>"
   echo " Options:"
   echo "    --cmd (run.pl|queue.pl...)      # specify how to run the sub-processes."
+  echo "    --num-processes <n>             # number of processes that read the stats (default: 1)"
   echo "e.g.:"
   echo "$0 data/lang exp/tri4b"
   echo "This script writes some diagnostics to <ali-dir>/log/alignments.log"
@@ -47,9 +50,9 @@ $cmd JOB=1:$num_jobs $dir/log/get_phone_alignments.JOB.log \
    awk 'BEGIN{FS=" ; "; OFS="\n";} {print "begin " $1; print "end " $NF; for (n=1;n<=NF;n++) print "all " $n; }' \| \
    sort \| uniq -c \| gzip -c '>' $dir/phone_stats.JOB.gz || exit 1
 
-if ! $cmd $dir/log/analyze_alignments.log \
-  gunzip -c "$dir/phone_stats.*.gz" \| \
-  steps/diagnostic/analyze_phone_length_stats.py $lang; then
+if ! $cmd --num-threads $num_processes $dir/log/analyze_alignments.log \
+  steps/diagnostic/analyze_phone_length_stats.py --num-processes $num_processes \
+    $lang $dir/phone_stats.*.gz; then
   echo "$0: analyze_phone_length_stats.py failed, but ignoring the error (it's just for diagnostics)"
 fi
 
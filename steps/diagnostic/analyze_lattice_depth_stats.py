@@ -6,8 +6,13 @@
 
 from __future__ import print_function
 import argparse
+import functools
 import sys, os
-from collections import defaultdict
+
+import numpy as np
+
+sys.path.insert(0, 'steps')
+import libs.histogram as histogram_lib
 
 
 parser = argparse.ArgumentParser(description="This script reads stats created in analyze_lats.sh "
@@ -19,9 +24,16 @@ parser.add_argument("--frequency-cutoff-percentage", type = float,
                     default = 0.5, help="Cutoff, expressed as a percentage "
                     "(between 0 and 100), of frequency at which we print stats "
                     "for a phone.")
+parser.add_argument("--num-processes", type = int, default = 1,
+                    help="Number of processes that read the stats files in "
+                    "parallel.")
 
 parser.add_argument("lang",
                     help="Language directory, e.g. data/lang.")
+parser.add_argument("stats_files", nargs = "*",
+                    help="Files (possibly gzipped, e.g. one per job) with lines "
+                    "'phone depth count'; they are read from the standard input "
+                    "if not given.")
 
 args = parser.parse_args()
 
@@ -58,72 +70,55 @@ except Exception as e:
     sys.exit("analyze_lattice_depth_stats.py: error processing {0}/phones/silence.csl: {1}".format(
             args.lang, str(e)))
 
-# phone_depth_counts is a dict of dicts.
-# for each integer phone-id 'phone',
-# phone_depth_counts[phone] is a map from depth to count (of frames on which
-# that was the 1-best phone in the alignment, and the lattice depth
-# had that value).  So we'd access it as
-# count = phone_depth_counts[phone][depth].
 
+# Returns a histogram_lib.Histograms with one row per integer phone-id 'phone',
+# such that row(phone)[depth] is the count (of frames on which that was the
+# 1-best phone in the alignment, and the lattice depth had that value) in the
+# file 'filename'.  'known_phones' is a numpy array of bools indexed by phone.
+def AccumulateDepthStats(known_phones, filename):
+    fields = histogram_lib.read_fields(filename, 3)
+    try:
+        phones, depths, counts = fields.astype(np.int64).T
+    except ValueError as e:
+        raise ValueError("could not interpret stats: " + str(e))
+    unknown = (phones < 0) | (phones >= len(known_phones))
+    unknown[~unknown] = ~known_phones[phones[~unknown]]
+    if unknown.any():
+        raise ValueError("unexpected phone {0} seen (lang directory mismatch?)".format(
+                phones[unknown][0]))
+    histograms = histogram_lib.Histograms(len(known_phones))
+    histograms.add(phones, depths, counts)
+    return histograms
+
+
+known_phones = np.zeros(max(phone_int2text.keys()) + 1, dtype=bool)
+known_phones[list(phone_int2text.keys())] = True
+stats_files = args.stats_files if len(args.stats_files) > 0 else [ "-" ]
+try:
+    histograms = histogram_lib.accumulate_in_parallel(
+        functools.partial(AccumulateDepthStats, known_phones),
+        stats_files, args.num_processes)
+except (IOError, ValueError) as e:
+    sys.exit("analyze_lattice_depth_stats.py: error reading stats: " + str(e))
+
+# phone_depth_counts is a dict from the integer phone-id 'phone' to the
+# histogram (a numpy array of counts indexed by depth) of the frames on which
+# that was the 1-best phone in the alignment.  So we'd access it as
+# count = phone_depth_counts[phone][depth].
+# note: 0 is for all nonsilence phones, and -1 is for all phones put in one
+# bucket.
 phone_depth_counts = dict()
+for p in phone_int2text.keys():
+    phone_depth_counts[p] = histograms.row(p)
+phone_depth_counts[0] = histograms.sum_rows([0] + sorted(nonsilence))
+phone_depth_counts[-1] = histograms.counts.sum(axis=0)
 
-# note: -1 is for all phones put in one bucket.
-for p in [ -1 ] + phone_int2text.keys():
-    phone_depth_counts[p] = defaultdict(int)
-
-total_frames = 0
-
-while True:
-    line = sys.stdin.readline()
-    if line == '':
-        break
-    a = line.split()
-    if len(a) != 3:
-        sys.exit("analyze_lattice_depth_stats.py: reading stdin, could not interpret line: " + line)
-    try:
-        phone, depth, count = [ int(x) for x in a ]
-
-        phone_depth_counts[phone][depth] += count
-        total_frames += count
-        if phone in nonsilence:
-            nonsilence_phone = 0
-            phone_depth_counts[nonsilence_phone][depth] += count
-        universal_phone = -1
-        phone_depth_counts[universal_phone][depth] += count
-    except Exception as e:
-        sys.exit("analyze_lattice_depth_stats.py: unexpected phone {0} "
-                 "seen (lang directory mismatch?): line is {1}, error is {2}".format(phone, line, str(e)))
+total_frames = histogram_lib.get_total(phone_depth_counts[-1])
 
 if total_frames == 0:
     sys.exit("analyze_lattice_depth_stats.py: read no input")
 
 
-# If depth_to_count is a map from depth-in-frames to count,
-# return the depth-in-frames that equals the (fraction * 100)'th
-# percentile of the distribution.
-def GetPercentile(depth_to_count, fraction):
-    this_total_frames = sum(depth_to_count.values())
-    if this_total_frames == 0:
-        return 0
-    else:
-        items = sorted(depth_to_count.items())
-        count_cutoff = int(fraction * this_total_frames)
-        cur_count_total = 0
-        for depth,count in items:
-            assert count >= 0
-            cur_count_total += count
-            if cur_count_total >= count_cutoff:
-                return depth
-        assert false # we shouldn't reach here.
-
-def GetMean(depth_to_count):
-    this_total_frames = sum(depth_to_count.values())
-    if this_total_frames == 0:
-        return 0.0
-    this_total_depth = sum([ float(l * c) for l,c in depth_to_count.items() ])
-    return this_total_depth / this_total_frames
-
-
 print("The total amount of data analyzed assuming 100 frames per second "
       "is {0} hours".format("%.1f" % (total_frames / 360000.0)))
 
@@ -135,17 +130,18 @@ print("The total amount of data analyzed assuming 100 frames per second "
 
 
 # sort the phones in decreasing order of count.
-for phone,depths in sorted(phone_depth_counts.items(), key = lambda x : -sum(x[1].values())):
+for phone,depths in sorted(phone_depth_counts.items(),
+                           key = lambda x : (-histogram_lib.get_total(x[1]), x[0])):
 
-    frequency_percentage = sum(depths.values()) * 100.0 / total_frames
+    frequency_percentage = histogram_lib.get_total(depths) * 100.0 / total_frames
     if frequency_percentage < args.frequency_cutoff_percentage:
         continue
 
 
-    depth_percentile_10 = GetPercentile(depths, 0.1)
-    depth_percentile_50 = GetPercentile(depths, 0.5)
-    depth_percentile_90 = GetPercentile(depths, 0.9)
-    depth_mean = GetMean(depths)
+    depth_percentile_10 = histogram_lib.get_percentile(depths, 0.1)
+    depth_percentile_50 = histogram_lib.get_percentile(depths, 0.5)
+    depth_percentile_90 = histogram_lib.get_percentile(depths, 0.9)
+    depth_mean = histogram_lib.get_mean(depths)
 
     if phone > 0:
         try:
@@ -6,9 +6,15 @@
 
 from __future__ import print_function
 import argparse
+import functools
 import sys, os
 from collections import defaultdict
 
+import numpy as np
+
+sys.path.insert(0, 'steps')
+import libs.histogram as histogram_lib
+
 
 parser = argparse.ArgumentParser(description="This script reads stats created in analyze_alignments.sh "
                                  "to print information about phone lengths in alignments.  It's principally "
@@ -21,9 +27,16 @@ parser.add_argument("--frequency-cutoff-percentage", type = float,
                     default = 0.5, help="Cutoff, expressed as a percentage "
                     "(between 0 and 100), of frequency at which we print stats "
                     "for a phone.")
+parser.add_argument("--num-processes", type = int, default = 1,
+                    help="Number of processes that read the stats files in "
+                    "parallel.")
 
 parser.add_argument("lang",
                     help="Language directory, e.g. data/lang.")
+parser.add_argument("stats_files", nargs = "*",
+                    help="Files (possibly gzipped, e.g. one per job) with lines "
+                    "'count boundary-type phone length'; they are read from the "
+                    "standard input if not given.")
 
 args = parser.parse_args()
 
@@ -63,47 +76,68 @@ except Exception as e:
             args.lang, str(e)))
 
 
-# phone_length is a dict of dicts of dicts;
-# it's indexed
-# phone_length[boundary_type][
+boundary_types = [ 'begin', 'end', 'all' ]
+
+# Returns a histogram_lib.Histograms with one row per pair (boundary_type,
+# phone), at index boundary_types.index(boundary_type) * len(known_phones) + phone,
+# such that the row's histogram maps the length of the phone instances in
+# frames to their count of occurrences in the file 'filename'.
+# 'known_phones' is a numpy array of bools indexed by phone.
+def AccumulateLengthStats(known_phones, filename):
+    fields = histogram_lib.read_fields(filename, 4)
+    boundary_indexes = np.full(len(fields), -1, dtype=np.int64)
+    for i, boundary_type in enumerate(boundary_types):
+        boundary_indexes[fields[:, 1] == boundary_type] = i
+    if (boundary_indexes < 0).any():
+        raise ValueError("unexpected boundary type {0}".format(
+                fields[boundary_indexes < 0][0][1]))
+    try:
+        counts, phones, lengths = fields[:, [0, 2, 3]].astype(np.int64).T
+    except ValueError as e:
+        raise ValueError("could not interpret stats: " + str(e))
+    unknown = (phones < 0) | (phones >= len(known_phones))
+    unknown[~unknown] = ~known_phones[phones[~unknown]]
+    if unknown.any():
+        raise ValueError("unexpected phone {0} seen (lang directory mismatch?)".format(
+                phones[unknown][0]))
+    histograms = histogram_lib.Histograms(len(boundary_types) * len(known_phones))
+    histograms.add(boundary_indexes * len(known_phones) + phones, lengths, counts)
+    return histograms
+
+
+known_phones = np.zeros(max(phone_int2text.keys()) + 1, dtype=bool)
+known_phones[list(phone_int2text.keys())] = True
+stats_files = args.stats_files if len(args.stats_files) > 0 else [ "-" ]
+try:
+    histograms = histogram_lib.accumulate_in_parallel(
+        functools.partial(AccumulateLengthStats, known_phones),
+        stats_files, args.num_processes)
+except (IOError, ValueError) as e:
+    sys.exit("analyze_phone_length_stats.py: error reading stats: " + str(e))
+
+# phone_lengths is a dict of dicts;
 # phone_lengths[boundary_type] for boundary_type in [ 'begin', 'end', 'all' ] is
-# a dict from a 2-tuple (phone, length) to a count of occurrences, where phone is
-# an integer phone-id, and length is the length of the phone instance in frames.
-# note: for the 'begin' and 'end' boundary-types, we group all nonsilence phones
-# into phone-id zero.
+# a dict from the integer phone-id 'phone' to the histogram (a numpy array of
+# counts indexed by length) of the lengths in frames of the instances of that
+# phone.
+# note: we group all nonsilence phones into phone-id zero.
 phone_lengths = dict()
-for boundary_type in [ 'begin', 'end', 'all' ]:
-    phone_lengths[boundary_type] = dict()
-    for p in phone_int2text.keys():
-        phone_lengths[boundary_type][p] = defaultdict(int)
-
 # total_phones is a dict from boundary_type to total count [of phone occurrences]
 total_phones = defaultdict(int)
 # total_frames is a dict from boundary_type to total number of frames.
 total_frames = defaultdict(int)
-# total_frames is a dict from num-frames to count of num-utterances with that
-# num-frames.
-
-while True:
-    line = sys.stdin.readline()
-    if line == '':
-        break
-    a = line.split()
-    if len(a) != 4:
-        sys.exit("analyze_phone_length_stats.py: reading stdin, could not interpret line: " + line)
-    try:
-        count, boundary_type, phone, length = a
-        total_phones[boundary_type] += int(count)
-        total_frames[boundary_type] += int(count) * int(length)
-        phone_lengths[boundary_type][int(phone)][int(length)] += int(count)
-        if int(phone) in nonsilence:
-            nonsilence_phone = 0
-            phone_lengths[boundary_type][nonsilence_phone][int(length)] += int(count)
-    except Exception as e:
-        sys.exit("analyze_phone_length_stats.py: unexpected phone {0} "
-                 "seen (lang directory mismatch?): {1}".format(phone, str(e)))
-
-if len(phone_lengths) == 0:
+for i, boundary_type in enumerate(boundary_types):
+    offset = i * len(known_phones)
+    phone_lengths[boundary_type] = dict()
+    for p in phone_int2text.keys():
+        phone_lengths[boundary_type][p] = histograms.row(offset + p)
+    phone_lengths[boundary_type][0] = histograms.sum_rows(
+        [ offset ] + [ offset + p for p in sorted(nonsilence) ])
+    boundary_lengths = histograms.counts[offset:offset + len(known_phones)].sum(axis=0)
+    total_phones[boundary_type] = histogram_lib.get_total(boundary_lengths)
+    total_frames[boundary_type] = histogram_lib.get_sum_of_values(boundary_lengths)
+
+if total_phones['all'] == 0:
     sys.exit("analyze_phone_length_stats.py: read no input")
 
 # work out the optional-silence phone
@@ -120,7 +154,7 @@ except:
     optional_silence_phone = 1
     for p in phone_int2text.keys():
         if p > 0 and not p in nonsilence:
-            this_count = sum([ l * c for l,c in phone_lengths['all'][p].items() ])
+            this_count = histogram_lib.get_sum_of_values(phone_lengths['all'][p])
             if this_count > largest_count:
                 largest_count = this_count
                 optional_silence_phone = p
@@ -131,32 +165,6 @@ except:
 
 
 
-# If length_to_count is a map from length-in-frames to count,
-# return the length-in-frames that equals the (fraction * 100)'th
-# percentile of the distribution.
-def GetPercentile(length_to_count, fraction):
-    total_phones = sum(length_to_count.values())
-    if total_phones == 0:
-        return 0
-    else:
-        items = sorted(length_to_count.items())
-        count_cutoff = int(fraction * total_phones)
-        cur_count_total = 0
-        for length,count in items:
-            assert count >= 0
-            cur_count_total += count
-            if cur_count_total >= count_cutoff:
-                return length
-        assert false # we shouldn't reach here.
-
-def GetMean(length_to_count):
-    total_phones = sum(length_to_count.values())
-    if total_phones == 0:
-        return 0.0
-    total_frames = sum([ float(l * c) for l,c in length_to_count.items() ])
-    return total_frames / total_phones
-
-
 # Analyze frequency, median and mean of optional-silence at beginning and end of utterances.
 # The next block will print something like
 #  "At utterance begin, SIL is seen 15.0% of the time; when seen, duration (median, mean) is (5, 7.6) frames."
@@ -170,7 +178,7 @@ for boundary_type in 'begin', 'end':
     num_utterances = total_phones[boundary_type]
     assert num_utterances > 0
     opt_sil_lengths = phone_to_lengths[optional_silence_phone]
-    frequency_percentage = sum(opt_sil_lengths.values()) * 100.0 / num_utterances
+    frequency_percentage = histogram_lib.get_total(opt_sil_lengths) * 100.0 / num_utterances
     # The reason for this warning is that the tradition in speech recognition is
     # to supply a little silence at the beginning and end of utterances... up to
     # maybe half a second.  If your database is not like this, you should know;
@@ -199,14 +207,15 @@ for boundary_type in 'begin', 'end', 'all':
     phone_to_lengths = phone_lengths[boundary_type]
     tot_num_phones = total_phones[boundary_type]
     # sort the phones in decreasing order of count.
-    for phone,lengths in sorted(phone_to_lengths.items(), key = lambda x : -sum(x[1].values())):
-        frequency_percentage = sum(lengths.values()) * 100.0 / tot_num_phones
+    for phone,lengths in sorted(phone_to_lengths.items(),
+                                key = lambda x : (-histogram_lib.get_total(x[1]), x[0])):
+        frequency_percentage = histogram_lib.get_total(lengths) * 100.0 / tot_num_phones
         if frequency_percentage < args.frequency_cutoff_percentage:
             continue
 
-        duration_median = GetPercentile(lengths, 0.5)
-        duration_percentile_95 = GetPercentile(lengths, 0.95)
-        duration_mean = GetMean(lengths)
+        duration_median = histogram_lib.get_percentile(lengths, 0.5)
+        duration_percentile_95 = histogram_lib.get_percentile(lengths, 0.95)
+        duration_mean = histogram_lib.get_mean(lengths)
 
         text = boundary_to_text[boundary_type]  # e.g. 'At utterance begin'.
         try:
@@ -228,17 +237,16 @@ for boundary_type in 'begin', 'end', 'all':
 total_frames['internal'] = total_frames['all'] - total_frames['begin'] - total_frames['end']
 total_phones['internal'] = total_phones['all'] - total_phones['begin'] - total_phones['end']
 
-internal_opt_sil_phone_lengths = dict(phone_lengths['all'][optional_silence_phone])
-for length in internal_opt_sil_phone_lengths.keys():
-    # subtract the counts for begin and end from the overall counts to get the
-    # word-internal count.
-    internal_opt_sil_phone_lengths[length] -= (phone_lengths['begin'][optional_silence_phone][length] +
-                                               phone_lengths['end'][optional_silence_phone][length])
+# subtract the counts for begin and end from the overall counts to get the
+# word-internal count.
+internal_opt_sil_phone_lengths = (phone_lengths['all'][optional_silence_phone] -
+                                  phone_lengths['begin'][optional_silence_phone] -
+                                  phone_lengths['end'][optional_silence_phone])
 
 if total_phones['internal'] != 0.0:
-    total_internal_optsil_frames = sum([ float(l * c) for l,c in internal_opt_sil_phone_lengths.items() ])
-    total_optsil_frames = sum([ float(l * c)
-                                for l,c in phone_lengths['all'][optional_silence_phone].items() ])
+    total_internal_optsil_frames = histogram_lib.get_sum_of_values(internal_opt_sil_phone_lengths)
+    total_optsil_frames = histogram_lib.get_sum_of_values(
+        phone_lengths['all'][optional_silence_phone])
     opt_sil_internal_frame_percent = total_internal_optsil_frames * 100.0 / total_frames['internal']
     opt_sil_total_frame_percent = total_optsil_frames * 100.0 / total_frames['all']
     internal_frame_percent = total_frames['internal'] * 100.0 / total_frames['all']
@@ -255,11 +263,11 @@ if total_phones['internal'] != 0.0:
           "or {1} hours if {2} frames are excluded.".format(
             "%.1f" % hours_total, "%.1f" % hours_nonsil, optional_silence_phone_text))
 
-    opt_sil_internal_phone_percent = (sum(internal_opt_sil_phone_lengths.values()) *
+    opt_sil_internal_phone_percent = (histogram_lib.get_total(internal_opt_sil_phone_lengths) *
                                       100.0 / total_phones['internal'])
-    duration_median = GetPercentile(internal_opt_sil_phone_lengths, 0.5)
-    duration_mean = GetMean(internal_opt_sil_phone_lengths)
-    duration_percentile_95 = GetPercentile(internal_opt_sil_phone_lengths, 0.95)
+    duration_median = histogram_lib.get_percentile(internal_opt_sil_phone_lengths, 0.5)
+    duration_mean = histogram_lib.get_mean(internal_opt_sil_phone_lengths)
+    duration_percentile_95 = histogram_lib.get_percentile(internal_opt_sil_phone_lengths, 0.95)
     print("Utterance-internal optional-silences {0} comprise {1}% of utterance-internal phones, with duration "
           "(median, mean, 95-percentile) = ({2},{3},{4})".format(
                 optional_silence_phone_text, "%.1f" % opt_sil_internal_phone_percent,
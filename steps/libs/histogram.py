@@ -0,0 +1,159 @@
+# Apache 2.0.
+
+""" This module contains an accumulator of integer histograms, used by the
+    scripts in steps/diagnostic to get the distributions of e.g. phone lengths
+    or lattice depths, and the percentiles and means of these distributions.
+    The stats may be read from several shards (e.g. one per job) in parallel
+    and merged.
+"""
+
+import gzip
+import multiprocessing
+import sys
+
+import numpy as np
+
+
+class Histograms(object):
+    """ A set of histograms of non-negative integer values (e.g. lengths in
+        frames), one per row (e.g. per phone).  counts[row][value] is the
+        count of 'value' in the histogram of 'row'; the number of columns
+        grows as larger values are added.
+    """
+    def __init__(self, num_rows, num_values=1):
+        self.counts = np.zeros((num_rows, num_values), dtype=np.int64)
+
+    def num_rows(self):
+        return self.counts.shape[0]
+
+    def _resize(self, num_values):
+        if num_values > self.counts.shape[1]:
+            counts = np.zeros((self.counts.shape[0], num_values),
+                              dtype=np.int64)
+            counts[:, :self.counts.shape[1]] = self.counts
+            self.counts = counts
+
+    def add(self, rows, values, counts):
+        """ Adds counts[i] to the count of values[i] in row rows[i], for the
+            integer numpy arrays rows, values and counts of the same length.
+        """
+        if len(values) == 0:
+            return
+        if values.min() < 0:
+            raise ValueError("Negative value {0} in histogram".format(
+                values.min()))
+        self._resize(values.max() + 1)
+        num_values = self.counts.shape[1]
+        self.counts += np.bincount(
+            rows * num_values + values, weights=counts,
+            minlength=self.counts.size).astype(np.int64).reshape(
+                self.counts.shape)
+
+    def merge(self, other):
+        """ Adds the counts of the Histograms 'other' to this one. """
+        assert other.num_rows() == self.num_rows()
+        self._resize(other.counts.shape[1])
+        self.counts[:, :other.counts.shape[1]] += other.counts
+
+    def row(self, row):
+        """ Returns the histogram of 'row' as a 1-d array of counts indexed by
+            value, which can be given to get_percentile() or get_mean().
+        """
+        return self.counts[row]
+
+    def sum_rows(self, rows):
+        """ Returns the sum of the histograms of 'rows', a list of rows. """
+        return self.counts[list(rows)].sum(axis=0)
+
+
+def get_total(counts):
+    return int(counts.sum())
+
+
+def get_percentile(counts, fraction):
+    """ Returns the value that equals the (fraction * 100)'th percentile of
+        the histogram 'counts' (a 1-d array of counts indexed by value),
+        i.e. the smallest value such that the total count of it and the smaller
+        values is at least int(fraction * total-count) (and nonzero); or 0
+        for an empty histogram.
+    """
+    cumulative_counts = np.cumsum(counts)
+    if len(cumulative_counts) == 0 or cumulative_counts[-1] == 0:
+        return 0
+    count_cutoff = max(int(fraction * cumulative_counts[-1]), 1)
+    return int(np.searchsorted(cumulative_counts, count_cutoff, side='left'))
+
+
+def get_sum_of_values(counts):
+    """ Returns the sum of the values in the histogram 'counts', i.e. the sum
+        of value * count, as a float (e.g. the total number of frames of a
+        histogram of lengths).
+    """
+    return float(np.dot(np.arange(len(counts), dtype=np.float64), counts))
+
+
+def get_mean(counts):
+    """ Returns the mean value of the histogram 'counts', or 0.0 if it is
+        empty.
+    """
+    total_count = counts.sum()
+    if total_count == 0:
+        return 0.0
+    return get_sum_of_values(counts) / total_count
+
+
+def open_stats_file(filename):
+    """ Opens a (possibly gzipped) text file of stats; '-' is the standard
+        input.
+    """
+    if filename == "-":
+        return sys.stdin
+    if filename.endswith(".gz"):
+        return gzip.open(filename, "rb")
+    return open(filename, "r")
+
+
+def read_fields(filename, num_fields):
+    """ Reads the whitespace-separated text file 'filename', which should have
+        'num_fields' fields on each line, and returns a 2-d numpy array of
+        strings, with one row per line.  Raises ValueError if a line has a
+        different number of fields.
+    """
+    f = open_stats_file(filename)
+    try:
+        text = f.read()
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    if not isinstance(text, str):
+        text = text.decode()
+    fields = text.split()
+    num_lines = text.count("\n")
+    if len(text) > 0 and not text.endswith("\n"):
+        num_lines += 1
+    if len(fields) != num_fields * num_lines:
+        for line in text.split("\n")[:num_lines]:
+            if len(line.split()) != num_fields:
+                raise ValueError("could not interpret line: " + line)
+    return np.array(fields, dtype=str).reshape(-1, num_fields)
+
+
+def accumulate_in_parallel(accumulate, filenames, num_processes=1):
+    """ Returns the sum of the Histograms returned by accumulate(filename)
+        for each of 'filenames', which are processed in num_processes
+        parallel processes if num_processes > 1.  'accumulate' must be a
+        module-level function, so that it can be pickled.
+    """
+    assert len(filenames) > 0
+    if num_processes > 1 and len(filenames) > 1:
+        pool = multiprocessing.Pool(min(num_processes, len(filenames)))
+        try:
+            shard_histograms = pool.map(accumulate, filenames)
+        finally:
+            pool.terminate()
+    else:
+        shard_histograms = [accumulate(filename) for filename in filenames]
+    histograms = shard_histograms[0]
+    for other in shard_histograms[1:]:
+        histograms.merge(other)
+    return histograms
@@ -40,6 +40,28 @@ g_normal_nonlin_regex_pattern = ''.join([".*progress.([0-9]+).log:component name
     "value-avg=\[.*=\((.+)\), mean=([0-9\.\-e]+), stddev=([0-9\.e\-]+)\].*",
     "deriv-avg=\[.*=\((.+)\), mean=([0-9\.\-e]+), stddev=([0-9\.e\-]+)\]"])
 
+# The following patterns are matched against lines as printed by 'grep -H',
+# i.e. prefixed by the name of the log file.
+g_param_diff_regex_pattern = ".*progress\.([0-9]+)\.log:LOG.*{0}.*\[(.*)\]"
+
+g_train_time_regex_pattern = (".*train\.([0-9]+)\.([0-9]+)\.log:# "
+                              "Accounting: time=([0-9]+) thread.*")
+
+# LOG
+# (nnet3-chain-compute-prob:PrintTotalStats():nnet-chain-diagnostics.cc:149)
+# Overall log-probability for 'output' is -0.399395 + -0.013437 = -0.412832
+# per frame, over 20000 fra
+
+# LOG
+# (nnet3-chain-compute-prob:PrintTotalStats():nnet-chain-diagnostics.cc:144)
+# Overall log-probability for 'output' is -0.307255 per frame, over 20000
+# frames.
+g_prob_regex_pattern = (".*compute_prob_.*\.([0-9]+).log:LOG "
+                        ".nnet3.*compute-prob.*:PrintTotalStats..:"
+                        "nnet.*diagnostics.cc:[0-9]+. Overall ([a-zA-Z\-]+) for "
+                        "'{output}'.*is ([0-9.\-e]+) .*per frame")
+
+
 class KaldiLogParseException(Exception):
     """ An Exception class that throws an error when there is an issue in
     parsing the log files. Extend this class if more granularity is needed.
@@ -259,8 +281,7 @@ def parse_progress_logs_for_param_diff(exp_dir, pattern):
     component_names = set([])
     progress_log_lines = common_lib.get_command_stdout(
         'grep -e "{0}" {1}'.format(pattern, progress_log_files))
-    parse_regex = re.compile(".*progress\.([0-9]+)\.log:"
-                             "LOG.*{0}.*\[(.*)\]".format(pattern))
+    parse_regex = re.compile(g_param_diff_regex_pattern.format(pattern))
     for line in progress_log_lines.split("\n"):
         mat_obj = parse_regex.search(line)
         if mat_obj is None:
@@ -314,8 +335,7 @@ def get_train_times(exp_dir):
     train_log_names = "train.*.log"
     train_log_lines = common_lib.get_command_stdout(
         'find {0} -name "{1}" | xargs grep -H -e Accounting'.format(train_log_files,train_log_names))
-    parse_regex = re.compile(".*train\.([0-9]+)\.([0-9]+)\.log:# "
-                             "Accounting: time=([0-9]+) thread.*")
+    parse_regex = re.compile(g_train_time_regex_pattern)
 
     train_times = {}
     for line in train_log_lines.split('\n'):
@@ -342,21 +362,7 @@ def parse_prob_logs(exp_dir, key='accuracy', output="output"):
     valid_prob_strings = common_lib.get_command_stdout(
         'grep -e {0} {1}'.format(key, valid_prob_files))
 
-    # LOG
-    # (nnet3-chain-compute-prob:PrintTotalStats():nnet-chain-diagnostics.cc:149)
-    # Overall log-probability for 'output' is -0.399395 + -0.013437 = -0.412832
-    # per frame, over 20000 fra
-
-    # LOG
-    # (nnet3-chain-compute-prob:PrintTotalStats():nnet-chain-diagnostics.cc:144)
-    # Overall log-probability for 'output' is -0.307255 per frame, over 20000
-    # frames.
-
-    parse_regex = re.compile(
-        ".*compute_prob_.*\.([0-9]+).log:LOG "
-        ".nnet3.*compute-prob.*:PrintTotalStats..:"
-        "nnet.*diagnostics.cc:[0-9]+. Overall ([a-zA-Z\-]+) for "
-        "'{output}'.*is ([0-9.\-e]+) .*per frame".format(output=output))
+    parse_regex = re.compile(g_prob_regex_pattern.format(output=output))
 
     train_loss = {}
     valid_loss = {}
@@ -393,13 +399,19 @@ def parse_prob_logs(exp_dir, key='accuracy', output="output"):
 
 
 
-def generate_acc_logprob_report(exp_dir, key="accuracy", output="output"):
-    try:
-        times = get_train_times(exp_dir)
-    except:
-        tb = traceback.format_exc()
-        logger.warning("Error getting info from logs, exception was: " + tb)
-        times = []
+def generate_acc_logprob_report(exp_dir, key="accuracy", output="output",
+                                times=None):
+    """Returns [report, times, data]; 'times' may be passed in (as returned by
+    a previous call for the same exp_dir) to avoid parsing the train logs
+    again."""
+
+    if times is None:
+        try:
+            times = get_train_times(exp_dir)
+        except:
+            tb = traceback.format_exc()
+            logger.warning("Error getting info from logs, exception was: " + tb)
+            times = []
 
     report = []
     report.append("%Iter\tduration\ttrain_loss\tvalid_loss\tdifference")
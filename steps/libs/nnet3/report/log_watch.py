@@ -0,0 +1,191 @@
+# Apache 2.0.
+
+""" This module follows the log directory of an nnet3 (or chain) training run
+while it is running, and appends the per-iteration statistics it finds to a
+CSV file, so that training can be monitored without parsing all the logs again
+(as generate_plots.py does).  Each update only reads the bytes that were added
+to the log files since the previous update; the position reached in each file
+is kept in a state file next to the CSV file.
+
+The CSV file has the columns 'iter,name,value', one row per value, e.g.
+  12,valid-accuracy,0.5362
+  12,train-log-probability,-0.0731
+  12,param-diff/tdnn3.affine,0.0213
+  12,relative-param-diff/tdnn3.affine,0.00913
+  12,train-time/3,73
+(the train time is given for each job of the iteration).  The rows are only
+ever appended; if a log file is rewritten (e.g. an iteration is rerun), its
+values are written again, and the later rows replace the earlier ones.  A log
+file counts as rewritten if its inode or its first bytes (which include the
+start time written by run.pl) have changed since it was last read.
+
+The lines are matched with the same patterns as in log_parse.py.
+"""
+
+from __future__ import print_function
+import hashlib
+import json
+import logging
+import os
+import re
+
+import libs.nnet3.report.log_parse as log_parse
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+g_param_diff_names = {"Parameter differences": "param-diff",
+                      "Relative parameter differences": "relative-param-diff"}
+
+# the number of bytes at the start of each log file that are compared to
+# detect that the file was rewritten.
+g_head_size = 1024
+
+
+class TrainingLogWatcher(object):
+    """Appends the statistics in the logs of exp_dir/log to 'csv_file'; call
+    update() to process whatever has been written to the logs since the last
+    call (or since the last run, as the state is kept in csv_file + '.state').
+    """
+
+    def __init__(self, exp_dir, csv_file, output_name='output'):
+        self.log_dir = os.path.join(exp_dir, 'log')
+        self.csv_file = csv_file
+        self.state_file = csv_file + '.state'
+
+        self.file_regex = re.compile(
+            r"^(compute_prob_(train|valid)\.[0-9]+|progress\.[0-9]+|"
+            r"train\.[0-9]+\.[0-9]+)\.log$")
+        self.prob_regex = re.compile(
+            log_parse.g_prob_regex_pattern.format(output=output_name))
+        self.param_diff_regexes = [
+            (re.compile(log_parse.g_param_diff_regex_pattern.format(pattern)),
+             name) for pattern, name in g_param_diff_names.items()]
+        self.train_time_regex = re.compile(
+            log_parse.g_train_time_regex_pattern)
+
+        # 'offsets' maps each log file to the number of bytes of it that have
+        # been processed (up to the end of the last complete line), and
+        # 'heads' maps it to its inode and the hash of its first bytes (see
+        # get_head()).
+        self.offsets = {}
+        self.heads = {}
+        csv_size = 0
+        if os.path.exists(self.state_file):
+            with open(self.state_file) as f:
+                state = json.load(f)
+            self.offsets = state['offsets']
+            self.heads = state.get('heads', {})
+            csv_size = state['csv-size']
+        if not os.path.exists(self.csv_file):
+            self.offsets = {}
+            self.heads = {}
+            csv_size = 0
+        # we remove anything appended to the CSV file after the state was
+        # written (e.g. if we were killed in between), as it will be
+        # appended again.
+        with open(self.csv_file, 'a+') as f:
+            f.truncate(csv_size)
+            if csv_size == 0:
+                f.write('iter,name,value\n')
+
+    def parse_line(self, file_name, line):
+        """Returns a list of rows (iter, name, value) for a line of the log
+        file 'file_name'."""
+
+        # the patterns expect the lines as printed by 'grep -H'.
+        line = '{0}:{1}'.format(os.path.join(self.log_dir, file_name), line)
+        rows = []
+        if file_name.startswith('compute_prob_'):
+            mat_obj = self.prob_regex.search(line)
+            if mat_obj is not None:
+                groups = mat_obj.groups()
+                kind = 'train' if file_name.startswith('compute_prob_train') \
+                       else 'valid'
+                rows.append((int(groups[0]), '{0}-{1}'.format(kind, groups[1]),
+                             groups[2]))
+        elif file_name.startswith('progress.'):
+            for parse_regex, name in self.param_diff_regexes:
+                mat_obj = parse_regex.search(line)
+                if mat_obj is None:
+                    continue
+                groups = mat_obj.groups()
+                differences = log_parse.parse_difference_string(groups[1])
+                for component_name in sorted(differences.keys()):
+                    rows.append((int(groups[0]),
+                                 '{0}/{1}'.format(name, component_name),
+                                 repr(differences[component_name])))
+                break
+        else:
+            mat_obj = self.train_time_regex.search(line)
+            if mat_obj is not None:
+                groups = mat_obj.groups()
+                rows.append((int(groups[0]),
+                             'train-time/{0}'.format(groups[1]), groups[2]))
+        return rows
+
+    def get_head(self, f, offset):
+        """Returns [inode, length, hash] for the open log file 'f', where
+        'hash' is the sha1 of its first 'length' bytes, with 'length' at most
+        g_head_size and 'offset'."""
+
+        length = min(offset, g_head_size)
+        f.seek(0)
+        return [os.fstat(f.fileno()).st_ino, length,
+                hashlib.sha1(f.read(length)).hexdigest()]
+
+    def read_new_lines(self, file_name):
+        """Returns the complete lines that were added to the log file since it
+        was last read, and updates its offset.  If the file was rewritten
+        since then, it is read again from the start."""
+
+        file_path = os.path.join(self.log_dir, file_name)
+        offset = self.offsets.get(file_name, 0)
+        try:
+            f = open(file_path, 'rb')
+        except IOError:
+            return []
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if offset > 0 and (size < offset or self.heads.get(file_name)
+                               != self.get_head(f, offset)):
+                # the file was rewritten, e.g. the iteration was rerun.
+                offset = 0
+            if size == offset:
+                return []
+            f.seek(offset)
+            data = f.read(size - offset)
+            end = data.rfind(b'\n') + 1
+            self.offsets[file_name] = offset + end
+            self.heads[file_name] = self.get_head(f, offset + end)
+        return data[:end].decode('utf-8', 'replace').splitlines()
+
+    def update(self):
+        """Processes what was added to the logs since the last update, appending
+        it to the CSV file; returns the number of rows appended."""
+
+        if not os.path.isdir(self.log_dir):
+            return 0
+        rows = []
+        for file_name in sorted(os.listdir(self.log_dir)):
+            if self.file_regex.match(file_name) is None:
+                continue
+            for line in self.read_new_lines(file_name):
+                rows += self.parse_line(file_name, line)
+
+        with open(self.csv_file, 'a') as f:
+            for row in rows:
+                print('{0},{1},{2}'.format(*row), file=f)
+            csv_size = f.tell()
+        # the state is written after the rows, so that a crash in between
+        # can't lose rows (see __init__()).
+        tmp_state_file = self.state_file + '.tmp'
+        with open(tmp_state_file, 'w') as f:
+            json.dump({'offsets': self.offsets, 'heads': self.heads,
+                       'csv-size': csv_size}, f)
+        os.rename(tmp_state_file, self.state_file)
+        if len(rows) > 0:
+            logger.info("Appended {0} rows to {1}".format(len(rows),
+                                                          self.csv_file))
+        return len(rows)
@@ -100,6 +100,74 @@ def get_multitask_egs_opts(egs_dir, egs_prefix="",
     return multitask_egs_opts
 
 
+def get_lang_stats(egs_dir, egs_prefix=""):
+    """ Reads {egs_dir}/info/{egs_prefix}lang_stats, as written by
+        steps/nnet3/multilingual/allocate_multilingual_examples.py, so that
+        the per-language counts are available without reading the scp files.
+        Returns a tuple (archive_stats, lang_stats), where
+        archive_stats[archive][lang] and lang_stats[lang] are pairs
+        (num-egs, num-frames), with archive numbered from 1 as the egs
+        archives; or (None, None) if the file does not exist.
+    """
+    lang_stats_file = "{0}/info/{1}lang_stats".format(egs_dir, egs_prefix)
+    if not os.path.isfile(lang_stats_file):
+        return None, None
+
+    archive_stats = {}
+    lang_stats = {}
+    try:
+        for line in open(lang_stats_file):
+            parts = line.split()
+            if len(parts) == 0:
+                continue
+            if len(parts) != 4:
+                raise ValueError
+            stats = (int(parts[2]), int(parts[3]))
+            if parts[0] == "total":
+                lang_stats[int(parts[1])] = stats
+            else:
+                archive_stats.setdefault(
+                    int(parts[0]), {})[int(parts[1])] = stats
+    except ValueError:
+        raise Exception("Bad line '{0}' in {1}".format(line.strip(),
+                                                       lang_stats_file))
+    return archive_stats, lang_stats
+
+
+def get_archive_learning_rate_factors(archive_stats):
+    """ Returns a dict from the archive index to the number of frames in the
+        archive divided by the average number of frames per archive, which
+        can be used to scale the learning rate of the archives, e.g. the
+        last ones of a multilingual egs dir that only contain the larger
+        languages.  archive_stats is as returned by get_lang_stats().
+    """
+    archive_frames = dict(
+        (archive, sum(frames for (egs, frames) in stats.values()))
+        for archive, stats in archive_stats.items())
+    if len(archive_frames) == 0:
+        return {}
+    average_frames = float(sum(archive_frames.values())) / len(archive_frames)
+    if average_frames == 0:
+        return dict((archive, 1.0) for archive in archive_frames)
+    return dict((archive, frames / average_frames)
+                for archive, frames in archive_frames.items())
+
+
+def get_iteration_learning_rate_factor(archive_factors,
+                                       num_archives_processed, num_jobs,
+                                       num_archives):
+    """ Returns the average of the factors from
+        get_archive_learning_rate_factors() of the archives that the jobs of
+        an iteration train on, i.e. archive
+        ((num_archives_processed + job - 1) % num_archives) + 1 for job
+        = 1..num_jobs, as in train_one_iteration().  Archives without a
+        factor count as 1.0.
+    """
+    return sum(archive_factors.get((num_archives_processed + job)
+                                   % num_archives + 1, 1.0)
+               for job in range(num_jobs)) / float(num_jobs)
+
+
 def get_successful_models(num_models, log_file_pattern,
                           difference_threshold=1.0):
     assert num_models > 0
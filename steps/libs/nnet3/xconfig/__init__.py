@@ -36,4 +36,5 @@ It generates three different configs:
 """
 
 
-__all__ = ["utils", "layers", "parser"]
+__all__ = ["utils", "layers", "parser", "model_context", "compile_cache",
+           "costs", "sweep"]
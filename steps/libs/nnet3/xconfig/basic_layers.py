@@ -13,6 +13,7 @@ import math
 import re
 import sys
 import libs.nnet3.xconfig.utils as xutils
+import libs.nnet3.xconfig.costs as xcosts
 import libs.common as common_lib
 
 
@@ -310,6 +311,63 @@ class XconfigLayerBase(object):
 
         raise Exception("Child classes must override get_full_config()")
 
+    ######  Functions for estimating the cost of the layer: #####
+    # They are used in steps/nnet3/xconfig_cost_report.py and
+    # libs/nnet3/xconfig/sweep.py.  They work out the costs from the
+    # components in the layer's lines of 'ref.config' (see costs.py);
+    # a child class whose costs are not described by those lines should
+    # override get_node_costs().
+
+    def get_node_costs(self):
+        """Returns a list of dicts, one for each node of this layer that has a
+        cost, with the keys 'node' (the node name), 'num-parameters',
+        'model-size' (the number of values stored in the model, including
+        those that are not trained), 'flops' (per frame at which the node is
+        computed) and 'output-dim' (the number of values stored per frame).
+        """
+
+        return xcosts.get_node_costs(
+            [line for (config_name, line) in self.get_full_config()
+             if config_name == 'ref'])
+
+    def num_parameters(self):
+        """The number of trainable parameters, as nnet3-info would count them.
+        """
+
+        return sum([x['num-parameters'] for x in self.get_node_costs()])
+
+    def param_bytes(self):
+        """The number of bytes the layer takes up in the model."""
+
+        return xcosts.BYTES_PER_VALUE * sum([x['model-size']
+                                             for x in self.get_node_costs()])
+
+    def flops_per_frame(self):
+        """The approximate number of FLOPs needed to compute the layer at one
+        frame, i.e. assuming that all of its nodes are computed at every frame.
+        See get_chunk_costs() for networks with frame subsampling."""
+
+        return sum([x['flops'] for x in self.get_node_costs()])
+
+    def get_chunk_costs(self, node_times, default_num_frames):
+        """Returns a pair (FLOPs, activation bytes) for computing the layer on
+        a chunk.  'node_times' is a dict from node name to the list of times at
+        which that node is computed for the chunk (see
+        model_context.compute_node_times()), which is where frame subsampling
+        comes in; nodes that are not in it are assumed to be computed at
+        'default_num_frames' frames.  The activation bytes are the memory
+        taken by the outputs of the nodes during training, which are kept
+        until the backward pass."""
+
+        flops = 0
+        num_values = 0
+        for x in self.get_node_costs():
+            num_frames = (len(node_times[x['node']]) if x['node'] in node_times
+                          else default_num_frames)
+            flops += num_frames * x['flops']
+            num_values += num_frames * x['output-dim']
+        return (flops, xcosts.BYTES_PER_VALUE * num_values)
+
 
 class XconfigInputLayer(XconfigLayerBase):
     """This class is for lines like
@@ -360,6 +418,13 @@ class XconfigInputLayer(XconfigLayerBase):
                                                              self.config['dim'])))
         return ans
 
+    def get_node_costs(self):
+
+        # the input has no components, but it is stored for the
+        # backward pass of the first layer.
+        return [{'node': self.name, 'num-parameters': 0, 'model-size': 0,
+                 'flops': 0, 'output-dim': self.config['dim']}]
+
 
 class XconfigTrivialOutputLayer(XconfigLayerBase):
     """
@@ -0,0 +1,121 @@
+# Apache 2.0.
+
+""" This module contains a cache for xconfig_to_configs.py, which is useful when
+many xconfig files that differ only in some layers are compiled (e.g. in an
+architecture search).  It keeps, in a directory:
+
+  - the layer objects parsed from the xconfig lines, indexed by a hash of the
+    line together with all the lines before it (since a layer depends on the
+    preceding layers, e.g. for the dimensions of its inputs).  So for two
+    xconfig files with the same first N layers, the second one reuses the
+    first N layer objects of the first one.
+  - the model contexts of the config files, indexed by a hash of their
+    contents, so nnet3-init and nnet3-info are not run again for config
+    files we have seen before.
+
+The hashes include the source code of this package, so changes to the layer
+classes invalidate the cache.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+
+class XconfigCache(object):
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        for subdir in ['layers', 'contexts']:
+            if not os.path.isdir(os.path.join(cache_dir, subdir)):
+                try:
+                    os.makedirs(os.path.join(cache_dir, subdir))
+                except OSError:
+                    if not os.path.isdir(os.path.join(cache_dir, subdir)):
+                        raise
+        sha1 = hashlib.sha1()
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        for filename in sorted(glob.glob(os.path.join(package_dir, '*.py'))):
+            with open(filename, 'rb') as f:
+                sha1.update(f.read())
+        self.code_hash = sha1.hexdigest()
+
+    def initial_layer_key(self, existing_layers):
+        """Returns the key that the key of the first xconfig line is computed
+        from; it depends on the layers of the existing model, if any."""
+
+        return self.get_hash([self.code_hash] +
+                             [str(layer) for layer in existing_layers])
+
+    def next_layer_key(self, prev_key, first_token, key_to_value):
+        """Returns the key of the layer parsed from an xconfig line, given the
+        key of the previous line and the parsed line; the parsed line is used
+        rather than the text so that comments and spacing don't matter."""
+
+        return self.get_hash([prev_key, first_token,
+                              sorted(key_to_value.items())])
+
+    def get_layer(self, key):
+        """Returns the layer object stored with this key, or None."""
+
+        filename = os.path.join(self.cache_dir, 'layers', key + '.pkl')
+        try:
+            with open(filename, 'rb') as f:
+                return pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def put_layer(self, key, layer):
+        self.write_file(os.path.join(self.cache_dir, 'layers', key + '.pkl'),
+                        pickle.dumps(layer, pickle.HIGHEST_PROTOCOL))
+
+    def contexts_key(self, config_dir, file_names, nnet_edits=None,
+                     existing_model=None):
+        """Returns the key of the contexts of the config files
+        config_dir/{file_names}.config, with the options used to compute them."""
+
+        items = [self.code_hash, nnet_edits]
+        if existing_model is not None:
+            stat = os.stat(existing_model)
+            items.append([os.path.abspath(existing_model), stat.st_size,
+                          stat.st_mtime])
+        for file_name in file_names:
+            filename = '{0}/{1}.config'.format(config_dir, file_name)
+            if os.path.exists(filename):
+                with open(filename) as f:
+                    # skip the header, which contains the command line.
+                    items.append([file_name] + [line for line in f
+                                                if not line.startswith('#')])
+        return self.get_hash(items)
+
+    def get_contexts(self, key):
+        """Returns the contexts stored with this key, or None; they are a
+        dict from the config file name, e.g. 'ref', to a dict with keys
+        'left-context' and 'right-context'."""
+
+        filename = os.path.join(self.cache_dir, 'contexts', key + '.json')
+        try:
+            with open(filename) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def put_contexts(self, key, contexts):
+        self.write_file(os.path.join(self.cache_dir, 'contexts', key + '.json'),
+                        json.dumps(contexts, sort_keys=True).encode('utf-8'))
+
+    @staticmethod
+    def get_hash(items):
+        return hashlib.sha1(repr(items).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def write_file(filename, data):
+        # we write to a temporary file and rename it, so that concurrent jobs
+        # sharing the cache never read a partially written file.
+        fd, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(filename),
+                                            suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(tmp_filename, filename)
@@ -0,0 +1,190 @@
+# Apache 2.0.
+
+""" This module contains rough estimates of the size and the computational cost
+of nnet3 components, worked out from the 'component' lines of config files
+(e.g. as returned by the get_full_config() functions of the layers).
+
+The number of parameters is computed in the same way as by nnet3-info, i.e.
+it only counts the parameters of updatable components (so FixedAffineComponent
+and the stats of BatchNormComponent are not counted); the model size also
+counts those.  The FLOPs are the floating-point operations (a multiply-add
+counts as two) needed to propagate one frame through a component in test mode;
+they ignore the overhead of copying data and of the Descriptors.
+"""
+
+import libs.nnet3.xconfig.model_context as xcontext
+
+
+# Approximate number of FLOPs per output element of the simple elementwise
+# component types.
+ELEMENTWISE_COMPONENT_FLOPS = {
+    'BackpropTruncationComponent': 0,
+    'BatchNormComponent': 2,
+    'ClipGradientComponent': 0,
+    'DropoutComponent': 0,
+    'DropoutMaskComponent': 0,
+    'ElementwiseProductComponent': 1,
+    'FixedBiasComponent': 1,
+    'FixedScaleComponent': 1,
+    'LogSoftmaxComponent': 3,
+    'NaturalGradientPerElementScaleComponent': 1,
+    'NoOpComponent': 0,
+    'NormalizeComponent': 3,
+    'PerElementOffsetComponent': 1,
+    'PerElementScaleComponent': 1,
+    'RectifiedLinearComponent': 1,
+    'ScaleAndOffsetComponent': 2,
+    'SigmoidComponent': 4,
+    'SoftmaxComponent': 3,
+    'TanhComponent': 4}
+
+# Approximate number of FLOPs per cell of LstmNonlinearityComponent: the
+# sigmoids and tanhs (4 FLOPs each, see above), the diagonal
+# ("peephole") connections and the products.
+LSTM_NONLINEARITY_FLOPS_PER_CELL = 31
+
+# Size of the values in parameters and activations (BaseFloat is float).
+BYTES_PER_VALUE = 4
+
+
+def get_int(fields, key, default=0):
+    return int(fields.get(key, default))
+
+
+def get_num_offsets(fields, key):
+    offsets = fields.get(key, '')
+    return len(offsets.split(',')) if offsets != '' else 1
+
+
+def get_output_dim(fields):
+    """Returns the output dimension of a component, from the fields of its
+    config line."""
+
+    for key in ['output-dim', 'dim']:
+        if key in fields:
+            return int(fields[key])
+    if fields['type'] == 'LstmNonlinearityComponent':
+        return 2 * get_int(fields, 'cell-dim')
+    if fields['type'] == 'TimeHeightConvolutionComponent':
+        return get_int(fields, 'num-filters-out') * get_int(fields,
+                                                            'height-out')
+    if fields['type'] == 'RestrictedAttentionComponent':
+        context_dim = (get_int(fields, 'num-left-inputs') +
+                       get_int(fields, 'num-right-inputs') + 1)
+        return get_int(fields, 'num-heads', 1) * (
+            get_int(fields, 'value-dim') +
+            (context_dim if fields.get('output-context', '').lower() == 'true'
+             else 0))
+    return 0
+
+
+def component_num_parameters(fields):
+    """Returns the number of parameters of the component whose config line
+    has the fields 'fields' (a dict as returned by
+    model_context.parse_config_line_fields())."""
+
+    component_type = fields['type']
+    if component_type in ['AffineComponent', 'NaturalGradientAffineComponent']:
+        return (get_int(fields, 'input-dim') + 1) * get_int(fields,
+                                                            'output-dim')
+    if component_type == 'LinearComponent':
+        return get_int(fields, 'input-dim') * get_int(fields, 'output-dim')
+    if component_type == 'TimeHeightConvolutionComponent':
+        num_filters_out = get_int(fields, 'num-filters-out')
+        return (num_filters_out * (get_int(fields, 'num-filters-in') *
+                                   get_num_offsets(fields, 'time-offsets') *
+                                   get_num_offsets(fields, 'height-offsets')
+                                   + 1))
+    if component_type == 'LstmNonlinearityComponent':
+        # the diagonal matrices for the input, forget and output gates.
+        return 3 * get_int(fields, 'cell-dim')
+    if component_type in ['NaturalGradientPerElementScaleComponent',
+                          'PerElementScaleComponent',
+                          'PerElementOffsetComponent']:
+        return get_int(fields, 'dim')
+    if component_type == 'ScaleAndOffsetComponent':
+        return 2 * get_int(fields, 'dim')
+    return 0
+
+
+def component_model_size(fields):
+    """Returns the number of values stored in the model for the component
+    whose config line has the fields 'fields', including those that are not
+    trained."""
+
+    component_type = fields['type']
+    if component_type == 'FixedAffineComponent':
+        return (get_int(fields, 'input-dim') + 1) * get_int(fields,
+                                                            'output-dim')
+    if component_type == 'BatchNormComponent':
+        # the scale and offset used in test mode.
+        return 2 * get_int(fields, 'block-dim', get_int(fields, 'dim'))
+    if component_type in ['FixedScaleComponent', 'FixedBiasComponent']:
+        return get_int(fields, 'dim')
+    return component_num_parameters(fields)
+
+
+def component_flops(fields):
+    """Returns the approximate number of FLOPs needed to compute one frame of
+    the output of the component whose config line has the fields 'fields'."""
+
+    component_type = fields['type']
+    if component_type in ['AffineComponent', 'NaturalGradientAffineComponent',
+                          'FixedAffineComponent', 'LinearComponent']:
+        return 2 * get_int(fields, 'input-dim') * get_int(fields, 'output-dim')
+    if component_type == 'TimeHeightConvolutionComponent':
+        return (2 * get_int(fields, 'num-filters-in') *
+                get_num_offsets(fields, 'time-offsets') *
+                get_num_offsets(fields, 'height-offsets') *
+                get_output_dim(fields))
+    if component_type == 'LstmNonlinearityComponent':
+        return LSTM_NONLINEARITY_FLOPS_PER_CELL * get_int(fields, 'cell-dim')
+    if component_type == 'RestrictedAttentionComponent':
+        num_inputs = (get_int(fields, 'num-left-inputs') +
+                      get_int(fields, 'num-right-inputs') + 1)
+        # the dot products of the query with the keys, the softmax, and the
+        # weighted sum of the values, for each head.
+        return (get_int(fields, 'num-heads', 1) * num_inputs *
+                (2 * get_int(fields, 'key-dim') + 3 +
+                 2 * get_int(fields, 'value-dim')))
+    if component_type in ['SumGroupComponent', 'SumBlockComponent',
+                          'StatisticsExtractionComponent',
+                          'StatisticsPoolingComponent']:
+        # one addition per input element (the statistics components do a
+        # few more, but they are not evaluated on every frame).
+        return get_int(fields, 'input-dim')
+    return (ELEMENTWISE_COMPONENT_FLOPS.get(component_type, 1) *
+            get_output_dim(fields))
+
+
+def get_node_costs(config_lines):
+    """Returns a list with the costs of the component-nodes defined in
+    'config_lines', which are lines of a config file; each element is a dict
+    with the keys 'node' (the node name), 'num-parameters', 'model-size',
+    'flops' (per frame at which the node is computed) and 'output-dim' (the
+    number of values stored per such frame).  Components that are not used by
+    a component-node in 'config_lines' are ignored."""
+
+    components = {}
+    nodes = []
+    for line in config_lines:
+        line = line.split('#')[0].strip()
+        if line == '':
+            continue
+        first_token, fields = xcontext.parse_config_line_fields(line)
+        if first_token == 'component':
+            components[fields['name']] = fields
+        elif first_token == 'component-node':
+            nodes.append(fields)
+
+    ans = []
+    for node in nodes:
+        if node['component'] not in components:
+            continue
+        fields = components[node['component']]
+        ans.append({'node': node['name'],
+                    'num-parameters': component_num_parameters(fields),
+                    'model-size': component_model_size(fields),
+                    'flops': component_flops(fields),
+                    'output-dim': get_output_dim(fields)})
+    return ans
@@ -0,0 +1,366 @@
+# Apache 2.0.
+
+""" This module works out the left and right context of a neural network from
+its config file (e.g. ref.config as written by xconfig_to_configs.py), without
+running nnet3-init and nnet3-info.
+
+It does the same as ComputeSimpleNnetContext() in src/nnet3/nnet-utils.cc, i.e.
+it finds how many frames of 'input' to the left and right of a frame are
+required to compute 'output' at that frame, with the 'ivector' input available
+only at t=0.  This is only possible when we know how each component depends on
+the time index of its input; for networks containing component types we don't
+know about (or Descriptors like Round() or Failover(), or nodes from an existing
+model), compute_model_context() returns None and the caller should fall back to
+the binaries.
+"""
+
+import re
+
+
+# Component types whose output at time t depends only on their input at time t.
+FRAME_LEVEL_COMPONENT_TYPES = set([
+    'AffineComponent',
+    'BackpropTruncationComponent',
+    'BatchNormComponent',
+    'ClipGradientComponent',
+    'DropoutComponent',
+    'DropoutMaskComponent',
+    'ElementwiseProductComponent',
+    'FixedAffineComponent',
+    'FixedBiasComponent',
+    'FixedScaleComponent',
+    'LinearComponent',
+    'LogSoftmaxComponent',
+    'LstmNonlinearityComponent',
+    'NaturalGradientAffineComponent',
+    'NaturalGradientPerElementScaleComponent',
+    'NoOpComponent',
+    'NormalizeComponent',
+    'PerElementOffsetComponent',
+    'PerElementScaleComponent',
+    'RectifiedLinearComponent',
+    'ScaleAndOffsetComponent',
+    'SigmoidComponent',
+    'SoftmaxComponent',
+    'SumBlockComponent',
+    'SumGroupComponent',
+    'TanhComponent'])
+
+
+class UnsupportedConfigError(Exception):
+    """Raised internally when the context can't be worked out in Python."""
+    pass
+
+
+def parse_config_line_fields(line):
+    """Splits a line of a (non-xconfig) config file like
+    'component-node name=foo component=foo input=Append(Offset(bar, -1), bar)'
+    into its first token and a dict from keys to values; as in the C++ code,
+    the values may contain spaces (e.g. Descriptors)."""
+
+    parts = line.split(None, 1)
+    first_token = parts[0]
+    fields = {}
+    if len(parts) == 2:
+        matches = list(re.finditer(r'(?:^|\s)([^\s=]+)=', parts[1]))
+        for i, m in enumerate(matches):
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(parts[1])
+            fields[m.group(1)] = parts[1][m.end():end].strip()
+    return first_token, fields
+
+
+def parse_descriptor(descriptor_string):
+    """Parses a Descriptor in the form that appears in config files, returning
+    a nested list: a node name or other bare token is returned as a string,
+    and an expression like 'Offset(foo, -1)' as ['Offset', 'foo', '-1']."""
+
+    tokens = re.findall(r'[(),]|[^\s(),]+', descriptor_string)
+    (expr, pos) = parse_descriptor_tokens(tokens, 0)
+    if pos != len(tokens):
+        raise UnsupportedConfigError("junk at end of Descriptor "
+                                     "{0}".format(descriptor_string))
+    return expr
+
+
+def parse_descriptor_tokens(tokens, pos):
+    if pos >= len(tokens) or tokens[pos] in '(),':
+        raise UnsupportedConfigError("error parsing Descriptor")
+    name = tokens[pos]
+    pos += 1
+    if pos == len(tokens) or tokens[pos] != '(':
+        return (name, pos)
+    expr = [name]
+    pos += 1
+    while True:
+        (arg, pos) = parse_descriptor_tokens(tokens, pos)
+        expr.append(arg)
+        if pos == len(tokens):
+            raise UnsupportedConfigError("error parsing Descriptor")
+        if tokens[pos] == ')':
+            return (expr, pos + 1)
+        if tokens[pos] != ',':
+            raise UnsupportedConfigError("error parsing Descriptor")
+        pos += 1
+
+
+def combine_contexts(contexts):
+    """The context required for all of 'contexts' to be computable; None
+    means no requirement."""
+
+    contexts = [c for c in contexts if c is not None]
+    if len(contexts) == 0:
+        return None
+    return (max([c[0] for c in contexts]), max([c[1] for c in contexts]))
+
+
+class ContextComputer(object):
+    def __init__(self, config_lines):
+        self.component_lines = {}
+        self.nodes = {}
+        for line in config_lines:
+            line = line.split('#')[0].strip()
+            if line == '':
+                continue
+            first_token, fields = parse_config_line_fields(line)
+            if first_token == 'component':
+                self.component_lines[fields['name']] = fields
+            elif first_token in ['input-node', 'component-node',
+                                 'dim-range-node', 'output-node']:
+                self.nodes[fields['name']] = (first_token, fields)
+            else:
+                raise UnsupportedConfigError(
+                    "unexpected config line {0}".format(line))
+        # map from node name to its context, or None if it is
+        # computable at any time.
+        self.node_context = {}
+        self.nodes_in_progress = set()
+
+    def descriptor_context(self, expr):
+        """Returns (left-context, right-context) of 'input' required to compute
+        the Descriptor 'expr' at a given time, or None if it is always
+        computable."""
+
+        if not isinstance(expr, list):
+            return self.get_node_context(expr)
+        operator = expr[0]
+        args = expr[1:]
+        if operator == 'Offset' and len(args) in [2, 3]:
+            context = self.descriptor_context(args[0])
+            if context is None:
+                return None
+            time_offset = int(args[1])
+            return (context[0] - time_offset, context[1] + time_offset)
+        elif operator in ['Append', 'Sum']:
+            return combine_contexts([self.descriptor_context(x) for x in args])
+        elif operator == 'IfDefined' and len(args) == 1:
+            # IfDefined() is computable even if its argument is not.
+            return None
+        elif operator == 'Scale' and len(args) == 2:
+            return self.descriptor_context(args[1])
+        elif operator == 'Const':
+            return None
+        elif operator == 'ReplaceIndex' and len(args) == 3:
+            if args[1] == 'x':
+                return self.descriptor_context(args[0])
+            if args[1] == 't' and args[0] == 'ivector':
+                # the ivector is provided at t=0 only.
+                return None
+        raise UnsupportedConfigError("unsupported Descriptor expression "
+                                     "{0}".format(operator))
+
+    def get_node_context(self, name):
+        if name in self.node_context:
+            return self.node_context[name]
+        if name not in self.nodes:
+            raise UnsupportedConfigError("unknown node {0}".format(name))
+        if name in self.nodes_in_progress:
+            raise UnsupportedConfigError("recursion at node {0} not broken by "
+                                         "IfDefined()".format(name))
+        self.nodes_in_progress.add(name)
+
+        (node_type, fields) = self.nodes[name]
+        if node_type == 'input-node':
+            if name != 'input':
+                # e.g. 'ivector' not inside ReplaceIndex(ivector, t, 0).
+                raise UnsupportedConfigError("unsupported use of input "
+                                             "{0}".format(name))
+            context = (0, 0)
+        elif node_type == 'dim-range-node':
+            context = self.get_node_context(fields['input-node'])
+        else:
+            context = self.descriptor_context(parse_descriptor(fields['input']))
+            if node_type == 'component-node':
+                context = self.component_context(fields['component'], context)
+
+        self.nodes_in_progress.remove(name)
+        self.node_context[name] = context
+        return context
+
+    def component_context(self, component_name, input_context):
+        if component_name not in self.component_lines:
+            raise UnsupportedConfigError("unknown component "
+                                         "{0}".format(component_name))
+        fields = self.component_lines[component_name]
+        component_type = fields['type']
+        if component_type in FRAME_LEVEL_COMPONENT_TYPES:
+            return input_context
+        if component_type == 'TimeHeightConvolutionComponent':
+            offsets = fields.get('required-time-offsets',
+                                 fields.get('time-offsets', ''))
+            if input_context is None or offsets == '':
+                return input_context
+            offsets = [int(x) for x in offsets.split(',')]
+            return (input_context[0] - min(offsets),
+                    input_context[1] + max(offsets))
+        raise UnsupportedConfigError("unsupported component type "
+                                     "{0}".format(component_type))
+
+
+def compute_model_context(config_lines):
+    """Returns the pair (left-context, right-context) of the network defined
+    by 'config_lines' (the lines of a config file), as nnet3-info would print
+    it; or None if it can't be worked out here."""
+
+    try:
+        computer = ContextComputer(config_lines)
+        if 'input' not in computer.nodes or 'output' not in computer.nodes:
+            return None
+        context = computer.get_node_context('output')
+    except UnsupportedConfigError:
+        return None
+    if context is None:
+        return (0, 0)
+    return (max(context[0], 0), max(context[1], 0))
+
+
+class TimeIndexComputer(object):
+    """Works out at which time indices ('t' values) each node of a network is
+    computed, when the output is requested at a given set of times, e.g. at
+    every third frame of a chunk for a model with frame-subsampling-factor=3.
+    This is a simplified version of what the nnet3 compiler does; like
+    ContextComputer, it only knows about the component types and Descriptors
+    that appear in the networks created by the xconfig layers.
+    """
+
+    def __init__(self, config_lines):
+        self.context_computer = ContextComputer(config_lines)
+        self.descriptors = {}
+
+    def get_descriptor(self, name):
+        if name not in self.descriptors:
+            fields = self.context_computer.nodes[name][1]
+            self.descriptors[name] = parse_descriptor(fields['input'])
+        return self.descriptors[name]
+
+    def is_computable(self, name, t):
+        """Returns true if node 'name' can be computed at time t from the
+        input frames in self.input_range."""
+
+        context = self.context_computer.get_node_context(name)
+        if context is None:
+            return True
+        return (t - context[0] >= self.input_range[0] and
+                t + context[1] <= self.input_range[1])
+
+    def descriptor_dependencies(self, expr, t, optional, ans):
+        """Appends to 'ans' the tuples (node-name, time, optional) that the
+        Descriptor 'expr' depends on at time t; 'optional' is true for
+        dependencies inside IfDefined()."""
+
+        if not isinstance(expr, list):
+            ans.append((expr, t, optional))
+            return
+        operator = expr[0]
+        args = expr[1:]
+        if operator == 'Offset' and len(args) in [2, 3]:
+            self.descriptor_dependencies(args[0], t + int(args[1]), optional,
+                                         ans)
+        elif operator in ['Append', 'Sum']:
+            for arg in args:
+                self.descriptor_dependencies(arg, t, optional, ans)
+        elif operator == 'IfDefined' and len(args) == 1:
+            self.descriptor_dependencies(args[0], t, True, ans)
+        elif operator == 'Scale' and len(args) == 2:
+            self.descriptor_dependencies(args[1], t, optional, ans)
+        elif operator == 'Const':
+            pass
+        elif operator == 'ReplaceIndex' and len(args) == 3 and args[1] == 't':
+            self.descriptor_dependencies(args[0], int(args[2]), optional, ans)
+        elif operator == 'ReplaceIndex' and len(args) == 3 and args[1] == 'x':
+            self.descriptor_dependencies(args[0], t, optional, ans)
+        else:
+            raise UnsupportedConfigError("unsupported Descriptor expression "
+                                         "{0}".format(operator))
+
+    def node_dependencies(self, name, t):
+        (node_type, fields) = self.context_computer.nodes[name]
+        ans = []
+        if node_type == 'dim-range-node':
+            ans.append((fields['input-node'], t, False))
+        elif node_type == 'output-node':
+            self.descriptor_dependencies(self.get_descriptor(name), t, False,
+                                         ans)
+        elif node_type == 'component-node':
+            component = self.context_computer.component_lines[
+                fields['component']]
+            input_times = [(t, False)]
+            if component['type'] == 'TimeHeightConvolutionComponent':
+                offsets = component.get('time-offsets', '')
+                required_offsets = component.get('required-time-offsets',
+                                                 offsets)
+                if offsets != '':
+                    required_offsets = set(
+                        [int(x) for x in required_offsets.split(',')])
+                    input_times = [(t + int(x), int(x) not in required_offsets)
+                                   for x in offsets.split(',')]
+            elif component['type'] not in FRAME_LEVEL_COMPONENT_TYPES:
+                raise UnsupportedConfigError(
+                    "unsupported component type {0}".format(component['type']))
+            for (input_t, optional) in input_times:
+                self.descriptor_dependencies(self.get_descriptor(name), input_t,
+                                             optional, ans)
+        return ans
+
+    def compute(self, output_times, output_name='output'):
+        """Returns a dict from node name to the sorted list of times at which it
+        is computed, when 'output_name' is computed at 'output_times'."""
+
+        context = self.context_computer.get_node_context(output_name)
+        if context is None:
+            context = (0, 0)
+        # the input is provided with the model's left and right context.
+        self.input_range = (min(output_times) - context[0],
+                            max(output_times) + context[1])
+
+        node_times = {}
+        queue = [(output_name, t) for t in output_times]
+        while len(queue) > 0:
+            (name, t) = queue.pop()
+            if name not in self.context_computer.nodes:
+                raise UnsupportedConfigError("unknown node {0}".format(name))
+            times = node_times.setdefault(name, set())
+            if t in times:
+                continue
+            times.add(t)
+            for (input_name, input_t, optional) in self.node_dependencies(name,
+                                                                           t):
+                if optional and not self.is_computable(input_name, input_t):
+                    continue
+                queue.append((input_name, input_t))
+        return dict([(name, sorted(times))
+                     for name, times in node_times.items()])
+
+
+def compute_node_times(config_lines, output_times, output_name='output'):
+    """Returns a dict from node name to the sorted list of times at which it
+    is computed when the network defined by 'config_lines' computes
+    'output_name' at the times in 'output_times'; or None if this can't be
+    worked out here (see TimeIndexComputer)."""
+
+    try:
+        computer = TimeIndexComputer(config_lines)
+        if output_name not in computer.context_computer.nodes:
+            return None
+        return computer.compute(output_times, output_name)
+    except UnsupportedConfigError:
+        return None
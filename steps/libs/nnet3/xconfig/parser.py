@@ -73,6 +73,30 @@ def xconfig_line_to_object(config_line, prev_layers = None):
         raise
 
 
+# This is like xconfig_line_to_object(), but if 'cache' (an object of type
+# XconfigCache, see compile_cache.py) contains the layer for this line and all
+# the lines before it, it is taken from there.  'prev_key' is the key of the
+# previous line (see XconfigCache.initial_layer_key() for the first line).
+# Returns a pair (layer object or None, key of this line).
+def cached_xconfig_line_to_object(config_line, prev_layers, cache, prev_key):
+    try:
+        x = xutils.parse_config_line(config_line)
+    except Exception:
+        logging.error(
+            "***Exception caught while parsing the following xconfig line:\n"
+            "*** {0}".format(config_line))
+        raise
+    if x is None:
+        return (None, prev_key)
+    (first_token, key_to_value) = x
+    key = cache.next_layer_key(prev_key, first_token, key_to_value)
+    layer = cache.get_layer(key)
+    if layer is None:
+        layer = xconfig_line_to_object(config_line, prev_layers)
+        cache.put_layer(key, layer)
+    return (layer, key)
+
+
 def get_model_component_info(model_filename):
     """ 
     This function reads existing model (*.raw or *.mdl) and returns array
@@ -143,20 +167,30 @@ def get_model_component_info(model_filename):
 # layers but are actual component node names from an existing neural net model
 # and created using get_model_component_info function).
 # 'existing' layers can be used as input to component-nodes in layers of xconfig file.
-def read_xconfig_file(xconfig_filename, existing_layers=[]):
+# If 'cache' (an object of type XconfigCache) is not None, layers are taken from
+# it when possible and the newly parsed layers are added to it.
+def read_xconfig_file(xconfig_filename, existing_layers=None, cache=None):
+    if existing_layers is None:
+        existing_layers = []
     try:
         f = open(xconfig_filename, 'r')
     except Exception as e:
         sys.exit("{0}: error reading xconfig file '{1}'; error was {2}".format(
             sys.argv[0], xconfig_filename, repr(e)))
     all_layers = []
+    if cache is not None:
+        layer_key = cache.initial_layer_key(existing_layers)
     while True:
         line = f.readline()
         if line == '':
             break
         # the next call will raise an easy-to-understand exception if
         # it fails.
-        this_layer = xconfig_line_to_object(line, existing_layers)
+        if cache is None:
+            this_layer = xconfig_line_to_object(line, existing_layers)
+        else:
+            (this_layer, layer_key) = cached_xconfig_line_to_object(
+                line, existing_layers, cache, layer_key)
         if this_layer is None:
             continue  # line was blank after removing comments.
         all_layers.append(this_layer)
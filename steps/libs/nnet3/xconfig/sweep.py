@@ -0,0 +1,179 @@
+# Apache 2.0.
+
+""" This module expands an xconfig template over a grid of parameter values
+(e.g. the layer dims of a TDNN-F or LSTM) and works out, for each variant, the
+number of parameters, the approximate FLOPs per frame and the model context,
+so that architectures can be chosen by their compute budget before training.
+See steps/nnet3/xconfig_sweep.py for the command-line interface.
+
+The template is an xconfig file in which the values to be swept appear as
+shell-style variables, e.g.
+
+  input dim=40 name=input
+  relu-batchnorm-layer name=tdnn1 dim=$dim input=Append(-2,-1,0,1,2)
+  relu-batchnorm-layer name=tdnn2 dim=$dim input=Append(-$stride,0,$stride)
+  output-layer name=output dim=3000
+
+and the grid is a dict from variable names to lists of values, e.g.
+{'dim': ['512', '768'], 'stride': ['1', '3']}.
+"""
+
+from __future__ import print_function
+import itertools
+import logging
+import multiprocessing
+import os
+import string
+import traceback
+from collections import OrderedDict
+
+import libs.nnet3.xconfig.parser as xparser
+import libs.nnet3.xconfig.model_context as xcontext
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+def parse_grid(param_strings):
+    """Parses strings like 'dim=512,768,1024' (one per variable) into an
+    OrderedDict from variable name to the list of its values."""
+
+    grid = OrderedDict()
+    for param_string in param_strings:
+        parts = param_string.split('=', 1)
+        if len(parts) != 2 or parts[0] == '' or parts[1] == '':
+            raise RuntimeError("Expected a string like 'dim=512,768', got "
+                               "'{0}'".format(param_string))
+        if parts[0] in grid:
+            raise RuntimeError("Variable '{0}' is given more than "
+                               "once".format(parts[0]))
+        grid[parts[0]] = parts[1].split(',')
+    return grid
+
+
+def expand_template(template, grid):
+    """Returns a list of pairs (assignment, xconfig_text), one for each
+    combination of the values in 'grid' (a dict from variable name to a list
+    of values); 'assignment' is a dict from variable name to value."""
+
+    names = list(grid.keys())
+    variants = []
+    for values in itertools.product(*[grid[name] for name in names]):
+        assignment = dict(zip(names, values))
+        try:
+            xconfig_text = string.Template(template).substitute(assignment)
+        except KeyError as e:
+            raise RuntimeError("Variable {0} of the template is not in the "
+                               "grid".format(str(e)))
+        variants.append((assignment, xconfig_text))
+    return variants
+
+
+def evaluate_variant(job):
+    """Parses the xconfig 'xconfig_text' and computes the size and cost of
+    the network.  'job' is a tuple (variant_name, xconfig_text, variant_dir);
+    the xconfig is written to variant_dir/xconfig, so that the variant can be
+    compiled later with steps/nnet3/xconfig_to_configs.py.  Returns a dict with
+    the keys 'name', 'num-parameters', 'flops', 'left-context',
+    'right-context' and 'error' (None if there was no error)."""
+
+    (variant_name, xconfig_text, variant_dir) = job
+    result = {'name': variant_name, 'num-parameters': None, 'flops': None,
+              'left-context': None, 'right-context': None, 'error': None}
+    try:
+        if not os.path.exists(variant_dir):
+            os.makedirs(variant_dir)
+        xconfig_file = os.path.join(variant_dir, 'xconfig')
+        with open(xconfig_file, 'w') as f:
+            f.write(xconfig_text)
+        all_layers = xparser.read_xconfig_file(xconfig_file)
+
+        # 'ref' contains the whole network, with the dims of all components.
+        config_lines = []
+        for layer in all_layers:
+            for config_name, line in layer.get_full_config():
+                if config_name == 'ref':
+                    config_lines.append(line)
+        if not any([line.startswith('output-node') for line in config_lines]):
+            raise RuntimeError("The network has no output-node")
+
+        result['num-parameters'] = sum([layer.num_parameters()
+                                        for layer in all_layers])
+        result['flops'] = sum([layer.flops_per_frame()
+                               for layer in all_layers])
+        context = xcontext.compute_model_context(config_lines)
+        if context is not None:
+            (result['left-context'], result['right-context']) = context
+    except Exception as e:
+        logger.debug(traceback.format_exc())
+        result['error'] = '{0}: {1}'.format(type(e).__name__, str(e))
+    return result
+
+
+def run_sweep(template, grid, sweep_dir, num_jobs=1, sort_by='flops'):
+    """Expands 'template' over 'grid' (see expand_template()) and evaluates
+    the variants in 'num_jobs' parallel processes, writing their xconfig files
+    to sweep_dir/<variant-name>/xconfig.  Returns the list of results (see
+    evaluate_variant()), each with the extra key 'assignment', sorted by
+    'sort_by' ('flops' or 'num-parameters'); variants that failed are at the
+    end."""
+
+    variants = expand_template(template, grid)
+    jobs = []
+    for i, (assignment, xconfig_text) in enumerate(variants):
+        variant_name = 'variant{0}'.format(i + 1)
+        jobs.append((variant_name, xconfig_text,
+                     os.path.join(sweep_dir, variant_name)))
+    logger.info("Evaluating {0} variants".format(len(jobs)))
+
+    if num_jobs > 1:
+        pool = multiprocessing.Pool(num_jobs)
+        try:
+            results = pool.map(evaluate_variant, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [evaluate_variant(job) for job in jobs]
+
+    for result, (assignment, xconfig_text) in zip(results, variants):
+        result['assignment'] = assignment
+        if result['error'] is not None:
+            logger.warning("{0} failed: {1}".format(result['name'],
+                                                    result['error']))
+    results.sort(key=lambda x: (x['error'] is not None, x[sort_by]))
+    return results
+
+
+def write_sweep_table(results, names, table_file):
+    """Writes the results of run_sweep() as a table, one line per variant in
+    rank order; 'names' are the names of the grid variables, whose values
+    are written as the last columns."""
+
+    header = (['#rank', 'variant', 'num-params', 'MFLOPs/frame',
+               'left-context', 'right-context'] + list(names))
+    rows = []
+    for rank, result in enumerate(results):
+        if result['error'] is not None:
+            row = ['-', result['name'], '-', '-', '-', '-']
+        else:
+            row = [str(rank + 1), result['name'],
+                   str(result['num-parameters']),
+                   '{0:.3f}'.format(result['flops'] / 1.0e6),
+                   '-' if result['left-context'] is None
+                   else str(result['left-context']),
+                   '-' if result['right-context'] is None
+                   else str(result['right-context'])]
+        rows.append(row + [result['assignment'][name] for name in names])
+
+    widths = [max([len(row[i]) for row in [header] + rows])
+              for i in range(len(header))]
+    with open(table_file, 'w') as f:
+        for row in [header] + rows:
+            print(' '.join([x.ljust(w) for x, w in zip(row, widths)]).rstrip(),
+                  file=f)
+        for result in results:
+            if result['error'] is not None:
+                print('# {0}: {1}'.format(result['name'], result['error']),
+                      file=f)
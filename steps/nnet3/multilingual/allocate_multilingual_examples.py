@@ -15,6 +15,24 @@
     the output-node in the neural net for that specific language, e.g.
     'output-2'.
 
+    It also writes info/egs.lang_stats, with the number of examples and
+    frames of each language in each archive, as lines
+    <archive-index> <lang> <num-examples> <num-frames>
+    followed by the totals of each language over all archives, as lines
+    total <lang> <num-examples> <num-frames>
+    The numbers of frames are the numbers of examples times the first value
+    in info/frames_per_eg of the output egs dir (1 if it does not exist).
+    The training scripts read these stats (as info/lang_stats, see
+    combine_egs.sh) to scale the learning rate by the relative number of
+    frames in the archives of each iteration.
+
+    With --sampling-temperature T != 1, the examples are not simply used once
+    each: every archive gets a fixed proportion of the examples of each
+    language i, proportional to n_i^(1/T), where n_i is the number of examples
+    of the language.  A larger T gives the smaller languages a larger share;
+    their examples are then reused (i.e. upsampled) in later archives, while
+    only part of the examples of the larger languages are used.
+
     This script additionally produces temporary files -- egs.ranges.*.txt,
     which are consumed by this script itself.
     There is one egs.ranges.*.txt file for each of the egs.*.scp files.
@@ -54,17 +72,24 @@
         --lang2weight  "0.2,0.8" exp/lang1/egs.scp exp/lang2/egs.scp
         exp/multi/egs
 
-    To avoid loading whole scp files from all languages in memory,
-    input egs.scp files are processed line by line using readline() for input
-    languages. To have more randomization across different archives,
-    "num-jobs * num-archives" temporary scp.<job>.<archive_index> files are created
-    in egs/temp dir and all "num_jobs" scp.*.<archive_index> combined into
-    egs.<archive_index>.scp.
+    To avoid loading whole scp files from all languages in memory, the
+    input egs.scp files are first scanned once to count their lines and to
+    record the byte offset of the start of every minibatch. The ranges of all
+    archives are then allocated without reading the examples, and each
+    egs.<archive_index>.scp (with its output, weight and ranges files) is
+    written by reading its ranges directly at the recorded offsets, so the
+    archives can be written in parallel (--num-processes).
+    To have more randomization across different archives, the examples of
+    each archive are allocated in "num-jobs" parts, as if "num-jobs"
+    allocations were interleaved; egs.<archive_index>.scp contains the
+    examples of part 1, then part 2, etc.
 """
 
 from __future__ import print_function
 import os, argparse, sys, random
+import itertools
 import logging
+import multiprocessing
 import traceback
 
 sys.path.insert(0, 'steps')
@@ -108,6 +133,21 @@ def get_args():
                         "randomly w.r.t distribution of remaining examples in "
                         "each language, otherwise it is generated sequentially.",
                         default=True, choices = ["false", "true"])
+    parser.add_argument("--sampling-temperature", type=float, default=1.0,
+                        help="If not 1, each archive contains the examples "
+                        "of language i in a proportion proportional to "
+                        "(num egs of language i)^(1/T) for this temperature "
+                        "T, reusing the examples of the smaller languages "
+                        "as needed.  A larger T gives a more uniform mix of "
+                        "the languages.  With T=1, each example is used "
+                        "once.")
+    parser.add_argument("--discard-partial-minibatches", type=str,
+                        action=common_lib.StrToBoolAction,
+                        help="If true, the last examples of each language "
+                        "that do not fill a whole --minibatch-size are "
+                        "discarded; otherwise they are allocated as a "
+                        "smaller range.",
+                        default=True, choices = ["false", "true"])
     parser.add_argument("--max-archives", type=int, default=1000,
                         help="max number of archives used to generate egs.*.scp")
     parser.add_argument("--seed", type=int, default=1,
@@ -123,6 +163,10 @@ def get_args():
                         "by the sript will be named with this prefix as "
                         "combine.output.*.ark, combine.weight.*.ark, combine.*.scp, "
                         "combine.ranges.*.ark.")
+    parser.add_argument("--num-processes", type=int, default=1,
+                        help="Number of processes that write the "
+                        "egs.*.scp, egs.output.*.ark and egs.weight.*.ark "
+                        "files of the archives in parallel.")
     parser.add_argument("--lang2weight", type=str,
                         help="comma-separated list of weights, one per language."
                         "The language order is as egs_scp_lists.")
@@ -137,34 +181,341 @@ def get_args():
     print(sys.argv, file=sys.stderr)
     args = parser.parse_args()
 
+    if args.sampling_temperature <= 0:
+        raise Exception("--sampling-temperature must be positive.")
+
     return args
 
 
-def select_random_lang(lang_len, tot_egs, random_selection):
+class LanguageSampler(object):
+    """ Keeps the number of remaining examples of each language in a
+        Fenwick (binary indexed) tree, so that a language can be sampled
+        w.r.t. these counts, and a count updated, in O(log(num-langs)) time
+        instead of scanning all the languages.
+    """
+    def __init__(self, counts):
+        self.counts = [0] * len(counts)
+        self.tree = [0] * (len(counts) + 1)
+        self.total = 0
+        for lang, count in enumerate(counts):
+            self.set_count(lang, count)
+
+    def set_count(self, lang, count):
+        delta = count - self.counts[lang]
+        self.counts[lang] = count
+        self.total += delta
+        i = lang + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def find(self, value):
+        """ Returns the smallest language index l such that
+            counts[0] + ... + counts[l] > value, for 0 <= value < total.
+        """
+        assert(0 <= value < self.total)
+        pos = 0
+        step = 1
+        while step * 2 < len(self.tree):
+            step *= 2
+        while step > 0:
+            if pos + step < len(self.tree) and self.tree[pos + step] <= value:
+                pos += step
+                value -= self.tree[pos]
+            step //= 2
+        return pos
+
+
+def select_random_lang(sampler, random_selection):
     """ Returns a random language index w.r.t
         amount of examples in each language.
         It works based on sampling from a
         discrete distribution, where it returns i
         with prob(i) = (num_egs in lang(i)/ tot_egs).
-        tot_egs is sum of lang_len.
+        tot_egs is the total count of the sampler.
+        If random_selection is False, it returns the first
+        language that has examples left.
+    """
+    assert(sampler.total > 0)
+    if random_selection:
+        return sampler.find(random.randint(0, sampler.total - 1))
+    return sampler.find(0)
+
+
+def read_scp_offsets(scp_file, minibatch_size):
+    """ Returns the number of lines in scp_file and the list of byte offsets
+        of lines 0, minibatch_size, 2 * minibatch_size, etc., which are the
+        lines where the ranges of examples selected from this file start.
+    """
+    offsets = []
+    num_lines = 0
+    offset = 0
+    with open(scp_file, 'rb') as f:
+        for line in f:
+            if num_lines % minibatch_size == 0:
+                offsets.append(offset)
+            num_lines += 1
+            offset += len(line)
+    return num_lines, offsets
+
+
+def allocate_egs(lang2len, num_archives, num_jobs, num_egs_per_archive,
+                 minibatch_size, random_selection, temperature=1.0,
+                 discard_partial_minibatches=True):
+    """ Returns a list with one element per (job, archive), at index
+        job * num_archives + archive, each of which is an array of 3-tuples
+        (lang-id, local-start-egs-line, num-egs).
+        If temperature is not 1, the allocation is done by
+        allocate_egs_with_temperature().
+    """
+    if temperature != 1.0:
+        return allocate_egs_with_temperature(
+            lang2len, num_archives, num_jobs, num_egs_per_archive,
+            minibatch_size, random_selection, temperature,
+            discard_partial_minibatches)
+
+    lang_len = lang2len[:]
+    for lang_id in range(len(lang_len)):
+        if discard_partial_minibatches and lang_len[lang_id] < minibatch_size:
+            discard_egs(lang_len, lang_id)
+    sampler = LanguageSampler(lang_len)
+
+    all_egs = []
+    for job in range(num_jobs):
+        for archive_index in range(num_archives):
+            this_egs = [] # this will be array of 3-tuples (lang-id start-egs-line num-egs)
+
+            num_egs = 0
+            while num_egs <= num_egs_per_archive:
+                if sampler.total > 0:
+                    lang_id = select_random_lang(sampler, random_selection)
+                    start_egs = lang2len[lang_id] - lang_len[lang_id]
+                    this_num_egs = min(minibatch_size, lang_len[lang_id])
+                    this_egs.append((lang_id, start_egs, this_num_egs))
+
+                    lang_len[lang_id] = lang_len[lang_id] - this_num_egs
+                    num_egs = num_egs + this_num_egs
+                    # If num of remaining egs in each lang is less than minibatch_size,
+                    # they are discarded unless discard_partial_minibatches is False.
+                    if (discard_partial_minibatches
+                            and lang_len[lang_id] < minibatch_size):
+                        discard_egs(lang_len, lang_id)
+                    if lang_len[lang_id] == 0:
+                        logger.info("Done processing data for language {0}".format(
+                            lang_id))
+                    sampler.set_count(lang_id, lang_len[lang_id])
+                else:
+                    logger.info("Done processing data for all languages.")
+                    break
+            all_egs.append(this_egs)
+    return all_egs
+
+
+def get_target_lang_probs(lang2len, temperature):
+    """ Returns the proportion of the examples of each language in each
+        archive, i.e. prob(i) = n_i^(1/T) / sum_j n_j^(1/T), where n_i is the
+        number of examples of language i.
+    """
+    lang2weight = [float(num_egs) ** (1.0 / temperature) if num_egs > 0
+                   else 0.0 for num_egs in lang2len]
+    tot_weight = sum(lang2weight)
+    if tot_weight == 0:
+        return [0.0] * len(lang2len)
+    return [weight / tot_weight for weight in lang2weight]
+
+
+def allocate_egs_with_temperature(lang2len, num_archives, num_jobs,
+                                  num_egs_per_archive, minibatch_size,
+                                  random_selection, temperature,
+                                  discard_partial_minibatches=True):
+    """ As allocate_egs(), but each archive gets a number of ranges of
+        each language proportional to its target probability (see
+        get_target_lang_probs()), rounded so that the cumulative number of
+        ranges of each language over the archives stays as close as possible
+        to its target.  The ranges of each language are taken in order, and
+        when they run out, they are used again from the start.  The ranges of
+        an archive are shuffled (if random_selection is True) and dealt out
+        to its num_jobs parts.
     """
-    assert(tot_egs > 0)
-    rand_int = random.randint(0, tot_egs - 1)
-    count = 0
-    for l in range(len(lang_len)):
+    num_langs = len(lang2len)
+    lang2ranges = []
+    for lang_id in range(num_langs):
+        ranges = [(lang_id, start_egs,
+                   min(minibatch_size, lang2len[lang_id] - start_egs))
+                  for start_egs in range(0, lang2len[lang_id], minibatch_size)]
+        if (discard_partial_minibatches and len(ranges) > 0
+                and ranges[-1][2] < minibatch_size):
+            logger.info("Discarding the last {0} examples of language {1}, "
+                        "which are less than --minibatch-size.".format(
+                            ranges[-1][2], lang_id))
+            ranges.pop()
+        lang2ranges.append(ranges)
+
+    lang2prob = get_target_lang_probs(
+        [sum(num_egs for (_, _, num_egs) in ranges)
+         for ranges in lang2ranges], temperature)
+    for lang_id in range(num_langs):
+        logger.info("Target proportion of language {0} is {1:.3f}.".format(
+            lang_id, lang2prob[lang_id]))
+
+    num_ranges_per_archive = max(
+        1, int(round(float(num_jobs * num_egs_per_archive) / minibatch_size)))
+    all_egs = [[] for i in range(num_jobs * num_archives)]
+    # lang2num_ranges[i] is the number of ranges of language i allocated so
+    # far; its next range is lang2ranges[i][lang2num_ranges[i] % len(...)].
+    lang2num_ranges = [0] * num_langs
+    for archive_index in range(num_archives):
+        this_lang_ids = []
+        for lang_id in range(num_langs):
+            num_ranges = int(round(lang2prob[lang_id] * num_ranges_per_archive
+                                   * (archive_index + 1)))
+            this_lang_ids += [lang_id] * (num_ranges - lang2num_ranges[lang_id])
         if random_selection:
-            if  rand_int <= (count + lang_len[l]):
-                return l
-            else:
-                count += lang_len[l]
-        else:
-            if (lang_len[l] > 0):
-                return l
-    return -1
+            random.shuffle(this_lang_ids)
+        for i, lang_id in enumerate(this_lang_ids):
+            ranges = lang2ranges[lang_id]
+            all_egs[(i % num_jobs) * num_archives + archive_index].append(
+                ranges[lang2num_ranges[lang_id] % len(ranges)])
+            lang2num_ranges[lang_id] += 1
+
+    for lang_id in range(num_langs):
+        if len(lang2ranges[lang_id]) > 0:
+            logger.info("The examples of language {0} are used {1:.2f} times "
+                        "on average.".format(
+                            lang_id, float(lang2num_ranges[lang_id])
+                            / len(lang2ranges[lang_id])))
+    return all_egs
+
+
+def discard_egs(lang_len, lang_id):
+    if lang_len[lang_id] > 0:
+        logger.info("Discarding the last {0} examples of language {1}, "
+                    "which are less than --minibatch-size.".format(
+                        lang_len[lang_id], lang_id))
+    lang_len[lang_id] = 0
+
+
+def get_frames_per_eg(egs_dir):
+    """ Returns the (principal) number of frames per example from
+        {egs_dir}/info/frames_per_eg, or 1 if it does not exist.
+    """
+    try:
+        with open("{0}/info/frames_per_eg".format(egs_dir)) as f:
+            return int(f.readline().split(",")[0])
+    except (IOError, ValueError):
+        logger.warning("Could not read {0}/info/frames_per_eg; the numbers "
+                       "of frames in lang_stats will be the numbers of "
+                       "examples.".format(egs_dir))
+        return 1
+
+
+def write_lang_stats(lang_stats_file, all_egs, num_archives, num_jobs,
+                     num_langs, frames_per_eg):
+    """ Writes the number of examples and frames of each language in each
+        archive, and in total, to lang_stats_file (see the top of the script
+        for the format) and logs the totals.
+    """
+    lang2num_egs = [0] * num_langs
+    with open(lang_stats_file, "w") as f:
+        for archive in range(num_archives):
+            archive_lang2num_egs = [0] * num_langs
+            for job in range(num_jobs):
+                for (lang_id, start_eg_line, num_egs) in all_egs[
+                        num_archives * job + archive]:
+                    archive_lang2num_egs[lang_id] += num_egs
+            for lang_id in range(num_langs):
+                print("{0} {1} {2} {3}".format(
+                        archive + 1, lang_id, archive_lang2num_egs[lang_id],
+                        archive_lang2num_egs[lang_id] * frames_per_eg),
+                      file=f)
+                lang2num_egs[lang_id] += archive_lang2num_egs[lang_id]
+        for lang_id in range(num_langs):
+            print("total {0} {1} {2}".format(
+                    lang_id, lang2num_egs[lang_id],
+                    lang2num_egs[lang_id] * frames_per_eg),
+                  file=f)
+
+    tot_num_egs = sum(lang2num_egs)
+    for lang_id in range(num_langs):
+        logger.info("Allocated {0} examples ({1:.2f}%) for language "
+                    "{2}.".format(lang2num_egs[lang_id],
+                                  lang2num_egs[lang_id] * 100.0
+                                  / max(tot_num_egs, 1), lang_id))
+
+
+class ArchiveWriter(object):
+    """ Writes the egs.*.scp, egs.output.*.ark, egs.weight.*.ark and
+        egs.ranges.*.txt files of an archive from the ranges allocated to it,
+        reading the examples of each range at the byte offset of its first
+        line in the scp file of its language.
+    """
+    def __init__(self, args, lang2offsets, lang2weight, all_egs, num_archives):
+        self.args = args
+        self.lang2offsets = lang2offsets
+        self.lang2weight = [str(weight).encode() for weight in lang2weight]
+        self.all_egs = all_egs
+        self.num_archives = num_archives
+        self.scp_files = {}
+
+    def read_lines(self, lang_id, start_eg_line, num_egs):
+        if lang_id not in self.scp_files:
+            self.scp_files[lang_id] = open(self.args.egs_scp_lists[lang_id], 'rb')
+        scp_file = self.scp_files[lang_id]
+        assert(start_eg_line % self.args.minibatch_size == 0)
+        scp_file.seek(self.lang2offsets[lang_id][
+            start_eg_line // self.args.minibatch_size])
+        lines = list(itertools.islice(scp_file, num_egs))
+        if len(lines) != num_egs:
+            raise Exception("Error reading {0} lines from line {1} of {2}".format(
+                num_egs, start_eg_line, self.args.egs_scp_lists[lang_id]))
+        return lines
+
+    def write(self, archive):
+        args = self.args
+        this_ranges = []
+        scp_lines = []
+        output_lines = []
+        weight_lines = []
+        for job in range(args.num_jobs):
+            for (lang_id, start_eg_line, num_egs) in self.all_egs[
+                    self.num_archives * job + archive]:
+                this_ranges.append("{0} {1} {2}\n".format(
+                    lang_id, start_eg_line, num_egs))
+                output_name = "output-{0}".format(lang_id).encode()
+                for line in self.read_lines(lang_id, start_eg_line, num_egs):
+                    scp_line = line.split()
+                    scp_lines.append(b" ".join(scp_line[:2]))
+                    output_lines.append(scp_line[0] + b" " + output_name)
+                    weight_lines.append(scp_line[0] + b" "
+                                        + self.lang2weight[lang_id])
+
+        # write egs.ranges.*.txt
+        with open("{0}/temp/{1}ranges.{2}.txt".format(
+                    args.egs_dir, args.egs_prefix, archive + 1), 'w') as f:
+            f.write("".join(this_ranges))
+        for name, lines in [("{1}{2}.scp", scp_lines),
+                            ("{1}output.{2}.ark", output_lines),
+                            ("{1}weight.{2}.ark", weight_lines)]:
+            with open(("{0}/" + name).format(args.egs_dir, args.egs_prefix,
+                                             archive + 1), 'wb') as f:
+                if len(lines) > 0:
+                    f.write(b"\n".join(lines) + b"\n")
+
+
+# The ArchiveWriter of the worker processes of the pool.
+_archive_writer = None
+
+
+def _init_archive_writer(archive_writer):
+    global _archive_writer
+    _archive_writer = archive_writer
+
+
+def _write_archive(archive):
+    _archive_writer.write(archive)
 
 
 def process_multilingual_egs(args):
-    args = get_args()
     random.seed(args.seed)
     rand_select = args.random_lang
 
@@ -172,11 +523,11 @@ def process_multilingual_egs(args):
     scp_lists = args.egs_scp_lists
     num_langs = len(scp_lists)
 
-    scp_files = [open(scp_lists[lang], 'r') for lang in range(num_langs)]
-
     lang2len = [0] * num_langs
+    lang2offsets = [None] * num_langs
     for lang in range(num_langs):
-        lang2len[lang] = sum(1 for line in open(scp_lists[lang]))
+        lang2len[lang], lang2offsets[lang] = read_scp_offsets(
+            scp_lists[lang], args.minibatch_size)
         logger.info("Number of examples for language {0} "
                     "is {1}.".format(lang, lang2len[lang]))
 
@@ -191,14 +542,11 @@ def process_multilingual_egs(args):
         os.makedirs("{0}/temp".format(args.egs_dir))
     num_lang_file = open("{0}/info/{1}num_tasks".format(args.egs_dir, args.egs_prefix), "w")
     print("{0}".format(num_langs), file=num_lang_file)
+    num_lang_file.close()
 
-    # Each element of all_egs (one per num_archive * num_jobs) is
-    # an array of 3-tuples (lang-id, local-start-egs-line, num-egs)
-    all_egs = []
-    lang_len = lang2len[:]
     # total num of egs in all languages
     tot_num_egs = sum(lang2len[i] for i in range(len(lang2len)))
-    num_archives = max(1, min(args.max_archives, tot_num_egs / args.samples_per_iter))
+    num_archives = max(1, min(args.max_archives, tot_num_egs // args.samples_per_iter))
 
     num_arch_file = open("{0}/info/{1}num_archives".format(
                             args.egs_dir,
@@ -206,101 +554,34 @@ def process_multilingual_egs(args):
                          "w")
     print("{0}".format(num_archives), file=num_arch_file)
     num_arch_file.close()
-    this_num_egs_per_archive = tot_num_egs / (num_archives * args.num_jobs)
-
-    logger.info("Generating {0}scp.<job>.<archive_index> temporary files used to "
-                "generate {0}<archive_index>.scp.".format(args.egs_prefix))
-    for job in range(args.num_jobs):
-        for archive_index in range(num_archives):
-            archfile = open("{0}/temp/{1}scp.{2}.{3}"
-                            "".format(args.egs_dir, args.egs_prefix,
-                                      job + 1, archive_index + 1),
-                            "w")
-            this_egs = [] # this will be array of 2-tuples (lang-id start-frame num-frames)
-
-            num_egs = 0
-            while num_egs <= this_num_egs_per_archive:
-                num_left_egs = sum(num_left_egs_per_lang for
-                                   num_left_egs_per_lang in lang_len)
-                if num_left_egs > 0:
-                    lang_id = select_random_lang(lang_len, num_left_egs, rand_select)
-                    start_egs = lang2len[lang_id] - lang_len[lang_id]
-                    this_egs.append((lang_id, start_egs, args.minibatch_size))
-                    for scpline in range(args.minibatch_size):
-                        scp_key = scp_files[lang_id].readline().splitlines()[0]
-                        print("{0} {1}".format(scp_key, lang_id),
-                              file=archfile)
-
-                    lang_len[lang_id] = lang_len[lang_id] - args.minibatch_size
-                    num_egs = num_egs + args.minibatch_size
-                    # If num of remaining egs in each lang is less than minibatch_size,
-                    # they are discarded.
-                    if lang_len[lang_id] < args.minibatch_size:
-                        lang_len[lang_id] = 0
-                        logger.info("Done processing data for language {0}".format(
-                            lang_id))
-                else:
-                    logger.info("Done processing data for all languages.")
-                    break
-            all_egs.append(this_egs)
-            archfile.close()
+    this_num_egs_per_archive = tot_num_egs // (num_archives * args.num_jobs)
 
-    logger.info("combining egs.<job>.*.scp across all jobs into egs.*.scp file.")
-    for archive in range(num_archives):
-        logger.info("Combine {0}job.{1}.scp across all jobs into "
-                    "{0}{1}.scp.".format(args.egs_prefix, archive))
-        this_ranges = []
-        f = open("{0}/temp/{1}ranges.{2}.txt".format(
-                    args.egs_dir, args.egs_prefix, archive + 1),
-                 'w')
-        o = open("{0}/{1}output.{2}.ark".format(
-                    args.egs_dir, args.egs_prefix, archive + 1),
-                 'w')
-        w = open("{0}/{1}weight.{2}.ark".format(
-                    args.egs_dir, args.egs_prefix, archive + 1),
-                 'w')
-        scp_per_archive_file = open("{0}/{1}{2}.scp"
-                                    "".format(args.egs_dir,
-                                              args.egs_prefix, archive + 1),
-                                    'w')
-
-        # check files before writing.
-        if f is None:
-            raise Exception("Error opening file {0}".format(f))
-        if o is None:
-            raise Exception("Error opening file {0}".format(o))
-        if w is None:
-            raise Exception("Error opening file {0}".format(w))
-        if scp_per_archive_file is None:
-            raise Exception("Error opening file {0}".format(scp_per_archive_file))
-
-        for job in range(args.num_jobs):
-            scp = ("{0}/temp/{1}scp.{2}.{3}".format(args.egs_dir, args.egs_prefix,
-                                                    job + 1, archive + 1))
-            with open(scp, "r") as scpfile:
-                for line in scpfile:
-                    scp_line = line.splitlines()[0].split()
-                    print("{0} {1}".format(scp_line[0], scp_line[1]),
-                          file=scp_per_archive_file)
-                    print("{0} output-{1}".format(scp_line[0], scp_line[2]),
-                          file=o)
-                    print("{0} {1}".format(
-                            scp_line[0],
-                            lang2weight[int(scp_line[2])]),
-                          file=w)
-            os.remove(scp)
-
-        for (lang_id, start_eg_line, num_egs) in all_egs[num_archives * job + archive]:
-            this_ranges.append((lang_id, start_eg_line, num_egs))
-
-        # write egs.ranges.*.txt
-        for (lang_id, start_eg_line, num_egs) in this_ranges:
-            print("{0} {1} {2}".format(lang_id, start_eg_line, num_egs), file=f)
-
-        f.close()
-        o.close()
-        w.close()
-        scp_per_archive_file.close()
+    # Each element of all_egs (one per num_archive * num_jobs) is
+    # an array of 3-tuples (lang-id, local-start-egs-line, num-egs)
+    all_egs = allocate_egs(lang2len, num_archives, args.num_jobs,
+                           this_num_egs_per_archive, args.minibatch_size,
+                           rand_select, args.sampling_temperature,
+                           args.discard_partial_minibatches)
+    write_lang_stats("{0}/info/{1}lang_stats".format(args.egs_dir,
+                                                     args.egs_prefix),
+                     all_egs, num_archives, args.num_jobs, num_langs,
+                     get_frames_per_eg(args.egs_dir))
+
+    logger.info("Writing {0}*.scp, {0}output.*.ark and {0}weight.*.ark files "
+                "for {1} archives.".format(args.egs_prefix, num_archives))
+    archive_writer = ArchiveWriter(args, lang2offsets, lang2weight, all_egs,
+                                   num_archives)
+    if args.num_processes > 1:
+        pool = multiprocessing.Pool(args.num_processes,
+                                    initializer=_init_archive_writer,
+                                    initargs=(archive_writer,))
+        try:
+            pool.map(_write_archive, range(num_archives))
+        finally:
+            pool.terminate()
+    else:
+        for archive in range(num_archives):
+            archive_writer.write(archive)
     logger.info("finished generating {0}*.scp, {0}output.*.ark "
                 "and {0}weight.*.ark files.".format(args.egs_prefix))
 
@@ -11,6 +11,10 @@
 # egs.output.*.ark map from the key of the example to the name of
 # the output-node in the neural net for that specific language, e.g.
 # 'output-2'.
+# info/lang_stats has the number of examples and frames of each language
+# in each training archive (see allocate_multilingual_examples.py);
+# steps/nnet3/train_raw_{dnn,rnn}.py scale the learning rate of each
+# iteration by the relative number of frames in the archives it uses.
 #
 # Begin configuration section.
 cmd=run.pl
@@ -26,6 +30,13 @@ samples_per_iter=400000 # this is the target number of egs in each archive of eg
                         # entire data.
 lang2weight=            # array of weights one per input languge to scale example's output
                         # w.r.t its input language during training.
+num_processes=1         # number of processes that write the training archives
+                        # in parallel.
+sampling_temperature=1.0 # if not 1, each archive has the languages in proportions
+                        # proportional to (num egs)^(1/T); a larger T gives the
+                        # smaller languages a larger share (reusing their egs).
+discard_partial_minibatches=true # if false, the last examples of each language
+                        # that do not fill a whole minibatch_size are kept too.
 stage=0
 
 echo "$0 $@"  # Print the command line for logging
@@ -96,8 +107,12 @@ if [ $stage -le 0 ]; then
     egs_opt="--lang2weight '$lang2weight'"
   fi
   # Generate egs.*.scp for multilingual setup.
-  $cmd $megs_dir/log/allocate_multilingual_examples_train.log \
+  $cmd --num-threads $num_processes \
+    $megs_dir/log/allocate_multilingual_examples_train.log \
   steps/nnet3/multilingual/allocate_multilingual_examples.py $egs_opt \
+      --num-processes $num_processes \
+      --sampling-temperature $sampling_temperature \
+      --discard-partial-minibatches $discard_partial_minibatches \
       --minibatch-size $minibatch_size \
       --samples-per-iter $samples_per_iter \
       $train_scp_list $megs_dir || exit 1;
@@ -142,4 +157,5 @@ for egs_type in combine train_diagnostic valid_diagnostic; do
 done
 mv $megs_dir/info/egs.num_archives $megs_dir/info/num_archives || exit 1;
 mv $megs_dir/info/egs.num_tasks $megs_dir/info/num_tasks || exit 1;
+mv $megs_dir/info/egs.lang_stats $megs_dir/info/lang_stats || exit 1;
 echo "$0: Finished preparing multilingual training example."
@@ -6,10 +6,14 @@
 
 import argparse
 import errno
+import hashlib
+import json
 import logging
+import multiprocessing
 import os
 import re
 import sys
+import traceback
 import warnings
 
 sys.path.insert(0, 'steps')
@@ -65,6 +69,9 @@ def get_args():
     parser.add_argument("--is-chain", type=str, default=False,
                         action=common_lib.StrToBoolAction,
                         help="True if directory contains chain models")
+    parser.add_argument("--num-jobs", type=int, default=4,
+                        help="Number of processes used to parse the logs and "
+                        "to plot the figures")
     parser.add_argument("--output-nodes", type=str, default=None,
                         action=common_lib.NullstrToNoneAction,
                         help="""List of space separated
@@ -87,11 +94,21 @@ def get_args():
             carefully tune the plot_colors variable which specified colors used
             for plotting.""")
     assert args.start_iter >= 1
+    assert args.num_jobs >= 1
     return args
 
 
 g_plot_colors = ['red', 'blue', 'green', 'black', 'magenta', 'yellow', 'cyan']
 
+# map from the parameter-difference patterns in the progress logs to the
+# files their tables are written to.
+g_param_diff_files = {"Parameter differences": "parameter.diff",
+                      "Relative parameter differences": "relative_parameter.diff"}
+
+# the cached figures are regenerated if this script changes.
+with open(os.path.abspath(__file__), 'rb') as f:
+    g_plot_code_hash = hashlib.sha1(f.read()).hexdigest()
+
 class LatexReport:
     """Class for writing a Latex report"""
 
@@ -156,61 +173,146 @@ def latex_compliant_name(name_string):
     return node_name_string
 
 
-def generate_acc_logprob_plots(exp_dir, output_dir, plot, key='accuracy',
-        file_basename='accuracy', comparison_dir=None,
-        start_iter=1, latex_report=None, output_name='output'):
+def get_acc_logprob_plot_types(objective_type):
+    """Returns a list of pairs (key, file_basename) for the
+    accuracy/log-probability plots of an output with this objective type."""
 
-    assert start_iter >= 1
+    if objective_type == "linear":
+        return [('accuracy', 'accuracy'), ('log-likelihood', 'loglikelihood')]
+    elif objective_type == "chain":
+        return [('log-probability', 'log_probability')]
+    else:
+        return [('objective', 'objective')]
 
-    if plot:
-        fig = plt.figure()
-        plots = []
+
+def parse_exp_dir_logs(job):
+    """Parses all the logs of an experiment directory that are needed for the
+    plots, so that each log is read only once.  'job' is a pair
+    (exp_dir, output_names).  This is called in parallel for the main and the
+    comparison directories."""
+
+    (exp_dir, output_names) = job
+    parsed_logs = {}
+
+    times = None
+    acc_logprob = {}
+    for (output_name, objective_type) in output_names:
+        for (key, file_basename) in get_acc_logprob_plot_types(objective_type):
+            acc_logprob[(key, output_name)] = (
+                log_parse.generate_acc_logprob_report(exp_dir, key,
+                                                      output_name, times))
+            times = acc_logprob[(key, output_name)][1]
+    parsed_logs['acc_logprob'] = acc_logprob
+
+    parsed_logs['nonlin_stats'] = (
+        log_parse.parse_progress_logs_for_nonlinearity_stats(exp_dir))
+
+    try:
+        parsed_logs['clipped_proportion'] = (
+            log_parse.parse_progress_logs_for_clipped_proportion(exp_dir))
+    except log_parse.MalformedClippedProportionLineException:
+        raise
+    except Exception:
+        warnings.warn("Could not extract the clipped proportions for {0},"
+                      " this might be because there are no "
+                      "ClipGradientComponents.".format(exp_dir))
+        parsed_logs['clipped_proportion'] = None
+
+    # errors in parsing the parameter differences are reported when the
+    # plots are generated.
+    try:
+        parsed_logs['param_diff'] = {}
+        for key in g_param_diff_files:
+            parsed_logs['param_diff'][key] = (
+                log_parse.parse_progress_logs_for_param_diff(exp_dir, key))
+        parsed_logs['param_diff_error'] = None
+    except Exception:
+        parsed_logs['param_diff_error'] = traceback.format_exc()
+    return parsed_logs
+
+
+def parse_logs(dirs, output_names, num_jobs=1):
+    """Returns a dict from each of the experiment directories 'dirs' to its
+    parsed logs (see parse_exp_dir_logs())."""
+
+    jobs = [(dir, output_names) for dir in dirs]
+    if num_jobs > 1 and len(dirs) > 1:
+        pool = multiprocessing.Pool(min(num_jobs, len(dirs)))
+        try:
+            results = pool.map(parse_exp_dir_logs, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [parse_exp_dir_logs(job) for job in jobs]
+    return dict(zip(dirs, results))
+
+
+def plot_acc_logprob(figfile_name, dirs, data_per_dir, key, output_name,
+                     start_iter):
+    fig = plt.figure()
+    plots = []
+    for index, dir in enumerate(dirs):
+        color_val = g_plot_colors[index]
+        data = np.array(data_per_dir[index])
+        data = data[data[:, 0] >= start_iter, :]
+        plot_handle, = plt.plot(data[:, 0], data[:, 1], color=color_val,
+                                linestyle="--",
+                                label="train {0}".format(dir))
+        plots.append(plot_handle)
+        plot_handle, = plt.plot(data[:, 0], data[:, 2], color=color_val,
+                                label="valid {0}".format(dir))
+        plots.append(plot_handle)
+    plt.xlabel('Iteration')
+    plt.ylabel(key)
+    lgd = plt.legend(handles=plots, loc='lower center',
+                     bbox_to_anchor=(0.5, -0.2 + len(dirs) * -0.1),
+                     ncol=1, borderaxespad=0.)
+    plt.grid(True)
+    fig.suptitle("{0} plot for {1}".format(key, output_name))
+    plt.savefig(figfile_name, bbox_extra_artists=(lgd,),
+                bbox_inches='tight')
+    plt.close(fig)
+
+
+def generate_acc_logprob_plots(exp_dir, output_dir, plot, parsed_logs,
+        key='accuracy', file_basename='accuracy', comparison_dir=None,
+        start_iter=1, output_name='output'):
+    """Writes the accuracy/log-probability report of the main experiment
+    directory, and returns the list of figures to plot (see
+    run_plot_jobs())."""
+
+    assert start_iter >= 1
 
     comparison_dir = [] if comparison_dir is None else comparison_dir
     dirs = [exp_dir] + comparison_dir
-    index = 0
+    data_per_dir = []
     for dir in dirs:
-        [report, times, data] = log_parse.generate_acc_logprob_report(dir, key,
-                output_name)
-        if index == 0:
+        [report, times, data] = parsed_logs[dir]['acc_logprob'][
+            (key, output_name)]
+        if dir == exp_dir:
             # this is the main experiment directory
             with open("{0}/{1}.log".format(output_dir,
                                            file_basename), "w") as f:
                 f.write(report)
-
-        if plot:
-            color_val = g_plot_colors[index]
-            data = np.array(data)
-            if data.shape[0] == 0:
-                logger.warning("Couldn't find any rows for the"
-                               "accuracy/log-probability plot, not generating it")
-                return
-            data = data[data[:, 0] >= start_iter, :]
-            plot_handle, = plt.plot(data[:, 0], data[:, 1], color=color_val,
-                                    linestyle="--",
-                                    label="train {0}".format(dir))
-            plots.append(plot_handle)
-            plot_handle, = plt.plot(data[:, 0], data[:, 2], color=color_val,
-                                    label="valid {0}".format(dir))
-            plots.append(plot_handle)
-        index += 1
-    if plot:
-        plt.xlabel('Iteration')
-        plt.ylabel(key)
-        lgd = plt.legend(handles=plots, loc='lower center',
-                         bbox_to_anchor=(0.5, -0.2 + len(dirs) * -0.1),
-                         ncol=1, borderaxespad=0.)
-        plt.grid(True)
-        fig.suptitle("{0} plot for {1}".format(key, output_name))
-        figfile_name = '{0}/{1}_{2}.pdf'.format(
-            output_dir, file_basename,
-            latex_compliant_name(output_name))
-        plt.savefig(figfile_name, bbox_extra_artists=(lgd,),
-                    bbox_inches='tight')
-        if latex_report is not None:
-            latex_report.add_figure(
-                figfile_name,
-                "Plot of {0} vs iterations for {1}".format(key, output_name))
+        if len(data) == 0:
+            logger.warning("Couldn't find any rows for the"
+                           "accuracy/log-probability plot, not generating it")
+            return []
+        data_per_dir.append(data)
+
+    if not plot:
+        return []
+    figfile_name = '{0}/{1}_{2}.pdf'.format(
+        output_dir, file_basename,
+        latex_compliant_name(output_name))
+    return [{'function': plot_acc_logprob,
+             'figfile': figfile_name,
+             'caption': "Plot of {0} vs iterations for {1}".format(
+                 key, output_name),
+             'kwargs': {'dirs': dirs, 'data_per_dir': data_per_dir,
+                        'key': key, 'output_name': output_name,
+                        'start_iter': start_iter}}]
 
 
 # The name of five gates of lstmp
@@ -286,27 +388,40 @@ def plot_a_nonlin_component(fig, dirs, stat_tables_per_component_per_dir,
     return lgd
 
 
+def plot_nonlin_stats(figfile_name, dirs, stat_tables_per_component_per_dir,
+                      component_name, common_prefix, prefix_length,
+                      component_type, start_iter, gate_index, title):
+    fig = plt.figure()
+    lgd = plot_a_nonlin_component(fig, dirs,
+            stat_tables_per_component_per_dir, component_name,
+            common_prefix, prefix_length, component_type, start_iter,
+            gate_index)
+    fig.suptitle(title)
+    fig.savefig(figfile_name, bbox_extra_artists=(lgd,),
+                bbox_inches='tight')
+    plt.close(fig)
+
+
 # This function is used to generate the statistic plots of nonlinearity component
 # Mainly divided into the following steps:
-# 1) With log_parse function, we get the statistics from each directory.
+# 1) With log_parse function, we get the statistics from each directory
+#    (this is done in parse_exp_dir_logs()).
 # 2) Convert the collected nonlinearity statistics into the tables. Each table
 #    contains all the statistics in each component of each directory.
 # 3) The statistics of each component are stored into corresponding log files.
 #    Each line of the log file contains the statistics of one iteration.
-# 4) Plot the "Per-dimension average-(value, derivative) percentiles" figure
-#    for each nonlinearity component.
-def generate_nonlin_stats_plots(exp_dir, output_dir, plot, comparison_dir=None,
-                                start_iter=1, latex_report=None):
+# 4) Return the list of "Per-dimension average-(value, derivative) percentiles"
+#    figures to plot for each nonlinearity component.
+def generate_nonlin_stats_plots(exp_dir, output_dir, plot, parsed_logs,
+                                comparison_dir=None, start_iter=1):
     assert start_iter >= 1
 
     comparison_dir = [] if comparison_dir is None else comparison_dir
     dirs = [exp_dir] + comparison_dir
-    index = 0
     stats_per_dir = {}
 
     for dir in dirs:
-        stats_per_component_per_iter = (
-            log_parse.parse_progress_logs_for_nonlinearity_stats(dir))
+        stats_per_component_per_iter = parsed_logs[dir]['nonlin_stats']
         for key in stats_per_component_per_iter:
             if len(stats_per_component_per_iter[key]['stats']) == 0:
                 logger.warning("Couldn't find any rows for the"
@@ -322,8 +437,7 @@ def generate_nonlin_stats_plots(exp_dir, output_dir, plot, comparison_dir=None,
             comp_data = stats_per_component_per_iter[component_name]
             comp_type = comp_data['type']
             comp_stats = comp_data['stats']
-            iters = comp_stats.keys()
-            iters.sort()
+            iters = sorted(comp_stats.keys())
             iter_stats = []
             for iter in iters:
                 iter_stats.append([iter] + comp_stats[iter])
@@ -344,9 +458,9 @@ def generate_nonlin_stats_plots(exp_dir, output_dir, plot, comparison_dir=None,
                 iter_stat_report.append("\t".join([str(x) for x in row]))
             f.write("\n".join(iter_stat_report))
             f.close()
+    plot_jobs = []
     if plot:
-        main_component_names = main_stat_tables.keys()
-        main_component_names.sort()
+        main_component_names = sorted(main_stat_tables.keys())
 
         plot_component_names = set(main_component_names)
         for dir in dirs:
@@ -361,71 +475,99 @@ def generate_nonlin_stats_plots(exp_dir, output_dir, plot, comparison_dir=None,
             provided only for common component names. Make sure that these are
             comparable experiments before analyzing these plots.""")
 
-        fig = plt.figure()
-
         common_prefix = os.path.commonprefix(dirs)
         prefix_length = common_prefix.rfind('/')
         common_prefix = common_prefix[0:prefix_length]
 
         for component_name in main_component_names:
+            # we only pass the tables of this component to the plotting
+            # job, so that its hash only depends on them.
+            component_tables_per_dir = dict(
+                [(dir, {component_name: tables[component_name]})
+                 for dir, tables in stat_tables_per_component_per_dir.items()
+                 if component_name in tables])
+            kwargs = {'dirs': dirs,
+                      'stat_tables_per_component_per_dir':
+                          component_tables_per_dir,
+                      'component_name': component_name,
+                      'common_prefix': common_prefix,
+                      'prefix_length': prefix_length,
+                      'start_iter': start_iter}
+            comp_name = latex_compliant_name(component_name)
             if stats_per_dir[exp_dir][component_name]['type'] == 'LstmNonlinearity':
                 for i in range(0,5):
-                    component_type = 'Lstm-' + g_lstm_gate[i]
-                    lgd = plot_a_nonlin_component(fig, dirs,
-                            stat_tables_per_component_per_dir, component_name,
-                            common_prefix, prefix_length, component_type, start_iter, i)
-                    fig.suptitle("Per-dimension average-(value, derivative) percentiles for "
-                         "{component_name}-{gate}".format(component_name=component_name, gate=g_lstm_gate[i]))
-                    comp_name = latex_compliant_name(component_name)
-                    figfile_name = '{dir}/nonlinstats_{comp_name}_{gate}.pdf'.format(
-                        dir=output_dir, comp_name=comp_name, gate=g_lstm_gate[i])
-                    fig.savefig(figfile_name, bbox_extra_artists=(lgd,),
-                        bbox_inches='tight')
-                    if latex_report is not None:
-                        latex_report.add_figure(
-                        figfile_name,
-                        "Per-dimension average-(value, derivative) percentiles for "
-                        "{0}-{1}".format(component_name, g_lstm_gate[i]))
+                    title = ("Per-dimension average-(value, derivative) "
+                             "percentiles for {0}-{1}".format(component_name,
+                                                              g_lstm_gate[i]))
+                    gate_kwargs = dict(kwargs)
+                    gate_kwargs.update({
+                        'component_type': 'Lstm-' + g_lstm_gate[i],
+                        'gate_index': i, 'title': title})
+                    plot_jobs.append({
+                        'function': plot_nonlin_stats,
+                        'figfile': '{dir}/nonlinstats_{comp_name}_{gate}.pdf'.format(
+                            dir=output_dir, comp_name=comp_name,
+                            gate=g_lstm_gate[i]),
+                        'caption': title,
+                        'kwargs': gate_kwargs})
             else:
-                component_type = stats_per_dir[exp_dir][component_name]['type']
-                lgd = plot_a_nonlin_component(fig, dirs,
-                        stat_tables_per_component_per_dir,component_name,
-                        common_prefix, prefix_length, component_type, start_iter, 0)
-                fig.suptitle("Per-dimension average-(value, derivative) percentiles for "
-                         "{component_name}".format(component_name=component_name))
-                comp_name = latex_compliant_name(component_name)
-                figfile_name = '{dir}/nonlinstats_{comp_name}.pdf'.format(
-                    dir=output_dir, comp_name=comp_name)
-                fig.savefig(figfile_name, bbox_extra_artists=(lgd,),
-                        bbox_inches='tight')
-                if latex_report is not None:
-                    latex_report.add_figure(
-                    figfile_name,
-                    "Per-dimension average-(value, derivative) percentiles for "
-                    "{0}".format(component_name))
-
-
-
-def generate_clipped_proportion_plots(exp_dir, output_dir, plot,
-                                      comparison_dir=None, start_iter=1,
-                                      latex_report=None):
+                title = ("Per-dimension average-(value, derivative) "
+                         "percentiles for {0}".format(component_name))
+                kwargs.update({
+                    'component_type':
+                        stats_per_dir[exp_dir][component_name]['type'],
+                    'gate_index': 0, 'title': title})
+                plot_jobs.append({
+                    'function': plot_nonlin_stats,
+                    'figfile': '{dir}/nonlinstats_{comp_name}.pdf'.format(
+                        dir=output_dir, comp_name=comp_name),
+                    'caption': title,
+                    'kwargs': kwargs})
+    return plot_jobs
+
+
+def plot_clipped_proportion(figfile_name, dirs, iter_stats_per_dir,
+                            component_name, start_iter):
+    fig = plt.figure()
+    plots = []
+    for index, dir in enumerate(dirs):
+        color_val = g_plot_colors[index]
+        if dir not in iter_stats_per_dir:
+            # this component is not available in this network so lets
+            # not just plot it
+            continue
+
+        data = np.array(iter_stats_per_dir[dir])
+        data = data[data[:, 0] >= start_iter, :]
+        ax = plt.subplot(111)
+        mp, = ax.plot(data[:, 0], data[:, 1], color=color_val,
+                      label="Clipped Proportion {0}".format(dir))
+        plots.append(mp)
+        ax.set_ylabel('Clipped Proportion')
+        ax.set_ylim([0, 1.2])
+        ax.grid(True)
+    lgd = plt.legend(handles=plots, loc='lower center',
+                     bbox_to_anchor=(0.5, -0.5 + len(dirs) * -0.2),
+                     ncol=1, borderaxespad=0.)
+    plt.grid(True)
+    fig.suptitle("Clipped-proportion value at {comp_name}".format(
+                    comp_name=component_name))
+    fig.savefig(figfile_name, bbox_extra_artists=(lgd,),
+                bbox_inches='tight')
+    plt.close(fig)
+
+
+def generate_clipped_proportion_plots(exp_dir, output_dir, plot, parsed_logs,
+                                      comparison_dir=None, start_iter=1):
     assert(start_iter >= 1)
 
     comparison_dir = [] if comparison_dir is None else comparison_dir
     dirs = [exp_dir] + comparison_dir
-    index = 0
     stats_per_dir = {}
     for dir in dirs:
-        try:
-            stats_per_dir[dir] = (
-                log_parse.parse_progress_logs_for_clipped_proportion(dir))
-        except log_parse.MalformedClippedProportionLineException as e:
-            raise e
-        except common_lib.KaldiCommandException as e:
-            warnings.warn("Could not extract the clipped proportions for {0},"
-                          " this might be because there are no "
-                          "ClipGradientComponents.".format(dir))
+        if parsed_logs[dir]['clipped_proportion'] is None:
             continue
+        stats_per_dir[dir] = parsed_logs[dir]['clipped_proportion']
         if len(stats_per_dir[dir]) == 0:
             logger.warning("Couldn't find any rows for the"
                            "clipped proportion plot, not generating it")
@@ -435,7 +577,7 @@ def generate_clipped_proportion_plots(exp_dir, output_dir, plot,
         warnings.warn("The main experiment directory {0} does not have "
                       "clipped proportions. So not generating clipped "
                       "proportion plots.".format(exp_dir))
-        return
+        return []
 
     # this is the main experiment directory
     file = open("{dir}/clipped_proportion.log".format(dir=output_dir), "w")
@@ -445,10 +587,10 @@ def generate_clipped_proportion_plots(exp_dir, output_dir, plot,
     file.write(iter_stat_report)
     file.close()
 
+    plot_jobs = []
     if plot:
-        main_component_names = (
+        main_component_names = sorted(
             stats_per_dir[exp_dir]['cp_per_iter_per_component'].keys())
-        main_component_names.sort()
         plot_component_names = set(main_component_names)
         for dir in dirs:
             try:
@@ -467,66 +609,80 @@ def generate_clipped_proportion_plots(exp_dir, output_dir, plot,
                 provided only for common component names. Make sure that these
                 are comparable experiments before analyzing these plots.""")
 
-        fig = plt.figure()
         for component_name in main_component_names:
-            fig.clf()
-            index = 0
-            plots = []
+            iter_stats_per_dir = {}
             for dir in dirs:
-                color_val = g_plot_colors[index]
-                index += 1
                 try:
-                    iter_stats = stats_per_dir[dir][
+                    iter_stats_per_dir[dir] = stats_per_dir[dir][
                         'cp_per_iter_per_component'][component_name]
                 except KeyError:
-                    # this component is not available in this network so lets
-                    # not just plot it
                     continue
-
-                data = np.array(iter_stats)
-                data = data[data[:, 0] >= start_iter, :]
-                ax = plt.subplot(111)
-                mp, = ax.plot(data[:, 0], data[:, 1], color=color_val,
-                              label="Clipped Proportion {0}".format(dir))
-                plots.append(mp)
-                ax.set_ylabel('Clipped Proportion')
-                ax.set_ylim([0, 1.2])
-                ax.grid(True)
-            lgd = plt.legend(handles=plots, loc='lower center',
-                             bbox_to_anchor=(0.5, -0.5 + len(dirs) * -0.2),
-                             ncol=1, borderaxespad=0.)
-            plt.grid(True)
-            fig.suptitle("Clipped-proportion value at {comp_name}".format(
-                            comp_name=component_name))
             comp_name = latex_compliant_name(component_name)
-            figfile_name = '{dir}/clipped_proportion_{comp_name}.pdf'.format(
-                dir=output_dir, comp_name=comp_name)
-            fig.savefig(figfile_name, bbox_extra_artists=(lgd,),
-                        bbox_inches='tight')
-            if latex_report is not None:
-                latex_report.add_figure(
-                    figfile_name,
-                    "Clipped proportion at {0}".format(component_name))
-
-
-def generate_parameter_diff_plots(exp_dir, output_dir, plot,
-                                  comparison_dir=None, start_iter=1,
-                                  latex_report=None):
+            plot_jobs.append({
+                'function': plot_clipped_proportion,
+                'figfile': '{dir}/clipped_proportion_{comp_name}.pdf'.format(
+                    dir=output_dir, comp_name=comp_name),
+                'caption': "Clipped proportion at {0}".format(component_name),
+                'kwargs': {'dirs': dirs,
+                           'iter_stats_per_dir': iter_stats_per_dir,
+                           'component_name': component_name,
+                           'start_iter': start_iter}})
+    return plot_jobs
+
+
+def plot_param_diff(figfile_name, dirs, iter_stats_per_dir, component_name):
+    fig = plt.figure()
+    plots = []
+    for index, dir in enumerate(dirs):
+        color_val = g_plot_colors[index]
+        if dir not in iter_stats_per_dir:
+            # this component is not available in this network so lets
+            # not just plot it
+            continue
+        iter_stats = [np.array(x) for x in iter_stats_per_dir[dir]]
+        ax = plt.subplot(211)
+        mp, = ax.plot(iter_stats[0][:, 0], iter_stats[0][:, 1],
+                      color=color_val,
+                      label="Parameter Differences {0}".format(dir))
+        plots.append(mp)
+        ax.set_ylabel('Parameter Differences')
+        ax.grid(True)
+
+        ax = plt.subplot(212)
+        mp, = ax.plot(iter_stats[1][:, 0], iter_stats[1][:, 1],
+                      color=color_val,
+                      label="Relative Parameter "
+                            "Differences {0}".format(dir))
+        ax.set_xlabel('Iteration')
+        ax.set_ylabel('Relative Parameter Differences')
+        ax.grid(True)
+
+    lgd = plt.legend(handles=plots, loc='lower center',
+                     bbox_to_anchor=(0.5, -0.5 + len(dirs) * -0.2),
+                     ncol=1, borderaxespad=0.)
+    plt.grid(True)
+    fig.suptitle("Parameter differences at {comp_name}".format(
+        comp_name=component_name))
+    fig.savefig(figfile_name, bbox_extra_artists=(lgd,),
+                bbox_inches='tight')
+    plt.close(fig)
+
+
+def generate_parameter_diff_plots(exp_dir, output_dir, plot, parsed_logs,
+                                  comparison_dir=None, start_iter=1):
     # Parameter changes
     assert start_iter >= 1
 
     comparison_dir = [] if comparison_dir is None else comparison_dir
     dirs = [exp_dir] + comparison_dir
-    index = 0
-    stats_per_dir = {}
-    key_file = {"Parameter differences": "parameter.diff",
-                "Relative parameter differences": "relative_parameter.diff"}
+    key_file = g_param_diff_files
     stats_per_dir = {}
     for dir in dirs:
-        stats_per_dir[dir] = {}
-        for key in key_file:
-            stats_per_dir[dir][key] = (
-                log_parse.parse_progress_logs_for_param_diff(dir, key))
+        if parsed_logs[dir]['param_diff_error'] is not None:
+            raise Exception("Error parsing the parameter differences in the "
+                            "logs of {0}: {1}".format(
+                                dir, parsed_logs[dir]['param_diff_error']))
+        stats_per_dir[dir] = parsed_logs[dir]['param_diff']
 
     # write down the stats for the main experiment directory
     for diff_type in key_file:
@@ -559,12 +715,12 @@ def generate_parameter_diff_plots(exp_dir, output_dir, plot,
 
                 f.write(" ".join(iter_data)+"\n")
 
+    plot_jobs = []
     if plot:
         # get the component names
-        diff_type = key_file.keys()[0]
-        main_component_names = stats_per_dir[exp_dir][diff_type][
-            'progress_per_component'].keys()
-        main_component_names.sort()
+        diff_type = list(key_file.keys())[0]
+        main_component_names = sorted(stats_per_dir[exp_dir][diff_type][
+            'progress_per_component'].keys())
         plot_component_names = set(main_component_names)
 
         for dir in dirs:
@@ -587,26 +743,21 @@ def generate_parameter_diff_plots(exp_dir, output_dir, plot,
 
         assert main_component_names
 
-        fig = plt.figure()
         logger.info("Generating parameter-difference plots for the "
                     "following components:{0}".format(
                         ', '.join(main_component_names)))
 
         for component_name in main_component_names:
-            fig.clf()
-            index = 0
-            plots = []
+            iter_stats_per_dir = {}
             for dir in dirs:
-                color_val = g_plot_colors[index]
-                index += 1
                 iter_stats = []
                 try:
                     for diff_type in ['Parameter differences',
                                       'Relative parameter differences']:
-                        iter_stats.append(np.array(
+                        iter_stats.append(
                             sorted(stats_per_dir[dir][diff_type][
                                 'progress_per_component'][
-                                    component_name].items())))
+                                    component_name].items()))
                 except KeyError as e:
                     # this component is not available in this network so lets
                     # not just plot it
@@ -618,42 +769,93 @@ def generate_parameter_diff_plots(exp_dir, output_dir, plot,
                                         "{1}.".format(
                                             component_name, str(e)))
                     continue
-                ax = plt.subplot(211)
-                mp, = ax.plot(iter_stats[0][:, 0], iter_stats[0][:, 1],
-                              color=color_val,
-                              label="Parameter Differences {0}".format(dir))
-                plots.append(mp)
-                ax.set_ylabel('Parameter Differences')
-                ax.grid(True)
-
-                ax = plt.subplot(212)
-                mp, = ax.plot(iter_stats[1][:, 0], iter_stats[1][:, 1],
-                              color=color_val,
-                              label="Relative Parameter "
-                                    "Differences {0}".format(dir))
-                ax.set_xlabel('Iteration')
-                ax.set_ylabel('Relative Parameter Differences')
-                ax.grid(True)
-
-            lgd = plt.legend(handles=plots, loc='lower center',
-                             bbox_to_anchor=(0.5, -0.5 + len(dirs) * -0.2),
-                             ncol=1, borderaxespad=0.)
-            plt.grid(True)
-            fig.suptitle("Parameter differences at {comp_name}".format(
-                comp_name=component_name))
+                iter_stats_per_dir[dir] = iter_stats
             comp_name = latex_compliant_name(component_name)
-            figfile_name = '{dir}/param_diff_{comp_name}.pdf'.format(
-                dir=output_dir, comp_name=comp_name)
-            fig.savefig(figfile_name, bbox_extra_artists=(lgd,),
-                        bbox_inches='tight')
-            if latex_report is not None:
-                latex_report.add_figure(
-                    figfile_name,
-                    "Parameter differences at {0}".format(component_name))
+            plot_jobs.append({
+                'function': plot_param_diff,
+                'figfile': '{dir}/param_diff_{comp_name}.pdf'.format(
+                    dir=output_dir, comp_name=comp_name),
+                'caption': "Parameter differences at {0}".format(
+                    component_name),
+                'kwargs': {'dirs': dirs,
+                           'iter_stats_per_dir': iter_stats_per_dir,
+                           'component_name': component_name}})
+    return plot_jobs
+
+
+def get_plot_job_hash(plot_job):
+    """Returns a hash of the data that a figure is plotted from, and of the code
+    that plots it."""
+
+    return hashlib.sha1(json.dumps(
+        [g_plot_code_hash, plot_job['function'].__name__, plot_job['figfile'],
+         plot_job['kwargs']], sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def run_plot_job(plot_job):
+    """Plots one figure; returns a pair (figfile, error), where error is None
+    if the figure was plotted."""
+
+    try:
+        plot_job['function'](plot_job['figfile'], **plot_job['kwargs'])
+        return (plot_job['figfile'], None)
+    except Exception:
+        return (plot_job['figfile'], traceback.format_exc())
+
+
+def run_plot_jobs(plot_jobs, output_dir, num_jobs=1):
+    """Plots the figures described by 'plot_jobs', a list of dicts with the
+    keys 'function' (the plotting function), 'figfile' (the file to write),
+    'caption' (for the latex report) and 'kwargs' (the other arguments of the
+    function, which contain all the data that is plotted).  A figure is
+    only plotted if its data (or this script) changed since it was last
+    plotted; the hashes of the data are kept in output_dir/plot_cache.json.
+    Returns the list of the jobs whose figures exist."""
+
+    cache_file = "{0}/plot_cache.json".format(output_dir)
+    try:
+        with open(cache_file) as f:
+            cache = json.load(f)
+    except (IOError, ValueError):
+        cache = {}
+
+    jobs_to_run = []
+    for plot_job in plot_jobs:
+        plot_job['hash'] = get_plot_job_hash(plot_job)
+        if (cache.get(plot_job['figfile']) == plot_job['hash'] and
+                os.path.exists(plot_job['figfile'])):
+            continue
+        cache.pop(plot_job['figfile'], None)
+        jobs_to_run.append(plot_job)
+    logger.info("Plotting {0} figures ({1} are unchanged)".format(
+        len(jobs_to_run), len(plot_jobs) - len(jobs_to_run)))
+
+    if num_jobs > 1 and len(jobs_to_run) > 1:
+        pool = multiprocessing.Pool(min(num_jobs, len(jobs_to_run)))
+        try:
+            results = pool.map(run_plot_job, jobs_to_run)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [run_plot_job(plot_job) for plot_job in jobs_to_run]
+
+    failed_figfiles = set()
+    for (figfile, error), plot_job in zip(results, jobs_to_run):
+        if error is None:
+            cache[figfile] = plot_job['hash']
+        else:
+            logger.warning("Error plotting {0}: {1}".format(figfile, error))
+            failed_figfiles.add(figfile)
+
+    with open(cache_file, "w") as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    return [plot_job for plot_job in plot_jobs
+            if plot_job['figfile'] not in failed_figfiles]
 
 
 def generate_plots(exp_dir, output_dir, output_names, comparison_dir=None,
-                   start_iter=1):
+                   start_iter=1, num_jobs=1):
     try:
         os.makedirs(output_dir)
     except OSError as e:
@@ -666,52 +868,39 @@ def generate_plots(exp_dir, output_dir, output_names, comparison_dir=None,
     else:
         latex_report = None
 
+    comparison_dir = [] if comparison_dir is None else comparison_dir
+    logger.info("Parsing the logs")
+    parsed_logs = parse_logs([exp_dir] + comparison_dir, output_names,
+                             num_jobs=num_jobs)
+
+    plot_jobs = []
     for (output_name, objective_type) in output_names:
-        if objective_type == "linear":
-            logger.info("Generating accuracy plots")
-            generate_acc_logprob_plots(
-                exp_dir, output_dir, g_plot, key='accuracy',
-                file_basename='accuracy', comparison_dir=comparison_dir,
-                start_iter=start_iter,
-                latex_report=latex_report, output_name=output_name)
-
-            logger.info("Generating log-likelihood plots")
-            generate_acc_logprob_plots(
-                exp_dir, output_dir, g_plot, key='log-likelihood',
-                file_basename='loglikelihood', comparison_dir=comparison_dir,
-                start_iter=start_iter,
-                latex_report=latex_report, output_name=output_name)
-        elif objective_type == "chain":
-            logger.info("Generating log-probability plots")
-            generate_acc_logprob_plots(
-                exp_dir, output_dir, g_plot,
-                key='log-probability', file_basename='log_probability',
-                comparison_dir=comparison_dir, start_iter=start_iter,
-                latex_report=latex_report, output_name=output_name)
-        else:
-            logger.info("Generating " + objective_type + " objective plots")
-            generate_acc_logprob_plots(
-                exp_dir, output_dir, g_plot, key='objective',
-                file_basename='objective', comparison_dir=comparison_dir,
-                start_iter=start_iter,
-                latex_report=latex_report, output_name=output_name)
+        for (key, file_basename) in get_acc_logprob_plot_types(objective_type):
+            logger.info("Generating {0} plots".format(key))
+            plot_jobs += generate_acc_logprob_plots(
+                exp_dir, output_dir, g_plot, parsed_logs, key=key,
+                file_basename=file_basename, comparison_dir=comparison_dir,
+                start_iter=start_iter, output_name=output_name)
 
     logger.info("Generating non-linearity stats plots")
-    generate_nonlin_stats_plots(
-        exp_dir, output_dir, g_plot, comparison_dir=comparison_dir,
-        start_iter=start_iter, latex_report=latex_report)
+    plot_jobs += generate_nonlin_stats_plots(
+        exp_dir, output_dir, g_plot, parsed_logs,
+        comparison_dir=comparison_dir, start_iter=start_iter)
 
     logger.info("Generating clipped-proportion plots")
-    generate_clipped_proportion_plots(
-        exp_dir, output_dir, g_plot, comparison_dir=comparison_dir,
-        start_iter=start_iter, latex_report=latex_report)
+    plot_jobs += generate_clipped_proportion_plots(
+        exp_dir, output_dir, g_plot, parsed_logs,
+        comparison_dir=comparison_dir, start_iter=start_iter)
 
     logger.info("Generating parameter difference plots")
-    generate_parameter_diff_plots(
-        exp_dir, output_dir, g_plot, comparison_dir=comparison_dir,
-        start_iter=start_iter, latex_report=latex_report)
+    plot_jobs += generate_parameter_diff_plots(
+        exp_dir, output_dir, g_plot, parsed_logs,
+        comparison_dir=comparison_dir, start_iter=start_iter)
 
     if g_plot and latex_report is not None:
+        for plot_job in run_plot_jobs(plot_jobs, output_dir,
+                                      num_jobs=num_jobs):
+            latex_report.add_figure(plot_job['figfile'], plot_job['caption'])
         has_compiled = latex_report.close()
         if has_compiled:
             logger.info("Report has been generated. "
@@ -738,15 +927,15 @@ def main():
     if args.comparison_dir is not None:
       generate_plots(args.exp_dir[0], args.output_dir, output_nodes,
                      comparison_dir=args.comparison_dir,
-                     start_iter=args.start_iter)
+                     start_iter=args.start_iter, num_jobs=args.num_jobs)
     else:
       if len(args.exp_dir) == 1:
         generate_plots(args.exp_dir[0], args.output_dir, output_nodes,
-                       start_iter=args.start_iter)
+                       start_iter=args.start_iter, num_jobs=args.num_jobs)
       if len(args.exp_dir) > 1:
         generate_plots(args.exp_dir[0], args.output_dir, output_nodes,
                        comparison_dir=args.exp_dir[1:],
-                       start_iter=args.start_iter)
+                       start_iter=args.start_iter, num_jobs=args.num_jobs)
 
 
 if __name__ == "__main__":
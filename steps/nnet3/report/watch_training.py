@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+# Apache 2.0.
+
+""" This script follows the logs of a running nnet3 or chain training, and
+keeps appending the objectives, accuracies, parameter differences and train
+times of the iterations to a CSV file (see libs/nnet3/report/log_watch.py for
+its format).  Each update only reads what was added to the logs since the
+previous one.  With --port, the CSV file is also served over HTTP at
+http://localhost:<port>/data.csv; a client that already has the first N bytes
+can fetch only the rest with /data.csv?offset=N.
+
+e.g.: steps/nnet3/report/watch_training.py --port 8080 exp/chain/tdnn1a \\
+        exp/chain/tdnn1a/report/live.csv
+"""
+
+from __future__ import print_function
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from urlparse import urlparse, parse_qs
+
+sys.path.insert(0, 'steps')
+import libs.nnet3.report.log_watch as log_watch
+
+
+logger = logging.getLogger('libs')
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+handler.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s [%(filename)s:%(lineno)s - "
+                              "%(funcName)s - %(levelname)s ] %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="""Follows the logs of a running training and appends the
+        per-iteration statistics to a CSV file, optionally serving it over
+        HTTP.""")
+
+    parser.add_argument("--poll-interval", type=float, default=30.0,
+                        help="Seconds between updates")
+    parser.add_argument("--port", type=int, default=None,
+                        help="If set, serve the CSV file on this port of "
+                        "localhost")
+    parser.add_argument("--once", action='store_true',
+                        help="Update the CSV file once and exit (e.g. for "
+                        "running from cron)")
+    parser.add_argument("--output-name", type=str, default='output',
+                        help="Name of the output node whose objectives are "
+                        "extracted")
+    parser.add_argument("exp_dir",
+                        help="the experiment directory, e.g. exp/nnet3/tdnn")
+    parser.add_argument("csv_file",
+                        help="the CSV file to append to, e.g. "
+                        "exp/nnet3/tdnn/report/live.csv")
+
+    args = parser.parse_args()
+    if args.poll_interval <= 0:
+        raise Exception("--poll-interval should be positive")
+    return args
+
+
+def make_request_handler(csv_file):
+    class CsvRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != '/data.csv':
+                self.send_error(404)
+                return
+            try:
+                offset = int(parse_qs(url.query).get('offset', ['0'])[0])
+            except ValueError:
+                self.send_error(400)
+                return
+            if offset < 0:
+                self.send_error(400)
+                return
+            with open(csv_file, 'rb') as f:
+                # the file may have been truncated since the client read it
+                # (see log_watch.py).
+                offset = min(offset, os.fstat(f.fileno()).st_size)
+                f.seek(offset)
+                data = f.read()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/csv')
+            self.send_header('Content-Length', str(len(data)))
+            # the offset to request next time.
+            self.send_header('X-Next-Offset', str(offset + len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return CsvRequestHandler
+
+
+def main():
+    args = get_args()
+    csv_dir = os.path.dirname(os.path.abspath(args.csv_file))
+    if not os.path.isdir(csv_dir):
+        os.makedirs(csv_dir)
+
+    watcher = log_watch.TrainingLogWatcher(args.exp_dir, args.csv_file,
+                                           output_name=args.output_name)
+    watcher.update()
+    if args.once:
+        return
+
+    if args.port is not None:
+        server = HTTPServer(('localhost', args.port),
+                            make_request_handler(args.csv_file))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        logger.info("Serving {0} at http://localhost:{1}/data.csv".format(
+            args.csv_file, args.port))
+
+    while True:
+        time.sleep(args.poll_interval)
+        watcher.update()
+
+
+if __name__ == "__main__":
+    main()
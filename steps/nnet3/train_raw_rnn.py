@@ -377,6 +377,17 @@ def train(args, run_opts):
                             ''.format(egs_dir))
         use_multitask_egs = False
 
+    # With multilingual egs, the learning rate of an iteration is scaled by
+    # the relative number of frames in the archives it trains on, as given by
+    # info/lang_stats (see steps/nnet3/multilingual/combine_egs.sh).
+    archive_lrate_factors = None
+    if use_multitask_egs:
+        archive_stats, lang_stats = common_train_lib.get_lang_stats(egs_dir)
+        if archive_stats is not None:
+            archive_lrate_factors = (
+                common_train_lib.get_archive_learning_rate_factors(
+                    archive_stats))
+
     min_deriv_time = None
     max_deriv_time_relative = None
     if args.deriv_truncate_margin is not None:
@@ -404,6 +415,10 @@ def train(args, run_opts):
                                                        num_archives_to_process,
                                                        args.initial_effective_lrate,
                                                        args.final_effective_lrate)
+            if archive_lrate_factors is not None:
+                lrate *= common_train_lib.get_iteration_learning_rate_factor(
+                    archive_lrate_factors, num_archives_processed,
+                    current_num_jobs, num_archives)
 
             # shrinkage_value is a scale on the parameters.
             shrinkage_value = 1.0 - (args.proportional_shrink * lrate)
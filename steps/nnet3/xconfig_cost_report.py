@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+# Apache 2.0.
+
+""" This script reads an xconfig file and prints an estimate of the cost of
+each layer of the network: its number of parameters and size in the model, the
+FLOPs needed to compute it, and the memory taken by its activations during
+training, for chunks of a given width.  It also prints the estimated cost of
+decoding per second of audio and the training memory per minibatch, so that
+these can be compared between architectures before training them.
+
+The costs are rough estimates (see libs/nnet3/xconfig/costs.py); the numbers of
+frames at which each layer is computed take frame subsampling into account.
+
+Example:
+  steps/nnet3/xconfig_cost_report.py --xconfig-file exp/chain/tdnn1a/configs/xconfig \\
+    --chunk-width 150 --frame-subsampling-factor 3
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import sys
+
+sys.path.insert(0, 'steps/')
+# the following is in case we weren't running this from the normal directory.
+sys.path.insert(0, os.path.realpath(os.path.dirname(sys.argv[0])) + '/')
+
+import libs.nnet3.xconfig.parser as xparser
+import libs.nnet3.xconfig.model_context as xcontext
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Prints an estimate of the compute and memory cost of each "
+                    "layer of the network in an xconfig file.",
+        epilog="See the top of this script for an example.")
+    parser.add_argument('--xconfig-file', required=True,
+                        help='Filename of input xconfig file')
+    parser.add_argument('--chunk-width', type=int, default=150,
+                        help="""Number of input frames per chunk (as in
+                        --egs.chunk-width in training, or --frames-per-chunk
+                        in decoding)""")
+    parser.add_argument('--frame-subsampling-factor', type=int, default=1,
+                        help="""The output is computed at every this many
+                        frames (e.g. 3 for 'chain' models)""")
+    parser.add_argument('--minibatch-size', type=int, default=64,
+                        help="""Number of chunks per minibatch, for the
+                        estimate of the training memory""")
+    parser.add_argument('--frames-per-second', type=float, default=100.0,
+                        help="Number of input frames per second of audio")
+
+    print(' '.join(sys.argv), file=sys.stderr)
+
+    args = parser.parse_args()
+    if args.chunk_width <= 0 or args.frame_subsampling_factor <= 0:
+        raise Exception("--chunk-width and --frame-subsampling-factor should "
+                        "be positive")
+    return args
+
+
+def print_table(rows):
+    widths = [max([len(row[i]) for row in rows]) for i in range(len(rows[0]))]
+    for row in rows:
+        print(' '.join([x.ljust(w) for x, w in zip(row, widths)]).rstrip())
+
+
+def main():
+    args = get_args()
+    all_layers = xparser.read_xconfig_file(args.xconfig_file)
+    config_lines = [line for layer in all_layers
+                    for (config_name, line) in layer.get_full_config()
+                    if config_name == 'ref']
+
+    output_times = list(range(0, args.chunk_width,
+                              args.frame_subsampling_factor))
+    node_times = xcontext.compute_node_times(config_lines, output_times)
+    if node_times is None:
+        print("# Could not work out the frames at which the nodes are "
+              "computed; assuming every layer is computed at all {0} frames "
+              "of the chunk.".format(args.chunk_width))
+        node_times = {}
+
+    rows = [['#layer', 'type', 'num-params', 'size(MB)', 'MFLOPs/frame',
+             'frames/chunk', 'MFLOPs/chunk', 'activations(MB)/chunk']]
+    total_num_parameters = 0
+    total_param_bytes = 0
+    total_chunk_flops = 0
+    total_activation_bytes = 0
+    for layer in all_layers:
+        node_costs = layer.get_node_costs()
+        if len(node_costs) == 0:
+            continue
+        (chunk_flops, activation_bytes) = layer.get_chunk_costs(
+            node_times, args.chunk_width)
+        num_frames = max([len(node_times[x['node']]) if x['node'] in node_times
+                          else args.chunk_width for x in node_costs])
+        rows.append([layer.get_name(), layer.layer_type,
+                     str(layer.num_parameters()),
+                     '{0:.2f}'.format(layer.param_bytes() / 1.0e6),
+                     '{0:.3f}'.format(layer.flops_per_frame() / 1.0e6),
+                     str(num_frames),
+                     '{0:.2f}'.format(chunk_flops / 1.0e6),
+                     '{0:.2f}'.format(activation_bytes / 1.0e6)])
+        total_num_parameters += layer.num_parameters()
+        total_param_bytes += layer.param_bytes()
+        total_chunk_flops += chunk_flops
+        total_activation_bytes += activation_bytes
+    rows.append(['#total', '', str(total_num_parameters),
+                 '{0:.2f}'.format(total_param_bytes / 1.0e6), '', '',
+                 '{0:.2f}'.format(total_chunk_flops / 1.0e6),
+                 '{0:.2f}'.format(total_activation_bytes / 1.0e6)])
+    print_table(rows)
+
+    context = xcontext.compute_model_context(config_lines)
+    if context is not None:
+        print("# model-left-context={0} model-right-context={1}".format(
+            context[0], context[1]))
+    # for decoding, the chunks follow each other, so the cost per second
+    # includes the overhead of the context at the edges of each chunk.
+    flops_per_second = (total_chunk_flops * args.frames_per_second /
+                        args.chunk_width)
+    print("# decoding: {0:.3f} GFLOPs per second of audio ({1:.3f} MFLOPs "
+          "per input frame)".format(flops_per_second / 1.0e9,
+                                    total_chunk_flops / 1.0e6 /
+                                    args.chunk_width))
+    # in training we keep the model and its derivative, and the activations
+    # of all the chunks in the minibatch and their derivatives.
+    training_bytes = (2 * total_param_bytes + 2 * args.minibatch_size *
+                      total_activation_bytes)
+    print("# training: about {0:.1f} MB for a minibatch of {1} chunks of {2} "
+          "frames".format(training_bytes / 1.0e6, args.minibatch_size,
+                          args.chunk_width))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+# Apache 2.0.
+
+""" This script expands an xconfig template over a grid of parameter values,
+checks that each variant can be compiled, and writes a table of the variants
+ranked by their estimated FLOPs per frame (or number of parameters), with their
+model context.  The xconfig of each variant is written to
+<dir>/<variant-name>/xconfig, to be compiled with xconfig_to_configs.py.
+
+Example:
+  steps/nnet3/xconfig_sweep.py --xconfig-template exp/sweep/xconfig.template \\
+    --param dim=512,768,1024 --param bottleneck-dim=128,160 \\
+    --num-jobs 8 --dir exp/sweep
+where exp/sweep/xconfig.template contains lines like
+  relu-batchnorm-layer name=tdnn1 dim=$dim
+"""
+
+from __future__ import print_function
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, 'steps/')
+# the following is in case we weren't running this from the normal directory.
+sys.path.insert(0, os.path.realpath(os.path.dirname(sys.argv[0])) + '/')
+
+import libs.nnet3.xconfig.sweep as xsweep
+
+logger = logging.getLogger('libs')
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+handler.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s [%(pathname)s:%(lineno)s - "
+                              "%(funcName)s - %(levelname)s ] %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Expands an xconfig template over a grid of parameter "
+                    "values and ranks the variants by their estimated cost.",
+        epilog="See the top of this script for an example.")
+    parser.add_argument('--xconfig-template', required=True,
+                        help="""xconfig file in which the swept values appear
+                        as shell-style variables, e.g. dim=$dim.""")
+    parser.add_argument('--param', action='append', default=[],
+                        help="""A variable of the template and the values it
+                        takes, e.g. 'dim=512,768,1024'.  May be repeated; all
+                        combinations of the values are evaluated.""")
+    parser.add_argument('--dir', required=True,
+                        help="""Directory to write the xconfig files of the
+                        variants and the table 'sweep.txt' to.""")
+    parser.add_argument('--num-jobs', type=int, default=4,
+                        help="Number of parallel processes")
+    parser.add_argument('--sort-by', type=str, default='flops',
+                        choices=['flops', 'num-parameters'],
+                        help="Quantity by which the variants are ranked")
+
+    print(' '.join(sys.argv), file=sys.stderr)
+
+    args = parser.parse_args()
+    if args.num_jobs < 1:
+        raise Exception("--num-jobs should be at least 1")
+    if not os.path.exists(args.dir):
+        os.makedirs(args.dir)
+    return args
+
+
+def main():
+    args = get_args()
+    with open(args.xconfig_template) as f:
+        template = f.read()
+    grid = xsweep.parse_grid(args.param)
+    results = xsweep.run_sweep(template, grid, args.dir,
+                               num_jobs=args.num_jobs, sort_by=args.sort_by)
+    table_file = os.path.join(args.dir, 'sweep.txt')
+    xsweep.write_sweep_table(results, list(grid.keys()), table_file)
+    num_failed = len([x for x in results if x['error'] is not None])
+    logger.info("Wrote {0} ({1} variants, {2} failed)".format(
+        table_file, len(results), num_failed))
+    if num_failed == len(results):
+        raise Exception("All variants failed; see {0}".format(table_file))
+
+
+if __name__ == '__main__':
+    main()
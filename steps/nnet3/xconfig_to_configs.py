@@ -8,6 +8,7 @@
 # we're using python 3.x style print but want it to work in python 2.x,
 from __future__ import print_function
 import argparse
+import logging
 import os
 import sys
 from collections import defaultdict
@@ -17,8 +18,19 @@ sys.path.insert(0, 'steps/')
 sys.path.insert(0, os.path.realpath(os.path.dirname(sys.argv[0])) + '/')
 
 import libs.nnet3.xconfig.parser as xparser
+import libs.nnet3.xconfig.model_context as xcontext
+import libs.nnet3.xconfig.compile_cache as xcache
 import libs.common as common_lib
 
+logger = logging.getLogger('libs')
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+handler.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s [%(pathname)s:%(lineno)s - "
+                              "%(funcName)s - %(levelname)s ] %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
 
 def get_args():
     # we add compulsary arguments as named arguments for readability
@@ -50,6 +62,21 @@ def get_args():
                         new-name=output' if node xxx plays the role of the
                         output node in this network.  This is only used for
                         computing the left/right context.""")
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        action=common_lib.NullstrToNoneAction,
+                        help="""If set, a directory in which the parsed layers
+                        and the model contexts are cached, so that compiling
+                        many xconfig files that share their first layers (e.g.
+                        in an architecture search) is faster.  It may be shared
+                        between jobs.""")
+    parser.add_argument('--compute-context-in-python', type=str,
+                        default=True, action=common_lib.StrToBoolAction,
+                        choices=['true', 'false'],
+                        help="""If true, work out the left/right context of the
+                        network from the config files directly where possible,
+                        rather than running nnet3-init and nnet3-info.  The
+                        config files are still checked by running nnet3-init
+                        on them if it is on the PATH.""")
 
     print(' '.join(sys.argv), file=sys.stderr)
 
@@ -230,16 +257,19 @@ def write_config_files(config_dir, all_layers):
             raise
 
 
-def add_nnet_context_info(config_dir, nnet_edits=None,
-                          existing_model=None):
-    """Create the 'vars' file that specifies model_left_context, etc."""
+def compute_model_context_with_binaries(config_dir, file_name,
+                                        nnet_edits=None, existing_model=None):
+    """Works out the left and right context of the model in
+    config_dir/{file_name}.config by running nnet3-init and nnet3-info.
+    Returns a dict with keys 'left-context' and 'right-context'."""
 
-    common_lib.execute_command("nnet3-init {0} {1}/ref.config "
-                               "{1}/ref.raw"
+    common_lib.execute_command("nnet3-init {0} {1}/{2}.config "
+                               "{1}/{2}.raw"
                                "".format(existing_model if
-                                         existing_model is not None else "",
-                                         config_dir))
-    model = "{0}/ref.raw".format(config_dir)
+                                         existing_model is not
+                                         None else '',
+                                         config_dir, file_name))
+    model = "{0}/{1}.raw".format(config_dir, file_name)
     if nnet_edits is not None:
         model = "nnet3-copy --edits='{0}' {1} - |".format(nnet_edits,
                                                           model)
@@ -250,56 +280,110 @@ def add_nnet_context_info(config_dir, nnet_edits=None,
     # right-context: 0
     # num-parameters: 90543902
     # modulus: 1
-    info = {}
+    context = {}
     for line in out.split("\n"):
         parts = line.split(":")
         if len(parts) != 2:
             continue
-        info[parts[0].strip()] = int(parts[1].strip())
+        key = parts[0].strip()
+        value = int(parts[1].strip())
+        if key in ['left-context', 'right-context']:
+            context[key] = value
+    return context
+
+
+def nnet3_binaries_available():
+    return any([os.access(os.path.join(path, 'nnet3-init'), os.X_OK)
+                for path in os.environ.get('PATH', '').split(os.pathsep)])
+
+
+def check_config_with_binaries(config_dir, file_name):
+    """Checks that config_dir/{file_name}.config is valid by running nnet3-init
+    on it, if nnet3-init is on the PATH; this is the check that
+    compute_model_context_with_binaries() would otherwise do.  Returns True
+    if the config file was checked."""
+
+    if not nnet3_binaries_available():
+        logger.warning("nnet3-init is not on the PATH, so {0}/{1}.config was "
+                       "not checked.".format(config_dir, file_name))
+        return False
+    common_lib.execute_command("nnet3-init {0}/{1}.config {0}/{1}.raw"
+                               "".format(config_dir, file_name))
+    return True
+
+
+def get_model_contexts(config_dir, nnet_edits=None, existing_model=None,
+                       compute_in_python=True, cache=None):
+    """Returns a dict from config file name ('init', 'ref'; only those that
+    exist) to a dict with keys 'left-context' and 'right-context'.
+
+    If compute_in_python is true the contexts are worked out from the config
+    files directly (see libs/nnet3/xconfig/model_context.py) where possible;
+    otherwise, or for networks it doesn't handle, we run nnet3-init and
+    nnet3-info.  Config files whose context is worked out directly are still
+    checked with nnet3-init (see check_config_with_binaries()).  If 'cache' is
+    not None, contexts of config files that were seen before are taken from
+    it; the contexts are only added to the cache if all the config files were
+    checked, so that configs that could not be checked are checked again by
+    a later run."""
+
+    file_names = [file_name for file_name in ['init', 'ref']
+                  if os.path.exists('{0}/{1}.config'.format(config_dir,
+                                                            file_name))]
+    if cache is not None:
+        key = cache.contexts_key(config_dir, file_names, nnet_edits,
+                                 existing_model)
+        contexts = cache.get_contexts(key)
+        if contexts is not None:
+            logger.info("Using cached model contexts")
+            return contexts
+
+    contexts = {}
+    all_checked = True
+    for file_name in file_names:
+        context = None
+        # the edits and the nodes of an existing model are only known to the
+        # binaries.
+        if (compute_in_python and nnet_edits is None and
+                existing_model is None):
+            with open('{0}/{1}.config'.format(config_dir, file_name)) as f:
+                context = xcontext.compute_model_context(f.readlines())
+            if context is None:
+                logger.info("Could not work out the context of {0}/{1}.config "
+                            "directly, using nnet3-info.".format(config_dir,
+                                                                 file_name))
+        if context is not None:
+            if not check_config_with_binaries(config_dir, file_name):
+                all_checked = False
+            contexts[file_name] = {'left-context': context[0],
+                                   'right-context': context[1]}
+        else:
+            contexts[file_name] = compute_model_context_with_binaries(
+                config_dir, file_name, nnet_edits, existing_model)
+
+    if cache is not None and all_checked:
+        cache.put_contexts(key, contexts)
+    return contexts
+
+
+def add_nnet_context_info(config_dir, contexts):
+    """Create the 'vars' file that specifies model_left_context, etc."""
 
     # Writing the 'vars' file:
     #   model_left_context=0
     #   model_right_context=7
     vf = open('{0}/vars'.format(config_dir), 'w')
-    vf.write('model_left_context={0}\n'.format(info['left-context']))
-    vf.write('model_right_context={0}\n'.format(info['right-context']))
+    vf.write('model_left_context={0}\n'.format(
+        contexts['ref']['left-context']))
+    vf.write('model_right_context={0}\n'.format(
+        contexts['ref']['right-context']))
     vf.close()
 
-def check_model_contexts(config_dir, nnet_edits=None, existing_model=None):
-    contexts = {}
-    for file_name in ['init', 'ref']:
-        if os.path.exists('{0}/{1}.config'.format(config_dir, file_name)):
-            contexts[file_name] = {}
-            common_lib.execute_command("nnet3-init {0} {1}/{2}.config "
-                                       "{1}/{2}.raw"
-                                       "".format(existing_model if
-                                                 existing_model is not
-                                                 None else '',
-                                                 config_dir, file_name))
-            model = "{0}/{1}.raw".format(config_dir, file_name)
-            if nnet_edits is not None:
-                model = "nnet3-copy --edits='{0}' {1} - |".format(nnet_edits,
-                                                                  model)
-            out = common_lib.get_command_stdout('nnet3-info "{0}" | head -n 4 '
-                                                .format(model))
-            # out looks like this
-            # left-context: 7
-            # right-context: 0
-            # num-parameters: 90543902
-            # modulus: 1
-            for line in out.split("\n"):
-                parts = line.split(":")
-                if len(parts) != 2:
-                    continue
-                key = parts[0].strip()
-                value = int(parts[1].strip())
-                if key in ['left-context', 'right-context']:
-                    contexts[file_name][key] = value
-
-    if contexts.has_key('init'):
-        assert(contexts.has_key('ref'))
-        if (contexts['init'].has_key('left-context') and
-            contexts['ref'].has_key('left-context')):
+def check_model_contexts(config_dir, contexts):
+    if 'init' in contexts:
+        assert('ref' in contexts)
+        if ('left-context' in contexts['init'] and
+            'left-context' in contexts['ref']):
             if ((contexts['init']['left-context']
                  > contexts['ref']['left-context'])
                 or (contexts['init']['right-context']
@@ -310,7 +394,7 @@ def check_model_contexts(config_dir, nnet_edits=None, existing_model=None):
                     " This might be due to use of label-delay at the output"
                     " in ref.config. Please use delay=$label_delay in the"
                     " initial fixed-affine-layer of the network, to avoid"
-                    " this issue.")
+                    " this issue.".format(config_dir))
 
 
 
@@ -320,13 +404,19 @@ def main():
     existing_layers = []
     if args.existing_model is not None:
         existing_layers = xparser.get_model_component_info(args.existing_model)
-    all_layers = xparser.read_xconfig_file(args.xconfig_file, existing_layers)
+    cache = None
+    if args.cache_dir is not None:
+        cache = xcache.XconfigCache(args.cache_dir)
+    all_layers = xparser.read_xconfig_file(args.xconfig_file, existing_layers,
+                                           cache=cache)
     write_expanded_xconfig_files(args.config_dir, all_layers)
     write_config_files(args.config_dir, all_layers)
-    check_model_contexts(args.config_dir, args.nnet_edits,
-                         existing_model=args.existing_model)
-    add_nnet_context_info(args.config_dir, args.nnet_edits,
-                          existing_model=args.existing_model)
+    contexts = get_model_contexts(
+        args.config_dir, args.nnet_edits,
+        existing_model=args.existing_model,
+        compute_in_python=args.compute_context_in_python, cache=cache)
+    check_model_contexts(args.config_dir, contexts)
+    add_nnet_context_info(args.config_dir, contexts)
 
 
 if __name__ == '__main__':
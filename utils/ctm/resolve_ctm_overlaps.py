@@ -19,6 +19,7 @@ and the first 2.5s of the second utterance i.e. from 25s to 27.s is truncated.
 from __future__ import print_function
 import argparse
 import collections
+import itertools
 import logging
 
 from collections import defaultdict
@@ -47,8 +48,22 @@ def get_args():
                         help='output_ctm_file')
     parser.add_argument('--verbose', type=int, default=0,
                         help="Higher value for more verbose logging.")
+    parser.add_argument('--streaming', type=str, default='false',
+                        choices=['true', 'false'],
+                        help="""If true, read the segments and the CTM in
+                        parallel and resolve the overlaps one recording at a
+                        time, so that the memory used does not grow with the
+                        size of the input and the CTM can be piped from
+                        lattice-to-ctm-conf. This requires the CTM to be in
+                        the order of the segments, and the utterances of each
+                        recording to be contiguous and sorted by start time
+                        in the segments (as for the uniform subsegments of
+                        utils/data/get_uniform_subsegments.py); this is
+                        verified.""")
     args = parser.parse_args()
 
+    args.streaming = bool(args.streaming == 'true')
+
     if args.verbose > 2:
         logger.setLevel(logging.DEBUG)
         handler.setLevel(logging.DEBUG)
@@ -122,15 +137,77 @@ def read_ctm(ctm_file, segments):
     return ctms
 
 
+def read_segments_in_order(segments_file):
+    """Yields (utterance-id, (recording_id, start_time, end_time)) for the
+    lines of segments_file, in the order of the file."""
+    num_lines = 0
+    for line in segments_file:
+        num_lines += 1
+        parts = line.strip().split()
+        assert len(parts) in [4, 5]
+        yield parts[0], (parts[1], float(parts[2]), float(parts[3]))
+
+    logger.info("Read %d lines from segments file %s",
+                num_lines, segments_file.name)
+
+
+def read_ctm_by_utterance(ctm_file):
+    """Yields the CTM lines of each utterance in ctm_file as a list, in the
+    format of the values of the dictionary read by read_ctm(). The lines
+    of an utterance are expected to be contiguous."""
+    ctm_for_cur_utt = []
+
+    num_lines = 0
+    for line in ctm_file:
+        num_lines += 1
+        parts = line.split()
+
+        if len(ctm_for_cur_utt) > 0 and parts[0] != ctm_for_cur_utt[0][0]:
+            yield ctm_for_cur_utt
+            ctm_for_cur_utt = []
+
+        ctm_for_cur_utt.append([parts[0], parts[1], float(parts[2]),
+                                float(parts[3])] + parts[4:])
+
+    if len(ctm_for_cur_utt) > 0:
+        yield ctm_for_cur_utt
+
+    logger.info("Read %d lines from CTM %s", num_lines, ctm_file.name)
+
+
+def read_ctm_with_segments(ctm_file, segments_file):
+    """Reads the CTM and the segments in parallel, and yields
+    (utterance-id, (recording_id, start_time, end_time), ctm_lines) for each
+    utterance in the CTM. The utterances in the CTM must be in the same
+    order as in the segments file; the utterances of the segments file that
+    have no CTM lines are skipped."""
+    segments = read_segments_in_order(segments_file)
+    for ctm_for_utt in read_ctm_by_utterance(ctm_file):
+        utt = ctm_for_utt[0][0]
+        for segment_utt, segment in segments:
+            if segment_utt == utt:
+                break
+        else:
+            logger.error(
+                "Could not find utterance %s in segments after the "
+                "previous utterance of the CTM. "
+                "CTM is not in the order of the segments?", utt)
+            raise ValueError
+        yield utt, segment, ctm_for_utt
+
+
 def resolve_overlaps(ctms, segments):
     """Resolve overlaps within segments of the same recording.
 
-    Returns new lines of CTM for the recording.
+    Yields the new lines of CTM for the recording. Only the CTMs of two
+    consecutive utterances are held at a time, so 'ctms' may be a generator
+    that reads them as they are needed.
 
     Arguments:
-        ctms - The CTM lines for a single recording. This is one value stored
-            in the dictionary read by read_ctm(). Assumes that the lines
-            are sorted by the utterance-ids.
+        ctms - The CTM lines for a single recording, one list per utterance,
+            in the order of the start times of the utterances. This is one
+            value stored in the dictionary read by read_ctm(), or any other
+            iterable of the same lists.
             The format is the following:
             [[(utteranceA, channelA, start_time1, duration1, hyp_word1, conf1),
               (utteranceA, channelA, start_time2, duration2, hyp_word2, conf2),
@@ -146,34 +223,22 @@ def resolve_overlaps(ctms, segments):
             ]
         segments - Dictionary containing the output of read_segments()
             { utterance_id: (recording_id, start_time, end_time) }
+            It needs to contain an utterance only once its CTM has been
+            read from 'ctms'.
         """
-    total_ctm = []
-    if len(ctms) == 0:
+    ctms = iter(ctms)
+    try:
+        ctm_for_cur_utt = next(ctms)
+    except StopIteration:
         raise RuntimeError('CTMs for recording is empty. '
                            'Something wrong with the input ctms')
 
-    # First column of first line in CTM for first utterance
-    next_utt = ctms[0][0][0]
-    for utt_index, ctm_for_cur_utt in enumerate(ctms):
-        if utt_index == len(ctms) - 1:
-            break
-
+    for ctm_for_next_utt in ctms:
         if len(ctm_for_cur_utt) == 0:
-            next_utt = ctms[utt_index + 1][0][0]
+            ctm_for_cur_utt = ctm_for_next_utt
             continue
 
         cur_utt = ctm_for_cur_utt[0][0]
-        if cur_utt != next_utt:
-            logger.error(
-                "Current utterance %s is not the same as the next "
-                "utterance %s in previous iteration.\n"
-                "CTM is not sorted by utterance-id?",
-                cur_utt, next_utt)
-            raise ValueError
-
-        # Assumption here is that the segments are written in
-        # consecutive order?
-        ctm_for_next_utt = ctms[utt_index + 1]
         next_utt = ctm_for_next_utt[0][0]
         if segments[next_utt][1] < segments[cur_utt][1]:
             logger.error(
@@ -200,8 +265,9 @@ def resolve_overlaps(ctms, segments):
             if overlap > 0 and segments[next_utt][2] <= segments[cur_utt][2]:
                 # Next utterance is entirely within this utterance.
                 # So we leave this ctm as is and make the next one empty.
-                total_ctm.extend(ctm_for_cur_utt)
-                ctms[utt_index + 1] = []
+                for line in ctm_for_cur_utt:
+                    yield line
+                ctm_for_cur_utt = []
                 continue
 
             # find a break point (a line in the CTM) for the current utterance
@@ -223,7 +289,8 @@ def resolve_overlaps(ctms, segments):
 
             # Ignore the hypotheses beyond this midpoint. They will be
             # considered as part of the next segment.
-            total_ctm.extend(ctm_for_cur_utt[:index])
+            for line in ctm_for_cur_utt[:index]:
+                yield line
 
             # Find a break point (a line in the CTM) for the next utterance
             # i.e. the first line that has more than half of it outside
@@ -235,14 +302,11 @@ def resolve_overlaps(ctms, segments):
             except StopIteration:
                 # This can happen if there is no word hypothesized after
                 # half the overlap region.
-                ctms[utt_index + 1] = []
+                ctm_for_cur_utt = []
                 continue
 
-            if index > 0:
-                # Update the ctm_for_next_utt to include only the lines
-                # starting from index.
-                ctms[utt_index + 1] = ctm_for_next_utt[index:]
-            # else leave the ctm as is.
+            # Keep only the lines of the next utterance starting from index.
+            ctm_for_cur_utt = ctm_for_next_utt[index:]
         except:
             logger.error("Could not resolve overlaps between CTMs for "
                          "%s and %s", cur_utt, next_utt)
@@ -255,9 +319,8 @@ def resolve_overlaps(ctms, segments):
             raise
 
     # merge the last ctm entirely
-    total_ctm.extend(ctms[-1])
-
-    return total_ctm
+    for line in ctm_for_cur_utt:
+        yield line
 
 
 def ctm_line_to_string(line):
@@ -272,12 +335,47 @@ def write_ctm(ctm_lines, out_file):
         print(ctm_line_to_string(line), file=out_file)
 
 
+def ctms_for_recording(utterances, segments):
+    """Yields the CTM lines of the utterances, as output by
+    read_ctm_with_segments(), adding their segments to the dictionary
+    'segments' as they are read."""
+    for utt, segment, ctm_for_utt in utterances:
+        segments[utt] = segment
+        yield ctm_for_utt
+
+
+def run_streaming(args):
+    """Resolves the overlaps one recording at a time, reading the CTM and
+    the segments in parallel (--streaming=true)."""
+    utterances = read_ctm_with_segments(args.ctm_in, args.segments)
+
+    finished_recos = set()
+    for reco, utterances_of_reco in itertools.groupby(
+            utterances, key=lambda x: x[1][0]):
+        if reco in finished_recos:
+            logger.error("Utterances of recording %s are not contiguous. "
+                         "Segments are not sorted by recording?", reco)
+            raise ValueError
+        finished_recos.add(reco)
+        try:
+            segments = {}
+            write_ctm(resolve_overlaps(
+                ctms_for_recording(utterances_of_reco, segments), segments),
+                args.ctm_out)
+        except Exception:
+            logger.error("Failed to process CTM for recording %s",
+                         reco)
+            raise
+    args.ctm_out.close()
+    logger.info("Wrote CTM for %d recordings.", len(finished_recos))
+
+
 def run(args):
     """this method does everything in this script"""
     segments, reco2utt = read_segments(args.segments)
     ctms = read_ctm(args.ctm_in, segments)
 
-    for reco, utts in reco2utt.iteritems():
+    for reco, utts in reco2utt.items():
         ctms_for_reco = []
         for utt in sorted(utts, key=lambda x: segments[x][1]):
             if (reco, utt) in ctms:
@@ -301,7 +399,10 @@ def main():
     """The main function which parses arguments and call run()."""
     args = get_args()
     try:
-        run(args)
+        if args.streaming:
+            run_streaming(args)
+        else:
+            run(args)
     except:
         logger.error("Failed to resolve overlaps", exc_info=True)
         raise SystemExit(1)
@@ -16,6 +16,8 @@
 
 # begin configuration section
 cleanup=true
+num_processes=1  # number of processes in which choose_utts_to_combine.py
+                 # combines the utterances of the different speakers.
 # end configuration section
 
 . utils/parse_options.sh
@@ -72,6 +74,7 @@ set -o pipefail
 utils/data/get_utt2dur.sh $srcdir
 
 utils/data/internal/choose_utts_to_combine.py --min-duration=$min_seg_len \
+  --num-processes=$num_processes \
   $srcdir/spk2utt $srcdir/utt2dur $dir/utt2utts $dir/utt2spk $dir/utt2dur
 
 utils/utt2spk_to_spk2utt.pl < $dir/utt2spk > $dir/spk2utt
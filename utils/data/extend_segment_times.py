@@ -3,7 +3,8 @@
 from __future__ import print_function
 import sys
 import argparse
-from collections import defaultdict
+
+import numpy as np
 
 
 parser = argparse.ArgumentParser(description="""
@@ -35,15 +36,12 @@ args = parser.parse_args()
 # The output will be in the same format and in the same
 # order, except wiht modified times.
 
-# This variable maps from a recording-id to a listof the utterance
-# indexes (as integer indexes into 'entries']
-# that are part of that recording.
-recording_to_utt_indexes = defaultdict(list)
-
-# This is an array of the entries in the segments file, in the fomrat:
-# (utterance-id as astring, recording-id as string,
-#  start-time as float, end-time as float)
+# This is an array of the entries in the segments file, in the format:
+# (utterance-id as a string, recording-id as string), and the start and end
+# times of the entries as numpy arrays of floats.
 entries = []
+start_times = []
+end_times = []
 
 
 while True:
@@ -59,53 +57,80 @@ while True:
     if not end_time > start_time:
         print("extend_segment_times.py: bad segment (ignoring): " + line,
               file = sys.stderr)
-    recording_to_utt_indexes[recording_id].append(len(entries))
-    entries.append([utt_id, recording_id, start_time, end_time])
+    entries.append((utt_id, recording_id))
+    start_times.append(start_time)
+    end_times.append(end_time)
+
+start_times = np.array(start_times, dtype=np.float64)
+end_times = np.array(end_times, dtype=np.float64)
+
+# recording_indexes maps each entry to an integer index of its recording.
+recording_ids, recording_indexes = np.unique(
+    [ x[1] for x in entries ], return_inverse=True)
+recording_indexes = recording_indexes.reshape(-1)
+
+# 'order' has the entries grouped by recording and sorted on mid-time; the sort
+# is stable, so entries with the same mid-time keep their order in the input.
+order = np.lexsort((0.5 * (start_times + end_times), recording_indexes))
+
+min_time = 0
+max_times = np.full(len(recording_ids), -np.inf)
+np.maximum.at(max_times, recording_indexes, end_times)
+max_times += args.last_segment_end_padding
+start_times = np.maximum(min_time, start_times - args.start_padding)
+end_times = np.minimum(max_times[recording_indexes], end_times + args.end_padding)
 
 num_times_fixed = 0
 
-for recording, utt_indexes in recording_to_utt_indexes.items():
-    # this_entries is a list of lists, sorted on mid-time.
-    # Notice: because lists are objects, when we change 'this_entries'
-    # we change the underlying entries.
-    this_entries = sorted([ entries[x] for x in utt_indexes ],
-                          key = lambda x : 0.5 * (x[2] + x[3]))
-    min_time = 0
-    max_time = max([ x[3] for x in this_entries ]) + args.last_segment_end_padding
-    start_padding = args.start_padding
-    end_padding = args.end_padding
-    for n in range(len(this_entries)):
-        this_entries[n][2] = max(min_time, this_entries[n][2] - start_padding)
-        this_entries[n][3] = min(max_time, this_entries[n][3] + end_padding)
-
-    for n in range(len(this_entries) - 1):
-        this_end_time = this_entries[n][3]
-        next_start_time = this_entries[n+1][2]
-        if this_end_time > next_start_time and args.fix_overlapping_segments == 'true':
-            midpoint = 0.5 * (this_end_time + next_start_time)
-            this_entries[n][3] = midpoint
-            this_entries[n+1][2] = midpoint
-            num_times_fixed += 1
-
-
-# this prints a number with a certain number of digits after
+if args.fix_overlapping_segments == 'true' and len(order) > 1:
+    # Each pair of consecutive segments of a recording in 'order' that
+    # overlap after padding is split at the midpoint of the overlap.  The
+    # end-time of a segment and the start-time of the next segment are only
+    # changed by the pair they both belong to, so all the pairs can be fixed
+    # at once.
+    this_indexes = order[:-1]
+    next_indexes = order[1:]
+    this_end_times = end_times[this_indexes]
+    next_start_times = start_times[next_indexes]
+    overlapping = ((recording_indexes[this_indexes] == recording_indexes[next_indexes])
+                   & (this_end_times > next_start_times))
+    midpoints = 0.5 * (this_end_times[overlapping] + next_start_times[overlapping])
+    end_times[this_indexes[overlapping]] = midpoints
+    start_times[next_indexes[overlapping]] = midpoints
+    num_times_fixed = int(np.count_nonzero(overlapping))
+
+
+# Returns the number of digits after the point with which to print the numbers
+# in the array 'f': 6 digits after the zero, and one more for each time we can
+# divide by 10 until the number is <= 1.0.
+def GetNumDigits(f):
+    num_digits = np.full(len(f), 6, dtype=np.int64)
+    g = f.copy()
+    larger = np.abs(g) > 1.0
+    while larger.any():
+        g[larger] *= 0.1
+        num_digits[larger] += 1
+        larger = np.abs(g) > 1.0
+    return num_digits
+
+start_digits = GetNumDigits(start_times).tolist()
+end_digits = GetNumDigits(end_times).tolist()
+
+# this prints the numbers with a certain number of digits after
 # the point, while removing trailing zeros.
-def FloatToString(f):
-    num_digits = 6 # we want to print 6 digits after the zero
-    g = f
-    while abs(g) > 1.0:
-        g *= 0.1
-        num_digits += 1
-    format_str = '%.{0}g'.format(num_digits)
-    return format_str % f
-
-for entry in entries:
-    [ utt_id, recording_id, start_time, end_time ] = entry
+output = []
+for n, (start_time, end_time) in enumerate(zip(start_times.tolist(),
+                                               end_times.tolist())):
+    [ utt_id, recording_id ] = entries[n]
     if not start_time < end_time:
         print("extend_segment_times.py: bad segment after processing (ignoring): " +
-              ' '.join(entry), file = sys.stderr)
+              ' '.join([ utt_id, recording_id, str(start_time), str(end_time) ]),
+              file = sys.stderr)
         continue
-    print(utt_id, recording_id, FloatToString(start_time), FloatToString(end_time))
+    output.append("%s %s %.*g %.*g\n" % (utt_id, recording_id,
+                                         start_digits[n], start_time,
+                                         end_digits[n], end_time))
+sys.stdout.write("".join(output))
 
 
 print("extend_segment_times.py: extended {0} segments; fixed {1} "
@@ -115,4 +140,3 @@ print("extend_segment_times.py: extended {0} segments; fixed {1} "
 ## test:
 #  (echo utt1 reco1 0.2 6.2; echo utt2 reco1 6.3 9.8 )| extend_segment_times.py
 # and also try the above with the options --last-segment-end-padding=0.0 --fix-overlapping-segments=false
-
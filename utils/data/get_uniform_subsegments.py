@@ -10,6 +10,9 @@ import logging
 import sys
 import textwrap
 
+import numpy as np
+
+
 def get_args():
     parser = argparse.ArgumentParser(
         description=textwrap.dedent("""
@@ -62,48 +65,108 @@ def get_args():
     return args
 
 
-def run(args):
-    if (args.constant_duration):
-        dur_threshold = args.max_segment_duration
+def read_segments(segments_file):
+    """ Returns the utterance-ids of the segments in segments_file as a list
+        and their start and end times as numpy arrays.
+    """
+    utt_ids = []
+    times = []
+    for line in segments_file:
+        parts = line.strip().split()
+        utt_ids.append(parts[0])
+        times.append((parts[2], parts[3]))
+    times = np.array(times, dtype=np.float64).reshape(-1, 2)
+    return utt_ids, times[:, 0], times[:, 1]
+
+
+def get_subsegments(start_times, end_times, max_segment_duration,
+                    overlap_duration, max_remaining_duration,
+                    constant_duration):
+    """ Computes the uniform subsegments of all the segments at once.
+        Returns a tuple (segment_indexes, starts, ends, is_last) of numpy
+        arrays with one element per subsegment, ordered by segment and then by
+        time, where segment_indexes are the indexes of the segments, starts
+        and ends the times relative to the segment start as used in the
+        subsegment-id, and is_last is true for the last subsegment of a segment
+        (whose id is rounded rather than truncated).
+        The windows are advanced for all the remaining segments together, with
+        the same floating-point operations as when processing one segment at a
+        time, so the output is identical.
+    """
+    if constant_duration:
+        dur_threshold = max_segment_duration
     else:
-        dur_threshold = args.max_segment_duration + args.max_remaining_duration
+        dur_threshold = max_segment_duration + max_remaining_duration
+    step = max_segment_duration - overlap_duration
+
+    num_segments = len(start_times)
+    start = start_times.copy()
+    dur = end_times - start_times
+
+    # Lists of arrays, one per window position, of the segment indexes and
+    # start times of the windows before the last one.
+    window_indexes = []
+    window_starts = []
+    active = np.nonzero(dur > dur_threshold)[0]
+    while len(active) > 0:
+        window_indexes.append(active)
+        window_starts.append(start[active])
+        start[active] += step
+        dur[active] -= step
+        active = active[dur[active] > dur_threshold]
+
+    if constant_duration:
+        keep = ~(dur < 0)
+        short = dur < max_remaining_duration
+        start = np.where(short, np.maximum(end_times - max_segment_duration,
+                                           start_times), start)
+        end = np.minimum(start + max_segment_duration, end_times)
+    else:
+        keep = np.ones(num_segments, dtype=bool)
+        end = end_times
+
+    segment_indexes = window_indexes + [np.nonzero(keep)[0]]
+    starts = [x - start_times[i] for i, x in zip(window_indexes, window_starts)]
+    ends = [x + max_segment_duration - start_times[i]
+            for i, x in zip(window_indexes, window_starts)]
+    starts.append((start - start_times)[keep])
+    ends.append((end - start_times)[keep])
+    is_last = ([np.zeros(len(x), dtype=bool) for x in window_indexes]
+               + [np.ones(np.count_nonzero(keep), dtype=bool)])
+
+    segment_indexes = np.concatenate(segment_indexes)
+    # the windows were appended by position, so a stable sort on the segment
+    # index puts the windows of each segment in order.
+    order = np.argsort(segment_indexes, kind='mergesort')
+    return (segment_indexes[order], np.concatenate(starts)[order],
+            np.concatenate(ends)[order], np.concatenate(is_last)[order])
 
-    for line in args.segments_file:
-        parts = line.strip().split()
-        utt_id = parts[0]
-        start_time = float(parts[2])
-        end_time = float(parts[3])
-
-        dur = end_time - start_time
-
-        start = start_time
-        while (dur > dur_threshold):
-            end = start + args.max_segment_duration
-            start_relative = start - start_time
-            end_relative = end - start_time
-            new_utt = "{utt_id}-{s:08d}-{e:08d}".format(
-                utt_id=utt_id, s=int(100 * start_relative),
-                e=int(100 * end_relative))
-            print ("{new_utt} {utt_id} {s:.3f} {e:.3f}".format(
-                new_utt=new_utt, utt_id=utt_id, s=start_relative,
-                e=start_relative + args.max_segment_duration))
-            start += args.max_segment_duration - args.overlap_duration
-            dur -= args.max_segment_duration - args.overlap_duration
-
-        if (args.constant_duration):
-            if (dur < 0):
-              continue
-            if (dur < args.max_remaining_duration):
-              start = max(end_time - args.max_segment_duration, start_time)
-            end = min(start + args.max_segment_duration, end_time)
-        else:
-            end = end_time
-        new_utt = "{utt_id}-{s:08d}-{e:08d}".format(
-            utt_id=utt_id, s=int(round(100 * (start - start_time))),
-            e=int(round(100 * (end - start_time))))
-        print ("{new_utt} {utt_id} {s:.3f} {e:.3f}".format(
-            new_utt=new_utt, utt_id=utt_id, s=start - start_time,
-            e=end - start_time))
+
+def run(args):
+    utt_ids, start_times, end_times = read_segments(args.segments_file)
+    segment_indexes, starts, ends, is_last = get_subsegments(
+        start_times, end_times, args.max_segment_duration,
+        args.overlap_duration, args.max_remaining_duration,
+        args.constant_duration)
+
+    # The ids of the windows before the last one have truncated times, and
+    # their end-time is printed as start + max-segment-duration; the last one
+    # has rounded times in the id (computed with python's round() below).
+    start_ids = (100 * starts).astype(np.int64)
+    end_ids = (100 * ends).astype(np.int64)
+    print_ends = np.where(is_last, ends, starts + args.max_segment_duration)
+
+    output = []
+    for i, s, e, s_id, e_id, last in zip(
+            segment_indexes.tolist(), starts.tolist(), print_ends.tolist(),
+            start_ids.tolist(), end_ids.tolist(), is_last.tolist()):
+        if last:
+            s_id = int(round(100 * s))
+            e_id = int(round(100 * e))
+        utt_id = utt_ids[i]
+        output.append("%s-%08d-%08d %s %.3f %.3f\n" % (
+            utt_id, s_id, e_id, utt_id, s, e))
+    sys.stdout.write("".join(output))
 
 
 def main():
@@ -7,6 +7,8 @@
 from __future__ import print_function
 import argparse
 from random import randint
+import functools
+import multiprocessing
 import sys
 import os
 from collections import defaultdict
@@ -43,6 +45,9 @@ parser.add_argument("--merge-within-speakers-only", type = str, default = 'false
                     "It may be useful for the speaker recognition task."
                     "If false, utterances are preferentially combined from the same speaker,"
                     "and then combined across different speakers.")
+parser.add_argument("--num-processes", type = int, default = 1,
+                    help="Number of processes in which the utterances of the "
+                    "different speakers are combined.")
 parser.add_argument("spk2utt_in", type = str, metavar = "<spk2utt-in>",
                     help="Filename of [input] speaker to utterance map needed "
                     "because this script tries to merge utterances from the "
@@ -92,30 +97,31 @@ def CombineList(min_duration, durations):
 
     num_utts = len(durations)
 
-    # for each utterance-index i, group_start[i] gives us the
-    # start-index of the group of utterances of which it's currently
-    # a member.
-    group_start = list(range(num_utts))
-    # if utterance-index i currently corresponds to the start of a group
-    # of utterances, then group_durations[i] is the total duration of
-    # that utterance-group, otherwise undefined.
+    # The current groups of utterances form a doubly linked list: if utterance-index
+    # i currently corresponds to the start of a group of utterances, then
+    # is_group_start[i] is True, group_durations[i] is the total duration of
+    # that utterance-group, group_end[i] is the end-index (i.e. last index plus
+    # one) of that utterance-group, which is also the start-index of the next
+    # group, and prev_group_start[i] is the start-index of the group to its left
+    # (or -1 if there is no such group); otherwise they are undefined.  This
+    # way merging two groups takes constant time, instead of time proportional
+    # to the number of utterances in them.
+    is_group_start = [ True ] * num_utts
     group_durations = list(durations)
-    # if utterance-index i currently corresponds to the start of a group
-    # of utterances, then group_end[i] is the end-index (i.e. last index plus one
-    # of that utterance-group, otherwise undefined.
     group_end = [ x + 1 for x in range(num_utts) ]
+    prev_group_start = [ x - 1 for x in range(num_utts) ]
 
     queue = [ i for i in range(num_utts) if LessThan(group_durations[i], min_duration) ]
 
     while len(queue) > 0:
         i = queue.pop()
-        if group_start[i] != i or not LessThan(group_durations[i], min_duration):
+        if not is_group_start[i] or not LessThan(group_durations[i], min_duration):
             # this group no longer exists or already has at least the minimum duration.
             continue
         this_dur = group_durations[i]
         # left_dur is the duration of the group to the left of this group,
         # or 0.0 if there is no such group.
-        left_dur = group_durations[group_start[i-1]] if i > 0 else 0.0
+        left_dur = group_durations[prev_group_start[i]] if i > 0 else 0.0
         # right_dur is the duration of the group to the right of this group,
         # or 0.0 if there is no such group.
         right_dur = group_durations[group_end[i]] if group_end[i] < num_utts else 0.0
@@ -123,7 +129,7 @@ def CombineList(min_duration, durations):
 
         if left_dur == 0.0 and right_dur == 0.0:
             # there is only one group.  Nothing more to merge; break
-            assert group_start[i] == 0 and group_end[i] == num_utts
+            assert i == 0 and group_end[i] == num_utts
             break
         # work out whether to combine left or right,
         # by means of the combine_left variable [ True or False ]
@@ -155,28 +161,28 @@ def CombineList(min_duration, durations):
 
         if combine_left:
             assert left_dur != 0.0
-            new_group_start = group_start[i-1]
-            group_end[new_group_start] = group_end[i]
-            for j in range(group_start[i], group_end[i]):
-                group_start[j] = new_group_start
-                group_durations[new_group_start] += durations[j]
-            # note: there is no need to add group_durations[new_group_start] to
-            # the queue even if it is still below the minimum length, because it
-            # would have previously had to have been below the minimum length,
-            # therefore it would already be in the queue.
+            # the group starting at i is merged into the group to its left.
+            left_start = prev_group_start[i]
+            right_start = i
         else:
             assert right_dur != 0.0
-            # group start doesn't change, group end changes.
-            old_group_end = group_end[i]
-            new_group_end = group_end[old_group_end]
-            group_end[i] = new_group_end
-            for j in range(old_group_end, new_group_end):
-                group_durations[i] += durations[j]
-                group_start[j] = i
-            if LessThan(group_durations[i], min_duration):
-                # the group starting at i is still below the minimum length, so
-                # we need to put it back on the queue.
-                queue.append(i)
+            # the group to the right is merged into the group starting at i.
+            left_start = i
+            right_start = group_end[i]
+        new_group_end = group_end[right_start]
+        group_end[left_start] = new_group_end
+        if new_group_end < num_utts:
+            prev_group_start[new_group_end] = left_start
+        group_durations[left_start] += group_durations[right_start]
+        is_group_start[right_start] = False
+        # note: if we combined left, there is no need to add the group at
+        # left_start to the queue even if it is still below the minimum length,
+        # because it would have previously had to have been below the minimum
+        # length, therefore it would already be in the queue.
+        if not combine_left and LessThan(group_durations[i], min_duration):
+            # the group starting at i is still below the minimum length, so
+            # we need to put it back on the queue.
+            queue.append(i)
 
     ans = []
     cur_group_start = 0
@@ -226,10 +232,13 @@ def SelfTest():
 # If true, then utterances are only combined if they belong to the same speaker.
 # 'spk2utt' which is a list of pairs (speaker-id, [list-of-utterances])
 # 'utt2dur' which is a dict from utterance-id to duration (as a float)
+# 'num_processes' which is the number of processes in which the speakers are
+# processed in the first pass.
 # It returns a lists of lists of utterances; each list corresponds to
 # a group, e.g.
 # [ ['utt1'], ['utt2', 'utt3'] ]
-def GetUtteranceGroups(min_duration, merge_within_speakers_only, spk2utt, utt2dur):
+def GetUtteranceGroups(min_duration, merge_within_speakers_only, spk2utt, utt2dur,
+                       num_processes = 1):
     # utt_groups will be a list of lists of utterance-ids formed from the
     # first pass of combination.
     utt_groups = []
@@ -237,8 +246,9 @@ def GetUtteranceGroups(min_duration, merge_within_speakers_only, spk2utt, utt2du
     # 'utt_groups'.
     group_durations = []
 
-    # This block calls CombineList for the utterances of each speaker
-    # separately, in the 'first pass' of combination.
+    # spk_durations[i] is the list of durations of the utterances of the i'th
+    # speaker.
+    spk_durations = []
     for i in range(len(spk2utt)):
         (spk, utts) = spk2utt[i]
         durations = [] # durations for this group of utts.
@@ -249,8 +259,27 @@ def GetUtteranceGroups(min_duration, merge_within_speakers_only, spk2utt, utt2du
                 sys.exit("choose_utts_to_combine.py: no duration available "
                          "in utt2dur file {0} for utterance {1}".format(
                         args.utt2dur_in, utt))
-        ranges = CombineList(min_duration, durations)
-        for start, end in ranges:  # each element of 'ranges' is a 2-tuple (start, end)
+        spk_durations.append(durations)
+
+    # This block calls CombineList for the utterances of each speaker
+    # separately, in the 'first pass' of combination.  The speakers are
+    # independent, so they may be processed in parallel.
+    if num_processes > 1 and len(spk2utt) > 1:
+        pool = multiprocessing.Pool(num_processes)
+        try:
+            spk_ranges = pool.map(functools.partial(CombineList, min_duration),
+                                  spk_durations,
+                                  chunksize = max(1, len(spk2utt) // (4 * num_processes)))
+        finally:
+            pool.terminate()
+    else:
+        spk_ranges = [ CombineList(min_duration, durations)
+                       for durations in spk_durations ]
+
+    for i in range(len(spk2utt)):
+        (spk, utts) = spk2utt[i]
+        durations = spk_durations[i]
+        for start, end in spk_ranges[i]:  # each element of 'ranges' is a 2-tuple (start, end)
             utt_groups.append( [ utts[i] for i in range(start, end) ])
             group_durations.append(sum([ durations[i] for i in range(start, end) ]))
 
@@ -334,7 +363,8 @@ while True:
                 args.utt2dur_in, line))
 
 
-utt_groups = GetUtteranceGroups(args.min_duration, args.merge_within_speakers_only, spk2utt, utt2dur)
+utt_groups = GetUtteranceGroups(args.min_duration, args.merge_within_speakers_only, spk2utt, utt2dur,
+                                args.num_processes)
 
 # set utt_group names to an array like [ 'utt1', 'utt2-comb2', 'utt4', ... ]
 utt_group_names = [ group[0] if len(group)==1 else "{0}-comb{1}".format(group[0], len(group))